@@ -1,196 +1,358 @@
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException, WebDriverException, NoSuchElementException
-from selenium import webdriver
-from bs4 import BeautifulSoup
-import pandas as pd
 import time
-from selenium.webdriver.common.keys import Keys
 import csv
 import datetime
 import os
-import pytz
-import smtplib
-import email.message
-import psutil
 import re
-import numpy as np
 # import dotenv
 
 
-
-#destinatário = 'gabriel.calazans@ini.fiocruz.br'
-destinatário = 'regulatorios@ini.fiocruz.br'
-
-# GABRIEL LOGIN
-login = "gabrielcgs12@gmail.com"; senha = "0Dije!c!"
-
-# TANIA LOGIN
-#login = "tania.krstic@ipec.fiocruz.br"; senha = "987654"
-
-timezone = pytz.timezone('Etc/GMT+3')
-
-for proc in psutil.process_iter(attrs=["pid", "name"]):
-    if proc.info["name"] in ["chromedriver", "chrome"]:
-        try:
-            proc.kill()
-            print(f"Processo encerrado: {proc.info['name']} (PID {proc.info['pid']})")
-        except psutil.NoSuchProcess:
-            print(f"Processo {proc.info['name']} (PID {proc.info['pid']}) não encontrado.")
-        except Exception as e:
-            print(f"Erro ao encerrar processo: {e}")
+def enfileirar_email(caixa_saida, fragmentos, destinatario, data_hora):
+    """
+    Enfileira em `caixa_saida` o resumo dos estudos alterados (`fragmentos`: HTML de cada um).
+    O assunto é datado pelo dia, não pela hora: uma nova tentativa da mesma execução gera a
+    mesma chave de idempotência e não duplica o email.
+    """
+    from pb.digest import DEFAULT_MAX_BYTES, OVERFLOW_PARTS, Digest, build_digest, entry_from_study
+    from pb.page_parsing import parse_study_html
+    data = data_hora.strftime('%d/%m/%Y')
+    estudos = [entry_from_study(parse_study_html(fragmento)) for fragmento in fragmentos if isinstance(fragmento, str)]
+    # Resumo com limite de tamanho: texto simples + HTML compacto, excedente em partes numeradas (ou anexo .zip)
+    digest = Digest(f'Últimas atualizações da PB de {data}', 'regulatorios.aids@gmail.com', destinatario,
+                    ["Bom dia equipe,", f"Abaixo os estudos que tiveram atualizações na Plataforma Brasil no dia {data}.",
+                     f"Houve atualização em <b>{len(fragmentos)}</b> estudos."],
+                    ["Um ótimo dia a todos e todas!"])
+    mensagens = build_digest(digest, estudos,
+                             int(float(os.environ.get('PB_EMAIL_MAX_KB', DEFAULT_MAX_BYTES / 1024)) * 1024),
+                             os.environ.get('PB_EMAIL_OVERFLOW', OVERFLOW_PARTS))
+    for mensagem in mensagens:
+        caixa_saida.enqueue(mensagem)
+    print(f"Email em {len(mensagens)} mensagem(ns) na caixa de saída")
+
+
+def main():
+    # Dependências pesadas só são importadas ao rodar o script, não ao importar o módulo
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.by import By
+    from selenium.common.exceptions import TimeoutException, WebDriverException, NoSuchElementException, StaleElementReferenceException
+    from selenium import webdriver
+    from bs4 import BeautifulSoup
+    import pandas as pd
+    from selenium.webdriver.common.keys import Keys
+    import pytz
+    import psutil
+    from pb.run_journal import RunJournal
+    from pb.failure_memory import FailureMemory
+    from pb.state_log import StateLog
+    from pb.outbox import Outbox, flush_outbox, smtp_connection
+    from pb.driver_provisioning import provision_driver
+    from pb.startup_timing import StartupTimer
+    from pb.session_cache import SessionCache, probe_session, restore_browser_session
+    from pb.spans import build_run_metrics, default_spans as etapas, export_run_metrics
+    from pb.run_history import RunHistory, run_record
+    from pb.resource_blocking import BlockingReport, configure_options as configure_blocking_options, enable_blocking
+    from pb.waits import (default_recorder, install_ajax_monitor, is_ajax_idle, rows_signature,
+                          wait_for_element, wait_for_rows_change, wait_until)
+    tempos_inicio = StartupTimer()
+    tempos_inicio.record_imports()
+
+
+
+    #destinatário = 'gabriel.calazans@ini.fiocruz.br'
+    destinatário = 'regulatorios@ini.fiocruz.br'
+
+    # GABRIEL LOGIN
+    login = "gabrielcgs12@gmail.com"; senha = "0Dije!c!"
+
+    # TANIA LOGIN
+    #login = "tania.krstic@ipec.fiocruz.br"; senha = "987654"
+
+    timezone = pytz.timezone('Etc/GMT+3')
+
+    for proc in psutil.process_iter(attrs=["pid", "name"]):
+        if proc.info["name"] in ["chromedriver", "chrome"]:
+            try:
+                proc.kill()
+                print(f"Processo encerrado: {proc.info['name']} (PID {proc.info['pid']})")
+            except psutil.NoSuchProcess:
+                print(f"Processo {proc.info['name']} (PID {proc.info['pid']}) não encontrado.")
+            except Exception as e:
+                print(f"Erro ao encerrar processo: {e}")
 
             
-options = Options()
-options.add_argument("--disable-gpu")  # Desativa GPU para melhorar desempenho
-options.add_argument("--no-sandbox")  # Evita problemas de permissão
-options.add_argument("--disable-dev-shm-usage")  # Melhora estabilidade
-options.add_argument("--blink-settings=imagesEnabled=false")  # Desativa imagens
-options.add_argument("--disable-extensions")  # Desativa extensões
-options.add_argument("--disable-popup-blocking")  # Evita bloqueios de pop-up
-options.add_argument("--disable-infobars")  # Remove barra de informações do Chrome
-options.add_argument("--headless")  # Modo headless (opcional)
-service = Service(ChromeDriverManager().install())
-
-data_hora0 = datetime.datetime.now(timezone)
-data_hora00 = str(data_hora0)
-print(f"Hora de início: {str(data_hora0)[0:16]}")
-
-driver = webdriver.Chrome(service=service, options=options)
-wait = WebDriverWait(driver, 120)
-driver.get("https://plataformabrasil.saude.gov.br/login.jsf")
-driver.maximize_window()
-
-print("Abrindo Plataforma Brasil")
-time.sleep(10)
-
-while True:
-    wait.until(EC.element_to_be_clickable((By.XPATH,'/html/body/div[2]/div/div[3]/div/div/form[1]/input[4]')))
-    driver.find_element(By.XPATH,'//*[@id="j_id19:email"]').clear() # email
-    driver.find_element(By.XPATH,'//*[@id="j_id19:email"]').send_keys(login) # email
-    driver.find_element(By.XPATH,'//*[@id="j_id19:senha"]').clear() # senha
-    driver.find_element(By.XPATH,'//*[@id="j_id19:senha"]').send_keys(senha) # senha
+    options = Options()
+    options.add_argument("--disable-gpu")  # Desativa GPU para melhorar desempenho
+    options.add_argument("--no-sandbox")  # Evita problemas de permissão
+    options.add_argument("--disable-dev-shm-usage")  # Melhora estabilidade
+    options.add_argument("--blink-settings=imagesEnabled=false")  # Desativa imagens
+    options.add_argument("--disable-extensions")  # Desativa extensões
+    options.add_argument("--disable-popup-blocking")  # Evita bloqueios de pop-up
+    options.add_argument("--disable-infobars")  # Remove barra de informações do Chrome
+    options.add_argument("--headless")  # Modo headless (opcional)
+    configure_blocking_options(options)  # Registra as requisições de rede para o relatório de bloqueio
+    with tempos_inicio.phase('provisioning'):
+        caminho_driver = provision_driver()  # chromedriver em cache para a versão instalada do Chrome
+    service = Service(caminho_driver) if caminho_driver else Service()
+
+    data_hora0 = datetime.datetime.now(timezone)
+    data_hora00 = str(data_hora0)
+    print(f"Hora de início: {str(data_hora0)[0:16]}")
+
+    def abrir_navegador():
+        novo_driver = webdriver.Chrome(service=service, options=options)
+        enable_blocking(novo_driver)  # Bloqueia CSS, imagens, fontes e rastreadores; documentos, scripts e AJAX passam
+        novo_driver.maximize_window()
+        return novo_driver, WebDriverWait(novo_driver, 120)
+
+    with tempos_inicio.phase('browser launch'):
+        driver, wait = abrir_navegador()
+
+    print("Abrindo Plataforma Brasil")
+
+    MAX_TENTATIVAS_LOGIN = 5
+    inicio_login = time.perf_counter()
+    cache_sessao = SessionCache()
+
+    def autenticar():
+        """Autentica o driver atual: com a sessão em cache, se ainda válida, ou pelo formulário de login. Retorna True se logado."""
+        sessao = cache_sessao.load()
+        logado = False
+        if sessao and probe_session(sessao):  # sessão da execução anterior ainda válida: dispensa o login
+            try:
+                restore_browser_session(driver, sessao)
+                wait_for_element(driver, (By.XPATH, "//table[@class='rich-dtascroller-table']"), timeout=60, name='session_restore')
+                logado = True
+                print("Sessão em cache reaproveitada")
+            except:
+                pass
+
+        tentativa = 0
+        while not logado and tentativa < MAX_TENTATIVAS_LOGIN:
+            tentativa += 1
+            driver.get("https://plataformabrasil.saude.gov.br/login.jsf")
+            wait.until(EC.element_to_be_clickable((By.XPATH,'/html/body/div[2]/div/div[3]/div/div/form[1]/input[4]')))
+            driver.find_element(By.XPATH,'//*[@id="j_id19:email"]').clear() # email
+            driver.find_element(By.XPATH,'//*[@id="j_id19:email"]').send_keys(login) # email
+            driver.find_element(By.XPATH,'//*[@id="j_id19:senha"]').clear() # senha
+            driver.find_element(By.XPATH,'//*[@id="j_id19:senha"]').send_keys(senha) # senha
     
-    driver.find_element(By.XPATH, '//*[@id="j_id19"]/input[4]').click() # logar"
-    time.sleep(2)
+            botao_logar = driver.find_element(By.XPATH, '//*[@id="j_id19"]/input[4]')
+            botao_logar.click() # logar"
+            # espera sair da página de login ou aparecer o aviso de usuário já logado
+            botao_invalidar = '//*[@id="formModalMsgUsuarioLogado:idBotaoInvalidarUsuarioLogado"]'
+            try:
+                wait_until(driver, EC.any_of(EC.staleness_of(botao_logar),
+                                             EC.element_to_be_clickable((By.XPATH, botao_invalidar))), 60, 'login_submit')
+            except:
+                continue
     
-    try:   
-        driver.find_element(By.XPATH, 
-                            '//*[@id="formModalMsgUsuarioLogado:idBotaoInvalidarUsuarioLogado"]').click()
-    except:
-        pass 
+            try:   
+                botao = driver.find_element(By.XPATH, botao_invalidar)
+                botao.click()
+                wait_until(driver, EC.staleness_of(botao), 60, 'login_invalidate_session')
+            except:
+                pass 
         
-    try:
-        valid_login = driver.find_element(By.XPATH,"/html/body/div[2]/div/div[4]/div").text
-        #print(valid_login)
-        if "sessão" in valid_login:
-            break
-    except:
-        continue
-
-print("Login realizado com sucesso")
-
-time.sleep(10)
-
-list_CAAE = []
-soup = BeautifulSoup(driver.page_source, 'html.parser')
-paginas0 = soup.find("table",class_="rich-dtascroller-table").text
-paginas0 = re.search((r'de (.*?) registro\(s\)'), paginas0).group(1)
-paginas = int((int(paginas0)-1)/10)
-
-for i in range(paginas+1):
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
+            try:
+                valid_login = wait_for_element(driver, (By.XPATH, "/html/body/div[2]/div/div[4]/div"), timeout=60, name='login_status').text
+                #print(valid_login)
+                if "sessão" in valid_login:
+                    logado = True
+            except:
+                continue
+        return logado
+
+    logado = autenticar()
+    if not logado:
+        cache_sessao.clear()
+        driver.quit()
+        raise SystemExit(f"Falha no login após {MAX_TENTATIVAS_LOGIN} tentativas")
+    cache_sessao.save(driver.get_cookies())
+    tempos_inicio.record('login', time.perf_counter() - inicio_login)
+    etapas.record('login', time.perf_counter() - inicio_login)
+    print("Login realizado com sucesso")
+    print(f"Tempos de inicialização: {tempos_inicio.summary()}")
+
+    TBODY_LISTAGEM = '/html/body/div[2]/div/div[6]/div[1]/form/div[3]/div[2]/table/tbody'
+    CAMPO_CAAE = '/html/body/div[2]/div/div[6]/div[1]/form/div[2]/div[2]/table[1]/tbody/tr/td[2]/table/tbody/tr[2]/td/input'
+    TABELA_TRAMITES = 'formDetalharProjeto:tableTramiteApreciacaoProjeto:tb'
+
+    wait_for_element(driver, (By.XPATH, "//table[@class='rich-dtascroller-table']"), timeout=120, name='login_landing')
+
+    # Retomar execução interrompida (ex.: nova tentativa do workflow): reaproveita a listagem e os CAAEs já extraídos
+    journal = RunJournal()
+    listagem_retomada = journal.listing()
+
+    if listagem_retomada:
+        list_CAAE = listagem_retomada[0]
+        print(f"Retomando execução interrompida: {len(list_CAAE)} CAAEs na listagem, {len(journal.records())} já extraídos")
+    else:
+        list_CAAE = []
+        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        paginas0 = soup.find("table",class_="rich-dtascroller-table").text
+        paginas0 = re.search((r'de (.*?) registro\(s\)'), paginas0).group(1)
+        paginas = int((int(paginas0)-1)/10)
+
+        for i in range(paginas+1):
+            inicio_etapa = time.perf_counter()
+            soup = BeautifulSoup(driver.page_source, 'html.parser')
     
-    try:
-        time.sleep(10)
-        wait.until(EC.element_to_be_clickable((By.XPATH,'/html/body/div[2]/div/div[6]/div[1]/form/div[3]/div[2]/table/tfoot/tr/td/div/table/tbody/tr/td[6]'))).click() #clicar no >>
-    except:
-        pass
+            try:
+                if i < paginas:
+                    linhas = rows_signature(driver, TBODY_LISTAGEM)
+                    install_ajax_monitor(driver)
+                    wait.until(EC.element_to_be_clickable((By.XPATH,'/html/body/div[2]/div/div[6]/div[1]/form/div[3]/div[2]/table/tfoot/tr/td/div/table/tbody/tr/td[6]'))).click() #clicar no >>
+                    wait_for_rows_change(driver, TBODY_LISTAGEM, linhas, timeout=60, name='listing_next_page') # espera a próxima página
+            except:
+                pass
     
-    a = []
-    aa = soup.find_all("label")
+            a = []
+            aa = soup.find_all("label")
 
-    for label in aa:
-        a.append(label.text)
+            for label in aa:
+                a.append(label.text)
     
-    for item in a:
-        if '5262' in item:
-            list_CAAE.append(item)
-            #print(item)
-
-list_CAAE = set(list_CAAE)
-list_CAAE = list(list_CAAE)
-list_CAAE = [item.replace("\n", "") if isinstance(item, str) else item for item in list_CAAE]
-#print(f"CAAEs válidos extraídos: {len(list_CAAE)}")
-
-CAAE = list_CAAE
-
-df_email = []
-df_CAAE = []
-count = 0
-
-for i in CAAE:
-
-    max_retries = 3
-    retry_count = 0
-    while retry_count < max_retries:
+            for item in a:
+                if '5262' in item:
+                    list_CAAE.append(item)
+                    #print(item)
+            etapas.record('listing.page', time.perf_counter() - inicio_etapa)
+
+        list_CAAE = set(list_CAAE)
+        list_CAAE = list(list_CAAE)
+        list_CAAE = [item.replace("\n", "") if isinstance(item, str) else item for item in list_CAAE]
+        journal.record_listing(list_CAAE)
+    #print(f"CAAEs válidos extraídos: {len(list_CAAE)}")
+
+    CAAE = list_CAAE
+
+    df_email = []
+    df_CAAE = []
+    count = 0
+    ja_extraidos = journal.records()
+
+    for i in CAAE:
+        if i in ja_extraidos:
+            df_CAAE.append(ja_extraidos[i]['CAAE'])
+            df_email.append(ja_extraidos[i]['email'])
+
+    # Um CAAE com problema não segura os demais: cada um tem uma tentativa na fila, os que falham
+    # são tentados de novo no fim, e os que falham em execuções seguidas esperam cada vez mais
+    memoria_falhas = FailureMemory(os.environ.get('PB_FAILURE_MEMORY', 'caae_failures.json'),
+                                   datetime.timedelta(hours=float(os.environ.get('PB_FAILURE_BACKOFF_HOURS', '1'))))
+    fila, em_espera = memoria_falhas.split([i for i in CAAE if i not in ja_extraidos], data_hora0)
+    adiados, falhas, concluidos = [], [], set()
+
+    # Sessão que cai no meio da execução (logout, navegador travado, páginas que ficam obsoletas):
+    # novo login ou novo navegador, e o CAAE interrompido é tentado de novo em seguida, sem contar como falha
+    URL_LISTAGEM = "https://plataformabrasil.saude.gov.br/visao/pesquisador/gerirPesquisa/gerirPesquisaAgrupador.jsf"
+    MAX_RECUPERACOES = int(os.environ.get('PB_MAX_SESSION_RECOVERIES', '5'))
+    recuperacoes, obsoletos, sessao_perdida = 0, 0, False
+
+    def problema_de_sessao():
+        """'navegador' se o Chrome não responde mais, 'logout' se a sessão caiu na página de login, senão None."""
         try:
-            t1 = datetime.datetime.now(timezone)
-
-            driver.find_element(By.XPATH,'/html/body/div[2]/div/div[6]/div[1]/form/div[2]/div[2]/table[1]/tbody/tr/td[2]/table/tbody/tr[2]/td/input').clear() #apagar
-            driver.find_element(By.XPATH,'/html/body/div[2]/div/div[6]/div[1]/form/div[2]/div[2]/table[1]/tbody/tr/td[2]/table/tbody/tr[2]/td/input').send_keys(i) #escrever CAAE
-            driver.find_element(By.XPATH,'/html/body/div[2]/div/div[6]/div[1]/form/div[2]/div[2]/table[1]/tbody/tr/td[2]/table/tbody/tr[2]/td/input').send_keys('\ue006') #clicar para pesquisar
-
-            o = 0
-            while o < 10:
+            if 'login.jsf' in driver.current_url or driver.find_elements(By.ID, 'j_id19:email'):
+                return 'logout'
+        except WebDriverException:
+            return 'navegador'
+        return None
+
+    def recuperar_sessao(problema):
+        """Abre um navegador novo (se o atual parou), autentica de novo e volta à listagem. Retorna True se deu certo."""
+        nonlocal driver, wait
+        try:
+            if problema == 'navegador':
                 try:
-                    wait.until(EC.element_to_be_clickable((By.XPATH,'/html/body/div[2]/div/div[6]/div[1]/form/div[3]/div[2]/table/tbody/tr/td[10]/a/img'))).click() #clicar na lupa
-                    break
+                    driver.quit()
                 except:
-                    # Esperar 1 segundo antes de tentar novamente
-                    time.sleep(1)
-                    o += 1
-
-            time.sleep(5)
-            print(f"Entrou na página do CAAE {i}")
+                    pass
+                driver, wait = abrir_navegador()
+            if problema == 'logout':
+                cache_sessao.clear()  # os cookies em cache são os da sessão expirada
+            if not autenticar():
+                return False
+            cache_sessao.save(driver.get_cookies())
+            driver.get(URL_LISTAGEM)
+            wait_for_element(driver, (By.XPATH, CAMPO_CAAE), timeout=60, name='session_recovery')
+            return True
+        except Exception as e:
+            print(f"Falha ao recuperar a sessão: {e}")
+            return False
+
+    for rodada, caaes_rodada in enumerate((fila, adiados)):
+        if rodada and adiados:
+            print(f"Tentando de novo, no fim da fila, {len(adiados)} CAAEs que falharam: {', '.join(adiados)}")
+        caaes_rodada = list(caaes_rodada)  # cópia: o CAAE interrompido por uma queda de sessão é reinserido logo adiante
+        for posicao, i in enumerate(caaes_rodada):
+            try:
+                t1 = datetime.datetime.now(timezone)
+
+                inicio_etapa = time.perf_counter()
+                linhas = rows_signature(driver, TBODY_LISTAGEM)
+                install_ajax_monitor(driver)
+                driver.find_element(By.XPATH, CAMPO_CAAE).clear() #apagar
+                driver.find_element(By.XPATH, CAMPO_CAAE).send_keys(i) #escrever CAAE
+                driver.find_element(By.XPATH, CAMPO_CAAE).send_keys('\ue006') #clicar para pesquisar
+                wait_for_rows_change(driver, TBODY_LISTAGEM, linhas, timeout=60, expected_text=i, name='caae_search') # espera o resultado da pesquisa
+                etapas.record('caae.search', time.perf_counter() - inicio_etapa)
+
+                inicio_etapa = time.perf_counter()
+                lupa = wait.until(EC.element_to_be_clickable((By.XPATH,'/html/body/div[2]/div/div[6]/div[1]/form/div[3]/div[2]/table/tbody/tr/td[10]/a/img'))) 
+                lupa.click() #clicar na lupa
+
+                # espera a página do CAAE: tabela de trâmites carregada, ou página estável sem ela
+                wait_until(driver, EC.any_of(
+                    EC.presence_of_element_located((By.ID, TABELA_TRAMITES)),
+                    EC.all_of(EC.staleness_of(lupa),
+                              EC.presence_of_element_located((By.XPATH, '/html/body/div[2]/div/div[3]/div[2]/form/a[2]')),
+                              is_ajax_idle)),
+                    60, 'detail_page')
+                etapas.record('caae.lupa', time.perf_counter() - inicio_etapa)
+                print(f"Entrou na página do CAAE {i}")
             
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
+                inicio_etapa = time.perf_counter()
+                soup = BeautifulSoup(driver.page_source, 'html.parser')
+                tempo_parse = time.perf_counter() - inicio_etapa
             
-            wait.until(EC.element_to_be_clickable((By.XPATH,'/html/body/div[2]/div/div[3]/div[2]/form/a[2]'))).click() #voltar ao menu
-            print(f"Saiu da página do CAAE {i}")
-
-            #Contador
-            t2 = datetime.datetime.now(timezone)
-            t = t2-t1
-            count = count + 1
-            con = f'Progresso: {count}/{len(CAAE)} Duração: {str(t)[2:9]}'
-            print(con)
-
-            #extrai o nome do estudo
-            nome_estudo = soup.find('td', class_="text-top").text[21:].replace('"',"") 
+                inicio_etapa = time.perf_counter()
+                voltar = wait.until(EC.element_to_be_clickable((By.XPATH,'/html/body/div[2]/div/div[3]/div[2]/form/a[2]')))
+                voltar.click() #voltar ao menu
+                wait_until(driver, EC.staleness_of(voltar), 60, 'voltar_leave_details')
+                wait_for_element(driver, (By.XPATH, CAMPO_CAAE), timeout=60, name='voltar_listing')
+                etapas.record('caae.back', time.perf_counter() - inicio_etapa)
+                print(f"Saiu da página do CAAE {i}")
+
+                #Contador
+                t2 = datetime.datetime.now(timezone)
+                t = t2-t1
+                count = count + 1
+                con = f'Progresso: {count}/{len(CAAE)} Duração: {str(t)[2:9]}'
+                print(con)
+
+                inicio_etapa = time.perf_counter()
+                #extrai o nome do estudo
+                nome_estudo = soup.find('td', class_="text-top").text[21:].replace('"',"") 
                         
-            #extrai o PI
-            PI = soup.find_all("td")[6].text 
-            PI = PI.replace("\n", "")
-
-            #extrai o primeiro histórico de trâmites
-            a = soup.find(id='formDetalharProjeto:tableTramiteApreciacaoProjeto:tb') 
-            time.sleep(2)
-            a = a.find_all('span')
-            b = []
-            for span in a:
-                b.append(span.text)
-
-            q = []
-            output = []
-            x = 0
-
-            while x < len(b[0::8]):
-                t = f"""
+                #extrai o PI
+                PI = soup.find_all("td")[6].text 
+                PI = PI.replace("\n", "")
+
+                #extrai o primeiro histórico de trâmites
+                a = soup.find(id=TABELA_TRAMITES) 
+                a = a.find_all('span')
+                b = []
+                for span in a:
+                    b.append(span.text)
+
+                q = []
+                output = []
+                x = 0
+
+                while x < len(b[0::8]):
+                    t = f"""
                     <tr>
                     <th>{x+1}</th> 
                     <td>{b[0::8][x]}</td> 
@@ -203,16 +365,16 @@ for i in CAAE:
                     <td>{b[7::8][x]}</td>
                     </tr>
                     """
-                q.append(t)
-                x = (x + 1)
+                    q.append(t)
+                    x = (x + 1)
                 
-            output = ''.join(q)
+                output = ''.join(q)
 
-            CAAE_estudo = soup.find_all("td")[15].text
-            CAAE_estudo = CAAE_estudo.replace("\n", "")
-            CAAE_estudo = CAAE_estudo.replace("CAAE: ","")
+                CAAE_estudo = soup.find_all("td")[15].text
+                CAAE_estudo = CAAE_estudo.replace("\n", "")
+                CAAE_estudo = CAAE_estudo.replace("CAAE: ","")
 
-            tabela_tramites = f"""
+                tabela_tramites = f"""
                             <table border="1" class="dataframe" style="text-align: center"> 
                             <thead><tr> 
                             <th></th> 
@@ -229,119 +391,182 @@ for i in CAAE:
                             </table>
                             """
 
-            corpo_email =   f"""
+                corpo_email =   f"""
                             <p><b>{nome_estudo}</b></p> 
                             <p>CAAE: {CAAE_estudo}</p> 
                             <p>{PI}</p> 
                             {tabela_tramites}
                             """
 
-            df_email.append(corpo_email)
-            df_CAAE.append(CAAE_estudo)
-            
-            
-
+                etapas.record('caae.parse', tempo_parse + time.perf_counter() - inicio_etapa)
+                df_email.append(corpo_email)
+                df_CAAE.append(CAAE_estudo)
+                journal.record(i, {'CAAE': CAAE_estudo, 'email': corpo_email}) # gravado em disco antes do próximo CAAE
+                concluidos.add(i)
+                obsoletos = 0
+
+            except Exception as e:
+                obsoletos = obsoletos + 1 if isinstance(e, StaleElementReferenceException) else 0
+                problema = problema_de_sessao() or ('páginas obsoletas' if obsoletos >= 3 else None)
+                if problema:
+                    if recuperacoes < MAX_RECUPERACOES:
+                        recuperacoes += 1
+                        print(f"Sessão com problema no CAAE {i} ({problema}); recuperando ({recuperacoes}/{MAX_RECUPERACOES})")
+                        if recuperar_sessao(problema):
+                            obsoletos = 0
+                            caaes_rodada.insert(posicao + 1, i)
+                            continue
+                    print(f"Sessão perdida no CAAE {i} ({problema}); os CAAEs restantes ficam para a próxima execução")
+                    sessao_perdida = True
+                    break
+                (falhas if rodada else adiados).append(i)
+                print(f"Erro no CAAE {i}: {e}. {'Não será verificado nesta execução' if rodada else 'Nova tentativa no fim da fila'}")
+                # Voltar à listagem, onde o próximo CAAE é pesquisado
+                driver.get("https://plataformabrasil.saude.gov.br/visao/pesquisador/gerirPesquisa/gerirPesquisaAgrupador.jsf")
+                try:
+                    wait_for_element(driver, (By.XPATH, CAMPO_CAAE), timeout=60, name='retry_recovery')
+                except:
+                    pass
+        if sessao_perdida:
             break
 
-        except Exception as e:
-            retry_count += 1
-            print(f"Erro no CAAE {i}: {e}. Tentativa {retry_count} de {max_retries}")
-            # Recarregar página ou voltar à página inicial
-            driver.get("https://plataformabrasil.saude.gov.br/visao/pesquisador/gerirPesquisa/gerirPesquisaAgrupador.jsf")
-            time.sleep(10)
-            
-
-print("Trâmites extraidos")
-
-driver.close()
-
-# Criar DataFrame com as informações de estudo, CAAE e tabela do histórico de tramites
-now = pd.DataFrame(zip(df_CAAE, df_email), columns=['CAAE', "email"]).sort_values(by=['CAAE'])
-
-# Comparar os resultados
-old = pd.read_csv("new.csv")
-
-comparar = pd.merge(
-    now, 
-    old, 
-    on = 'CAAE', 
-    how = 'outer',
-    )
-comparar = comparar[comparar["email_x"] != comparar["email_y"]]
-
-# Monta lista com os email
-join1 = comparar['email_x'].tolist()
-
-vezes = len(join1)
-
-def enviar_email():
-    # Config do email
-    data_hora1 = datetime.datetime.now(timezone)
-    str_data_hora1 = data_hora1.strftime("%d/%m/%Y %H:%M:%S")
-    tempo = (data_hora1 - data_hora0)
-    
-    corpo_email = f"""
-    <meta http-equiv="Content-Type" content="text/html; charset=utf-8"> 
-    <p>Bom dia equipe,</p> 
-    <p>Abaixo os estudos que tiveram atualizações na Plataforma Brasil no dia {data}.</p> 
-    <p>Houve atualização em <b>{vezes}</b> estudos.</p> 
-    <br/> 
-    {join1}
-    <br/> 
-    <p>Um ótimo dia a todos e todas!</p>
-    """
-
-    msg = email.message.Message()
-    msg['Subject'] = f'Últimas atualizações da PB de {data_hora}'
-    msg['From'] = 'regulatorios.aids@gmail.com'
-    msg['To'] = destinatário
+    retentativas = len(adiados)
+    # CAAEs que ficaram sem sessão para processá-los não falharam: nem sucesso nem falha na memória
+    nao_processados = [i for i in fila if i not in concluidos and i not in falhas]
+    for i in fila:
+        if i in falhas:
+            memoria_falhas.record_failure(i, data_hora0)
+        elif i in concluidos:
+            memoria_falhas.record_success(i)
+    memoria_falhas.save()
+    nao_verificados = sorted(falhas + nao_processados + em_espera)
+    if nao_verificados:
+        print(f"CAAEs não verificados nesta execução ({len(nao_verificados)}); seus dados anteriores foram mantidos:")
+        for i in falhas:
+            print(f"  {memoria_falhas.describe(i)}: falhou nesta execução, mesmo após nova tentativa no fim da fila")
+        for i in nao_processados:
+            print(f"  {i}: não processado, sessão perdida")
+        for i in em_espera:
+            print(f"  {memoria_falhas.describe(i)}: em espera após falhas em execuções anteriores")
+
+    print("Trâmites extraidos")
+    for nome_espera, espera in sorted(default_recorder.summary().items()):
+        print(f"Espera {nome_espera}: {espera['count']}x, total {espera['total']:.1f}s, máx {espera['max']:.2f}s, timeouts {espera['timeouts']}")
+
+    relatorio_bloqueio = BlockingReport()
+    relatorio_bloqueio.collect(driver)
+    print(f"Recursos bloqueados: {sum(relatorio_bloqueio.blocked_requests.values())} requisições "
+          f"({len(relatorio_bloqueio.blocked_urls)} URLs únicas); {relatorio_bloqueio.loaded_requests} carregadas")
+    driver.close()
+
+    # Criar DataFrame com as informações de estudo, CAAE e tabela do histórico de tramites
+    now = pd.DataFrame(zip(df_CAAE, df_email), columns=['CAAE', "email"]).sort_values(by=['CAAE'])
+
+    # Comparar com o estado da última execução, guardado no histórico de estados (só as mudanças de cada execução)
+    inicio_etapa = time.perf_counter()
+    historico = StateLog(os.environ.get('PB_STATE_LOG', 'pb_history'), int(os.environ.get('PB_STATE_LOG_SNAPSHOT_EVERY', '30')))
+    if historico.is_empty():
+        # Primeira execução com o histórico: parte dos CSVs da rotação antiga, que deixam de ser usados
+        for csv_legado in ('old.csv', 'new.csv'):
+            historico.import_csv(csv_legado, data_hora0)
+        for csv_legado in ('old.csv', 'new.csv'):
+            if os.path.exists(csv_legado):
+                os.remove(csv_legado)
+    old = pd.DataFrame(sorted(historico.state().items()), columns=['CAAE', 'email'])
+    etapas.record('state.read', time.perf_counter() - inicio_etapa)
+    # CAAEs não verificados mantêm a linha anterior: nem aparecem como alterados nem somem do histórico
+    now = pd.concat([now, old[old['CAAE'].isin(nao_verificados)]]).sort_values(by=['CAAE'])
+    inicio_etapa = time.perf_counter()
+
+    comparar = pd.merge(
+        now, 
+        old, 
+        on = 'CAAE', 
+        how = 'outer',
+        )
+    comparar = comparar[comparar["email_x"] != comparar["email_y"]]
+    etapas.record('compare', time.perf_counter() - inicio_etapa)
+
+    # Monta lista com os email
+    join1 = comparar['email_x'].tolist()
+
+    vezes = len(join1)
+
+    # Caixa de saída durável: o email é gravado antes de atualizar o CSV e enviado depois;
+    # uma falha no SMTP fica para 'python -m pb outbox send', sem refazer a raspagem
+    caixa_saida = Outbox(os.environ.get('PB_OUTBOX', 'outbox'))
     password = 'hwle abms newc pubc' 
-    msg.add_header('Content-Type', 'text/html')
-    msg.set_payload(corpo_email)
-
-    s = smtplib.SMTP('smtp.gmail.com: 587')
-    s.starttls()
-        
-    # Login Credentials for sending the mail
-    s.login(msg['From'], password)
-    s.sendmail(msg['From'], [msg['To']], msg.as_string().encode('utf-8'))
-
-if vezes > 0:
-    join1 = '<br/>'.join(join1)
-
-    data = datetime.date.today().strftime('%d/%m/%Y')
-    data_hora = datetime.datetime.now(timezone) 
-    data_hora = data_hora.strftime("%d/%m/%Y %H:%M:%S")
-
-    print("configurando email")
-
-    # Enviar email e registrar o término do programa
-    data_hora1 = datetime.datetime.now(timezone)
-    data_hora_str = data_hora1.strftime("%d/%m/%Y %H:%M:%S")
-    tempo = (data_hora1 - data_hora0)
-    tempo_str = str(tempo)
-
-    data_hora_str = data_hora0.strftime("%d/%m/%Y %H:%M:%S")
-    file = open("registro.txt", "a")
-    file.write(f'\n\n{data_hora00} - O programa comecou a rodar. \n')
-    file.write(f'{data_hora_str} - O email foi enviado com sucesso. {vezes} estudos atualizados. Demorou: {tempo} minutos')
-    file.close()
+    email_enviado = False
+
+    def enviar_emails():
+        # Uma única conexão para todas as mensagens pendentes; as que falharem ficam para a próxima tentativa
+        inicio_smtp = time.perf_counter()
+        resultado = flush_outbox(caixa_saida, lambda: smtp_connection('regulatorios.aids@gmail.com', password))
+        etapas.record('smtp', time.perf_counter() - inicio_smtp)
+        return not caixa_saida.pending() and not resultado.dead
+
+    if vezes > 0:
+        print("configurando email")
+
+        # Enviar email e registrar o término do programa
+        data_hora1 = datetime.datetime.now(timezone)
+        data_hora_str = data_hora1.strftime("%d/%m/%Y %H:%M:%S")
+        tempo = (data_hora1 - data_hora0)
+        tempo_str = str(tempo)
+
+        data_hora_str = data_hora0.strftime("%d/%m/%Y %H:%M:%S")
+        file = open("registro.txt", "a")
+        file.write(f'\n\n{data_hora00} - O programa comecou a rodar. \n')
+        file.write(f'{data_hora_str} - O email foi enviado com sucesso. {vezes} estudos atualizados. Demorou: {tempo} minutos')
+        file.close()
     
-    # Atualizar CSV
-    os.replace("new.csv", "old.csv")
-    now.to_csv("new.csv", index=False)
+        enfileirar_email(caixa_saida, join1, destinatário, datetime.datetime.now(timezone))
+
+        # Gravar no histórico só os CAAEs alterados; execuções além da retenção viram um snapshot
+        inicio_etapa = time.perf_counter()
+        historico.append(dict(zip(now['CAAE'], now['email'])), data_hora0)
+        historico.compact(datetime.timedelta(days=float(os.environ.get('PB_STATE_LOG_RETENTION_DAYS', '365'))), data_hora0)
+        etapas.record('state.write', time.perf_counter() - inicio_etapa)
     
-    enviar_email()
-    print(f"Email enviado. Hora de término: {data_hora_str[0:16]}. Duração: {tempo_str[0:16]}")
+        email_enviado = enviar_emails()
+        if email_enviado:
+            print(f"Email enviado. Hora de término: {data_hora_str[0:16]}. Duração: {tempo_str[0:16]}")
+        else:
+            print(f"Email na caixa de saída, envio pendente ('python -m pb outbox send'). Hora de término: {data_hora_str[0:16]}")
     
-else:
-    data_hora_str = data_hora0.strftime("%d/%m/%Y %H:%M:%S")
-    file = open("registro.txt", "a")
-    file.write(f'\n\n{data_hora00} - O programa comecou a rodar. \n')
-    data_hora1 = datetime.datetime.now(timezone)
-    data_hora_str = data_hora1.strftime("%d/%m/%Y %H:%M:%S")
-    tempo = (data_hora1 - data_hora0)
-    tempo_str = str(tempo)
-    file.write(f'{data_hora_str} - O email nao precisou ser enviado. {vezes} estudos atualizados. Demorou: {tempo} minutos')
-    file.close()
-    print(f"Não foi necessário enviar email. Hora de término: {data_hora_str[0:16]}. Duração: {tempo_str[0:16]}")
+    else:
+        data_hora_str = data_hora0.strftime("%d/%m/%Y %H:%M:%S")
+        file = open("registro.txt", "a")
+        file.write(f'\n\n{data_hora00} - O programa comecou a rodar. \n')
+        data_hora1 = datetime.datetime.now(timezone)
+        data_hora_str = data_hora1.strftime("%d/%m/%Y %H:%M:%S")
+        tempo = (data_hora1 - data_hora0)
+        tempo_str = str(tempo)
+        file.write(f'{data_hora_str} - O email nao precisou ser enviado. {vezes} estudos atualizados. Demorou: {tempo} minutos')
+        file.close()
+        print(f"Não foi necessário enviar email. Hora de término: {data_hora_str[0:16]}. Duração: {tempo_str[0:16]}")
+        if caixa_saida.due():
+            enviar_emails() # Mensagens de execuções anteriores que ainda não foram entregues
+
+    journal.complete()
+    journal.close()
+
+    # Métricas da execução: etapas, esperas do servidor e pausas deliberadas
+    data_hora_fim = datetime.datetime.now(timezone)
+    fatos = {'caaes': len(CAAE), 'processed': len(df_CAAE), 'failed': len(falhas), 'retries': retentativas,
+             'skipped': len(nao_verificados), 'skipped_caaes': nao_verificados, 'session_recoveries': recuperacoes,
+             'updates': vezes, 'email_sent': email_enviado}
+    export_run_metrics(build_run_metrics(dict(fatos, started=data_hora0, finished=data_hora_fim, engine='browser', workers=1,
+                                              duration_seconds=round((data_hora_fim - data_hora0).total_seconds(), 3)),
+                                         etapas),
+                       os.environ.get('PB_METRICS_JSON', 'run_metrics.json') or None,
+                       os.environ.get('PB_METRICS_PROM', 'run_metrics.prom') or None)
+    # Histórico estruturado das execuções (python -m pb history report)
+    etapas_execucao = {f'startup.{fase}': segundos for fase, segundos in tempos_inicio.phases.items()}
+    etapas_execucao.update((nome, etapa['total']) for nome, etapa in etapas.summary('span').items())
+    RunHistory(os.environ.get('PB_RUN_HISTORY', 'run_history.jsonl')).append(
+        run_record(data_hora0, data_hora_fim, source='PB3', stages=etapas_execucao, **fatos))
+
+
+if __name__ == "__main__":
+    main()
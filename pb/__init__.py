@@ -0,0 +1,7 @@
+"""
+Plataforma Brasil update checker.
+
+Importing `pb` (or its light modules: config, comparison, tramite_diff, tramite_store, run...)
+does not load Selenium, pandas, requests or BeautifulSoup; they are imported where they are used.
+The command line interface is `python -m pb` (see pb.cli).
+"""
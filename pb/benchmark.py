@@ -0,0 +1,326 @@
+"""
+Benchmarks of the stages that do not touch the network: parsing the listing and details
+pages, diffing the studies against the stored state, rendering the changed rows, assembling
+the email and the legacy DataFrame comparison.
+
+The pages come either from a directory of recorded pages (`listing*.html` and `detail*.html`,
+anonymized with `anonymize_page` before they are shared) or from the synthetic generator of
+pb.fake_plataforma, which scales to thousands of CAAEs with long trâmite histories.
+Pages are generated lazily, outside the timed calls, so large datasets are not kept in memory.
+
+Every stage reports its throughput, the latency percentiles of its items and its peak
+memory (traced allocations, measured in a second pass so tracing does not skew the timings).
+The results are written as JSON, and `compare_results` flags the stages that got slower or
+bigger than a baseline file by more than a tolerance.
+"""
+import copy
+import datetime
+import glob
+import hashlib
+import itertools
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import time
+import tracemalloc
+from .digest import Digest, build_digest, entry_from_diff, message_size
+from .notification import email_paragraphs
+from .page_parsing import DEFAULT_INSTITUTION_CODE, DEFAULT_PARSER, extract_listing_rows, parse_caae_details, render_study_html
+from .tramite_diff import diff_study
+
+logger = logging.getLogger('PB_Scraper')
+
+LISTING_PAGE_SIZE = 100 # Rows per synthetic listing page (the largest page size of the real listing)
+DEFAULT_CHANGED_RATIO = 0.1 # Share of the studies with new or modified trâmites in the current run
+LEGACY_REPEATS = 3 # The DataFrame comparison is a single call over all studies: time it a few times
+PERCENTILES = (50, 90, 99)
+MEMORY_SAMPLE = 200 # Items traced in the memory pass: outputs are dropped, so the peak does not grow with more
+
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+CPF_PATTERN = re.compile(r'\b\d{3}\.\d{3}\.\d{3}-\d{2}\b')
+CAAE_PATTERN = re.compile(r'\b(\d{8})\.(\d)\.(\d{4})\.(\d{4})\b')
+PERSON_PATTERN = re.compile(r'(Pesquisador Responsável:\s*|Pesquisador Principal:\s*)([^<"\n]+)')
+
+
+def _digest(value, digits):
+    return str(int(hashlib.sha256(value.encode('utf-8')).hexdigest(), 16))[:digits]
+
+
+def anonymize_page(html):
+    """
+    Masks the personal data of a recorded page: e-mail addresses, CPFs and researcher names
+    are replaced, and the CAAE numbers get stable fake digits (the institution code is kept,
+    so the institution filter still applies). The same input always maps to the same output,
+    so the listing and details pages of one study stay consistent.
+    """
+    html = EMAIL_PATTERN.sub(lambda m: f"pessoa{_digest(m.group(0), 6)}@example.org", html)
+    html = CPF_PATTERN.sub('000.000.000-00', html)
+    html = CAAE_PATTERN.sub(lambda m: f"{_digest(m.group(0), 8):0>8}.{m.group(2)}.{m.group(3)}.{m.group(4)}", html)
+    return PERSON_PATTERN.sub(lambda m: f"{m.group(1)}Pesquisador {_digest(m.group(2).strip(), 4)}", html)
+
+
+def anonymize_directory(source_dir, target_dir):
+    """Writes an anonymized copy of every .html page of `source_dir` to `target_dir`. Returns the file count."""
+    os.makedirs(target_dir, exist_ok=True)
+    paths = sorted(glob.glob(os.path.join(source_dir, '*.html')))
+    for path in paths:
+        with open(path, encoding='utf-8') as source:
+            html = source.read()
+        with open(os.path.join(target_dir, os.path.basename(path)), 'w', encoding='utf-8') as target:
+            target.write(anonymize_page(html))
+    return len(paths)
+
+
+def percentile(sorted_values, q):
+    """Linear interpolation percentile (`q` in 0-100) of an already sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class StageResult:
+    """Timings (seconds per item) and peak traced memory (bytes) of one stage."""
+
+    def __init__(self, name, latencies, peak_memory=None):
+        self.name = name
+        self.latencies = latencies
+        self.peak_memory = peak_memory
+
+    @property
+    def total_seconds(self):
+        return sum(self.latencies)
+
+    def as_dict(self):
+        ordered = sorted(self.latencies)
+        total = self.total_seconds
+        result = {
+            'items': len(ordered),
+            'total_seconds': round(total, 6),
+            'throughput_per_second': round(len(ordered) / total, 3) if total else None,
+            'max_ms': round(ordered[-1] * 1000, 4) if ordered else None,
+            'peak_memory_mb': round(self.peak_memory / (1024 * 1024), 3) if self.peak_memory is not None else None,
+        }
+        for q in PERCENTILES:
+            value = percentile(ordered, q)
+            result[f'p{q}_ms'] = round(value * 1000, 4) if value is not None else None
+        return result
+
+
+def measure_stage(name, make_items, func, track_memory=True):
+    """
+    Times `func(item)` for every item of `make_items()`. `make_items` is called again for the
+    memory pass (tracemalloc is slow, so only the first MEMORY_SAMPLE items are traced), which
+    lets items be generated lazily. Returns (StageResult, results of the timing pass).
+    """
+    latencies, outputs = [], []
+    for item in make_items():
+        started = time.perf_counter()
+        outputs.append(func(item))
+        latencies.append(time.perf_counter() - started)
+    peak_memory = None
+    if track_memory:
+        tracemalloc.start()
+        try:
+            for item in itertools.islice(make_items(), MEMORY_SAMPLE):
+                func(item)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return StageResult(name, latencies, peak_memory), outputs
+
+
+# --- Datasets ---
+
+class SyntheticDataset:
+    """`caaes` fake projects of the configured institution, with up to `max_tramites` trâmites each."""
+
+    def __init__(self, caaes, max_tramites=40, changed_ratio=DEFAULT_CHANGED_RATIO, seed=0):
+        from .fake_plataforma import generate_projects
+        self.caaes = caaes
+        self.max_tramites = max_tramites
+        self.changed_ratio = changed_ratio
+        self.seed = seed
+        # generate_projects mixes in other institutions; ask for enough projects to keep `caaes` of ours
+        self.projects = []
+        total = caaes
+        while len(self.projects) < caaes:
+            total = int(total * 1.8) + 10
+            self.projects = [p for p in generate_projects(total, max_tramites=max_tramites, seed=seed)
+                             if p['caae'].endswith(DEFAULT_INSTITUTION_CODE)][:caaes]
+
+    def describe(self):
+        return {'source': 'synthetic', 'caaes': self.caaes, 'max_tramites': self.max_tramites,
+                'changed_ratio': self.changed_ratio, 'seed': self.seed}
+
+    def listing_pages(self):
+        from .fake_plataforma import render_listing_page
+        pages = (len(self.projects) + LISTING_PAGE_SIZE - 1) // LISTING_PAGE_SIZE
+        for page in range(1, pages + 1):
+            yield render_listing_page('j_id1', 'benchmark@example.org', self.projects, page, '', page_size=LISTING_PAGE_SIZE)
+
+    def detail_pages(self):
+        from .fake_plataforma import render_detail_page
+        for project in self.projects:
+            yield render_detail_page('j_id2', 'benchmark@example.org', project)
+
+
+class RecordedDataset:
+    """Recorded pages: `listing*.html` and `detail*.html` files of `directory`."""
+
+    def __init__(self, directory, changed_ratio=DEFAULT_CHANGED_RATIO):
+        self.directory = directory
+        self.changed_ratio = changed_ratio
+        self.listing_paths = sorted(glob.glob(os.path.join(directory, 'listing*.html')))
+        self.detail_paths = sorted(glob.glob(os.path.join(directory, 'detail*.html')))
+        if not self.listing_paths and not self.detail_paths:
+            raise ValueError(f"No listing*.html or detail*.html pages in '{directory}'.")
+
+    def describe(self):
+        return {'source': f'recorded:{self.directory}', 'listing_pages': len(self.listing_paths),
+                'caaes': len(self.detail_paths), 'changed_ratio': self.changed_ratio}
+
+    @staticmethod
+    def _read(paths):
+        for path in paths:
+            with open(path, encoding='utf-8') as page:
+                yield page.read()
+
+    def listing_pages(self):
+        return self._read(self.listing_paths)
+
+    def detail_pages(self):
+        return self._read(self.detail_paths)
+
+
+def evolve_studies(previous_studies, changed_ratio, seed=0):
+    """
+    The state of a later run: every 1/`changed_ratio`-th study gets a new trâmite and, when
+    it has one, its latest trâmite modified. The others are unchanged.
+    """
+    current = {}
+    step = max(1, round(1 / changed_ratio)) if changed_ratio else 0
+    for index, (caae, details) in enumerate(previous_studies.items()):
+        if step and (index + seed) % step == 0:
+            details = copy.deepcopy(details)
+            tramites = details['tramites'] or []
+            if tramites:
+                tramites[0][7] = 'Parecer anexado'
+            details['tramites'] = [['E1', '01/06/2025 09:00:00', 'Notificação enviada', '1', 'Pesquisador',
+                                    'CEP', 'PESQUISADOR', '']] + tramites
+        current[caae] = details
+    return current
+
+
+# --- Runner ---
+
+def run_benchmark(dataset, track_memory=True, legacy=True):
+    """Runs every stage over `dataset`. Returns the results as a JSON-serializable dict."""
+    stages = {}
+
+    result, _ = measure_stage('parse_listing', dataset.listing_pages, extract_listing_rows, track_memory)
+    stages[result.name] = result
+
+    result, parsed = measure_stage('parse_details', dataset.detail_pages, parse_caae_details, track_memory)
+    stages[result.name] = result
+    previous = {details['caae']: details for details in parsed}
+    current = evolve_studies(previous, dataset.changed_ratio)
+
+    result, diffs = measure_stage('diff', lambda: iter(current),
+                                  lambda caae: diff_study(caae, previous.get(caae), current[caae]), track_memory)
+    stages[result.name] = result
+    diffs = [diff for diff in diffs if diff]
+
+    result, entries = measure_stage('render', lambda: iter(diffs), entry_from_diff, track_memory)
+    stages[result.name] = result
+
+    changed_rows = sum(diff.changed_rows for diff in diffs)
+    intro, footer = email_paragraphs(len(entries), '01/06/2025', '01/06/2025 09:00:00', datetime.timedelta(minutes=5),
+                                     changed_rows)
+    digest = Digest('Atualizações da Plataforma Brasil em 01/06/2025', 'de@example.org', 'para@example.org', intro, footer)
+    result, built = measure_stage('assemble_email', lambda: range(LEGACY_REPEATS),
+                                  lambda _: build_digest(digest, entries), track_memory)
+    stages[result.name] = result
+    messages = built[0] if built else []
+
+    if legacy:
+        try:
+            import pandas as pd
+        except ImportError:
+            logger.warning("pandas is not installed; skipping the legacy comparison stage.")
+        else:
+            from .comparison import _perform_data_comparison
+            old_df = pd.DataFrame([{'caae': caae, 'email_html': render_study_html(d)} for caae, d in previous.items()])
+            new_df = pd.DataFrame([{'caae': caae, 'email_html': render_study_html(d)} for caae, d in current.items()])
+            result, _ = measure_stage('compare_legacy', lambda: range(LEGACY_REPEATS),
+                                      lambda _: _perform_data_comparison(new_df, old_df), track_memory)
+            stages[result.name] = result
+
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'parser': DEFAULT_PARSER,
+        'dataset': dataset.describe(),
+        'updated_studies': len(diffs),
+        'email': {'messages': len(messages), 'bytes': sum(message_size(msg) for msg in messages)},
+        'stages': {name: stage.as_dict() for name, stage in stages.items()},
+    }
+
+
+def current_commit():
+    """The git commit of the working tree, or None outside a repository."""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def compare_results(baseline, current, tolerance=0.2, min_delta_ms=0.1):
+    """
+    Lists the regressions of `current` against `baseline` (both as returned by run_benchmark):
+    stages whose p50 latency or peak memory grew, or whose throughput dropped, by more than `tolerance`.
+    Latencies that grew by less than `min_delta_ms` are timer noise, not regressions.
+    """
+    regressions = []
+    for name, stage in current['stages'].items():
+        before = baseline.get('stages', {}).get(name)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'peak_memory_mb'):
+            old, new = before.get(metric), stage.get(metric)
+            if metric == 'p50_ms' and old and new is not None and new - old < min_delta_ms:
+                continue
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {old} -> {new} (+{(new / old - 1):.0%})")
+        old, new = before.get('throughput_per_second'), stage.get('throughput_per_second')
+        if old and new and new < old * (1 - tolerance) and (1000 / new - 1000 / old) >= min_delta_ms:
+            regressions.append(f"{name}: throughput_per_second {old} -> {new} ({(new / old - 1):.0%})")
+    return regressions
+
+
+def format_results(results):
+    """One line per stage, for the console."""
+    lines = []
+    for name, stage in results['stages'].items():
+        memory = f", pico {stage['peak_memory_mb']} MB" if stage['peak_memory_mb'] is not None else ""
+        lines.append(f"{name}: {stage['items']} itens em {stage['total_seconds']:.3f}s "
+                     f"({stage['throughput_per_second']}/s), p50 {stage['p50_ms']} ms, "
+                     f"p90 {stage['p90_ms']} ms, p99 {stage['p99_ms']} ms{memory}")
+    return lines
+
+
+def write_results(results, path):
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(results, output, indent=2, ensure_ascii=False)
+
+
+def read_results(path):
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
@@ -0,0 +1,521 @@
+"""
+Selenium engine: browser start-up, login, the project listing and the details pages.
+
+Everything that drives Chrome lives here, so Selenium is only imported by runs that use
+the browser engine (the HTTP engine, the comparison and the notification do not need it).
+"""
+import contextlib
+import datetime
+import logging
+import os
+import psutil
+from bs4 import BeautifulSoup
+from selenium import webdriver
+from selenium.common.exceptions import (TimeoutException, WebDriverException, NoSuchElementException,
+                                        StaleElementReferenceException)
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import Select, WebDriverWait
+from .browser_extraction import JUMP_TO_PAGE_JS, SELECTS_HTML_JS, extract_details, extract_listing
+from .driver_provisioning import DriverCache, provision_driver
+from .page_parsing import (LISTING_ROW_CLASS, TRAMITE_TABLE_ID, find_page_size_select, institution_filter,
+                           listing_page_count, parse_total_records)
+from .resource_blocking import configure_options as configure_blocking_options, default_report as blocking_report, enable_blocking
+from .session_cache import BASE_URL, LISTING_PATH, probe_session, restore_browser_session
+from .session_supervisor import DRIVER_DEAD, LOGGED_OUT, STALE_ELEMENT, SessionProblem
+from .spans import default_spans as spans
+from . import waits
+from .waits import (install_ajax_monitor, is_ajax_idle, rows_signature, wait_for_ajax_idle, wait_for_element,
+                    wait_for_rows_change, wait_until)
+
+logger = logging.getLogger('PB_Scraper')
+
+# Plataforma Brasil pages; use_base_url points them to another server (e.g. the local simulator)
+LOGIN_URL = BASE_URL + "/login.jsf"
+PLATAFORMA_BRASIL_MAIN_LIST_URL = BASE_URL + LISTING_PATH
+
+def use_base_url(base_url):
+    """Points the browser engine to the Plataforma Brasil instance at `base_url`."""
+    global LOGIN_URL, PLATAFORMA_BRASIL_MAIN_LIST_URL
+    base_url = base_url.rstrip('/')
+    LOGIN_URL = base_url + "/login.jsf"
+    PLATAFORMA_BRASIL_MAIN_LIST_URL = base_url + LISTING_PATH
+
+def kill_existing_browser_processes():
+    """Kills any existing chromedriver or chrome processes."""
+    logger.warning("Attempting to terminate existing 'chrome' and 'chromedriver' processes.")
+    killed_any = False
+    for proc in psutil.process_iter(attrs=["pid", "name"]):
+        if proc.info["name"] in ["chromedriver", "chrome"]:
+            try:
+                logger.info(f"Attempting to kill process: {proc.info['name']} (PID {proc.info['pid']})")
+                proc.kill()
+                logger.info(f"Successfully killed process: {proc.info['name']} (PID {proc.info['pid']})")
+                killed_any = True
+            except psutil.NoSuchProcess:
+                logger.warning(f"Process {proc.info['name']} (PID {proc.info['pid']}) not found or already terminated.")
+            except psutil.AccessDenied:
+                logger.error(f"Access denied when trying to kill process: {proc.info['name']} (PID {proc.info['pid']}). May require higher privileges.")
+            except Exception as e:
+                logger.error(f"Error killing process {proc.info['name']} (PID {proc.info['pid']}): {e}", exc_info=True)
+    if not killed_any:
+        logger.info("No 'chrome' or 'chromedriver' processes found running or needing termination.")
+
+_driver_path = None # Resolved once per process; worker browsers reuse it
+
+def initialize_webdriver(settings, profile_dir=None, timer=None):
+    """
+    Initializes and returns the Selenium WebDriver and WebDriverWait objects.
+    `settings` (a pb.config.Settings) selects the server, the driver cache, resource blocking,
+    headless mode and how often the waits poll the page.
+    `profile_dir` keeps the Chrome profile (disk cache included) in that directory across runs;
+    a profile can only be used by one browser at a time.
+    `timer` (a StartupTimer) records the provisioning and browser launch phases.
+    """
+    global _driver_path
+    logger.info("Initializing WebDriver...")
+    use_base_url(settings.base_url)
+    waits.POLL_FREQUENCY = settings.wait_poll_seconds
+    options = Options()
+    #options.add_argument("--disable-gpu")  # Desativa GPU para melhorar desempenho
+    options.add_argument("--no-sandbox")  # Evita problemas de permissão
+    options.add_argument("--disable-dev-shm-usage")  # Melhora estabilidade
+    options.add_argument("--blink-settings=imagesEnabled=false")  # Desativa imagens
+    options.add_argument("--disable-extensions")  # Desativa extensões
+    options.add_argument("--disable-popup-blocking")  # Evita bloqueios de pop-up
+    options.add_argument("--disable-infobars")  # Remove barra de informações do Chrome
+    if settings.headless:
+        options.add_argument("--headless")  # Modo headless (opcional)
+    if profile_dir:
+        options.add_argument(f"--user-data-dir={os.path.abspath(profile_dir)}")
+    if settings.block_resources:
+        configure_blocking_options(options)
+    try:
+        with timer.phase('provisioning') if timer else contextlib.nullcontext():
+            if _driver_path is None:
+                _driver_path = provision_driver(DriverCache(settings.driver_cache_path), offline=settings.fast_start,
+                                                chrome_binary=settings.chrome_binary) or ''
+        service = Service(_driver_path) if _driver_path else Service() # Empty path: Selenium Manager resolves it
+        with timer.phase('browser launch') if timer else contextlib.nullcontext():
+            driver = webdriver.Chrome(service=service, options=options)
+        if settings.block_resources:
+            enable_blocking(driver)
+        wait = WebDriverWait(driver, 300) # Default wait time of 300 seconds
+        logger.info("WebDriver initialized successfully.")
+        return driver, wait
+    except WebDriverException as e:
+        logger.critical(f"WebDriverException during WebDriver initialization: {e}", exc_info=True)
+        raise # Re-raise the exception to be caught by main or terminate script
+    except Exception as e:
+        logger.critical(f"An unexpected error occurred during WebDriver initialization: {e}", exc_info=True)
+        raise
+
+def quit_browser_session(driver, block_resources=True):
+    """Quits `driver`, first draining its network log into the resource blocking report."""
+    if block_resources:
+        blocking_report.collect(driver)
+    driver.quit()
+
+def login_to_plataforma_brasil(driver, wait, login_email, login_password):
+    """
+    Logs into Plataforma Brasil.
+    Returns True on successful login, False otherwise.
+    """
+    logger.info("Attempting to log in to Plataforma Brasil...")
+    try:
+        driver.get(LOGIN_URL)
+        logger.info(f"Navigated to login page: {LOGIN_URL}")
+        driver.maximize_window()
+    except WebDriverException as e:
+        logger.error(f"WebDriverException while navigating to login page: {e}", exc_info=True)
+        return False # Cannot proceed if navigation fails
+
+    logger.info("Login page opened. Waiting for elements...")
+
+    login_attempts = 0
+    max_login_attempts = 3 # Try to login 3 times before failing
+
+    while login_attempts < max_login_attempts:
+        try:
+            # Wait for the login button to be clickable
+            wait.until(EC.element_to_be_clickable((By.XPATH,'/html/body/div[2]/div/div[3]/div/div/form[1]/input[4]')))
+            
+            # Clear email field and enter email
+            email_field = driver.find_element(By.XPATH,'//*[@id="j_id19:email"]')
+            email_field.clear()
+            email_field.send_keys(login_email)
+            
+            # Clear password field and enter password
+            password_field = driver.find_element(By.XPATH,'//*[@id="j_id19:senha"]')
+            password_field.clear()
+            password_field.send_keys(login_password)
+            
+            # Click login button
+            login_button = driver.find_element(By.XPATH, '//*[@id="j_id19"]/input[4]')
+            login_button.click()
+            logger.info("Login form submitted.")
+
+            # Wait until the browser leaves the login form, or the "usuário já logado" modal shows up
+            invalidate_session_button_xpath = '//*[@id="formModalMsgUsuarioLogado:idBotaoInvalidarUsuarioLogado"]'
+            wait_until(driver, EC.any_of(EC.staleness_of(login_button),
+                                         EC.element_to_be_clickable((By.XPATH, invalidate_session_button_xpath))),
+                       60, 'login_submit')
+            invalidate_buttons = driver.find_elements(By.XPATH, invalidate_session_button_xpath)
+            if invalidate_buttons and invalidate_buttons[0].is_displayed():
+                # Click to invalidate other logged in user session
+                invalidate_buttons[0].click()
+                logger.info("Invalidated existing user session by clicking modal button.")
+                wait_until(driver, EC.staleness_of(invalidate_buttons[0]), 60, 'login_invalidate_session')
+            else:
+                logger.info("No existing session modal detected (this is often normal).")
+
+            # Check for successful login message or element indicating successful login
+            # The text "Bem vindo(a)" or the presence of a known element on the dashboard can be used.
+            # For this script, it checks for "sessão" in a div that appears.
+            # XPATH for login status: /html/body/div[2]/div/div[4]/div
+            login_status_element_xpath = "/html/body/div[2]/div/div[4]/div" # This XPath might indicate login status or error
+            # Wait for either a success indicator or an error message to appear
+            # For example, wait for a known element on the dashboard or the login status div
+            wait_for_element(driver, (By.XPATH, login_status_element_xpath), timeout=60, name='login_status') # Wait for the status div
+            valid_login_text = driver.find_element(By.XPATH, login_status_element_xpath).text
+            
+            # More robust check: Presence of a known dashboard element
+            # dashboard_element_xpath = "XPATH_OF_A_RELIABLE_DASHBOARD_ELEMENT"
+            # if driver.find_elements(By.XPATH, dashboard_element_xpath):
+            if "sessão iniciada" in valid_login_text.lower() or "bem vindo" in valid_login_text.lower() or "Painel de Navegação" in driver.page_source: # Added another check
+                logger.info("Login realizado com sucesso.")
+                wait_for_ajax_idle(driver, timeout=60, name='login_landing') # Landing page fully loaded
+                return True
+            else:
+                logger.warning(f"Login attempt {login_attempts + 1}/{max_login_attempts} failed. Status text found: '{valid_login_text}'. Retrying...")
+                login_attempts += 1
+                if login_attempts < max_login_attempts:
+                    logger.info("Re-navigating to login page for retry.")
+                    driver.get(LOGIN_URL) # Blocks until the page has loaded
+
+        except TimeoutException as e:
+            logger.error(f"Timeout during login attempt {login_attempts + 1}/{max_login_attempts}: {e}", exc_info=True)
+            login_attempts += 1
+            if login_attempts < max_login_attempts:
+                 logger.info("Re-navigating to login page after timeout.")
+                 driver.get(LOGIN_URL)
+        except NoSuchElementException as e:
+            logger.error(f"NoSuchElementException during login attempt {login_attempts + 1}/{max_login_attempts}: {e}", exc_info=True)
+            login_attempts += 1
+            if login_attempts < max_login_attempts:
+                 logger.info("Re-navigating to login page after NoSuchElementException.")
+                 driver.get(LOGIN_URL)
+        except WebDriverException as e: # Catch other Selenium-related exceptions
+            logger.error(f"WebDriverException during login attempt {login_attempts + 1}/{max_login_attempts}: {e}", exc_info=True)
+            login_attempts += 1
+            if login_attempts < max_login_attempts:
+                 logger.info("Re-navigating to login page after WebDriverException.")
+                 driver.get(LOGIN_URL)
+        except Exception as e: # Catch any other unexpected error
+            logger.critical(f"An unexpected error occurred during login attempt {login_attempts + 1}/{max_login_attempts}: {e}", exc_info=True)
+            login_attempts += 1 # Still increment attempt, might be recoverable
+            if login_attempts < max_login_attempts:
+                try:
+                    logger.info("Attempting to re-navigate to login page after unexpected error.")
+                    driver.get(LOGIN_URL)
+                except Exception as nav_e:
+                    logger.critical(f"Failed to re-navigate after unexpected error: {nav_e}", exc_info=True)
+                    # If re-navigation also fails, it's unlikely further attempts will succeed
+                    return False 
+            
+    logger.error("Login failed after multiple attempts.")
+    return False
+
+def start_authenticated_session(driver, wait, session_cache, login_email, login_password):
+    """
+    Authenticates `driver`, reusing the cached session when a probe request shows it is
+    still valid and logging in (then caching the new session) otherwise.
+    Returns True when `driver` is on the project listing with a valid session.
+    """
+    cookies = session_cache.load()
+    if cookies and probe_session(cookies, PLATAFORMA_BRASIL_MAIN_LIST_URL):
+        try:
+            driver.maximize_window()
+            restore_browser_session(driver, cookies, PLATAFORMA_BRASIL_MAIN_LIST_URL)
+            wait_for_element(driver, (By.XPATH, PAGINATION_INFO_XPATH), timeout=60, name='session_restore')
+            logger.info("Sessão em cache reaproveitada; login dispensado.")
+            return True
+        except WebDriverException as e: # Includes TimeoutException
+            logger.warning(f"Cached session could not be restored in the browser ({e}); logging in.")
+    elif cookies:
+        logger.info("Sessão em cache expirada; realizando login.")
+    session_cache.clear()
+    if not login_to_plataforma_brasil(driver, wait, login_email, login_password):
+        return False
+    session_cache.save(driver.get_cookies())
+    return True
+
+def clone_authenticated_session(source_driver, settings):
+    """
+    Starts a new WebDriver that shares the authenticated session of `source_driver`.
+    Copying the session cookies avoids a second login, which would trigger the
+    "usuário já logado" modal and invalidate the source session.
+    Returns (driver, wait) positioned on the project listing page.
+    """
+    cookies = source_driver.get_cookies()
+    driver, wait = initialize_webdriver(settings)
+    try:
+        restore_browser_session(driver, cookies, PLATAFORMA_BRASIL_MAIN_LIST_URL)
+        wait.until(EC.presence_of_element_located((By.XPATH, "//table[@class='rich-dtascroller-table']")))
+        logger.info("Cloned authenticated session into a new WebDriver.")
+        return driver, wait
+    except Exception:
+        driver.quit()
+        raise
+
+NEXT_PAGE_BUTTON_XPATH = '/html/body/div[2]/div/div[6]/div[1]/form/div[3]/div[2]/table/tfoot/tr/td/div/table/tbody/tr/td[6]'
+PAGINATION_INFO_XPATH = "//table[@class='rich-dtascroller-table']"
+
+def read_total_records(driver, timeout=60):
+    """Returns the total number of records shown by the listing datascroller, or None."""
+    pagination_element = WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.XPATH, PAGINATION_INFO_XPATH)))
+    paginas0_text = pagination_element.text
+    logger.info(f"Pagination text found: '{paginas0_text}'")
+    return parse_total_records(paginas0_text)
+
+def count_rows_on_page(driver):
+    """Number of project rows on the current listing page, whatever their institution."""
+    return len(driver.find_elements(By.CSS_SELECTOR, f"tr.{LISTING_ROW_CLASS}"))
+
+def select_largest_page_size(driver, total_records):
+    """Switches the listing to its largest rows-per-page option, if it offers one and it matters."""
+    try:
+        page_size = find_page_size_select(BeautifulSoup(driver.execute_script(SELECTS_HTML_JS), 'html.parser'))
+    except WebDriverException as e:
+        logger.warning(f"Could not look for a page size option: {e.msg}")
+        return
+    if page_size is None or page_size['selected'] >= min(max(page_size['sizes']), total_records):
+        return
+    largest = max(page_size['sizes'])
+    previous_rows = rows_signature(driver, LISTING_TBODY_XPATH)
+    install_ajax_monitor(driver)
+    Select(driver.find_element(By.NAME, page_size['name'])).select_by_value(str(largest))
+    wait_for_rows_change(driver, LISTING_TBODY_XPATH, previous_rows, timeout=60, name='listing_page_size')
+    logger.info(f"Listing page size set to {largest}.")
+
+def search_listing(driver, wait, text, expected_text=None, name='listing_search'):
+    """Types `text` in the listing's CAAE search field and waits for the rows to be replaced."""
+    search_input = wait.until(EC.presence_of_element_located((By.XPATH, CAAE_SEARCH_INPUT_XPATH)))
+    previous_rows = rows_signature(driver, LISTING_TBODY_XPATH)
+    install_ajax_monitor(driver)
+    search_input.clear()
+    search_input.send_keys(text)
+    search_input.send_keys(Keys.ENTER)
+    try:
+        wait_for_rows_change(driver, LISTING_TBODY_XPATH, previous_rows, timeout=60, expected_text=expected_text, name=name)
+    except TimeoutException:
+        logger.warning(f"Listing rows did not change after searching '{text}'.")
+
+def apply_institution_filter(driver, wait, institution_code):
+    """
+    Uses the listing's CAAE search to have the server list only the institution's projects.
+    Returns True if the filter was honored; otherwise clears the search again and returns False.
+    """
+    search_listing(driver, wait, institution_filter(institution_code), expected_text=institution_code, name='listing_filter')
+    rows = count_rows_on_page(driver)
+    if rows and rows == len(extract_listing(driver, institution_code)):
+        logger.info(f"Listing filtered on the server by '{institution_filter(institution_code)}'.")
+        return True
+    logger.warning("The listing search did not filter by institution; walking the full listing.")
+    search_listing(driver, wait, '', name='listing_filter_clear')
+    return False
+
+def go_to_listing_page(driver, wait, page_number):
+    """Jumps to `page_number` through the datascroller; clicks ">" if the jump is not available or has no effect."""
+    previous_rows = rows_signature(driver, LISTING_TBODY_XPATH)
+    install_ajax_monitor(driver)
+    # The datascroller replaces the rows through AJAX; wait until they change
+    if driver.execute_script(JUMP_TO_PAGE_JS, str(page_number)):
+        try:
+            wait_for_rows_change(driver, LISTING_TBODY_XPATH, previous_rows, timeout=20, name='listing_page_jump')
+            return
+        except TimeoutException:
+            logger.warning(f"Datascroller jump to page {page_number} had no effect.")
+    logger.info(f"Clicking next page (XPath: {NEXT_PAGE_BUTTON_XPATH})...")
+    wait.until(EC.element_to_be_clickable((By.XPATH, NEXT_PAGE_BUTTON_XPATH))).click()
+    wait_for_rows_change(driver, LISTING_TBODY_XPATH, previous_rows, timeout=60, name='listing_next_page')
+
+def extract_valid_caaes(driver, wait, listing_rows=None, institution_code='5262'):
+    """
+    Extracts the list of valid CAAE numbers from the project listing.
+    The institution is filtered on the server and the largest page size is used when
+    available, so only our own projects are paged through; pages are reached by number.
+    Returns a list of unique CAAE strings.
+    If `listing_rows` is a dict, it is filled with {caae: listing columns} for the fingerprint index.
+    """
+    logger.info("Starting extraction of valid CAAEs...")
+    list_CAAE = []
+
+    # Assumes login lands on the project listing (gerirPesquisaAgrupador.jsf).
+    try:
+        logger.info(f"Waiting for pagination info element: {PAGINATION_INFO_XPATH}")
+        total_registros = read_total_records(driver)
+        if total_registros is None:
+            logger.error("Could not parse total number of records from pagination text. Check XPath and page structure.")
+            return []
+        select_largest_page_size(driver, total_registros)
+        if apply_institution_filter(driver, wait, institution_code):
+            total_registros = read_total_records(driver)
+        rows_per_page = count_rows_on_page(driver)
+        paginas = listing_page_count(total_registros or 0, rows_per_page)
+        logger.info(f"Total records: {total_registros}, {rows_per_page} per page, pages to iterate: {paginas}")
+
+    except TimeoutException as e:
+        logger.error(f"Timeout waiting for pagination info element. Cannot determine number of pages. {e}", exc_info=True)
+        return [] 
+    except Exception as e: # Catching other potential errors during pagination info extraction
+        logger.error(f"Error extracting pagination info: {e}", exc_info=True)
+        return []
+
+    for page in range(1, paginas + 1):
+        logger.info(f"Processing page {page} of {paginas} for CAAEs...")
+        try:
+            with spans.span('listing.page'):
+                if page > 1:
+                    go_to_listing_page(driver, wait, page)
+                # Extract labels containing CAAEs (in the page, without transferring the page source)
+                rows_on_page = extract_listing(driver, institution_code)
+            list_CAAE.extend(row['caae'] for row in rows_on_page)
+            if listing_rows is not None:
+                listing_rows.update((row['caae'], row['columns']) for row in rows_on_page)
+            logger.info(f"Found {len(rows_on_page)} CAAEs containing '{institution_code}' on page {page}.")
+        except TimeoutException as e:
+            logger.error(f"Timeout moving to page {page} or waiting for its rows. Stopping CAAE extraction. {e}", exc_info=True)
+            break 
+        except NoSuchElementException as e:
+            logger.error(f"Next page button not found for page {page}. Stopping CAAE extraction. {e}", exc_info=True)
+            break
+        except WebDriverException as e:
+            logger.error(f"WebDriverException on page {page} while trying to extract/navigate: {e}", exc_info=True)
+            break
+        except Exception as e: # Catch any other unexpected error during page processing
+            logger.error(f"Unexpected error on page {page} during CAAE extraction: {e}", exc_info=True)
+            break
+                
+    unique_caaes = sorted(list(set(list_CAAE))) 
+    logger.info(f"Total unique CAAEs extracted: {len(unique_caaes)}")
+    if not unique_caaes:
+        logger.warning(f"No CAAEs were extracted. Check filter criteria ('{institution_code}') and website structure if this is unexpected.")
+    return unique_caaes
+
+# XPaths for process_caae_details (Consider moving to constants at the top)
+CAAE_SEARCH_INPUT_XPATH = '/html/body/div[2]/div/div[6]/div[1]/form/div[2]/div[2]/table[1]/tbody/tr/td[2]/table/tbody/tr[2]/td/input'
+LUPA_ICON_XPATH = '/html/body/div[2]/div/div[6]/div[1]/form/div[3]/div[2]/table/tbody/tr/td[10]/a/img' # This is likely page dependent, might need adjustment
+VOLTAR_AO_MENU_BUTTON_XPATH = '/html/body/div[2]/div/div[3]/div[2]/form/a[2]' # Button to go back after viewing details
+# URL for the main page listing projects, to navigate back to after processing a CAAE or if an error occurs during detail processing.
+# This needs to be the actual URL from the website.
+# Body of the project listing table; its rows are replaced by searches and pagination.
+LISTING_TBODY_XPATH = '/html/body/div[2]/div/div[6]/div[1]/form/div[3]/div[2]/table/tbody'
+
+
+def process_caae_details(driver, wait, caae_number, timezone_obj):
+    """
+    Processes a single CAAE number to extract its details, in one attempt: a CAAE that fails
+    is retried by the caller after the others (pb.worker_pool), not here.
+    Returns a dictionary with CAAE details or None if processing fails. Raises SessionProblem
+    when the failure came from the session (logged out, dead browser, stale page elements).
+    """
+    logger.info(f"Starting to process CAAE: {caae_number}...")
+    stale = False
+    try:
+        t1 = datetime.datetime.now(timezone_obj)
+
+        with spans.span('caae.search'):
+            search_input = wait.until(EC.presence_of_element_located((By.XPATH, CAAE_SEARCH_INPUT_XPATH)))
+            previous_rows = rows_signature(driver, LISTING_TBODY_XPATH)
+            install_ajax_monitor(driver)
+            search_input.clear()
+            search_input.send_keys(caae_number)
+            search_input.send_keys(Keys.ENTER)
+            logger.info(f"Submitted search for CAAE: {caae_number}")
+            # Wait for search results: the listing shows only the searched CAAE
+            wait_for_rows_change(driver, LISTING_TBODY_XPATH, previous_rows, timeout=60,
+                                 expected_text=caae_number, name='caae_search')
+
+        with spans.span('caae.lupa'):
+            # Click on the "lupa" (magnifying glass) icon to view details
+            try:
+                lupa_icon = wait.until(EC.element_to_be_clickable((By.XPATH, LUPA_ICON_XPATH)))
+            except TimeoutException:
+                raise TimeoutException(f"Lupa icon not found or clickable for {caae_number}.")
+            lupa_icon.click()
+            logger.info(f"Lupa icon clicked for CAAE {caae_number}.")
+
+            logger.info(f"Waiting for details page of CAAE {caae_number} to load...")
+            # Ready when the trâmite table is rendered, or when the listing is gone and the
+            # details page has settled without one (projects with no trâmites yet)
+            wait_until(driver, EC.any_of(
+                EC.presence_of_element_located((By.ID, TRAMITE_TABLE_ID)),
+                EC.all_of(EC.staleness_of(lupa_icon),
+                          EC.presence_of_element_located((By.XPATH, VOLTAR_AO_MENU_BUTTON_XPATH)),
+                          is_ajax_idle)),
+                60, 'detail_page')
+
+        with spans.span('caae.parse'):
+            details = extract_details(driver)
+        logger.info(f"Details extracted for CAAE {caae_number}.")
+
+        # Navigate back to the search/listing page
+        with spans.span('caae.back'):
+            voltar_button = wait.until(EC.element_to_be_clickable((By.XPATH, VOLTAR_AO_MENU_BUTTON_XPATH)))
+            voltar_button.click()
+            # Wait for menu page to load
+            wait_until(driver, EC.staleness_of(voltar_button), 60, 'voltar_leave_details')
+            wait_for_element(driver, (By.XPATH, LISTING_TBODY_XPATH), timeout=60, name='voltar_listing')
+        logger.info(f"Returned to menu/listing page after processing CAAE {caae_number}.")
+
+        t2 = datetime.datetime.now(timezone_obj)
+        processing_time = t2 - t1
+        logger.info(f"Successfully processed CAAE: {caae_number} in {processing_time}.")
+
+        return {
+            'caae': caae_number,
+            'details': details,
+            'processing_time': processing_time
+        }
+    except TimeoutException as e: # More specific exception
+        logger.warning(f"Timeout processing CAAE {caae_number}: {e}", exc_info=True)
+    except StaleElementReferenceException as e: # The page was replaced under us
+        logger.warning(f"Stale element while processing CAAE {caae_number}: {e}")
+        stale = True
+    except NoSuchElementException as e: # More specific exception
+        logger.warning(f"NoSuchElementException for CAAE {caae_number}: {e}", exc_info=True)
+    except WebDriverException as e: # More specific exception for other browser/driver issues
+        logger.warning(f"WebDriverException for CAAE {caae_number}: {e}", exc_info=True)
+    except Exception as e: # Catch-all for other unexpected errors during CAAE processing
+        logger.error(f"Unexpected error processing CAAE {caae_number}: {e}", exc_info=True)
+
+    # Leave the browser on the listing, where the next CAAE is searched
+    problem = session_problem(driver)
+    if problem is None:
+        try:
+            with spans.span('caae.recover'):
+                reload_listing(driver)
+        except Exception as nav_e:
+            logger.error(f"Failed to return to the listing after CAAE {caae_number}: {nav_e}. WebDriver state might be unstable.", exc_info=True)
+            problem = session_problem(driver)
+    if problem or stale:
+        raise SessionProblem(problem or STALE_ELEMENT, f"session failed while processing CAAE {caae_number}")
+    logger.error(f"Failed to process CAAE {caae_number}; it will be retried after the others.")
+    return None # Indicate failure for this CAAE
+
+def session_problem(driver):
+    """The SessionProblem kind `driver` shows (the browser died, or is on the login page), or None."""
+    try:
+        logged_out = 'login.jsf' in driver.current_url or driver.find_elements(By.ID, 'j_id19:email')
+    except WebDriverException:
+        return DRIVER_DEAD
+    return LOGGED_OUT if logged_out else None
+
+def reload_listing(driver):
+    """Opens a fresh project listing (a warm browser is wherever the previous check left it)."""
+    driver.get(PLATAFORMA_BRASIL_MAIN_LIST_URL)
+    wait_for_element(driver, (By.XPATH, PAGINATION_INFO_XPATH), timeout=60, name='listing_reload')
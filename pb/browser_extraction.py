@@ -0,0 +1,133 @@
+"""
+Extraction of listing rows and project details inside the browser.
+
+Instead of transferring the whole `driver.page_source` and parsing it in Python, a small
+script runs in the page and returns only the texts that page_parsing needs (the CAAE
+labels and their row cells, or the title, PI/CAAE cells and trâmite spans) as JSON. The
+same `*_from_fields` functions used by the HTML parser build the rows and details, so
+the records are identical on both paths. If the script fails, the page source is parsed
+with page_parsing's fastest available parser (lxml).
+
+The scripts used to drive the listing (page size select, datascroller page jumps) are
+kept here as well.
+"""
+import logging
+import threading
+from selenium.common.exceptions import WebDriverException
+from .page_parsing import (DEFAULT_INSTITUTION_CODE, TRAMITE_TABLE_ID, details_from_fields, extract_listing_rows,
+                          listing_row_from_fields, parse_caae_details)
+
+logger = logging.getLogger('PB_Scraper')
+
+# Text of an element as BeautifulSoup's get_text(' ') sees it: its text nodes joined by a space
+_NODE_TEXT_JS = """
+function pbNodeText(element) {
+    var walker = document.createTreeWalker(element, NodeFilter.SHOW_TEXT, null, false);
+    var parts = [];
+    while (walker.nextNode()) { parts.push(walker.currentNode.nodeValue); }
+    return parts.join(' ');
+}
+"""
+
+# arguments[0]: institution code. Returns [{label, cells}] for the labels containing it
+LISTING_JS = _NODE_TEXT_JS + """
+var code = arguments[0];
+var labels = document.getElementsByTagName('label');
+var rows = [];
+for (var i = 0; i < labels.length; i++) {
+    if (labels[i].textContent.indexOf(code) === -1) { continue; }
+    var row = labels[i].closest('tr');
+    rows.push({
+        label: labels[i].textContent,
+        cells: row ? Array.prototype.map.call(row.getElementsByTagName('td'), pbNodeText) : null
+    });
+}
+return rows;
+"""
+
+# arguments[0]: id of the trâmite table body. Returns the raw texts used by details_from_fields
+DETAILS_JS = """
+var tds = document.getElementsByTagName('td');
+var title = document.querySelector('td.text-top');
+var body = document.getElementById(arguments[0]);
+var spans = body && body.childNodes.length ? body.getElementsByTagName('span') : null;
+return {
+    title: title ? title.textContent : null,
+    pi: tds.length > 6 ? tds[6].textContent : null,
+    caae: tds.length > 15 ? tds[15].textContent : null,
+    spans: spans ? Array.prototype.map.call(spans, function (span) { return span.textContent; }) : null
+};
+"""
+
+# Markup of every <select> in the page, for page_parsing.find_page_size_select
+SELECTS_HTML_JS = """
+return Array.prototype.map.call(document.getElementsByTagName('select'), function (s) { return s.outerHTML; }).join('');
+"""
+
+# arguments[0]: page number. Fires the RichFaces datascroller event its page links fire.
+# Returns false when the page has no datascroller or Prototype's Event.fire is missing.
+JUMP_TO_PAGE_JS = """
+var scroller = document.querySelector('div.rich-datascr');
+if (!scroller || typeof Event === 'undefined' || typeof Event.fire !== 'function') { return false; }
+Event.fire(scroller, 'rich:datascroller:onscroll', {'page': arguments[0]});
+return true;
+"""
+
+
+class ExtractionStats:
+    """Counts how many pages were extracted by script and how many fell back to page_source (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.scripted = 0
+        self.fallbacks = 0
+        self.fallback_bytes = 0 # Size of the page sources that had to be transferred and parsed
+
+    def record(self, scripted, page_bytes=0):
+        with self._lock:
+            if scripted:
+                self.scripted += 1
+            else:
+                self.fallbacks += 1
+                self.fallback_bytes += page_bytes
+
+    def log_summary(self):
+        logger.info(f"Extração no navegador: {self.scripted} páginas via script, {self.fallbacks} via page_source "
+                    f"({self.fallback_bytes / 1024:.0f} KB analisados).")
+
+
+default_stats = ExtractionStats()
+
+
+def _page_source(driver, stats):
+    html = driver.page_source
+    stats.record(False, len(html.encode('utf-8')))
+    return html
+
+
+def extract_listing(driver, institution_code=DEFAULT_INSTITUTION_CODE, stats=None):
+    """Returns the listing rows of the current page, as page_parsing.extract_listing_rows does."""
+    stats = stats or default_stats
+    try:
+        raw_rows = driver.execute_script(LISTING_JS, institution_code)
+        if isinstance(raw_rows, list):
+            stats.record(True)
+            return [listing_row_from_fields(raw['label'], raw['cells']) for raw in raw_rows]
+        logger.warning(f"Listing script returned {type(raw_rows).__name__}; parsing page_source instead.")
+    except WebDriverException as e:
+        logger.warning(f"Listing script failed ({e.msg}); parsing page_source instead.")
+    return extract_listing_rows(_page_source(driver, stats), institution_code)
+
+
+def extract_details(driver, stats=None):
+    """Returns the details of the current project page, as page_parsing.parse_caae_details does."""
+    stats = stats or default_stats
+    try:
+        raw = driver.execute_script(DETAILS_JS, TRAMITE_TABLE_ID)
+        if isinstance(raw, dict):
+            stats.record(True)
+            return details_from_fields(raw.get('title'), raw.get('pi'), raw.get('caae'), raw.get('spans'))
+        logger.warning(f"Details script returned {type(raw).__name__}; parsing page_source instead.")
+    except WebDriverException as e:
+        logger.warning(f"Details script failed ({e.msg}); parsing page_source instead.")
+    return parse_caae_details(_page_source(driver, stats))
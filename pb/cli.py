@@ -0,0 +1,327 @@
+"""
+Command line entry point: `python -m pb run|daemon|outbox|history|import-time|benchmark|anonymize-pages|simulate|e2e-benchmark`.
+
+Only the standard library and the light `pb` modules are imported here; each command imports
+what it needs (the engines are imported when the sessions are opened).
+"""
+import argparse
+import logging
+import sys
+
+logger = logging.getLogger('PB_Scraper')
+
+# Modules whose import time `import-time` reports by default: the CLI itself and the heavy dependencies
+DEFAULT_IMPORT_TIME_MODULES = ('pb.cli', 'pb.run', 'pb.browser', 'pb.http_engine', 'pandas', 'selenium.webdriver',
+                               'requests', 'bs4')
+
+
+def load_settings():
+    """Loads the .env file, configures logging and validates the required variables. Exits with 1 if any is missing."""
+    from dotenv import load_dotenv
+    from .config import Settings, configure_logging
+    configure_logging()
+    load_dotenv()
+    logger.info("Attempting to load environment variables from .env file.")
+    settings = Settings()
+    missing_vars = settings.missing_required()
+    if missing_vars:
+        logger.critical("Error: The following required environment variables are not set: " + ", ".join(missing_vars))
+        logger.critical("Please create or update your .env file and try again. Exiting script.")
+        sys.exit(1)
+    logger.info("All required environment variables are loaded successfully.")
+    return settings
+
+
+def command_run(args):
+    from .config import close_logging
+    from .run import run
+    from .startup_timing import default_timer
+    default_timer.record_imports()
+    settings = load_settings()
+    try:
+        run(settings)
+    finally:
+        close_logging()
+    return 0
+
+
+def command_daemon(args):
+    from .config import close_logging
+    from .run import run_daemon
+    from .startup_timing import default_timer
+    default_timer.record_imports()
+    settings = load_settings()
+    try:
+        run_daemon(settings)
+    finally:
+        close_logging()
+    return 0
+
+
+def command_outbox(args):
+    import datetime
+    import time
+    from dotenv import load_dotenv
+    from .config import Settings, close_logging, configure_logging
+    from .notification import deliver_outbox
+    from .outbox import Outbox
+    configure_logging()
+    load_dotenv()
+    settings = Settings()
+    outbox = Outbox(args.outbox or settings.outbox_path)
+    try:
+        if args.action == 'status':
+            pending = outbox.pending()
+            for state in pending:
+                error = f"; último erro: {state['last_error']}" if state['last_error'] else ""
+                print(f"{state['key']}: {state['to']} - {state['subject']} ({state['attempts']} tentativas, "
+                      f"próxima em {state['next_attempt']}{error})")
+            print(f"{len(pending)} mensagens pendentes em {outbox.path}")
+            return 0
+        # Retries due messages until the outbox is empty or the next attempt would fall after the deadline
+        deadline = time.monotonic() + args.wait_minutes * 60
+        force = args.force
+        while True:
+            result = deliver_outbox(outbox, settings.email_password, max_attempts=settings.email_max_attempts, force=force)
+            force = False
+            pending = outbox.pending()
+            if result is None or not pending:
+                break
+            next_attempt = min(datetime.datetime.fromisoformat(state['next_attempt']) for state in pending)
+            delay = max((next_attempt - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+            if time.monotonic() + delay > deadline:
+                break
+            logger.info(f"Outbox: próxima tentativa em {delay:.0f}s.")
+            time.sleep(delay)
+        print(f"{len(pending)} mensagens pendentes em {outbox.path}")
+        return 1 if pending else 0
+    finally:
+        close_logging()
+
+
+def command_history(args):
+    import os
+    from .run_history import (RunHistory, find_regressions, import_legacy_log, regression_lines, started_at,
+                              trend_lines)
+    history = RunHistory(args.history or os.environ.get('PB_RUN_HISTORY') or 'run_history.jsonl')
+    if args.action == 'import':
+        found, added = import_legacy_log(history, args.log)
+        print(f"{found} execuções encontradas em {args.log}, {added} novas gravadas em {history.path}")
+        return 0
+    records = history.records()
+    if args.since:
+        records = [record for record in records if started_at(record).date().isoformat() >= args.since]
+    if not records:
+        print(f"Nenhuma execução em {history.path}")
+        return 0
+    for line in trend_lines(records, by=args.by):
+        print(line)
+    skipped = records[-1].get('skipped_caaes')
+    if skipped:
+        print(f"CAAEs não verificados na última execução ({len(skipped)}): {', '.join(skipped)}")
+    if records[-1].get('session_recoveries'):
+        print(f"Recuperações de sessão na última execução: {records[-1]['session_recoveries']}")
+    flagged = find_regressions(records, window=args.window, duration_threshold=args.duration_threshold,
+                               failure_threshold=args.failure_threshold)
+    if flagged:
+        print(f"Execuções com regressão ({len(flagged)}):")
+        for line in regression_lines(flagged[-args.last:]):
+            print(f"  {line}")
+    latest_flagged = bool(flagged) and flagged[-1][0] is records[-1]
+    return 1 if args.fail_on_regression and latest_flagged else 0
+
+
+def command_state_log(args):
+    import csv
+    import datetime
+    import os
+    import sys
+    from .config import local_timezone
+    from .state_log import DEFAULT_STATE_LOG_PATH, StateLog
+    state_log = StateLog(args.log or os.environ.get('PB_STATE_LOG') or DEFAULT_STATE_LOG_PATH)
+    runs = state_log.runs()
+    if args.action == 'status':
+        if not runs:
+            print(f"Nenhuma execução em {state_log.path}")
+            return 0
+        files, size = state_log.size()
+        print(f"{len(runs)} execuções em {state_log.path}, de {runs[0][1].isoformat()} (execução {runs[0][0]}) "
+              f"a {runs[-1][1].isoformat()} (execução {runs[-1][0]}); {files} arquivos, {size / 1024:.1f} KB")
+        return 0
+    if args.action == 'compact':
+        removed = state_log.compact(datetime.timedelta(days=args.keep_days))
+        print(f"{removed} arquivos removidos de {state_log.path}")
+        return 0
+    run = args.run
+    if args.at:
+        at = datetime.datetime.fromisoformat(args.at)
+        at = at if at.tzinfo else local_timezone().localize(at)
+        run = state_log.run_at(at)
+        if run is None:
+            print(f"Nenhuma execução em {state_log.path} até {args.at}")
+            return 1
+    state = state_log.state(run)
+    # Same columns as the new.csv of PB3.py
+    output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        writer = csv.writer(output)
+        writer.writerow(['CAAE', 'email'])
+        writer.writerows(sorted(state.items()))
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+def command_import_time(args):
+    from .startup_timing import measure_import_time
+    over_budget = []
+    for module in args.modules or DEFAULT_IMPORT_TIME_MODULES:
+        try:
+            seconds = measure_import_time(module)
+        except Exception as e:
+            print(f"{module}: could not be imported ({e})")
+            continue
+        within = args.budget_ms is None or seconds * 1000 <= args.budget_ms
+        if not within:
+            over_budget.append(module)
+        print(f"{module}: {seconds * 1000:.1f} ms{'' if within else ' (over budget)'}")
+    return 1 if over_budget else 0
+
+
+def command_benchmark(args):
+    from .benchmark import (RecordedDataset, SyntheticDataset, compare_results, format_results, read_results,
+                            run_benchmark, write_results)
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    if args.fixtures:
+        dataset = RecordedDataset(args.fixtures, changed_ratio=args.changed_ratio)
+    else:
+        dataset = SyntheticDataset(args.caaes, max_tramites=args.max_tramites, changed_ratio=args.changed_ratio,
+                                   seed=args.seed)
+    results = run_benchmark(dataset, track_memory=not args.no_memory, legacy=not args.no_legacy)
+    for line in format_results(results):
+        print(line)
+    if args.output:
+        write_results(results, args.output)
+        print(f"Resultados gravados em {args.output}")
+    if args.baseline:
+        regressions = compare_results(read_results(args.baseline), results, args.tolerance)
+        for regression in regressions:
+            print(f"Regressão: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+def command_anonymize_pages(args):
+    from .benchmark import anonymize_directory
+    count = anonymize_directory(args.source, args.target)
+    print(f"{count} páginas anonimizadas em {args.target}")
+    return 0
+
+
+def command_simulate(args):
+    from .fake_plataforma import main as simulator_main
+    simulator_main(args.options)
+    return 0
+
+
+def command_e2e_benchmark(args):
+    from .simulation import SimulatorConfig, Strategy, format_runs, run_benchmark
+    from .benchmark import write_results
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    simulator = SimulatorConfig(
+        projects=args.projects, max_tramites=args.max_tramites, latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+        error_kinds=[kind for kind in args.error_kinds.split(',') if kind],
+        page_sizes=tuple(int(size) for size in args.page_sizes.split(',')) if args.page_sizes else None, seed=args.seed)
+    poll_intervals = [float(poll) for poll in args.poll_seconds.split(',')]
+    strategies = [Strategy(engine, int(workers), poll)
+                  for engine in args.engines.split(',')
+                  for workers in args.workers.split(',')
+                  for poll in (poll_intervals if engine == 'browser' else poll_intervals[:1])] # The HTTP engine does not poll
+    results = run_benchmark(strategies, simulator, repeats=args.repeats)
+    for line in format_runs(results):
+        print(line)
+    if args.output:
+        write_results(results, args.output)
+        print(f"Resultados gravados em {args.output}")
+    return 1 if any('error' in run for run in results['runs']) else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m pb', description="Plataforma Brasil update checker.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('run', help="Run one check and send the notification email.").set_defaults(handler=command_run)
+    commands.add_parser('daemon', help="Keep the sessions warm and check periodically.").set_defaults(handler=command_daemon)
+    outbox = commands.add_parser('outbox', help="Deliver the queued notification emails, or list them.")
+    outbox.add_argument('action', choices=('send', 'status'))
+    outbox.add_argument('--outbox', help="Outbox directory (default PB_OUTBOX or outbox).")
+    outbox.add_argument('--force', action='store_true', help="Also send the messages still waiting for their backoff.")
+    outbox.add_argument('--wait-minutes', type=float, default=0,
+                        help="Keep retrying failed messages for up to this many minutes (default 0: one pass).")
+    outbox.set_defaults(handler=command_outbox)
+    history = commands.add_parser('history', help="Import registro.txt into the run history, or report trends and regressions.")
+    history.add_argument('action', choices=('report', 'import'))
+    history.add_argument('--history', help="Run history file (default PB_RUN_HISTORY or run_history.jsonl).")
+    history.add_argument('--log', default='registro.txt', help="Log to import (default registro.txt).")
+    history.add_argument('--by', choices=('month', 'week'), default='month', help="Trend period (default month).")
+    history.add_argument('--since', help="Only runs started on or after this date (YYYY-MM-DD).")
+    history.add_argument('--window', type=int, default=10, help="Earlier runs whose median is the baseline (default 10).")
+    history.add_argument('--duration-threshold', type=float, default=0.5,
+                         help="Flag runs slower than the baseline by more than this (default 0.5, i.e. 50%%).")
+    history.add_argument('--failure-threshold', type=float, default=0.1,
+                         help="Flag runs whose CAAE failure rate exceeds the baseline by more than this (default 0.1).")
+    history.add_argument('--last', type=int, default=20, help="Flagged runs listed (default the last 20).")
+    history.add_argument('--fail-on-regression', action='store_true', help="Exit with 1 if the latest run is flagged.")
+    history.set_defaults(handler=command_history)
+    state_log = commands.add_parser('state-log', help="Export the studies as of a past run from the state log, or compact it.")
+    state_log.add_argument('action', choices=('status', 'export', 'compact'))
+    state_log.add_argument('--log', help="State log directory (default PB_STATE_LOG or pb_history).")
+    state_log.add_argument('--run', type=int, help="Run to export (default the latest).")
+    state_log.add_argument('--at', help="Export the state as of this date and time (ISO format, local time if no offset).")
+    state_log.add_argument('--output', help="CSV file to write (default standard output).")
+    state_log.add_argument('--keep-days', type=float, default=365, help="Runs kept by compact (default 365 days).")
+    state_log.set_defaults(handler=command_state_log)
+    import_time = commands.add_parser('import-time', help="Report the import time of modules, each in a fresh interpreter.")
+    import_time.add_argument('modules', nargs='*', help="Modules to measure (default: the CLI and the heavy dependencies).")
+    import_time.add_argument('--budget-ms', type=float, help="Exit with 1 if a module takes longer than this to import.")
+    import_time.set_defaults(handler=command_import_time)
+    benchmark = commands.add_parser('benchmark', help="Benchmark parsing, diff, rendering and comparison offline.")
+    benchmark.add_argument('--fixtures', help="Directory of recorded listing*.html and detail*.html pages (default: synthetic pages).")
+    benchmark.add_argument('--caaes', type=int, default=1000, help="Synthetic dataset size (default 1000).")
+    benchmark.add_argument('--max-tramites', type=int, default=40, help="Longest synthetic trâmite history (default 40).")
+    benchmark.add_argument('--changed-ratio', type=float, default=0.1, help="Share of studies changed between runs (default 0.1).")
+    benchmark.add_argument('--seed', type=int, default=0)
+    benchmark.add_argument('--no-memory', action='store_true', help="Skip the peak memory pass.")
+    benchmark.add_argument('--no-legacy', action='store_true', help="Skip the pandas comparison stage.")
+    benchmark.add_argument('--output', help="Write the results to this JSON file.")
+    benchmark.add_argument('--baseline', help="Results JSON to compare with; exits with 1 on a regression.")
+    benchmark.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative regression (default 0.2).")
+    benchmark.set_defaults(handler=command_benchmark)
+    anonymize = commands.add_parser('anonymize-pages', help="Mask the personal data of recorded pages for the benchmark.")
+    anonymize.add_argument('source', help="Directory of recorded .html pages.")
+    anonymize.add_argument('target', help="Directory where the anonymized copies are written.")
+    anonymize.set_defaults(handler=command_anonymize_pages)
+    simulate = commands.add_parser('simulate', help="Serve the local Plataforma Brasil simulator (options: python -m pb.fake_plataforma -h).")
+    simulate.add_argument('options', nargs=argparse.REMAINDER)
+    simulate.set_defaults(handler=command_simulate)
+    e2e = commands.add_parser('e2e-benchmark', help="Benchmark scraping strategies end-to-end against the local simulator.")
+    e2e.add_argument('--engines', default='http', help="Comma-separated engines: http, browser (default http).")
+    e2e.add_argument('--workers', default='1,2,4', help="Comma-separated worker counts (default 1,2,4).")
+    e2e.add_argument('--poll-seconds', default='0.1', help="Comma-separated browser wait poll intervals (default 0.1).")
+    e2e.add_argument('--repeats', type=int, default=1)
+    e2e.add_argument('--projects', type=int, default=100, help="Projects in the simulated listing (default 100).")
+    e2e.add_argument('--max-tramites', type=int, default=12)
+    e2e.add_argument('--latency-ms', type=float, default=50.0, help="Delay of every response (default 50).")
+    e2e.add_argument('--jitter-ms', type=float, default=0.0)
+    e2e.add_argument('--error-rate', type=float, default=0.0, help="Share of listing requests that fail (0-1).")
+    e2e.add_argument('--error-kinds', default='status,view_expired', help="Failures to inject: status, view_expired, drop.")
+    e2e.add_argument('--page-sizes', help="Rows-per-page options of the simulated listing, e.g. 10,50,100.")
+    e2e.add_argument('--seed', type=int, default=0)
+    e2e.add_argument('--output', help="Write the results to this JSON file.")
+    e2e.set_defaults(handler=command_e2e_benchmark)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
@@ -0,0 +1,98 @@
+"""
+Comparison of the studies fetched in a run with the state kept by previous runs.
+
+pandas is only needed by the legacy DataFrame comparison, so it is imported there.
+"""
+import logging
+from .digest import entry_from_diff
+from .spans import default_spans as spans
+from .tramite_diff import diff_studies
+
+logger = logging.getLogger('PB_Scraper')
+
+def save_current_state(processed_records, store):
+    """Saves the details of the processed records in the store, as the state the next run compares with."""
+    current_studies = {record['caae']: record['details'] for record in processed_records}
+    try:
+        with spans.span('store.save'):
+            store.save_studies(current_studies)
+        logger.info(f"Saved {len(current_studies)} studies to '{store.path}'.")
+    except Exception as e:
+        logger.error(f"Failed to save current data to '{store.path}': {e}", exc_info=True)
+
+def compare_with_previous_run(processed_records, store, save_state=True):
+    """
+    Compares the trâmite rows fetched in this run with the ones stored by previous runs and
+    saves the new state in the store (unless `save_state` is False: the caller then saves it
+    with save_current_state once the notification is queued). The digest entries (pb.digest) are rendered here, only
+    for the rows that changed.
+    Returns a tuple: (list of DigestEntry for updated studies, count of updated studies,
+    count of added/removed/modified trâmite rows).
+    """
+    logger.info("Starting comparison with previous run data...")
+    current_studies = {record['caae']: record['details'] for record in processed_records}
+    with spans.span('store.load'):
+        previous_studies = store.load_studies(current_studies)
+    if current_studies and not previous_studies:
+        logger.warning("No previous data for the processed CAAEs. Assuming first run; they will be reported as new/updated.")
+
+    with spans.span('compare.diff'):
+        study_diffs = diff_studies(previous_studies, current_studies)
+    for diff in study_diffs:
+        logger.info(f"CAAE {diff.caae}: {'novo estudo' if diff.is_new else 'alterado'} "
+                    f"({len(diff.added)} novos, {len(diff.modified)} alterados, {len(diff.removed)} removidos).")
+
+    if save_state:
+        save_current_state(processed_records, store)
+
+    with spans.span('compare.render'):
+        digest_entries = [entry_from_diff(diff) for diff in study_diffs]
+    num_changed_rows = sum(diff.changed_rows for diff in study_diffs)
+    logger.info(f"Comparison complete. Found {len(digest_entries)} updated or new studies "
+                f"({num_changed_rows} changed trâmite rows) for notification.")
+    return digest_entries, len(digest_entries), num_changed_rows
+
+def _perform_data_comparison(new_df, old_df):
+    """
+    Core logic to compare two DataFrames (new_df and old_df).
+    Returns a tuple: (list of HTML strings for updated/new studies, count of updated/new studies).
+    Assumes 'caae' and 'email_html' columns exist.
+    """
+    import pandas as pd
+    logger.info("Performing core data comparison...")
+    # A missing 'email_html' column compares as all NaN, and CAAEs of different types (1111 and '1111')
+    # are different keys: merging an int64 column with an object one would raise instead
+    new_df, old_df = [df.assign(caae=df['caae'].astype(object)).reindex(columns=df.columns.union(['email_html']))
+                      for df in (new_df, old_df)]
+    # Merge current and old dataframes
+    comparison_df = pd.merge(
+        new_df,
+        old_df,
+        on='caae', # Key for comparison
+        how='outer', # Keep all CAAEs from both dataframes
+        suffixes=('_new', '_old')
+    )
+
+    # Identify updated studies:
+    # 1. Content changed: 'email_html_new' is different from 'email_html_old'.
+    # 2. New CAAE: 'email_html_new' is present, but 'email_html_old' is NaN.
+    # We are not explicitly flagging removed CAAEs (present in old, NaN in new) for email notification,
+    # but they are part of the comparison_df if `how='outer'` is used.
+    
+    # Condition for changed content (present in both, but different email_html)
+    content_changed_mask = (comparison_df['email_html_new'].notna() & 
+                            comparison_df['email_html_old'].notna() & 
+                            (comparison_df['email_html_new'] != comparison_df['email_html_old']))
+    
+    # Condition for new CAAEs (present in new_df, not in old_df)
+    new_caae_mask = comparison_df['email_html_new'].notna() & comparison_df['email_html_old'].isna()
+    
+    # Combine masks: interested in content changed OR new CAAEs
+    # These are the rows whose 'email_html_new' will be included in the notification.
+    updated_studies_df = comparison_df[content_changed_mask | new_caae_mask]
+
+    updated_caae_html_list = updated_studies_df['email_html_new'].tolist() 
+    num_updated_studies = len(updated_caae_html_list)
+
+    logger.info(f"Core comparison complete. Found {num_updated_studies} updated or new studies for notification.")
+    return updated_caae_html_list, num_updated_studies
@@ -0,0 +1,193 @@
+"""
+Settings of a run, read from the environment (and the .env file loaded by the CLI).
+
+Reading them does not import any scraping dependency, so `pb.config` is cheap to import.
+"""
+import datetime
+import logging
+import os
+import sys
+from .daemon import DEFAULT_TRIGGER_PATH
+from .digest import DEFAULT_MAX_BYTES as DEFAULT_EMAIL_MAX_BYTES
+from .digest import OVERFLOW_MODES, OVERFLOW_PARTS
+from .driver_provisioning import DEFAULT_CACHE_PATH as DEFAULT_DRIVER_CACHE_PATH
+from .failure_memory import DEFAULT_FAILURES_PATH
+from .outbox import DEFAULT_MAX_ATTEMPTS as DEFAULT_EMAIL_MAX_ATTEMPTS
+from .outbox import DEFAULT_OUTBOX_PATH
+from .page_parsing import DEFAULT_INSTITUTION_CODE
+from .run_history import DEFAULT_HISTORY_PATH
+from .session_cache import BASE_URL, DEFAULT_SESSION_PATH
+from .session_supervisor import DEFAULT_MAX_RECOVERIES
+from .spans import DEFAULT_JSON_PATH as DEFAULT_METRICS_JSON_PATH
+from .spans import DEFAULT_PROMETHEUS_PATH as DEFAULT_METRICS_PROMETHEUS_PATH
+from .state_log import DEFAULT_STATE_LOG_PATH
+from .tramite_store import DEFAULT_DB_PATH
+
+logger = logging.getLogger('PB_Scraper')
+
+LOG_FILE_PATH = "registro.txt"
+TIMEZONE_NAME = 'Etc/GMT+3'
+REQUIRED_VARIABLES = ('DESTINATARIO_EMAIL', 'PB_LOGIN', 'PB_SENHA', 'EMAIL_PASSWORD')
+
+
+def _flag(env, name, default):
+    """Boolean variable: when on by default, only '0', 'false' and 'no' turn it off; otherwise only '1', 'true' and 'yes' turn it on."""
+    value = env.get(name)
+    if value is None:
+        return default
+    if default:
+        return value.strip().lower() not in ('0', 'false', 'no')
+    return value.strip().lower() in ('1', 'true', 'yes')
+
+
+def configure_logging(log_file_path=LOG_FILE_PATH):
+    """Logs INFO and above to `log_file_path` (appending) and to standard output."""
+    logger.setLevel(logging.INFO)
+    if logger.handlers: # Avoid adding handlers multiple times if the run is started again in the same process
+        return logger
+
+    file_handler = logging.FileHandler(log_file_path, mode='a', encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(module)s.%(funcName)s - %(message)s'))
+    file_handler.setLevel(logging.INFO)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    stream_handler.setLevel(logging.INFO)
+
+    logger.addHandler(file_handler)
+    logger.addHandler(stream_handler)
+    return logger
+
+
+def close_logging():
+    """Closes the logger handlers, flushing and releasing the log file."""
+    for handler in logger.handlers[:]:
+        handler.close()
+        logger.removeHandler(handler)
+
+
+def local_timezone():
+    import pytz
+    return pytz.timezone(TIMEZONE_NAME)
+
+
+def suffixed_path(path, suffix):
+    """'pb_state.sqlite3' -> 'pb_state_5240.sqlite3': the file of another account or institution."""
+    root, extension = os.path.splitext(path)
+    return f"{root}_{suffix}{extension}"
+
+
+def _codes(value):
+    return [code.strip() for code in value.split(',') if code.strip()]
+
+
+class Account:
+    """A Plataforma Brasil login and the institutions whose projects it lists."""
+
+    def __init__(self, login, password, institutions, number=1):
+        self.login = login
+        self.password = password
+        self.institutions = list(institutions)
+        self.number = number # 1 for PB_LOGIN/PB_SENHA, n for PB_LOGIN_n/PB_SENHA_n
+
+    def __repr__(self):
+        return f"Account({self.number}, {self.login!r}, {self.institutions})"
+
+
+class Settings:
+    """The configuration of a run. Every value comes from `environ` (os.environ by default)."""
+
+    def __init__(self, environ=None):
+        env = os.environ if environ is None else environ
+        self.destinatario_email = env.get('DESTINATARIO_EMAIL')
+        self.pb_login = env.get('PB_LOGIN')
+        self.pb_senha = env.get('PB_SENHA')
+        self.email_password = env.get('EMAIL_PASSWORD')
+        # Institutions (last segment of the CAAE) checked in one run; the first one keeps the unsuffixed state files
+        self.institutions = _codes(env.get('PB_INSTITUTIONS', DEFAULT_INSTITUTION_CODE)) or [DEFAULT_INSTITUTION_CODE]
+        # Accounts: PB_LOGIN/PB_SENHA, then PB_LOGIN_2/PB_SENHA_2, PB_LOGIN_3/PB_SENHA_3...; PB_INSTITUTIONS_n limits
+        # the institutions an account lists (default: all of them)
+        self.accounts = []
+        number, login, password = 1, self.pb_login, self.pb_senha
+        while login:
+            institutions = [code for code in _codes(env.get(f'PB_INSTITUTIONS_{number}', '')) if code in self.institutions]
+            self.accounts.append(Account(login, password, institutions or self.institutions, number))
+            number += 1
+            login, password = env.get(f'PB_LOGIN_{number}'), env.get(f'PB_SENHA_{number}')
+        # Notification recipient of each institution: DESTINATARIO_EMAIL_<code>, or DESTINATARIO_EMAIL
+        self.recipients = {code: env.get(f'DESTINATARIO_EMAIL_{code}') or self.destinatario_email
+                           for code in self.institutions}
+        # Size budget of each notification message, and where the studies that do not fit go ('parts' or 'attachment')
+        self.email_max_bytes = int(float(env.get('PB_EMAIL_MAX_KB', DEFAULT_EMAIL_MAX_BYTES / 1024)) * 1024)
+        self.email_overflow = env.get('PB_EMAIL_OVERFLOW', OVERFLOW_PARTS).strip().lower()
+        if self.email_overflow not in OVERFLOW_MODES:
+            logger.warning(f"Unknown PB_EMAIL_OVERFLOW '{self.email_overflow}'; using '{OVERFLOW_PARTS}'.")
+            self.email_overflow = OVERFLOW_PARTS
+        # Directory of the notification outbox, and the delivery attempts of a message before it is given up
+        self.outbox_path = env.get('PB_OUTBOX', DEFAULT_OUTBOX_PATH)
+        self.email_max_attempts = int(env.get('PB_EMAIL_MAX_ATTEMPTS', str(DEFAULT_EMAIL_MAX_ATTEMPTS)))
+        # Plataforma Brasil server (the local simulator in end-to-end benchmarks)
+        self.base_url = env.get('PB_BASE_URL', BASE_URL).rstrip('/')
+        # Number of parallel browser sessions used to process CAAEs
+        self.num_workers = int(env.get('PB_WORKERS', '1'))
+        # Scraping engine: 'browser' (Selenium + Chrome, default) or 'http' (browserless JSF client)
+        self.scraping_engine = env.get('PB_ENGINE', 'browser').strip().lower()
+        # Incremental mode: only open details pages whose listing row changed (on by default)
+        self.incremental_scraping = _flag(env, 'PB_INCREMENTAL', True)
+        self.force_refresh_age = datetime.timedelta(hours=float(env.get('PB_FORCE_REFRESH_HOURS', '168')))
+        # Adaptive polling: active studies every run, dormant ones less often (never beyond the forced-refresh age)
+        self.adaptive_polling = _flag(env, 'PB_ADAPTIVE_POLLING', True)
+        self.active_window = datetime.timedelta(days=float(env.get('PB_ACTIVE_DAYS', '30')))
+        self.idle_poll_ratio = float(env.get('PB_IDLE_POLL_RATIO', '0.1'))
+        # CAAEs that failed in earlier runs, left out until their backoff (doubled at every failed run) elapses
+        self.failure_memory_path = env.get('PB_FAILURE_MEMORY', DEFAULT_FAILURES_PATH)
+        self.failure_backoff = datetime.timedelta(hours=float(env.get('PB_FAILURE_BACKOFF_HOURS', '1')))
+        # Session recoveries (new login, new browser) a check may make before giving its remaining CAAEs up
+        self.max_session_recoveries = int(env.get('PB_MAX_SESSION_RECOVERIES', str(DEFAULT_MAX_RECOVERIES)))
+        # SQLite file holding the studies and trâmites of previous runs
+        self.state_db_path = env.get('PB_STATE_DB', DEFAULT_DB_PATH)
+        # Delta log of the states of PB3.py, used to fill an empty store
+        self.state_log_path = env.get('PB_STATE_LOG', DEFAULT_STATE_LOG_PATH)
+        # A restarted run resumes an unfinished run journal started less than this many minutes ago
+        self.resume_window = datetime.timedelta(minutes=float(env.get('PB_RESUME_WINDOW_MINUTES', '240')))
+        # File caching the cookies of the last login, and how long they are worth probing
+        self.session_cache_path = env.get('PB_SESSION_CACHE', DEFAULT_SESSION_PATH)
+        self.session_max_age = datetime.timedelta(hours=float(env.get('PB_SESSION_MAX_AGE_HOURS', '12')))
+        # Directory where the main browser keeps its Chrome profile between runs
+        self.browser_profile_dir = env.get('PB_BROWSER_PROFILE') or None
+        # Daemon mode: check schedule, jitter, keepalive and session recycling limits
+        self.daemon_interval = datetime.timedelta(minutes=float(env.get('PB_DAEMON_INTERVAL_MINUTES', '30')))
+        self.daemon_jitter = float(env.get('PB_DAEMON_JITTER', '0.2'))
+        self.daemon_keepalive = datetime.timedelta(minutes=float(env.get('PB_DAEMON_KEEPALIVE_MINUTES', '10')))
+        self.daemon_max_session_age = datetime.timedelta(hours=float(env.get('PB_DAEMON_MAX_SESSION_HOURS', '24')))
+        self.daemon_max_memory_mb = float(env.get('PB_DAEMON_MAX_MEMORY_MB', '2048'))
+        self.daemon_trigger_path = DEFAULT_TRIGGER_PATH
+        # Chromedriver resolved per installed Chrome version; fast start never looks it up online
+        self.driver_cache_path = env.get('PB_DRIVER_CACHE', DEFAULT_DRIVER_CACHE_PATH)
+        self.fast_start = _flag(env, 'PB_FAST_START', False)
+        self.chrome_binary = env.get('PB_CHROME_BINARY') or None
+        # Browser without a window, and how often the browser waits poll the page
+        self.headless = _flag(env, 'PB_HEADLESS', False)
+        self.wait_poll_seconds = float(env.get('PB_WAIT_POLL_SECONDS', '0.1'))
+        # Block stylesheets, images, fonts and trackers at the network level in the browser (on by default)
+        self.block_resources = _flag(env, 'PB_BLOCK_RESOURCES', True)
+        # Per-run metrics (step timings, server waits, sleeps): JSON file and Prometheus textfile ('' disables either)
+        self.metrics_json_path = env.get('PB_METRICS_JSON', DEFAULT_METRICS_JSON_PATH) or None
+        self.metrics_prometheus_path = env.get('PB_METRICS_PROM', DEFAULT_METRICS_PROMETHEUS_PATH) or None
+        # Append-only history of the runs (one structured record per run or daemon check)
+        self.run_history_path = env.get('PB_RUN_HISTORY', DEFAULT_HISTORY_PATH)
+
+    def missing_required(self):
+        """Names of the required variables that are not set."""
+        values = {'DESTINATARIO_EMAIL': self.destinatario_email, 'PB_LOGIN': self.pb_login,
+                  'PB_SENHA': self.pb_senha, 'EMAIL_PASSWORD': self.email_password}
+        missing = [name for name in REQUIRED_VARIABLES if not values[name]]
+        return missing + [f'PB_SENHA_{account.number}' for account in self.accounts[1:] if not account.password]
+
+    def state_path(self, path, institution):
+        """The state file `path` (store, fingerprints, run journal) of `institution`."""
+        return path if institution == self.institutions[0] else suffixed_path(path, institution)
+
+    def session_cache_for(self, account):
+        """The session cache file of `account` (the first one uses PB_SESSION_CACHE itself)."""
+        return self.session_cache_path if account.number == 1 else suffixed_path(self.session_cache_path, account.number)
@@ -0,0 +1,208 @@
+"""
+Long-lived scheduler that keeps authenticated sessions warm between checks.
+
+A scheduled run pays for installing the driver, starting Chrome and logging in before
+doing any work. In daemon mode that cost is paid when the sessions are opened. After
+that, each check reuses them:
+
+- Checks run every `interval`, shifted by a random jitter so they do not hit the platform
+  at fixed times.
+- Between checks the sessions are kept alive with a keepalive every `keepalive_interval`.
+  The server would otherwise expire them after some idle time.
+- After every check the RecyclePolicy decides whether to replace the sessions: they are
+  too old, have served too many checks, failed repeatedly, use too much memory, or no
+  longer pass the health probe.
+- A check can be triggered on demand by creating the trigger file or calling `trigger()`
+  (pb.run wires SIGUSR1 to it).
+
+The daemon only depends on the small interface below, so it can be tested without a browser:
+`open_sessions()` returns an object with `is_healthy()`, `keepalive()`, `memory_mb()` and
+`close()`, or None if it could not log in; `run_check(sessions)` runs one check and raises
+on failure.
+"""
+import datetime
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_TRIGGER_PATH = "pb_daemon.trigger"
+POLL_SECONDS = 1.0 # How often the trigger file and the stop flag are checked while waiting
+
+
+class RecyclePolicy:
+    """When the warm sessions must be closed and opened again."""
+
+    def __init__(self, max_age=datetime.timedelta(hours=24), max_checks=None, max_failures=3, max_memory_mb=2048):
+        self.max_age = max_age
+        self.max_checks = max_checks # None: no limit
+        self.max_failures = max_failures # Consecutive failed checks
+        self.max_memory_mb = max_memory_mb # None: no limit
+
+    def reason(self, age_seconds, checks, consecutive_failures, memory_mb, healthy):
+        """Returns why the sessions must be recycled, or None to keep them."""
+        if not healthy:
+            return "health probe failed"
+        if consecutive_failures >= self.max_failures:
+            return f"{consecutive_failures} consecutive failed checks"
+        if self.max_checks is not None and checks >= self.max_checks:
+            return f"{checks} checks served"
+        if age_seconds >= self.max_age.total_seconds():
+            return f"sessions older than {self.max_age}"
+        if self.max_memory_mb is not None and memory_mb is not None and memory_mb > self.max_memory_mb:
+            return f"browser memory {memory_mb:.0f} MB above {self.max_memory_mb} MB"
+        return None
+
+
+class ScraperDaemon:
+    """Runs `run_check` on a jittered schedule over sessions kept open between checks."""
+
+    def __init__(self, open_sessions, run_check, interval, jitter=0.2, policy=None, keepalive_interval=600,
+                 trigger_path=DEFAULT_TRIGGER_PATH, clock=time.monotonic, rng=None):
+        self.open_sessions = open_sessions
+        self.run_check = run_check
+        self.interval = interval # Seconds between checks
+        self.jitter = jitter # Fraction of the interval by which each wait may vary
+        self.policy = policy or RecyclePolicy()
+        self.keepalive_interval = keepalive_interval
+        self.trigger_path = trigger_path
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._triggered = threading.Event()
+        self._stopping = threading.Event()
+        self._sessions = None
+        self._opened_at = None
+        self._checks_on_sessions = 0
+        self._consecutive_failures = 0
+        self.checks_run = 0
+        self.recycles = 0
+
+    # --- Control ---
+
+    def trigger(self):
+        """Requests a check as soon as possible."""
+        self._triggered.set()
+
+    def stop(self):
+        """Makes `run` return after the current check or wait."""
+        self._stopping.set()
+        self._triggered.set()
+
+    # --- Sessions ---
+
+    def _ensure_sessions(self):
+        if self._sessions is not None:
+            return True
+        started = self.clock()
+        self._sessions = self.open_sessions()
+        if self._sessions is None:
+            logger.error("Daemon: could not open authenticated sessions.")
+            return False
+        self._opened_at = self.clock()
+        self._checks_on_sessions = 0
+        logger.info(f"Daemon: sessões abertas em {self._opened_at - started:.1f}s.")
+        return True
+
+    def _close_sessions(self, reason):
+        if self._sessions is None:
+            return
+        logger.info(f"Daemon: fechando sessões ({reason}).")
+        try:
+            self._sessions.close()
+        except Exception as e:
+            logger.error(f"Daemon: error closing sessions: {e}", exc_info=True)
+        self._sessions = None
+
+    def _recycle_reason(self):
+        try:
+            healthy = self._sessions.is_healthy()
+        except Exception as e:
+            logger.warning(f"Daemon: health probe raised {e}.")
+            healthy = False
+        try:
+            memory_mb = self._sessions.memory_mb()
+        except Exception:
+            memory_mb = None
+        return self.policy.reason(self.clock() - self._opened_at, self._checks_on_sessions,
+                                  self._consecutive_failures, memory_mb, healthy)
+
+    # --- Schedule ---
+
+    def next_delay(self):
+        """Seconds until the next scheduled check: the interval shifted by up to +/- jitter."""
+        return max(0.0, self.interval * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def _consume_trigger_file(self):
+        if self.trigger_path and os.path.exists(self.trigger_path):
+            try:
+                os.remove(self.trigger_path)
+            except OSError:
+                pass
+            return True
+        return False
+
+    def _wait(self, delay):
+        """Waits `delay` seconds, keeping the sessions alive. Returns early on a trigger or stop."""
+        deadline = self.clock() + delay
+        next_keepalive = self.clock() + self.keepalive_interval
+        while not self._stopping.is_set():
+            now = self.clock()
+            if now >= deadline:
+                return
+            if self._consume_trigger_file() or self._triggered.is_set():
+                logger.info("Daemon: verificação sob demanda solicitada.")
+                return
+            if self._sessions is not None and now >= next_keepalive:
+                next_keepalive = now + self.keepalive_interval
+                try:
+                    self._sessions.keepalive()
+                except Exception as e:
+                    logger.warning(f"Daemon: keepalive failed ({e}).")
+                    self.recycles += 1
+                    self._close_sessions("keepalive failed")
+            self._triggered.wait(min(POLL_SECONDS, deadline - now, max(0.0, next_keepalive - now)) or POLL_SECONDS)
+
+    def run_once(self):
+        """Runs one check on the warm sessions, then applies the recycle policy. Returns True on success."""
+        self._triggered.clear()
+        if not self._ensure_sessions():
+            self._consecutive_failures += 1
+            return False
+        started = self.clock()
+        try:
+            self.run_check(self._sessions)
+            succeeded = True
+            self._consecutive_failures = 0
+        except Exception as e:
+            logger.error(f"Daemon: check failed: {e}", exc_info=True)
+            succeeded = False
+            self._consecutive_failures += 1
+        self.checks_run += 1
+        self._checks_on_sessions += 1
+        logger.info(f"Daemon: verificação {self.checks_run} {'concluída' if succeeded else 'falhou'} em {self.clock() - started:.1f}s.")
+
+        reason = self._recycle_reason()
+        if reason:
+            self.recycles += 1
+            self._close_sessions(reason)
+            self._ensure_sessions() # Reopen now, so the next check starts warm
+        return succeeded
+
+    def run(self, max_checks=None):
+        """Runs checks until `stop()` is called (or `max_checks` checks have run), then closes the sessions."""
+        try:
+            while not self._stopping.is_set():
+                self.run_once()
+                if max_checks is not None and self.checks_run >= max_checks:
+                    break
+                delay = self.next_delay()
+                if self._consecutive_failures:
+                    # Back off after failures, up to 8 intervals
+                    delay *= min(2 ** self._consecutive_failures, 8)
+                logger.info(f"Daemon: próxima verificação em {delay / 60:.1f} min.")
+                self._wait(delay)
+        finally:
+            self._close_sessions("daemon stopping")
@@ -0,0 +1,218 @@
+"""
+Size-bounded digest of the studies that changed, sent as multipart/alternative messages.
+
+Each study becomes a DigestEntry: a compact HTML fragment, whose tables rely on the styles
+shared in the head instead of repeating their attributes, and a plain-text summary. The
+entries are packed into messages of at most `max_bytes` (as sent, headers and encoding
+included). What does not fit goes to numbered parts (OVERFLOW_PARTS) or to a zipped HTML
+attachment of a single message (OVERFLOW_ATTACHMENT).
+
+Each message carries an idempotency key (pb.outbox.KEY_HEADER) derived from its recipient,
+subject (which dates it), part and studies, not from the duration or time of day in its
+text, so re-rendering the same changes for the same notification yields the same key, while
+a later notification repeating the same studies gets a new one.
+"""
+import hashlib
+import html
+import io
+import logging
+import re
+import zipfile
+from email.message import EmailMessage
+from email.policy import SMTP
+from .outbox import KEY_HEADER, message_id
+from .page_parsing import TRAMITE_HEADERS, changes_summary, labelled_changes
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_MAX_BYTES = 100 * 1024
+OVERFLOW_PARTS, OVERFLOW_ATTACHMENT = 'parts', 'attachment'
+OVERFLOW_MODES = (OVERFLOW_PARTS, OVERFLOW_ATTACHMENT)
+ATTACHMENT_NAME = 'estudos.zip'
+SHARED_STYLE = ("body{font-family:Arial,sans-serif}"
+                ".study-details{border:1px solid #ccc;padding:10px;margin-bottom:10px;background-color:#f9f9f9}"
+                "table{border-collapse:collapse;width:100%;margin-top:10px}"
+                "th,td{border:1px solid #ddd;padding:8px;text-align:left}th{background-color:#f2f2f2}")
+NUMBERING_RESERVE = 64 # Bytes kept free for the part numbers, unknown while the parts are packed
+
+
+class DigestEntry:
+    """One study of the digest: its CAAE, compact HTML fragment and plain-text summary."""
+
+    def __init__(self, caae, html, text):
+        self.caae = caae
+        self.html = html
+        self.text = text
+
+    def __repr__(self):
+        return f"DigestEntry({self.caae!r}, {len(self.html)} + {len(self.text)} chars)"
+
+
+def _escape(value):
+    return html.escape(str(value), quote=False)
+
+
+def _table(header, labelled_rows):
+    head = ''.join(f"<th>{_escape(name)}</th>" for name in header)
+    body = ''.join(f"<tr><th>{_escape(label)}</th>{''.join(f'<td>{_escape(cell)}</td>' for cell in row)}</tr>"
+                   for label, row in labelled_rows)
+    return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+
+def _text_row(label, row):
+    return f"  {label}: {' | '.join(cell for cell in row if cell)}"
+
+
+def _study_entry(details, summary_label, summary, header, labelled_rows):
+    fragment = (f'<div class="study-details"><p><b>Título do Estudo:</b> {_escape(details["nome_estudo"])}</p>'
+                f'<p><b>CAAE:</b> {_escape(details["caae"])}</p>'
+                f'<p><b>Pesquisador Principal:</b> {_escape(details["pi"])}</p>'
+                f'<p><b>{summary_label}</b> {_escape(summary)}</p>'
+                f'{_table(header, labelled_rows) if labelled_rows else ""}</div>')
+    lines = [f"CAAE {details['caae']} - {details['nome_estudo']}", f"Pesquisador Principal: {details['pi']}", summary]
+    lines.extend(_text_row(label, row) for label, row in labelled_rows)
+    return DigestEntry(details['caae'], fragment, '\n'.join(lines))
+
+
+def entry_from_diff(diff):
+    """The DigestEntry of a StudyDiff (pb.tramite_diff): only the trâmite rows that changed."""
+    return _study_entry(diff.details, 'Alterações desde a última execução:',
+                        changes_summary(diff.added, diff.removed, diff.modified, diff.is_new),
+                        ('Alteração',) + TRAMITE_HEADERS, labelled_changes(diff.added, diff.removed, diff.modified))
+
+
+def entry_from_study(details):
+    """The DigestEntry of a whole study (the dict of parse_caae_details), with its full trâmite history."""
+    tramites = details.get('tramites') or []
+    summary = f"{len(tramites)} trâmite(s)." if tramites else "Tabela de trâmites não encontrada."
+    return _study_entry(details, 'Histórico de Trâmites:', summary, ('#',) + TRAMITE_HEADERS,
+                        [(str(number), row) for number, row in enumerate(tramites, start=1)])
+
+
+def _strip_tags(line):
+    return html.unescape(re.sub(r'<[^>]+>', '', line))
+
+
+def _html_document(paragraphs_before, entries, paragraphs_after):
+    paragraphs = lambda lines: ''.join(f"<p>{line}</p>" for line in lines)
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><style>{SHARED_STYLE}</style></head><body>'
+            f'{paragraphs(paragraphs_before)}{"".join(entry.html for entry in entries)}{paragraphs(paragraphs_after)}'
+            '</body></html>')
+
+
+def _text_document(paragraphs_before, entries, paragraphs_after):
+    blocks = ['\n'.join(_strip_tags(line) for line in paragraphs_before)]
+    blocks.extend(entry.text for entry in entries)
+    blocks.append('\n'.join(_strip_tags(line) for line in paragraphs_after))
+    return '\n\n'.join(block for block in blocks if block) + '\n'
+
+
+class Digest:
+    """
+    The texts of one notification: `subject`, and `intro`/`footer` paragraphs (HTML allowed,
+    stripped in the plain-text part) around the entries.
+    """
+
+    def __init__(self, subject, sender, recipient, intro=(), footer=()):
+        self.subject = subject
+        self.sender = sender
+        self.recipient = recipient
+        self.intro = list(intro)
+        self.footer = list(footer)
+
+    def message(self, entries, subject_suffix='', note=None, attachment=None):
+        """One multipart/alternative EmailMessage (multipart/mixed with the zipped `attachment` entries)."""
+        intro = self.intro + ([note] if note else [])
+        key = hashlib.sha256('\x1f'.join([self.recipient or '', self.subject, subject_suffix, note or '']
+                                          + [entry.html for entry in entries]
+                                          + [entry.caae for entry in attachment or ()]).encode('utf-8'))
+        msg = EmailMessage(policy=SMTP)
+        msg[KEY_HEADER] = key.hexdigest()[:40]
+        msg['Message-ID'] = message_id(msg[KEY_HEADER], self.sender)
+        msg['Subject'] = self.subject + subject_suffix
+        msg['From'] = self.sender
+        msg['To'] = self.recipient
+        msg.set_content(_text_document(intro, entries, self.footer), charset='utf-8', cte='quoted-printable')
+        msg.add_alternative(_html_document(intro, entries, self.footer), subtype='html', charset='utf-8',
+                            cte='quoted-printable')
+        if attachment:
+            msg.add_attachment(zip_entries(attachment, self.subject), maintype='application', subtype='zip',
+                               filename=ATTACHMENT_NAME)
+        return msg
+
+
+def zip_entries(entries, title):
+    """A zip file holding the HTML document of `entries`."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('estudos.html', _html_document([f"<b>{_escape(title)}</b>"], entries, []))
+    return buffer.getvalue()
+
+
+def message_size(msg):
+    return len(msg.as_bytes())
+
+
+def _largest_fit(count, fits):
+    """The largest n in 1..count with fits(n), assuming fits is monotonic (1 when nothing fits)."""
+    low, high = 1, count
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _split_in_parts(digest, entries, max_bytes):
+    parts, start = [], 0
+    while start < len(entries):
+        remaining = entries[start:]
+        size = _largest_fit(len(remaining),
+                            lambda n: message_size(digest.message(remaining[:n], ' (parte 1/1)')) + NUMBERING_RESERVE <= max_bytes)
+        parts.append(remaining[:size])
+        start += size
+    if len(parts) == 1:
+        return [digest.message(entries)]
+    messages = []
+    position = 0
+    for number, part in enumerate(parts, start=1):
+        note = (f"Parte {number} de {len(parts)}: estudos {position + 1} a {position + len(part)} "
+                f"de {len(entries)}.")
+        messages.append(digest.message(part, f' (parte {number}/{len(parts)})', note))
+        position += len(part)
+    return messages
+
+
+def _with_attachment(digest, entries, max_bytes):
+    def message(inline_count):
+        rest = entries[inline_count:]
+        note = (f"{inline_count} estudos abaixo; os outros {len(rest)} estão no anexo {ATTACHMENT_NAME}."
+                if rest else None)
+        return digest.message(entries[:inline_count], note=note, attachment=rest)
+    if message_size(message(0)) > max_bytes:
+        logger.warning(f"Even zipped, the {len(entries)} studies exceed the email budget; splitting into parts instead.")
+        return None
+    inline_count = _largest_fit(len(entries) + 1, lambda n: message_size(message(n - 1)) <= max_bytes) - 1
+    return [message(inline_count)]
+
+
+def build_digest(digest, entries, max_bytes=DEFAULT_MAX_BYTES, overflow=OVERFLOW_PARTS):
+    """
+    The messages carrying `entries`: one when they fit in `max_bytes`, otherwise numbered
+    parts or a single message with the overflow zipped, according to `overflow`.
+    A study larger than the budget on its own is still sent, alone in its part.
+    """
+    whole = digest.message(entries)
+    if message_size(whole) <= max_bytes or not entries:
+        return [whole]
+    messages = _with_attachment(digest, entries, max_bytes) if overflow == OVERFLOW_ATTACHMENT else None
+    if messages is None:
+        messages = _split_in_parts(digest, entries, max_bytes)
+    sizes = [message_size(msg) for msg in messages]
+    logger.info(f"Digest of {len(entries)} studies ({message_size(whole)} bytes in one message) split into "
+                f"{len(messages)} message(s) of {', '.join(map(str, sizes))} bytes (budget {max_bytes}).")
+    if max(sizes) > max_bytes:
+        logger.warning(f"A study alone exceeds the email budget of {max_bytes} bytes; it was sent anyway.")
+    return messages
@@ -0,0 +1,151 @@
+"""
+Offline chromedriver provisioning.
+
+`ChromeDriverManager().install()` looks up the driver version online on every run (and
+may download it), so each start pays for network round trips and fails without network
+access. Here a driver is resolved once per installed Chrome major version. Its path and
+version are cached in `chromedriver_cache.json`. Later starts only check locally that the
+cached binary still exists and that `chromedriver --version` reports the same major
+version as the installed Chrome.
+
+If Chrome was updated, the cache misses and the driver is resolved online again (unless
+`offline` is set). If that fails, a driver on the PATH with the right version is used.
+As a last resort the caller falls back to Selenium Manager (`Service()` without a path).
+"""
+import datetime
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_CACHE_PATH = "chromedriver_cache.json"
+CHROME_BINARIES = ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome')
+WINDOWS_VERSION_KEY = r'HKEY_CURRENT_USER\Software\Google\Chrome\BLBeacon'
+VERSION_PATTERN = re.compile(r'(\d+)\.(\d+)\.(\d+)\.(\d+)')
+
+
+def _run_version(command, timeout=10):
+    """Returns the first a.b.c.d version printed by `command`, or None."""
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=timeout).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = VERSION_PATTERN.search(output)
+    return match.group(0) if match else None
+
+
+def major_version(version):
+    return version.split('.')[0] if version else None
+
+
+def installed_chrome_version(binary=None):
+    """Returns the version of the installed Chrome (e.g. '124.0.6367.91'), or None if not found."""
+    if binary:
+        return _run_version([binary, '--version'])
+    if sys.platform.startswith('win'):
+        return _run_version(['reg', 'query', WINDOWS_VERSION_KEY, '/v', 'version'])
+    for name in CHROME_BINARIES:
+        path = shutil.which(name)
+        if path:
+            version = _run_version([path, '--version'])
+            if version:
+                return version
+    return None
+
+
+def driver_version(driver_path):
+    """Returns the version reported by `driver_path --version`, or None if it does not run."""
+    if not driver_path or not os.path.isfile(driver_path) or not os.access(driver_path, os.X_OK):
+        return None
+    return _run_version([driver_path, '--version'])
+
+
+class DriverCache:
+    """Resolved chromedriver per Chrome major version: {major: {'path', 'version', 'chrome_version', 'resolved_at'}}."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except ValueError:
+            logger.warning(f"Ignoring unreadable chromedriver cache '{path}'.")
+            self.entries = {}
+
+    def get(self, chrome_major):
+        return self.entries.get(str(chrome_major))
+
+    def put(self, chrome_version, driver_path, version):
+        self.entries[major_version(chrome_version)] = {
+            'path': os.path.abspath(driver_path),
+            'version': version,
+            'chrome_version': chrome_version,
+            'resolved_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def _matching(driver_path, chrome_major):
+    """Returns the driver version if `driver_path` runs and matches `chrome_major` (any version if unknown)."""
+    version = driver_version(driver_path)
+    if version and (chrome_major is None or major_version(version) == chrome_major):
+        return version
+    return None
+
+
+def _install_with_webdriver_manager():
+    from webdriver_manager.chrome import ChromeDriverManager
+    return ChromeDriverManager().install()
+
+
+def provision_driver(cache=None, install=None, offline=False, chrome_binary=None):
+    """
+    Returns the path of a chromedriver matching the installed Chrome, or None to let
+    Selenium Manager resolve one. `install()` resolves a driver online (webdriver-manager
+    by default) and is only called on a cache miss, never when `offline` is set.
+    """
+    cache = cache or DriverCache()
+    install = install or _install_with_webdriver_manager
+    chrome_version = installed_chrome_version(chrome_binary)
+    chrome_major = major_version(chrome_version)
+    if chrome_version is None:
+        logger.warning("Could not determine the installed Chrome version; cached drivers cannot be matched.")
+
+    entry = cache.get(chrome_major) if chrome_major else None
+    if entry and _matching(entry['path'], chrome_major):
+        logger.info(f"Chromedriver {entry['version']} from the cache for Chrome {chrome_version}.")
+        return entry['path']
+    if entry:
+        logger.warning(f"Cached chromedriver '{entry['path']}' is missing or does not match Chrome {chrome_version}.")
+
+    if not offline:
+        try:
+            driver_path = install()
+            version = _matching(driver_path, chrome_major)
+            if version:
+                if chrome_version:
+                    cache.put(chrome_version, driver_path, version)
+                logger.info(f"Chromedriver {version} resolved online for Chrome {chrome_version} and cached.")
+                return driver_path
+            logger.warning(f"Chromedriver '{driver_path}' resolved online does not match Chrome {chrome_version}.")
+        except Exception as e:
+            logger.warning(f"Could not resolve chromedriver online: {e}")
+
+    path_driver = shutil.which('chromedriver')
+    version = _matching(path_driver, chrome_major)
+    if version:
+        logger.info(f"Using chromedriver {version} found on the PATH ({path_driver}).")
+        return path_driver
+
+    logger.warning("No matching chromedriver available; leaving it to Selenium Manager.")
+    return None
@@ -0,0 +1,78 @@
+"""
+Persistent per-CAAE failure memory, so studies that keep failing do not stall every run.
+
+A CAAE whose details page still fails after the deferred retries at the end of a run
+(pb.worker_pool) is remembered with its consecutive failed runs. The next runs leave it
+out until its backoff has elapsed: the base backoff (PB_FAILURE_BACKOFF_HOURS) doubled at
+every further failed run, up to MAX_BACKOFF. A successful fetch forgets the CAAE.
+
+Format: {caae: {'failures', 'first_failure', 'last_failure', 'next_attempt'}} as JSON.
+"""
+import datetime
+import json
+import logging
+import os
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_FAILURES_PATH = "caae_failures.json"
+DEFAULT_BASE_BACKOFF = datetime.timedelta(hours=1)
+MAX_BACKOFF = datetime.timedelta(days=7)
+
+
+class FailureMemory:
+    """The failed CAAEs stored at `path` and when each may be tried again."""
+
+    def __init__(self, path=DEFAULT_FAILURES_PATH, base_backoff=DEFAULT_BASE_BACKOFF):
+        self.path = path
+        self.base_backoff = base_backoff
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.entries = json.load(f)
+                logger.info(f"Loaded failure memory with {len(self.entries)} CAAEs from '{path}'.")
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read failure memory '{path}': {e}. Every CAAE will be tried.", exc_info=True)
+                self.entries = {}
+
+    def backoff(self, failures):
+        """How long a CAAE is left out after `failures` consecutive failed runs."""
+        return min(self.base_backoff * 2 ** (failures - 1), MAX_BACKOFF)
+
+    def split(self, caae_list, now):
+        """Splits `caae_list` into (to_try, backing_off), both in input order."""
+        to_try, backing_off = [], []
+        for caae in caae_list:
+            entry = self.entries.get(caae)
+            if entry and datetime.datetime.fromisoformat(entry['next_attempt']) > now:
+                backing_off.append(caae)
+            else:
+                to_try.append(caae)
+        return to_try, backing_off
+
+    def record_failure(self, caae, now):
+        entry = self.entries.get(caae) or {'failures': 0, 'first_failure': now.isoformat()}
+        entry['failures'] += 1
+        entry['last_failure'] = now.isoformat()
+        entry['next_attempt'] = (now + self.backoff(entry['failures'])).isoformat()
+        self.entries[caae] = entry
+
+    def record_success(self, caae):
+        if self.entries.pop(caae, None):
+            logger.info(f"CAAE {caae} voltou a ser processado com sucesso; removido da memória de falhas.")
+
+    def describe(self, caae):
+        """Why `caae` is remembered, for the report of the skipped CAAEs."""
+        entry = self.entries.get(caae)
+        if not entry:
+            return caae
+        next_attempt = datetime.datetime.fromisoformat(entry['next_attempt'])
+        return f"{caae} ({entry['failures']} execuções com falha, próxima tentativa {next_attempt.strftime('%d/%m/%Y %H:%M')})"
+
+    def save(self):
+        """Writes the memory atomically, so an interrupted run cannot leave a truncated file."""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
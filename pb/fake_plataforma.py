@@ -0,0 +1,547 @@
+"""
+Local stand-in for the Plataforma Brasil JSF pages, for offline tests of the scrapers.
+
+It serves the login form (`j_id19`), the "usuário já logado" modal, the paginated
+project listing of `gerirPesquisaAgrupador.jsf` with its CAAE search and RichFaces
+datascroller (optionally with a rows-per-page select), and the project details page with its trâmite table and "voltar" link.
+The markup follows the element IDs and XPaths used by PB3.py and pb.browser, and the server
+keeps JSF-like state: a JSESSIONID cookie per session and a bounded set of ViewState
+ids per session, so a stale ViewState is answered with a view-expired page.
+
+RichFaces AJAX requests (AJAXREQUEST=_viewRoot) are answered with the whole page,
+which is a superset of the partial response the real server sends.
+
+It also serves as a simulator for end-to-end benchmarks (pb.simulation): every response
+can be delayed by a latency with jitter, and a share of the listing requests can fail
+with an HTTP error status, a view-expired page or a dropped connection.
+The login is never failed on purpose, so failures only hit the scraping itself.
+
+Usage:
+    server, base_url = serve_in_thread(FakePlataformaBrasil(generate_projects(30)))
+    ...
+    server.shutdown()
+
+    python -m pb.fake_plataforma 8080 --projects 500 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+"""
+import argparse
+import collections
+import html
+import http.server
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+import datetime
+
+LOGIN_PATH = '/login.jsf'
+LISTING_PATH = '/visao/pesquisador/gerirPesquisa/gerirPesquisaAgrupador.jsf'
+LISTING_FORM = 'formGerirPesquisa'
+SEARCH_INPUT = f'{LISTING_FORM}:caae'
+SEARCH_BUTTON = f'{LISTING_FORM}:btnPesquisar'
+SCROLLER_ID = f'{LISTING_FORM}:tabela:scroller'
+VOLTAR_LINK = 'formVoltar:voltar'
+INVALIDATE_BUTTON = 'formModalMsgUsuarioLogado:idBotaoInvalidarUsuarioLogado'
+PAGE_SIZE_SELECT = f'{LISTING_FORM}:tamanhoPagina'
+PAGE_SIZE_SUPPORT = f'{LISTING_FORM}:tamanhoPaginaSupport'
+PAGE_SIZE = 10
+MAX_VIEWS_PER_SESSION = 15 # Like Mojarra's numberOfViewsInSession
+ERROR_KINDS = ('status', 'view_expired', 'drop') # Injected failures: HTTP error status, view-expired page, closed connection
+
+TRAMITE_TYPES = [
+    'Submetido para avaliação do CEP', 'Aceitação do PP', 'Confirmação de Indicação de Relatoria',
+    'Parecer do relator emitido', 'Parecer do colegiado emitido', 'Parecer liberado',
+    'Notificação enviada', 'Emenda submetida',
+]
+SITUACOES = ['Aprovado', 'Em Recepção e Validação Documental', 'Pendente', 'Em Apreciação Ética', 'Retirado']
+PESQUISADORES = ['Ana Souza', 'Bruno Lima', 'Carla Mendes', 'Daniel Rocha', 'Elisa Castro', 'Fábio Nunes']
+TEMAS = ['adesão à terapia antirretroviral', 'profilaxia pré-exposição', 'coinfecção tuberculose-HIV',
+         'hepatites virais', 'doença de Chagas', 'arboviroses']
+INSTITUICAO = 'Instituto Nacional de Infectologia Evandro Chagas - INI / FIOCRUZ'
+
+
+def generate_projects(count, institution_code='5262', other_codes=('5240', '5249'), own_ratio=0.6,
+                      max_tramites=12, seed=0):
+    """
+    Returns a deterministic list of `count` fake projects. About `own_ratio` of them belong to
+    `institution_code`; the rest use `other_codes`, as the listing shows every visible project.
+    """
+    rng = random.Random(seed)
+    projects = []
+    base_date = datetime.datetime(2025, 5, 30, 12, 0, 0)
+    for index in range(count):
+        code = institution_code if rng.random() < own_ratio else rng.choice(other_codes)
+        caae = f"{rng.randrange(10**7, 10**8):08d}.{rng.randrange(10)}.0000.{code}"
+        versao = rng.randint(1, 6)
+        moment = base_date - datetime.timedelta(days=rng.randint(0, 900), minutes=rng.randint(0, 1440))
+        tramites = []
+        for row in range(rng.randint(1, max_tramites)):
+            moment -= datetime.timedelta(days=rng.randint(0, 40), minutes=rng.randint(1, 600))
+            tramites.append([
+                f"{rng.choice('EN')}{rng.randint(1, 9)}", moment.strftime('%d/%m/%Y %H:%M:%S'),
+                rng.choice(TRAMITE_TYPES), str(versao), rng.choice(['Coordenador', 'Membro do CEP', 'Pesquisador']),
+                INSTITUICAO, rng.choice([INSTITUICAO, 'PESQUISADOR']), '',
+            ])
+        projects.append({
+            'caae': caae,
+            'titulo': f"Estudo {index + 1} sobre {rng.choice(TEMAS)}",
+            'pesquisador': rng.choice(PESQUISADORES),
+            'versao': str(versao),
+            'situacao': rng.choice(SITUACOES),
+            'ultima_atualizacao': tramites[0][1] if tramites else '',
+            'tramites': tramites,
+        })
+    return projects
+
+
+class FakePlataformaBrasil:
+    """In-memory state of the stand-in server: users, projects and JSF sessions."""
+
+    def __init__(self, projects, users=None, page_sizes=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_kinds=ERROR_KINDS, error_status=503, seed=None):
+        self.projects = list(projects)
+        self.users = dict(users or {'pesquisador@example.org': 'senha'})
+        self.page_sizes = page_sizes # e.g. (10, 50, 100) to render a rows-per-page select; None for no select
+        self.sessions = {} # JSESSIONID -> {'user': email or None, 'views': OrderedDict, 'pending_login': email}
+        self.lock = threading.Lock()
+        self.request_counts = collections.Counter() # (method, path) -> count
+        self.latency = latency # Seconds added to every response (outside the lock, so requests overlap)
+        self.jitter = jitter # Uniform +/- variation of the latency, in seconds
+        self.error_rate = error_rate # Share of the listing requests answered with an injected failure
+        self.error_kinds = tuple(error_kinds)
+        self.error_status = error_status
+        self.error_counts = collections.Counter() # kind -> count
+        self.rng = random.Random(seed)
+
+    def response_delay(self):
+        with self.lock:
+            variation = self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return max(0.0, self.latency + variation)
+
+    def draw_failure(self, path):
+        """Returns the kind of failure to inject in this request, or None."""
+        if path != LISTING_PATH or not self.error_rate or not self.error_kinds:
+            return None
+        with self.lock:
+            if self.rng.random() >= self.error_rate:
+                return None
+            kind = self.rng.choice(self.error_kinds)
+            self.error_counts[kind] += 1
+            return kind
+
+    def new_view(self, session, view):
+        """Stores `view` under a fresh ViewState id, evicting the oldest beyond the per-session limit."""
+        view_id = f"j_id{uuid.uuid4().hex[:8]}"
+        session['views'][view_id] = view
+        while len(session['views']) > MAX_VIEWS_PER_SESSION:
+            session['views'].popitem(last=False)
+        return view_id
+
+    def active_session_of(self, email, exclude=None):
+        for session_id, session in self.sessions.items():
+            if session['user'] == email and session_id != exclude:
+                return session_id
+        return None
+
+    def filtered_projects(self, filter_text):
+        if not filter_text:
+            return self.projects
+        return [p for p in self.projects if filter_text in p['caae']]
+
+    def project(self, caae):
+        return next((p for p in self.projects if p['caae'] == caae), None)
+
+
+# --- Page rendering ---
+
+def _esc(value):
+    return html.escape(str(value), quote=True)
+
+
+def _jsf_link_onclick(form_id, param):
+    return (f"if(typeof jsfcljs == 'function'){{jsfcljs(document.getElementById('{form_id}'),"
+            f"{{'{param}':'{param}'}},'');}}return false")
+
+
+def _a4j_submit(form_id, param):
+    return (f"A4J.AJAX.Submit('_viewRoot','{form_id}',event,{{'similarityGroupingId':'{param}',"
+            f"'parameters':{{'{param}':'{param}'}},'actionUrl':'{LISTING_PATH}'}})")
+
+
+def _page(title, header_extra, status_text, content, body_extra=''):
+    # Layout: /html/body/div[2]/div/div[3] (login box or toolbar), div[4]/div (status), div[6]/div[1]/form (content)
+    return f"""<html>
+<head><title>{_esc(title)}</title></head>
+<body>
+<div id="topo"><span>Plataforma Brasil</span></div>
+<div id="principal"><div>
+<div id="cabecalho"><span>Ministério da Saúde</span></div>
+<div id="menu"><span>Menu</span></div>
+<div id="barra">{header_extra}</div>
+<div id="mensagens"><div>{_esc(status_text)}</div></div>
+<div id="trilha"><span>{_esc(title)}</span></div>
+<div id="conteudo"><div>{content}</div></div>
+</div></div>
+{body_extra}
+</body>
+</html>"""
+
+
+def _welcome(user):
+    # PB3.py looks for "sessão", pb.browser for "bem vindo" in this status text
+    return f"Bem vindo(a), {user}! Sua sessão foi iniciada."
+
+
+def render_login_page(view_id, message='', modal=False):
+    login_box = f"""<div><div>
+<form id="j_id19" name="j_id19" method="post" action="{LOGIN_PATH}" enctype="application/x-www-form-urlencoded">
+<input type="hidden" name="j_id19" value="j_id19" />
+<input type="text" id="j_id19:email" name="j_id19:email" value="" />
+<input type="password" id="j_id19:senha" name="j_id19:senha" value="" />
+<input type="submit" name="j_id19:j_id25" value="Entrar" />
+<input type="hidden" name="javax.faces.ViewState" id="javax.faces.ViewState" value="{view_id}" />
+</form>
+</div></div>"""
+    modal_html = ''
+    if modal:
+        modal_html = f"""<div id="modalMsgUsuarioLogado" class="rich-modalpanel">
+<form id="formModalMsgUsuarioLogado" name="formModalMsgUsuarioLogado" method="post" action="{LOGIN_PATH}">
+<input type="hidden" name="formModalMsgUsuarioLogado" value="formModalMsgUsuarioLogado" />
+<span>Usuário já logado em outra sessão. Deseja encerrar a outra sessão?</span>
+<input type="submit" id="{INVALIDATE_BUTTON}" name="{INVALIDATE_BUTTON}" value="Sim" />
+<input type="hidden" name="javax.faces.ViewState" value="{view_id}" />
+</form>
+</div>"""
+    return _page('Login', login_box, message, '', modal_html)
+
+
+def _format_total(total):
+    return f"{total:,}".replace(',', '.')
+
+
+def render_listing_page(view_id, user, projects, page, filter_text, page_size=PAGE_SIZE, page_sizes=None):
+    total = len(projects)
+    pages = max(1, (total + page_size - 1) // page_size)
+    page = min(max(page, 0), pages - 1)
+    shown = projects[page * page_size:(page + 1) * page_size]
+
+    rows = []
+    for index, project in enumerate(shown):
+        lupa = f"{LISTING_FORM}:tabela:{index}:lupa"
+        rows.append(f"""<tr class="rich-table-row">
+<td class="rich-table-cell"><label>{_esc(project['caae'])}</label></td>
+<td class="rich-table-cell">{_esc(project['titulo'])}</td>
+<td class="rich-table-cell">{_esc(project['pesquisador'])}</td>
+<td class="rich-table-cell">{_esc(project['versao'])}</td>
+<td class="rich-table-cell">{_esc(INSTITUICAO)}</td>
+<td class="rich-table-cell">{_esc(project['situacao'])}</td>
+<td class="rich-table-cell">Pesquisador</td>
+<td class="rich-table-cell">{_esc(project['ultima_atualizacao'])}</td>
+<td class="rich-table-cell">{_esc(project['tramites'][-1][1] if project['tramites'] else '')}</td>
+<td class="rich-table-cell"><a href="#" id="{lupa}" onclick="{_esc(_jsf_link_onclick(LISTING_FORM, lupa))}"><img src="/imagens/lupa.png" alt="Detalhar" /></a></td>
+</tr>""")
+
+    def scroller_cell(label, action, enabled):
+        if not enabled:
+            return f'<td class="rich-datascr-button-dsbld">{label}</td>'
+        onclick = f"Event.fire(this, 'rich:datascroller:onscroll', {{'page': '{action}'}});"
+        return f'<td class="rich-datascr-button" onclick="{_esc(onclick)}">{label}</td>'
+
+    first = page * page_size + 1 if total else 0
+    last = page * page_size + len(shown)
+    scroller = f"""<div class="rich-datascr" id="{SCROLLER_ID}"><table class="rich-dtascroller-table"><tbody><tr>
+<td class="rich-datascr-info">Página {page + 1} de {pages} ({first} a {last} de {_format_total(total)} registro(s))</td>
+{scroller_cell('««', 'first', page > 0)}
+{scroller_cell('«', 'fastrewind', page > 0)}
+{scroller_cell('‹', 'previous', page > 0)}
+<td class="rich-datascr-act">{page + 1}</td>
+{scroller_cell('›', 'next', page < pages - 1)}
+{scroller_cell('»', 'fastforward', page < pages - 1)}
+{scroller_cell('»»', 'last', page < pages - 1)}
+</tr></tbody></table></div>"""
+
+    search_onkeypress = f"if (event.keyCode == 13) {{ {_a4j_submit(LISTING_FORM, SEARCH_BUTTON)}; return false; }}"
+    page_size_select = ''
+    if page_sizes:
+        options = ''.join(f'<option value="{size}"{SELECTED if size == page_size else ""}>{size}</option>'
+                          for size in page_sizes)
+        page_size_select = (f'<tr><td><label for="{PAGE_SIZE_SELECT}">Registros por página:</label>'
+                            f'<select id="{PAGE_SIZE_SELECT}" name="{PAGE_SIZE_SELECT}" size="1" '
+                            f'onchange="{_esc(_a4j_submit(LISTING_FORM, PAGE_SIZE_SUPPORT))}">{options}</select></td></tr>')
+    content = f"""<form id="{LISTING_FORM}" name="{LISTING_FORM}" method="post" action="{LISTING_PATH}" enctype="application/x-www-form-urlencoded">
+<input type="hidden" name="{LISTING_FORM}" value="{LISTING_FORM}" />
+<div><span>Pesquisar Projetos</span></div>
+<div><div><span>Filtros</span></div><div>
+<table><tbody><tr><td><span>Filtro</span></td><td><table><tbody>
+<tr><td><label for="{SEARCH_INPUT}">CAAE:</label></td></tr>
+<tr><td><input type="text" id="{SEARCH_INPUT}" name="{SEARCH_INPUT}" value="{_esc(filter_text)}" onkeypress="{_esc(search_onkeypress)}" /></td></tr>
+</tbody></table></td></tr></tbody></table>
+<table><tbody>{page_size_select}<tr><td><input type="button" id="{SEARCH_BUTTON}" name="{SEARCH_BUTTON}" value="Pesquisar" onclick="{_esc(_a4j_submit(LISTING_FORM, SEARCH_BUTTON))}" /></td></tr></tbody></table>
+</div></div>
+<div><div><span>Projetos</span></div><div>
+<table id="{LISTING_FORM}:tabela" class="rich-table">
+<thead><tr><th>CAAE</th><th>Título</th><th>Pesquisador Responsável</th><th>Versão</th><th>Instituição</th><th>Situação</th><th>Perfil</th><th>Última Modificação</th><th>Submissão</th><th>Ações</th></tr></thead>
+<tbody id="{LISTING_FORM}:tabela:tb">{''.join(rows)}</tbody>
+<tfoot><tr><td colspan="10">{scroller}</td></tr></tfoot>
+</table>
+</div></div>
+<input type="hidden" name="javax.faces.ViewState" id="javax.faces.ViewState" value="{view_id}" />
+</form>"""
+    return _page('Gerir Pesquisa', '<div></div>', _welcome(user), content)
+
+
+def render_detail_page(view_id, user, project):
+    voltar = f"""<div><span>Detalhar Projeto de Pesquisa</span></div>
+<div><form id="formVoltar" name="formVoltar" method="post" action="{LISTING_PATH}">
+<input type="hidden" name="formVoltar" value="formVoltar" />
+<a href="#" id="formVoltar:imprimir" onclick="window.print();return false">Imprimir</a>
+<a href="#" id="{VOLTAR_LINK}" onclick="{_esc(_jsf_link_onclick('formVoltar', VOLTAR_LINK))}">Voltar</a>
+<input type="hidden" name="javax.faces.ViewState" value="{view_id}" />
+</form></div>"""
+    # The scrapers read the title from td.text-top, the PI from td #6 and the CAAE from td #15
+    fields = [
+        f'Título da Pesquisa: "{project["titulo"]}"',
+        'Área Temática:',
+        f'Versão: {project["versao"]}',
+        f'Instituição Proponente: {INSTITUICAO}',
+        'Patrocinador Principal: Financiamento Próprio',
+        f'Situação da Versão do Projeto: {project["situacao"]}',
+        f'Pesquisador Responsável: {project["pesquisador"]}',
+        'Localização atual da Versão do Projeto: CEP',
+        f'Data de Submissão do Projeto: {project["tramites"][-1][1] if project["tramites"] else ""}',
+        f'Última Modificação: {project["ultima_atualizacao"]}',
+        'Fase: Não se aplica',
+        f'Comitê de Ética: {INSTITUICAO}',
+        'Equipe de Pesquisa:',
+        'Instituição Coparticipante:',
+        'Tipo de Estudo: Observacional',
+        f'CAAE: {project["caae"]}',
+    ]
+    cells = ''.join(f'<tr><td{TEXT_TOP if i == 0 else ""}>{_esc(text)}</td></tr>' for i, text in enumerate(fields))
+    tramite_rows = ''.join(
+        '<tr>' + ''.join(f'<td><span>{_esc(value)}</span></td>' for value in row) + '</tr>'
+        for row in project['tramites'])
+    content = f"""<form id="formDetalharProjeto" name="formDetalharProjeto" method="post" action="{LISTING_PATH}">
+<table class="dadosProjeto"><tbody>{cells}</tbody></table>
+<table id="formDetalharProjeto:tableTramiteApreciacaoProjeto" class="rich-table">
+<thead><tr><th>Apreciação</th><th>Data/Hora</th><th>Tipo Trâmite</th><th>Versão</th><th>Perfil</th><th>Origem</th><th>Destino</th><th>Informações</th></tr></thead>
+<tbody id="formDetalharProjeto:tableTramiteApreciacaoProjeto:tb">{tramite_rows}</tbody>
+</table>
+</form>"""
+    return _page('Detalhar Projeto', voltar, _welcome(user), content)
+
+
+TEXT_TOP = ' class="text-top"'
+SELECTED = ' selected="selected"'
+
+
+def render_view_expired_page():
+    return _page('Erro', '<div></div>', 'A sessão expirou ou a página não é mais válida (ViewExpiredException).', '')
+
+
+# --- HTTP handling ---
+
+def make_handler(app):
+    """Returns a BaseHTTPRequestHandler class bound to the FakePlataformaBrasil `app`."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass # Keep test output quiet
+
+        # -- helpers --
+        def _session(self):
+            cookies = {}
+            for part in self.headers.get('Cookie', '').split(';'):
+                if '=' in part:
+                    name, value = part.strip().split('=', 1)
+                    cookies[name] = value
+            session_id = cookies.get('JSESSIONID')
+            if session_id not in app.sessions:
+                session_id = uuid.uuid4().hex.upper()
+                app.sessions[session_id] = {'user': None, 'views': collections.OrderedDict(), 'pending_login': None}
+            return session_id, app.sessions[session_id]
+
+        def _send(self, status, body='', session_id=None, location=None):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=UTF-8')
+            self.send_header('Content-Length', str(len(data)))
+            if session_id:
+                self.send_header('Set-Cookie', f'JSESSIONID={session_id}; Path=/; HttpOnly')
+            if location:
+                self.send_header('Location', location)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _form(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8')
+            return {k: v[-1] for k, v in urllib.parse.parse_qs(body, keep_blank_values=True).items()}
+
+        def _render_listing(self, session_id, session, view):
+            projects = app.filtered_projects(view['filter'])
+            pages = max(1, (len(projects) + view['page_size'] - 1) // view['page_size'])
+            view['page'] = min(max(view['page'], 0), pages - 1)
+            view_id = app.new_view(session, view)
+            self._send(200, render_listing_page(view_id, session['user'], projects, view['page'], view['filter'],
+                                                view['page_size'], app.page_sizes), session_id)
+
+        def _simulate(self, path):
+            """Applies the configured latency and, for some requests, an injected failure. Returns True if it answered."""
+            delay = app.response_delay()
+            if delay:
+                time.sleep(delay)
+            failure = app.draw_failure(path)
+            if failure == 'status':
+                self._send(app.error_status, 'Service Unavailable')
+            elif failure == 'view_expired':
+                self._send(200, render_view_expired_page())
+            elif failure == 'drop':
+                self.close_connection = True
+            return failure is not None
+
+        # -- verbs --
+        def do_GET(self):
+            path = urllib.parse.urlsplit(self.path).path
+            if self._simulate(path):
+                return
+            with app.lock:
+                app.request_counts[('GET', path)] += 1
+                session_id, session = self._session()
+                if path in ('/', LOGIN_PATH):
+                    if session['user']:
+                        return self._send(302, '', session_id, location=LISTING_PATH)
+                    view_id = app.new_view(session, {'name': 'login'})
+                    return self._send(200, render_login_page(view_id), session_id)
+                if path == LISTING_PATH:
+                    if not session['user']:
+                        return self._send(302, '', session_id, location=LOGIN_PATH)
+                    return self._render_listing(session_id, session, {'name': 'listing', 'filter': '', 'page': 0, 'page_size': PAGE_SIZE})
+                return self._send(404, 'Not Found', session_id)
+
+        def do_POST(self):
+            path = urllib.parse.urlsplit(self.path).path
+            form = self._form()
+            if self._simulate(path):
+                return
+            with app.lock:
+                app.request_counts[('POST', path)] += 1
+                session_id, session = self._session()
+                if path == LOGIN_PATH:
+                    return self._post_login(session_id, session, form)
+                if path == LISTING_PATH:
+                    if not session['user']:
+                        return self._send(302, '', session_id, location=LOGIN_PATH)
+                    view = session['views'].get(form.get('javax.faces.ViewState'))
+                    if view is None:
+                        return self._send(200, render_view_expired_page(), session_id)
+                    return self._post_listing(session_id, session, view, form)
+                return self._send(404, 'Not Found', session_id)
+
+        def _post_login(self, session_id, session, form):
+            if INVALIDATE_BUTTON in form and session['pending_login']:
+                other = app.active_session_of(session['pending_login'], exclude=session_id)
+                if other:
+                    app.sessions[other]['user'] = None # The other session is logged out
+                session['user'], session['pending_login'] = session['pending_login'], None
+                return self._send(302, '', session_id, location=LISTING_PATH)
+
+            email, senha = form.get('j_id19:email', ''), form.get('j_id19:senha', '')
+            if app.users.get(email) != senha or 'j_id19:j_id25' not in form:
+                view_id = app.new_view(session, {'name': 'login'})
+                return self._send(200, render_login_page(view_id, 'Usuário ou senha inválidos.'), session_id)
+            if app.active_session_of(email, exclude=session_id):
+                session['pending_login'] = email
+                view_id = app.new_view(session, {'name': 'login'})
+                return self._send(200, render_login_page(view_id, modal=True), session_id)
+            session['user'] = email
+            return self._send(302, '', session_id, location=LISTING_PATH)
+
+        def _post_listing(self, session_id, session, view, form):
+            if view['name'] == 'detail':
+                if VOLTAR_LINK in form:
+                    return self._render_listing(session_id, session, dict(view['back']))
+                return self._send(200, render_view_expired_page(), session_id)
+
+            view = dict(view)
+            if SEARCH_BUTTON in form:
+                view['filter'] = form.get(SEARCH_INPUT, '').strip()
+                view['page'] = 0
+                return self._render_listing(session_id, session, view)
+            if PAGE_SIZE_SUPPORT in form and app.page_sizes:
+                size = int(form.get(PAGE_SIZE_SELECT, PAGE_SIZE))
+                view['page_size'] = size if size in app.page_sizes else PAGE_SIZE
+                view['page'] = 0
+                return self._render_listing(session_id, session, view)
+            if SCROLLER_ID in form:
+                action = form[SCROLLER_ID]
+                pages = max(1, (len(app.filtered_projects(view['filter'])) + view['page_size'] - 1) // view['page_size'])
+                view['page'] = {
+                    'first': 0, 'last': pages - 1,
+                    'previous': view['page'] - 1, 'next': view['page'] + 1,
+                    'fastrewind': view['page'] - 5, 'fastforward': view['page'] + 5,
+                }.get(action, int(action) - 1 if action.isdigit() else view['page'])
+                return self._render_listing(session_id, session, view)
+            for name in form:
+                if name.startswith(f'{LISTING_FORM}:tabela:') and name.endswith(':lupa'):
+                    index = int(name.split(':')[2])
+                    size = view['page_size']
+                    shown = app.filtered_projects(view['filter'])[view['page'] * size:(view['page'] + 1) * size]
+                    if index >= len(shown):
+                        return self._send(200, render_view_expired_page(), session_id)
+                    project = shown[index]
+                    view_id = app.new_view(session, {'name': 'detail', 'caae': project['caae'], 'back': view})
+                    return self._send(200, render_detail_page(view_id, session['user'], project), session_id)
+            return self._render_listing(session_id, session, view) # Plain postback re-renders the view
+
+    return Handler
+
+
+def serve_in_thread(app, host='127.0.0.1', port=0):
+    """Starts the stand-in server in a daemon thread. Returns (server, base_url)."""
+    server = http.server.ThreadingHTTPServer((host, port), make_handler(app))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='fake-plataforma', daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m pb.fake_plataforma', description="Local Plataforma Brasil simulator.")
+    parser.add_argument('port', nargs='?', type=int, default=8080)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--projects', type=int, default=87, help="Number of projects in the listing (default 87).")
+    parser.add_argument('--max-tramites', type=int, default=12, help="Longest trâmite history (default 12).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--page-sizes', help="Rows-per-page options of the listing, e.g. 10,50,100 (default: no select).")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Delay added to every response.")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Uniform +/- variation of the delay.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of listing requests that fail (0-1).")
+    parser.add_argument('--error-kinds', default=','.join(ERROR_KINDS), help="Failures to inject: status, view_expired, drop.")
+    parser.add_argument('--error-status', type=int, default=503, help="HTTP status of the 'status' failures (default 503).")
+    parser.add_argument('--user', default='pesquisador@example.org')
+    parser.add_argument('--password', default='senha')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    app = FakePlataformaBrasil(
+        generate_projects(args.projects, max_tramites=args.max_tramites, seed=args.seed), users={args.user: args.password},
+        page_sizes=tuple(int(size) for size in args.page_sizes.split(',')) if args.page_sizes else None,
+        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+        error_kinds=[kind for kind in args.error_kinds.split(',') if kind], error_status=args.error_status, seed=args.seed)
+    server = http.server.ThreadingHTTPServer((args.host, args.port), make_handler(app))
+    print(f"Plataforma Brasil stand-in listening on http://{args.host}:{args.port}{LOGIN_PATH} (user {args.user} / {args.password})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Persistent per-CAAE fingerprint index of the project listing.
+
+The listing already shows, for every project, columns such as situation, version and
+last update. Their fingerprint changes whenever the project moves, so a details page
+only needs to be opened for CAAEs that are new, whose fingerprint changed since their
+details were last fetched, or whose last fetch is older than the forced-refresh age.
+Everything else can reuse the record stored by the previous run.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_INDEX_PATH = "fingerprints.json"
+DEFAULT_FORCE_REFRESH = datetime.timedelta(days=7)
+
+
+def row_fingerprint(columns):
+    """Returns a stable hash of the listing columns of one project."""
+    return hashlib.sha1('\x1f'.join(columns).encode('utf-8')).hexdigest()
+
+
+class FingerprintIndex:
+    """
+    {caae: {'fingerprint', 'columns', 'last_fetch', 'last_seen'}} stored as JSON.
+    'last_fetch' is when the details page was last fetched successfully with that fingerprint.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.entries = json.load(f)
+                logger.info(f"Loaded fingerprint index with {len(self.entries)} CAAEs from '{path}'.")
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read fingerprint index '{path}': {e}. Every CAAE will be fetched.", exc_info=True)
+                self.entries = {}
+
+    def plan(self, caae_list, listing_rows, known_caaes, now, force_refresh=DEFAULT_FORCE_REFRESH, refresh_ages=None):
+        """
+        Splits `caae_list` into (to_fetch, to_reuse), both in input order.
+        `listing_rows` maps CAAE -> listing columns; `known_caaes` are the CAAEs that have a
+        stored record to reuse. Returns also {caae: reason} for the CAAEs to fetch.
+        `refresh_ages` optionally gives each CAAE a shorter refresh age than `force_refresh`
+        (pb.poll_schedule); zero fetches it at every run.
+        """
+        to_fetch, to_reuse, reasons = [], [], {}
+        for caae in caae_list:
+            entry = self.entries.get(caae)
+            columns = listing_rows.get(caae)
+            refresh_age = min(refresh_ages.get(caae, force_refresh), force_refresh) if refresh_ages else force_refresh
+            if columns is None:
+                reason = 'no listing columns'
+            elif entry is None:
+                reason = 'new'
+            elif caae not in known_caaes:
+                reason = 'no stored record'
+            elif entry['fingerprint'] != row_fingerprint(columns):
+                reason = 'listing changed'
+            elif not refresh_age:
+                reason = 'active study'
+            elif now - datetime.datetime.fromisoformat(entry['last_fetch']) >= refresh_age:
+                reason = 'refresh age expired' if refresh_age == force_refresh else f'poll interval of {refresh_age} elapsed'
+            else:
+                reason = None
+
+            if reason:
+                to_fetch.append(caae)
+                reasons[caae] = reason
+            else:
+                to_reuse.append(caae)
+                entry['last_seen'] = now.isoformat()
+        return to_fetch, to_reuse, reasons
+
+    def record_fetch(self, caae, columns, now):
+        """Stores the listing columns seen when the details of `caae` were fetched successfully."""
+        if columns is None:
+            return
+        self.entries[caae] = {
+            'fingerprint': row_fingerprint(columns),
+            'columns': columns,
+            'last_fetch': now.isoformat(),
+            'last_seen': now.isoformat(),
+        }
+
+    def save(self):
+        """Writes the index atomically, so an interrupted run cannot leave a truncated file."""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        logger.info(f"Saved fingerprint index with {len(self.entries)} CAAEs to '{self.path}'.")
@@ -0,0 +1,359 @@
+"""
+Browserless engine for Plataforma Brasil.
+
+Logs in and replays the JSF/RichFaces form posts that the browser would send, over a
+pooled `requests` session: the `j_id19` login form (and the "usuário já logado" modal),
+the datascroller pagination and the CAAE search of `gerirPesquisaAgrupador.jsf`, and
+the "lupa" command link that opens the project details page. Component ids are not
+hard-coded: they are read from the forms and from the `A4J.AJAX.Submit`, `Event.fire`
+and `jsfcljs` handlers in the page, together with the current `javax.faces.ViewState`.
+
+The records returned by `fetch_caae_details` are built by page_parsing, exactly like
+the ones returned by pb.browser.process_caae_details, so both engines can be mixed freely.
+"""
+import datetime
+import logging
+import re
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup
+from .page_parsing import (DEFAULT_INSTITUTION_CODE, DEFAULT_PARSER, count_listing_rows, extract_listing_rows,
+                          find_page_size_select, institution_filter, listing_page_count, parse_caae_details,
+                          parse_total_records)
+from .session_cache import http_session_cookies, restore_http_session
+from .spans import SERVER, default_spans as spans
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_BASE_URL = "https://plataformabrasil.saude.gov.br"
+LOGIN_PATH = "/login.jsf"
+LISTING_PATH = "/visao/pesquisador/gerirPesquisa/gerirPesquisaAgrupador.jsf"
+VIEW_STATE_FIELD = 'javax.faces.ViewState'
+LOGIN_FORM_ID = 'j_id19'
+SESSION_MODAL_FORM_ID = 'formModalMsgUsuarioLogado'
+USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/124.0 Safari/537.36")
+
+
+class PlataformaBrasilError(Exception):
+    """Base class for errors raised by the HTTP engine."""
+
+
+class SessionExpiredError(PlataformaBrasilError):
+    """The server answered with the login page: the session is no longer authenticated."""
+
+
+class ViewExpiredError(PlataformaBrasilError):
+    """The server no longer knows the ViewState that was posted."""
+
+
+def jsf_parameters(handler):
+    """
+    Returns the request parameters embedded in a JSF/RichFaces event handler, e.g.
+    {'form:tabela:0:lupa': 'form:tabela:0:lupa'} from a jsfcljs(...) command link, or the
+    'parameters' map of an A4J.AJAX.Submit(...) call.
+    """
+    if not handler:
+        return {}
+    match = re.search(r"'parameters':\{([^}]*)\}", handler) or re.search(r"jsfcljs\([^,]+,\{([^}]*)\}", handler)
+    if not match:
+        return {}
+    return dict(re.findall(r"'([^']*)':'([^']*)'", match.group(1)))
+
+
+def form_fields(form):
+    """Returns the successful controls of a <form> as {name: value}, without buttons."""
+    fields = {}
+    for element in form.find_all(['input', 'select', 'textarea']):
+        name = element.get('name')
+        if not name:
+            continue
+        if element.name == 'input':
+            input_type = (element.get('type') or 'text').lower()
+            if input_type in ('submit', 'button', 'image', 'reset', 'file'):
+                continue
+            if input_type in ('checkbox', 'radio') and not element.has_attr('checked'):
+                continue
+            fields[name] = element.get('value', 'on' if input_type in ('checkbox', 'radio') else '')
+        elif element.name == 'select':
+            selected = element.find('option', selected=True) or element.find('option')
+            fields[name] = selected.get('value', selected.text) if selected else ''
+        else:
+            fields[name] = element.text
+    return fields
+
+
+class PlataformaBrasilHttpClient:
+    """
+    One JSF conversation with Plataforma Brasil over a pooled HTTP session.
+    Not thread-safe: use `clone()` to give each worker its own client sharing the login.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, timeout=60, pool_size=4,
+                 institution_code=DEFAULT_INSTITUTION_CODE, parser=DEFAULT_PARSER):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.institution_code = institution_code
+        self.parser = parser
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                                                allowed_methods=frozenset(['GET'])))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-Agent'] = USER_AGENT
+        self._listing = None # {'action', 'fields', 'search_input', 'search_params', 'scroller_id'}
+
+    # --- Low-level requests ---
+
+    def _url(self, path_or_url):
+        return urllib.parse.urljoin(self.base_url + '/', path_or_url)
+
+    def _request(self, method, path_or_url, data=None, expect_login=True):
+        with spans.span(f'http.{method.lower()}', SERVER): # Time spent waiting on the server, apart from the steps
+            response = self.session.request(method, self._url(path_or_url), data=data, timeout=self.timeout)
+        response.raise_for_status()
+        soup = BeautifulSoup(response.text, self.parser)
+        if expect_login and soup.find('form', id=LOGIN_FORM_ID):
+            raise SessionExpiredError(f"Redirected to the login page while requesting {path_or_url}.")
+        if 'ViewExpired' in response.text:
+            raise ViewExpiredError(f"ViewState no longer valid for {path_or_url}.")
+        return response, soup
+
+    # --- Login ---
+
+    def login(self, email, password):
+        """Logs in through the j_id19 form, confirming the "usuário já logado" modal if shown. Returns True on success."""
+        logger.info("HTTP engine: logging in to Plataforma Brasil...")
+        try:
+            _, soup = self._request('GET', LOGIN_PATH, expect_login=False)
+            form = soup.find('form', id=LOGIN_FORM_ID)
+            if form is None:
+                logger.error("HTTP engine: login form 'j_id19' not found on the login page.")
+                return False
+            fields = form_fields(form)
+            fields[f'{LOGIN_FORM_ID}:email'] = email
+            fields[f'{LOGIN_FORM_ID}:senha'] = password
+            submit = form.find('input', type='submit')
+            if submit is not None and submit.get('name'):
+                fields[submit['name']] = submit.get('value', '')
+            _, soup = self._request('POST', form.get('action') or LOGIN_PATH, data=fields, expect_login=False)
+
+            modal = soup.find('form', id=SESSION_MODAL_FORM_ID)
+            if modal is not None:
+                logger.info("HTTP engine: 'usuário já logado' modal shown; invalidating the other session.")
+                fields = form_fields(modal)
+                button = modal.find('input', id=re.compile('idBotaoInvalidarUsuarioLogado'))
+                if button is not None:
+                    fields[button['name']] = button.get('value', '')
+                _, soup = self._request('POST', modal.get('action') or LOGIN_PATH, data=fields, expect_login=False)
+
+            if soup.find('form', id=LOGIN_FORM_ID):
+                logger.error("HTTP engine: login failed (still on the login page).")
+                return False
+            self._absorb_listing(soup)
+            logger.info("HTTP engine: login realizado com sucesso.")
+            return True
+        except (requests.RequestException, PlataformaBrasilError) as e:
+            logger.error(f"HTTP engine: error during login: {e}", exc_info=True)
+            return False
+
+    def restore_session(self, cookies):
+        """Adopts the cookies of a cached session. Returns True if they still open the project listing."""
+        restore_http_session(self.session, cookies)
+        try:
+            self._load_listing()
+            return True
+        except (requests.RequestException, PlataformaBrasilError) as e:
+            logger.info(f"HTTP engine: cached session not usable ({e}).")
+            self.session.cookies.clear()
+            self._listing = None
+            return False
+
+    def cookies(self):
+        """Returns the session cookies as Selenium cookie dicts, for the session cache."""
+        return http_session_cookies(self.session)
+
+    def clone(self):
+        """Returns a new client that shares this client's authenticated cookies."""
+        other = PlataformaBrasilHttpClient(self.base_url, self.timeout, self.pool_size,
+                                           self.institution_code, self.parser)
+        other.session.cookies.update(self.session.cookies)
+        return other
+
+    def close(self):
+        self.session.close()
+
+    # --- Listing state ---
+
+    def _absorb_listing(self, soup):
+        """Updates the listing form state from a (full or partial) listing response."""
+        scroller = soup.find('div', class_='rich-datascr')
+        search_input = None
+        for candidate in soup.find_all('input', type='text'):
+            if 'A4J.AJAX.Submit' in (candidate.get('onkeypress') or ''):
+                search_input = candidate
+                break
+        form = search_input.find_parent('form') if search_input is not None else (
+            scroller.find_parent('form') if scroller is not None else None)
+
+        if form is not None:
+            self._listing = {
+                'action': form.get('action') or LISTING_PATH,
+                'fields': form_fields(form),
+                'search_input': search_input.get('name') if search_input is not None else None,
+                'search_params': jsf_parameters(search_input.get('onkeypress')) if search_input is not None else {},
+                'scroller_id': scroller.get('id') if scroller is not None else None,
+            }
+        elif self._listing is not None:
+            # RichFaces partial responses carry the new ViewState without the whole form
+            view_state = soup.find('input', attrs={'name': VIEW_STATE_FIELD})
+            if view_state is not None:
+                self._listing['fields'][VIEW_STATE_FIELD] = view_state.get('value', '')
+
+    def _load_listing(self):
+        _, soup = self._request('GET', LISTING_PATH)
+        self._absorb_listing(soup)
+        if self._listing is None:
+            raise PlataformaBrasilError("Project listing form not found on gerirPesquisaAgrupador.jsf.")
+        return soup
+
+    def _post_listing(self, params, ajax=True):
+        if self._listing is None:
+            self._load_listing()
+        data = dict(self._listing['fields'])
+        if ajax:
+            data['AJAXREQUEST'] = '_viewRoot'
+        data.update(params)
+        response, soup = self._request('POST', self._listing['action'], data=data)
+        return response, soup
+
+    # --- Public operations ---
+
+    def _select_largest_page_size(self, soup):
+        """Switches the listing to its largest rows-per-page option, if it has one. Returns the current listing soup."""
+        page_size = find_page_size_select(soup)
+        if page_size is None or page_size['selected'] == max(page_size['sizes']):
+            return soup
+        params = {page_size['name']: str(max(page_size['sizes']))}
+        params.update(jsf_parameters(page_size['onchange']))
+        _, soup = self._post_listing(params)
+        self._absorb_listing(soup)
+        logger.info(f"HTTP engine: listing page size set to {max(page_size['sizes'])}.")
+        return soup
+
+    def _search_listing(self, text):
+        search = {self._listing['search_input']: text}
+        search.update(self._listing['search_params'])
+        response, soup = self._post_listing(search)
+        self._absorb_listing(soup)
+        return response.text, soup
+
+    def _filter_listing(self):
+        """
+        Searches the institution filter so the server lists only our projects. If the
+        server does not honor it (rows of other institutions, or no rows), the search is
+        cleared again. Returns (filtered, html, soup) of the first listing page.
+        """
+        html, soup = self._search_listing(institution_filter(self.institution_code))
+        rows = count_listing_rows(html, self.parser)
+        if rows and rows == len(extract_listing_rows(html, self.institution_code, self.parser)):
+            return True, html, soup
+        logger.warning("HTTP engine: the listing search did not filter by institution; walking the full listing.")
+        html, soup = self._search_listing('')
+        return False, html, soup
+
+    def list_caaes(self, listing_rows=None):
+        """
+        Lists the sorted unique CAAEs of the configured institution. The institution is
+        filtered on the server and the largest page size is used when available, so only
+        our own projects are paged through; pages are requested by number.
+        If `listing_rows` is a dict, it is filled with {caae: listing columns}.
+        """
+        soup = self._select_largest_page_size(self._load_listing())
+        if self._listing.get('search_input'):
+            filtered, html, soup = self._filter_listing()
+        else:
+            filtered, html = False, str(soup)
+        scroller_table = soup.find('table', class_='rich-dtascroller-table')
+        total = parse_total_records(scroller_table.text) if scroller_table is not None else None
+        if total is None:
+            logger.error("HTTP engine: could not read the total number of records from the listing.")
+            return []
+        pages = listing_page_count(total, count_listing_rows(html, self.parser))
+        logger.info(f"HTTP engine: total records {total}{' (filtered by institution)' if filtered else ''}, pages to iterate: {pages}")
+
+        caaes = []
+        for page in range(1, pages + 1):
+            with spans.span('listing.page'):
+                if page > 1:
+                    if not self._listing.get('scroller_id'):
+                        logger.error("HTTP engine: datascroller not found; stopping pagination.")
+                        break
+                    scroller_id = self._listing['scroller_id']
+                    response, soup = self._post_listing({scroller_id: str(page), 'ajaxSingle': scroller_id})
+                    self._absorb_listing(soup)
+                    html = response.text
+                found = extract_listing_rows(html, self.institution_code, self.parser)
+            caaes.extend(row['caae'] for row in found)
+            if listing_rows is not None:
+                listing_rows.update((row['caae'], row['columns']) for row in found)
+            logger.info(f"HTTP engine: found {len(found)} CAAEs containing '{self.institution_code}' on page {page}.")
+        unique_caaes = sorted(set(caaes))
+        logger.info(f"HTTP engine: total unique CAAEs extracted: {len(unique_caaes)}")
+        return unique_caaes
+
+    def _lupa_parameters(self, soup, caae_number):
+        for label in soup.find_all('label'):
+            if label.text.strip() == caae_number:
+                row = label.find_parent('tr')
+                for link in row.find_all('a') if row is not None else []:
+                    params = jsf_parameters(link.get('onclick'))
+                    if params:
+                        return params
+        return None
+
+    def fetch_caae_details(self, caae_number, timezone_obj=None):
+        """
+        Searches for `caae_number`, opens its details page and returns
+        {'caae', 'details', 'processing_time'}, or None if the CAAE could not be fetched.
+        Raises SessionExpiredError if the session is no longer logged in.
+        """
+        t1 = datetime.datetime.now(timezone_obj)
+        for attempt in range(2):
+            try:
+                with spans.span('caae.search'):
+                    if self._listing is None or not self._listing.get('search_input'):
+                        self._load_listing()
+                    search = {self._listing['search_input']: caae_number}
+                    search.update(self._listing['search_params'])
+                    _, soup = self._post_listing(search)
+                    self._absorb_listing(soup)
+
+                lupa = self._lupa_parameters(soup, caae_number)
+                if lupa is None:
+                    logger.error(f"HTTP engine: CAAE {caae_number} not found in the search results.")
+                    return None
+                with spans.span('caae.lupa'): # No "voltar": the next search is posted from the listing view state
+                    response, _ = self._post_listing(lupa, ajax=False)
+                with spans.span('caae.parse'):
+                    details = parse_caae_details(response.text, self.parser)
+
+                processing_time = datetime.datetime.now(timezone_obj) - t1
+                logger.info(f"HTTP engine: successfully processed CAAE {caae_number} in {processing_time}.")
+                return {
+                    'caae': caae_number,
+                    'details': details,
+                    'processing_time': processing_time
+                }
+            except ViewExpiredError:
+                logger.warning(f"HTTP engine: view expired while processing CAAE {caae_number}; reloading the listing (attempt {attempt + 1}/2).")
+                self._listing = None
+            except requests.RequestException as e:
+                logger.warning(f"HTTP engine: request error for CAAE {caae_number}: {e} (attempt {attempt + 1}/2).")
+                self._listing = None
+        logger.error(f"HTTP engine: failed to process CAAE {caae_number}.")
+        return None
@@ -0,0 +1,98 @@
+"""
+The notification email listing the studies that changed.
+
+The studies are rendered as a size-bounded digest (pb.digest), whose messages go through the
+durable outbox (pb.outbox) and are then delivered over a single SMTP connection.
+"""
+import datetime
+import logging
+from .digest import DEFAULT_MAX_BYTES, OVERFLOW_PARTS, Digest, build_digest, message_size
+from .outbox import DEFAULT_MAX_ATTEMPTS, flush_outbox, idempotency_key, smtp_connection
+from .spans import default_spans as spans
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_SENDER = "regulatorios.aids@gmail.com"
+
+def email_paragraphs(num_updates, email_date_str, sent_at_str, duration, num_changed_rows=None):
+    """The (intro, footer) paragraphs of the notification email, as HTML."""
+    changed_rows_text = f" (<b>{num_changed_rows}</b> trâmites novos, alterados ou removidos)" if num_changed_rows is not None else ""
+    intro = ["Bom dia equipe,",
+             f"Abaixo os estudos que tiveram atualizações ou são novos na Plataforma Brasil no dia {email_date_str}.",
+             f"Houve alteração ou inclusão em <b>{num_updates}</b> estudos{changed_rows_text}."]
+    footer = ["Este e-mail foi gerado automaticamente.",
+              f"Hora do envio: {sent_at_str}. Duração da execução do script: {str(duration).split('.')[0]}.",
+              "Um ótimo dia a todos e todas!"]
+    return intro, footer
+
+def render_email_body(num_updates, email_body_updates_html, email_date_str, sent_at_str, duration, num_changed_rows=None):
+    """Assembles the full HTML of a single-part notification email around the rendered study fragments."""
+    intro, footer = email_paragraphs(num_updates, email_date_str, sent_at_str, duration, num_changed_rows)
+    intro_html = ' \n        '.join(f"<p>{line}</p>" for line in intro)
+    footer_html = '\n        '.join(f"<p>{line}</p>" for line in footer)
+    full_email_body = f"""
+    <meta http-equiv="Content-Type" content="text/html; charset=utf-8"> 
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; }}
+            .study-details {{ border: 1px solid #ccc; padding: 10px; margin-bottom: 10px; background-color: #f9f9f9; }}
+            table {{ border-collapse: collapse; width: 100%; margin-top: 10px; }}
+            th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+            th {{ background-color: #f2f2f2; }}
+        </style>
+    </head>
+    <body>
+        {intro_html} 
+        <br/> 
+        {email_body_updates_html}
+        <br/> 
+        {footer_html}
+    </body>
+    </html>
+    """
+    return full_email_body
+
+def queue_notification_email(outbox, recipient_email, num_updates, digest_entries, script_start_time_obj, timezone_obj,
+                             sender_email_address=DEFAULT_SENDER, num_changed_rows=None, message_stats=None,
+                             institution=None, max_bytes=DEFAULT_MAX_BYTES, overflow=OVERFLOW_PARTS):
+    """
+    Builds the size-bounded digest of `digest_entries` (pb.digest) and enqueues its messages
+    in `outbox` (pb.outbox), to be sent by deliver_outbox. Returns their idempotency keys.
+    `num_changed_rows` is the count of trâmite rows that changed. Messages larger than
+    `max_bytes` are split into numbered parts, or zip the overflow when `overflow` is 'attachment'.
+    If `message_stats` is a dict, it is filled with the total size in bytes ('bytes') and the number of messages ('parts').
+    `institution` names the institution in the subject, when a run checks several of them.
+    """
+    logger.info(f"Preparing email to {recipient_email} for {num_updates} updates...")
+    
+    current_time = datetime.datetime.now(timezone_obj)
+    duration = current_time - script_start_time_obj # Duration of the script until this point
+    email_date_str = current_time.strftime('%d/%m/%Y')
+    current_datetime_str_for_email = current_time.strftime("%d/%m/%Y %H:%M:%S")
+
+    email_subject = f'Atualizações da Plataforma Brasil em {email_date_str}'
+    if institution:
+        email_subject += f' (instituição {institution})'
+    with spans.span('email.render'):
+        intro, footer = email_paragraphs(num_updates, email_date_str, current_datetime_str_for_email, duration, num_changed_rows)
+        digest = Digest(email_subject, sender_email_address, recipient_email, intro, footer)
+        messages = build_digest(digest, digest_entries, max_bytes, overflow)
+    if message_stats is not None:
+        message_stats['bytes'] = sum(message_size(msg) for msg in messages)
+        message_stats['parts'] = len(messages)
+    keys = [idempotency_key(msg) for msg in messages]
+    for msg in messages:
+        outbox.enqueue(msg)
+    return keys
+
+def deliver_outbox(outbox, email_app_password, sender_email_address=DEFAULT_SENDER, max_attempts=DEFAULT_MAX_ATTEMPTS, force=False):
+    """
+    Sends the due messages of `outbox` over one SMTP connection (every pending one with `force`).
+    Returns the FlushResult, or None if there is no password to log in with.
+    """
+    if not email_app_password:
+        logger.error("Email app password is not set (EMAIL_PASSWORD environment variable). Cannot send email.")
+        return None
+    return flush_outbox(outbox, lambda: smtp_connection(sender_email_address, email_app_password),
+                        max_attempts=max_attempts, force=force)
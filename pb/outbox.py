@@ -0,0 +1,245 @@
+"""
+Durable notification outbox: the scrape enqueues its rendered messages, a sender delivers them.
+
+Every message is written to the outbox directory (`<key>.eml`, and `<key>.json` with its
+delivery state) before the scrape commits its state, so an SMTP failure neither loses the
+notification nor costs another scrape: the next run, or `python -m pb outbox send`,
+delivers what is left.
+
+- The idempotency key of a message (KEY_HEADER, set by pb.digest from its recipient and
+  studies) is also its Message-ID. A key that is pending or was sent is not enqueued again;
+  sent keys are kept in `sent.jsonl` for SENT_RETENTION.
+- Due messages are sent over one reused SMTP connection, reconnecting once if the server
+  drops it. A message that fails is retried with exponential backoff (BASE_DELAY doubled at
+  every attempt, up to MAX_DELAY); after `max_attempts` it is moved to `failed/`.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import smtplib
+from email import policy
+from email.parser import BytesParser
+from .spans import default_spans as spans
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_OUTBOX_PATH = "outbox"
+DEFAULT_MAX_ATTEMPTS = 8
+BASE_DELAY = datetime.timedelta(minutes=1)
+MAX_DELAY = datetime.timedelta(hours=6)
+SENT_RETENTION = datetime.timedelta(days=30)
+KEY_HEADER = 'X-PB-Idempotency-Key'
+SMTP_HOST, SMTP_PORT = 'smtp.gmail.com', 587
+# Errors about one message (refused recipient or sender, rejected data): the others can still be sent
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def idempotency_key(msg):
+    """The key set by the digest (KEY_HEADER), or a hash of the whole message."""
+    return msg.get(KEY_HEADER) or hashlib.sha256(msg.as_bytes()).hexdigest()[:40]
+
+
+def message_id(key, sender):
+    """The Message-ID of the message with idempotency key `key`: receivers drop duplicates by it."""
+    return f"<{key}@{(sender or '').rpartition('@')[2] or 'pb'}>"
+
+
+def backoff_delay(attempts):
+    """How long a message waits after its `attempts`-th failed attempt."""
+    return min(BASE_DELAY * 2 ** (attempts - 1), MAX_DELAY)
+
+
+def _write_atomically(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class Outbox:
+    """The pending messages of the directory `path`, their delivery state and the keys already sent."""
+
+    def __init__(self, path=DEFAULT_OUTBOX_PATH):
+        self.path = path
+        self.failed_path = os.path.join(path, 'failed')
+        self.sent_path = os.path.join(path, 'sent.jsonl')
+
+    def _message_path(self, key, directory=None):
+        return os.path.join(directory or self.path, f"{key}.eml")
+
+    def _state_path(self, key, directory=None):
+        return os.path.join(directory or self.path, f"{key}.json")
+
+    def _save_state(self, state, directory=None):
+        _write_atomically(self._state_path(state['key'], directory),
+                          json.dumps(state, ensure_ascii=False, indent=1).encode('utf-8'))
+
+    def enqueue(self, msg, now=None):
+        """Writes `msg` durably. Returns its key, or None if the same message is pending or was already sent."""
+        now = now or _now()
+        os.makedirs(self.path, exist_ok=True)
+        key = idempotency_key(msg)
+        if os.path.exists(self._state_path(key)) or key in self.sent_keys():
+            logger.info(f"Outbox: mensagem {key} já está na fila ou foi enviada; ignorada.")
+            return None
+        if msg.get('Message-ID') is None:
+            msg['Message-ID'] = message_id(key, msg.get('From'))
+        _write_atomically(self._message_path(key), msg.as_bytes())
+        # The state is written last: a message is pending only once it is complete on disk
+        self._save_state({'key': key, 'to': msg.get('To'), 'subject': msg.get('Subject'), 'enqueued': now.isoformat(),
+                          'attempts': 0, 'next_attempt': now.isoformat(), 'last_error': None})
+        logger.info(f"Outbox: mensagem {key} enfileirada para {msg.get('To')} ({msg.get('Subject')}).")
+        return key
+
+    def pending(self):
+        """The states of the pending messages, oldest first."""
+        if not os.path.isdir(self.path):
+            return []
+        states = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.path, name), encoding='utf-8') as f:
+                    states.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.error(f"Outbox: could not read '{name}': {e}", exc_info=True)
+        return sorted(states, key=lambda state: (state['enqueued'], state['key']))
+
+    def due(self, now=None):
+        now = now or _now()
+        return [state for state in self.pending() if datetime.datetime.fromisoformat(state['next_attempt']) <= now]
+
+    def message(self, state):
+        with open(self._message_path(state['key']), 'rb') as f:
+            return BytesParser(policy=policy.SMTP).parse(f)
+
+    def sent_keys(self):
+        if not os.path.exists(self.sent_path):
+            return set()
+        with open(self.sent_path, encoding='utf-8') as f:
+            return {json.loads(line)['key'] for line in f if line.strip()}
+
+    def mark_sent(self, state, now=None):
+        now = now or _now()
+        with open(self.sent_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'key': state['key'], 'to': state['to'], 'subject': state['subject'],
+                                'sent': now.isoformat()}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(self._state_path(state['key']))
+        os.remove(self._message_path(state['key']))
+
+    def mark_failed(self, state, error, now=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Records a failed attempt. Returns True if the message gave up and was moved to failed/."""
+        now = now or _now()
+        state = dict(state, attempts=state['attempts'] + 1, last_error=str(error))
+        if state['attempts'] >= max_attempts:
+            os.makedirs(self.failed_path, exist_ok=True)
+            self._save_state(state, self.failed_path)
+            os.replace(self._message_path(state['key']), self._message_path(state['key'], self.failed_path))
+            os.remove(self._state_path(state['key']))
+            logger.error(f"Outbox: mensagem {state['key']} descartada após {state['attempts']} tentativas ({error}); "
+                         f"guardada em '{self.failed_path}'.")
+            return True
+        state['next_attempt'] = (now + backoff_delay(state['attempts'])).isoformat()
+        self._save_state(state)
+        return False
+
+    def prune_sent(self, now=None):
+        """Forgets the keys sent longer than SENT_RETENTION ago."""
+        if not os.path.exists(self.sent_path):
+            return
+        cutoff = (now or _now()) - SENT_RETENTION
+        with open(self.sent_path, encoding='utf-8') as f:
+            lines = [line for line in f if line.strip()]
+        kept = [line for line in lines if datetime.datetime.fromisoformat(json.loads(line)['sent']) >= cutoff]
+        if len(kept) < len(lines):
+            _write_atomically(self.sent_path, ''.join(kept).encode('utf-8'))
+
+
+class FlushResult:
+    """The keys sent, deferred (to be retried after the backoff) and given up by one flush."""
+
+    def __init__(self):
+        self.sent, self.deferred, self.dead = [], [], []
+
+    def summary(self, remaining):
+        return (f"Outbox: {len(self.sent)} mensagens enviadas, {len(self.deferred)} adiadas, "
+                f"{len(self.dead)} descartadas, {remaining} pendentes.")
+
+
+def smtp_connection(sender_email_address, email_app_password, host=SMTP_HOST, port=SMTP_PORT):
+    """An SMTP connection to the Gmail server, logged in as the sender."""
+    logger.info(f"Connecting to SMTP server: {host}:{port} for sender {sender_email_address}")
+    with spans.span('smtp.connect'):
+        connection = smtplib.SMTP(host, port)
+        connection.starttls()
+    logger.info(f"Logging into SMTP server as {sender_email_address}.")
+    with spans.span('smtp.login'):
+        connection.login(sender_email_address, email_app_password)
+    return connection
+
+
+def flush_outbox(outbox, connect, now=None, max_attempts=DEFAULT_MAX_ATTEMPTS, force=False):
+    """
+    Sends the due messages of `outbox` (every pending one with `force`) over one connection
+    opened by `connect()`. Returns a FlushResult.
+    """
+    now = now or _now()
+    states = outbox.pending() if force else outbox.due(now)
+    result = FlushResult()
+
+    def defer(state, error):
+        (result.dead if outbox.mark_failed(state, error, now, max_attempts) else result.deferred).append(state['key'])
+
+    connection = None
+    try:
+        for index, state in enumerate(states):
+            for reconnected in (False, True):
+                try:
+                    if connection is None:
+                        connection = connect()
+                    with spans.span('smtp.send'):
+                        connection.send_message(outbox.message(state))
+                except smtplib.SMTPAuthenticationError as e:
+                    logger.error(f"SMTP Authentication Error: {e}. Check email/password or app password settings.", exc_info=True)
+                    for pending_state in states[index:]:
+                        defer(pending_state, e)
+                    return result
+                except MESSAGE_ERRORS as e:
+                    logger.error(f"Outbox: mensagem {state['key']} recusada pelo servidor: {e}", exc_info=True)
+                    defer(state, e)
+                    break
+                except OSError as e: # Dropped connection, unreachable server, other SMTP errors
+                    connection = None
+                    if not reconnected:
+                        logger.warning(f"Outbox: conexão SMTP perdida ({e}); reconectando.")
+                        continue
+                    logger.error(f"Outbox: servidor SMTP indisponível: {e}", exc_info=True)
+                    for pending_state in states[index:]:
+                        defer(pending_state, e)
+                    return result
+                else:
+                    outbox.mark_sent(state, now)
+                    result.sent.append(state['key'])
+                    logger.info(f"Email sent successfully to {state['to']}: {state['subject']}.")
+                    break
+        return result
+    finally:
+        if connection is not None:
+            try:
+                connection.quit()
+            except (OSError, smtplib.SMTPException):
+                pass
+        outbox.prune_sent(now)
+        if states:
+            logger.info(result.summary(len(outbox.pending())))
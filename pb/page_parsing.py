@@ -0,0 +1,273 @@
+"""
+Parsing of Plataforma Brasil listing and details pages, shared by every engine.
+
+The Selenium scraper feeds `driver.page_source` into these functions and the HTTP
+engine feeds the responses it downloads, so both produce identical records and the
+comparison with the previous run does not depend on which engine collected the data.
+When the page is scripted in the browser (browser_extraction), only the raw texts are
+returned and the same `*_from_fields` functions turn them into rows and details.
+
+lxml is used as parser when it is installed, as it is several times faster than the
+pure-Python 'html.parser'. BeautifulSoup itself is only imported when a page is parsed,
+so importing this module (e.g. to render the notification) stays cheap.
+"""
+import importlib.util
+import re
+
+DEFAULT_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+TRAMITE_TABLE_ID = 'formDetalharProjeto:tableTramiteApreciacaoProjeto:tb'
+TRAMITE_COLUMNS = 8 # Apreciação, Data/Hora, Tipo Trâmite, Versão, Perfil, Origem, Destino, Informações
+TRAMITE_HEADERS = ('Apreciação', 'Data/Hora', 'Tipo Trâmite', 'Versão', 'Perfil', 'Origem', 'Destino', 'Informações')
+DEFAULT_INSTITUTION_CODE = '5262'
+LISTING_PAGE_SIZE = 10 # Default rows per page of the listing datascroller
+LISTING_ROW_CLASS = 'rich-table-row'
+
+
+def _soup(html, parser):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, parser)
+
+
+def parse_total_records(pagination_text):
+    """Returns the total number of records from the datascroller text ("... de 1.234 registro(s)"), or None."""
+    match = re.search(r'de ([\d\.]+) registro\(s\)', pagination_text)
+    if not match:
+        return None
+    return int(match.group(1).replace('.', ''))
+
+
+def institution_filter(institution_code=DEFAULT_INSTITUTION_CODE):
+    """
+    Text typed in the listing's CAAE search field to list only one institution's projects:
+    the institution code is the last segment of the CAAE (XXXXXXXX.X.XXXX.5262).
+    """
+    return f".{institution_code}"
+
+
+def listing_page_count(total_records, rows_per_page):
+    """Returns how many listing pages hold `total_records` rows (at least 1)."""
+    rows_per_page = rows_per_page or LISTING_PAGE_SIZE
+    return max(1, (total_records + rows_per_page - 1) // rows_per_page)
+
+
+def count_listing_rows(html, parser=DEFAULT_PARSER):
+    """Returns the number of project rows (whatever their institution) on a listing page."""
+    return len(_soup(html, parser).find_all('tr', class_=LISTING_ROW_CLASS))
+
+
+def find_page_size_select(soup):
+    """
+    Returns the rows-per-page <select> of the listing as {'name', 'sizes', 'selected', 'onchange'},
+    or None if the page has none. It is recognised as a select whose options are all numbers.
+    """
+    for select in soup.find_all('select'):
+        values = [option.get('value', option.text).strip() for option in select.find_all('option')]
+        if len(values) > 1 and all(value.isdigit() for value in values) and select.get('name'):
+            selected = select.find('option', selected=True) or select.find('option')
+            return {'name': select['name'], 'sizes': [int(value) for value in values],
+                    'selected': int(selected.get('value', selected.text).strip()), 'onchange': select.get('onchange')}
+    return None
+
+
+# Cells of a listing row: CAAE, Título, Pesquisador Responsável, Versão, Instituição, Situação,
+# Perfil, Última Modificação, Submissão, Ações (the lupa)
+LISTING_SITUATION_COLUMN = 5
+
+
+def listing_row_from_fields(label_text, cell_texts):
+    """
+    Builds a listing row from the text of its CAAE label and the texts of the cells of its
+    table row (None if the label is not in a row).
+    """
+    columns = [' '.join(text.split()) for text in cell_texts] if cell_texts is not None else []
+    return {'caae': label_text.strip().replace("\n", ""), 'columns': columns}
+
+
+def extract_listing_rows(html, institution_code=DEFAULT_INSTITUTION_CODE, parser=DEFAULT_PARSER):
+    """
+    Returns the listing rows whose CAAE label contains `institution_code`, in page order,
+    as dicts with 'caae' and 'columns' (the whitespace-normalised text of every cell in
+    the row, such as situation and last update).
+    """
+    soup = _soup(html, parser)
+    rows = []
+    for label in soup.find_all("label"):
+        if institution_code in label.text:
+            row = label.find_parent('tr')
+            cell_texts = [td.get_text(' ') for td in row.find_all('td')] if row is not None else None
+            rows.append(listing_row_from_fields(label.text, cell_texts))
+    return rows
+
+
+def extract_caaes_from_listing(html, institution_code=DEFAULT_INSTITUTION_CODE, parser=DEFAULT_PARSER):
+    """Returns the CAAE labels on a listing page that contain `institution_code`, in page order."""
+    return [row['caae'] for row in extract_listing_rows(html, institution_code, parser)]
+
+
+def details_from_fields(title_text, pi_cell_text, caae_cell_text, tramite_span_texts):
+    """
+    Builds the details dict from the raw texts of a details page: the "text-top" title
+    cell, the 7th and 16th td of the page (PI and CAAE) and the spans of the trâmite table
+    body. Any of them is None when missing from the page.
+    """
+    nome_estudo = title_text[21:].replace('"', "").strip() if title_text is not None else "Nome do estudo não encontrado"
+    pi_text = "Pesquisador Principal não encontrado"
+    if pi_cell_text is not None:
+        pi_text = pi_cell_text.replace("\n", "").strip()
+    caae_estudo = "CAAE não encontrado na página de detalhes"
+    if caae_cell_text is not None:
+        caae_estudo = caae_cell_text.replace("\n", "").replace("CAAE: ", "").strip()
+
+    tramites = None
+    if tramite_span_texts is not None:
+        spans = [text.strip() for text in tramite_span_texts]
+        tramites = [spans[x * TRAMITE_COLUMNS:(x + 1) * TRAMITE_COLUMNS] for x in range(len(spans) // TRAMITE_COLUMNS)]
+
+    return {'nome_estudo': nome_estudo, 'pi': pi_text, 'caae': caae_estudo, 'tramites': tramites}
+
+
+def parse_caae_details(html, parser=DEFAULT_PARSER):
+    """
+    Extracts the study title, PI, CAAE and trâmite rows from a project details page.
+    Returns a dict with 'nome_estudo', 'pi', 'caae' and 'tramites' (a list of 8-item lists,
+    or None if the page has no trâmite table).
+    """
+    soup = _soup(html, parser)
+
+    # Study name - td with class "text-top"
+    nome_estudo_td = soup.find('td', class_="text-top")
+    # PI and CAAE - fragile, based on the td index in the details page
+    all_tds = soup.find_all("td")
+    # Trâmite table - by id 'formDetalharProjeto:tableTramiteApreciacaoProjeto:tb'
+    tramite_table_body = soup.find(id=TRAMITE_TABLE_ID)
+
+    return details_from_fields(
+        nome_estudo_td.text if nome_estudo_td else None,
+        all_tds[6].text if len(all_tds) > 6 else None,
+        all_tds[15].text if len(all_tds) > 15 else None,
+        [span.text for span in tramite_table_body.find_all('span')] if tramite_table_body else None)
+
+
+def parse_study_html(html, parser=DEFAULT_PARSER):
+    """
+    Recovers the dict returned by parse_caae_details from a rendered email fragment, either
+    the PB4 one (render_study_html) or the PB3 one saved in the 'email' column of new.csv.
+    Used to import the state of runs that predate the tramite store.
+    """
+    soup = _soup(html, parser)
+    details = {'nome_estudo': "Nome do estudo não encontrado",
+               'pi': "Pesquisador Principal não encontrado",
+               'caae': "CAAE não encontrado na página de detalhes",
+               'tramites': None}
+    for paragraph in soup.find_all('p'):
+        text = paragraph.get_text().strip()
+        bold = paragraph.find('b')
+        if text.startswith('Título do Estudo:'):
+            details['nome_estudo'] = text[len('Título do Estudo:'):].strip()
+        elif text.startswith('CAAE:'):
+            details['caae'] = text[len('CAAE:'):].strip()
+        elif text.startswith('Pesquisador Principal:'):
+            details['pi'] = text[len('Pesquisador Principal:'):].strip()
+        elif text.startswith('Pesquisador Responsável:'):
+            details['pi'] = text # PB3 keeps the label, as the details page td does
+        elif bold is not None and bold.get_text().strip() == text and not text.startswith('Histórico'):
+            details['nome_estudo'] = text # PB3: the title is the only fully bold paragraph
+
+    table = soup.find('table')
+    if table is not None:
+        details['tramites'] = [[td.get_text().strip() for td in tr.find_all('td')]
+                               for tr in table.find_all('tr') if len(tr.find_all('td')) == TRAMITE_COLUMNS]
+    return details
+
+
+def render_tramite_table(tramites):
+    """Renders trâmite rows as the HTML table used in the notification email."""
+    if not tramites:
+        return "Tabela de trâmites não encontrada."
+    q_rows = []
+    for x_row, row_data in enumerate(tramites):
+        q_rows.append(f"""
+                            <tr>
+                            <th>{x_row+1}</th> 
+                            <td>{row_data[0]}</td><td>{row_data[1]}</td><td>{row_data[2]}</td><td>{row_data[3]}</td>
+                            <td>{row_data[4]}</td><td>{row_data[5]}</td><td>{row_data[6]}</td><td>{row_data[7]}</td>
+                            </tr>
+                        """)
+    output_html_rows = ''.join(q_rows)
+    return f"""
+                                    <table border="1" class="dataframe" style="text-align: center"> 
+                                    <thead><tr> 
+                                    <th>#</th><th>Apreciação</th><th>Data/Hora</th><th>Tipo Trâmite</th><th>Versão</th> 
+                                    <th>Perfil</th><th>Origem</th><th>Destino</th><th>Informações</th> 
+                                    </tr></thead> 
+                                    <tbody>{output_html_rows}</tbody> 
+                                    </table>
+                                    """
+
+
+def render_study_html(details):
+    """Renders the email HTML fragment for one study from the dict returned by parse_caae_details."""
+    return f"""
+                                        <div class="study-details">
+                                        <p><b>Título do Estudo:</b> {details['nome_estudo']}</p> 
+                                        <p><b>CAAE:</b> {details['caae']}</p> 
+                                        <p><b>Pesquisador Principal:</b> {details['pi']}</p> 
+                                        <p><b>Histórico de Trâmites:</b></p>
+                                        {render_tramite_table(details['tramites'])}
+                                        </div>
+                                        """
+
+
+def labelled_changes(added, removed, modified):
+    """[(label, row)] of the changed trâmite rows: 'Novo', 'Alterado' followed by 'Antes', then 'Removido'."""
+    labelled = [('Novo', row) for row in added]
+    for previous_row, current_row in modified:
+        labelled.append(('Alterado', current_row))
+        labelled.append(('Antes', previous_row))
+    labelled.extend(('Removido', row) for row in removed)
+    return labelled
+
+
+def changes_summary(added, removed, modified, is_new=False):
+    """One-line summary of the changes of a study, as shown in the notification email."""
+    if is_new:
+        return "Novo estudo."
+    return f"{len(added)} trâmite(s) novo(s), {len(modified)} alterado(s), {len(removed)} removido(s)."
+
+
+def render_changes_table(added, removed, modified):
+    """Renders added, modified and removed trâmite rows as one table, labelled per row."""
+    q_rows = []
+    for label, row_data in labelled_changes(added, removed, modified):
+        cells = ''.join(f"<td>{cell}</td>" for cell in row_data)
+        q_rows.append(f"""
+                            <tr><th>{label}</th>{cells}</tr>""")
+    output_html_rows = ''.join(q_rows)
+    return f"""
+                                    <table border="1" class="dataframe" style="text-align: center"> 
+                                    <thead><tr> 
+                                    <th>Alteração</th><th>Apreciação</th><th>Data/Hora</th><th>Tipo Trâmite</th><th>Versão</th> 
+                                    <th>Perfil</th><th>Origem</th><th>Destino</th><th>Informações</th> 
+                                    </tr></thead> 
+                                    <tbody>{output_html_rows}</tbody> 
+                                    </table>
+                                    """
+
+
+def render_study_changes_html(details, added, removed, modified, is_new=False):
+    """
+    Renders the email HTML fragment for one study showing only the trâmite rows that
+    changed since the previous run (all of them, labelled 'Novo', for a new study).
+    """
+    summary = changes_summary(added, removed, modified, is_new)
+    table = render_changes_table(added, removed, modified) if (added or removed or modified) else ""
+    return f"""
+                                        <div class="study-details">
+                                        <p><b>Título do Estudo:</b> {details['nome_estudo']}</p> 
+                                        <p><b>CAAE:</b> {details['caae']}</p> 
+                                        <p><b>Pesquisador Principal:</b> {details['pi']}</p> 
+                                        <p><b>Alterações desde a última execução:</b> {summary}</p>
+                                        {table}
+                                        </div>
+                                        """
@@ -0,0 +1,117 @@
+"""
+Activity-aware polling schedule: how often the details page of each CAAE is worth opening.
+
+A study under review gets new trâmites every few days; one approved a year ago may not move
+for months. The schedule estimates how likely each study is to change from the trâmites
+already stored (how many, how recent) and from the situation shown in the listing:
+
+- active studies (a trâmite within the active window, or a situation such as "Pendente"
+  or "Em Apreciação Ética") are polled at every run;
+- the others are polled on a decaying schedule: the longer a study has been idle, the
+  longer it may go unpolled (a share of its idle time, doubled for settled situations
+  such as "Aprovado" or "Retirado");
+- no study goes unpolled longer than the maximum staleness (PB_FORCE_REFRESH_HOURS).
+
+A change in the listing row of a study still gets it polled right away (pb.fingerprint_index).
+"""
+import datetime
+import logging
+import unicodedata
+from .page_parsing import LISTING_SITUATION_COLUMN
+
+logger = logging.getLogger('PB_Scraper')
+
+ACTIVE, SETTLED = 'active', 'settled' # Listing situations
+# Situations in which the study is waiting on the committee or on the researcher
+ACTIVE_STATUS_WORDS = ('pendente', 'pendencia', 'apreciacao', 'recepcao', 'validacao', 'recurso', 'aguardando',
+                       'tramitacao', 'em edicao', 'notificacao')
+# Situations in which nothing is expected until a new version or notification is submitted
+SETTLED_STATUS_WORDS = ('aprovado', 'retirado', 'arquivado', 'encerrado', 'cancelado', 'suspenso')
+
+
+def _normalize(text):
+    return ''.join(char for char in unicodedata.normalize('NFD', text.lower()) if unicodedata.category(char) != 'Mn')
+
+
+def listing_status(columns):
+    """
+    ACTIVE, SETTLED or None, from the situation column of the listing row of a study (the
+    title or institution may contain the same words, so no other column is searched).
+    """
+    if not columns or len(columns) <= LISTING_SITUATION_COLUMN:
+        return None
+    text = _normalize(columns[LISTING_SITUATION_COLUMN])
+    if any(word in text for word in ACTIVE_STATUS_WORDS):
+        return ACTIVE
+    if any(word in text for word in SETTLED_STATUS_WORDS):
+        return SETTLED
+    return None
+
+
+class PollPolicy:
+    """
+    The schedule parameters. `max_staleness` bounds every interval; `active_window` is how
+    recent the last trâmite of an active study is; `idle_ratio` is the share of the idle
+    time a dormant study may go unpolled; `half_life` weighs the trâmites in the activity score.
+    """
+
+    def __init__(self, max_staleness, active_window=datetime.timedelta(days=30), idle_ratio=0.1,
+                 settled_factor=2.0, half_life=datetime.timedelta(days=30)):
+        self.max_staleness = max_staleness
+        self.active_window = active_window
+        self.idle_ratio = idle_ratio
+        self.settled_factor = settled_factor
+        self.half_life = half_life
+
+    def interval(self, tramite_times, status, now):
+        """How long the study may go unpolled (zero: every run). `tramite_times` are newest first."""
+        if status == ACTIVE:
+            return datetime.timedelta(0)
+        if not tramite_times:
+            return self.max_staleness
+        idle = now - tramite_times[0]
+        if idle <= self.active_window:
+            return datetime.timedelta(0)
+        interval = idle * self.idle_ratio * (self.settled_factor if status == SETTLED else 1)
+        return min(interval, self.max_staleness)
+
+    def activity_score(self, tramite_times, status, now):
+        """Estimated change likelihood: trâmites weighted by recency (halved every `half_life`), plus 1 if active."""
+        score = sum(0.5 ** (max((now - moment).total_seconds(), 0) / self.half_life.total_seconds())
+                    for moment in tramite_times)
+        return score + (1 if status == ACTIVE else 0)
+
+
+class PollPlan:
+    """Per-CAAE refresh ages and activity scores for one run."""
+
+    def __init__(self, refresh_ages, scores):
+        self.refresh_ages = refresh_ages # {caae: timedelta}
+        self.scores = scores # {caae: float}
+
+    def by_priority(self, caaes):
+        """`caaes` with the most active studies first (stable for equal scores)."""
+        return sorted(caaes, key=lambda caae: -self.scores.get(caae, 0))
+
+    def every_run(self):
+        return [caae for caae, age in self.refresh_ages.items() if not age]
+
+
+def plan_polling(caaes, listing_rows, tramite_times, policy, now):
+    """
+    Builds the PollPlan of `caaes`. `tramite_times` maps CAAE -> stored trâmite datetimes,
+    newest first; `now` is naive local time, like the trâmite dates.
+    """
+    refresh_ages, scores = {}, {}
+    for caae in caaes:
+        times = tramite_times.get(caae, [])
+        status = listing_status(listing_rows.get(caae))
+        refresh_ages[caae] = policy.interval(times, status, now)
+        scores[caae] = policy.activity_score(times, status, now)
+    plan = PollPlan(refresh_ages, scores)
+    if caaes:
+        deferred = [age for age in refresh_ages.values() if age]
+        logger.info(f"Agendamento adaptativo: {len(caaes) - len(deferred)} estudos ativos (toda execução), "
+                    f"{len(deferred)} com intervalo entre {min(deferred, default=datetime.timedelta(0))} e "
+                    f"{max(deferred, default=datetime.timedelta(0))} (defasagem máxima {policy.max_staleness}).")
+    return plan
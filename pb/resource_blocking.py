@@ -0,0 +1,136 @@
+"""
+Network-level resource blocking for the scraping browser.
+
+The JSF pages of Plataforma Brasil only need their HTML documents, their scripts
+(Prototype, A4J/RichFaces) and the AJAX requests those scripts send. Stylesheets,
+images, fonts, media and analytics are fetched by every page load but never read by the
+scraper, so they are blocked through the Chrome DevTools Protocol (Network.setBlockedURLs).
+
+That command only takes block patterns, so the allowlist is enforced as resource types:
+the patterns below never match a document, script or XHR of the platform, and the run
+report warns if a request of an allowed type was blocked anyway, which would mean the
+profile needs adjusting.
+
+The report is built from Chrome's performance log (network events only): blocked
+requests fail with blockedReason 'inspector', and loaded ones report their encoded size.
+The bytes saved are measured with a HEAD request per unique blocked URL at the end of
+the run, which undercounts repeats the browser cache would have served anyway.
+"""
+import collections
+import json
+import logging
+import threading
+from selenium.common.exceptions import WebDriverException
+
+logger = logging.getLogger('PB_Scraper')
+
+ALLOWED_RESOURCE_TYPES = ('Document', 'Script', 'XHR', 'Fetch')
+BLOCKED_URL_PATTERNS = (
+    # Stylesheets, including RichFaces' generated skin stylesheets
+    '*.css', '*.css?*', '*.xcss', '*.xcss?*', '*.xcss/*',
+    # Images
+    '*.png', '*.png?*', '*.jpg', '*.jpg?*', '*.jpeg', '*.jpeg?*', '*.gif', '*.gif?*',
+    '*.svg', '*.svg?*', '*.ico', '*.ico?*', '*.webp', '*.webp?*', '*.bmp',
+    # Fonts
+    '*.woff', '*.woff?*', '*.woff2', '*.woff2?*', '*.ttf', '*.ttf?*', '*.otf', '*.eot', '*.eot?*',
+    # Media
+    '*.mp4', '*.webm', '*.mp3', '*.ogg',
+    # Analytics and other third-party trackers
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*hotjar.com*',
+    '*facebook.net*', '*barra.sistema.gov.br*', '*vlibras.gov.br*',
+)
+MAX_SIZE_REQUESTS = 100 # HEAD requests made at the end of a run to measure the bytes saved
+
+
+def configure_options(options):
+    """Enables the network-only performance log used by BlockingReport on Chrome `options`."""
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+
+
+def enable_blocking(driver, patterns=BLOCKED_URL_PATTERNS):
+    """Installs the block list on `driver`. Returns False if the browser does not support it."""
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(patterns)})
+        return True
+    except (WebDriverException, AttributeError) as e:
+        logger.warning(f"Could not enable network resource blocking: {e}")
+        return False
+
+
+class BlockingReport:
+    """Requests and bytes loaded and blocked, aggregated over every browser of the run (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded_requests = 0
+        self.loaded_bytes = 0
+        self.blocked_requests = collections.Counter() # resource type -> count
+        self.blocked_urls = collections.Counter() # url -> count
+        self.blocked_allowed_types = collections.Counter() # url -> count, for types that should never be blocked
+
+    def add_events(self, messages):
+        """Aggregates DevTools network events ({'method', 'params'} dicts) of one browser."""
+        request_types = {}
+        with self._lock:
+            for message in messages:
+                method, params = message.get('method'), message.get('params', {})
+                if method == 'Network.requestWillBeSent':
+                    request_types[params.get('requestId')] = (params.get('type', 'Other'), params.get('request', {}).get('url', ''))
+                elif method == 'Network.loadingFinished':
+                    self.loaded_requests += 1
+                    self.loaded_bytes += int(params.get('encodedDataLength') or 0)
+                elif method == 'Network.loadingFailed' and params.get('blockedReason') == 'inspector':
+                    resource_type, url = request_types.get(params.get('requestId'), (params.get('type', 'Other'), ''))
+                    resource_type = params.get('type', resource_type)
+                    self.blocked_requests[resource_type] += 1
+                    self.blocked_urls[url] += 1
+                    if resource_type in ALLOWED_RESOURCE_TYPES:
+                        self.blocked_allowed_types[url] += 1
+
+    def collect(self, driver):
+        """Drains the performance log of `driver` into the report. Call it before quitting the driver."""
+        try:
+            entries = driver.get_log('performance')
+        except (WebDriverException, ValueError) as e:
+            logger.warning(f"Could not read the browser performance log: {e}")
+            return
+        messages = []
+        for entry in entries:
+            try:
+                messages.append(json.loads(entry['message'])['message'])
+            except (KeyError, ValueError):
+                continue
+        self.add_events(messages)
+
+    def measure_saved_bytes(self, session=None, timeout=5):
+        """Returns the bytes of the blocked URLs as announced by a HEAD request to each unique one."""
+        import requests
+        session = session or requests.Session()
+        saved = 0
+        for url, count in self.blocked_urls.most_common(MAX_SIZE_REQUESTS):
+            if not url.startswith('http'):
+                continue
+            try:
+                response = session.head(url, timeout=timeout, allow_redirects=True)
+                saved += int(response.headers.get('Content-Length') or 0)
+            except (requests.RequestException, ValueError):
+                continue
+        return saved
+
+    def log_summary(self, session=None):
+        blocked_total = sum(self.blocked_requests.values())
+        if not blocked_total and not self.loaded_requests:
+            return
+        by_type = ', '.join(f"{resource_type}: {count}" for resource_type, count in self.blocked_requests.most_common())
+        logger.info(f"Bloqueio de recursos: {blocked_total} requisições bloqueadas ({len(self.blocked_urls)} URLs únicas; {by_type or 'nenhuma'}), "
+                    f"{self.loaded_requests} carregadas ({self.loaded_bytes / 1024:.0f} KB).")
+        if blocked_total:
+            logger.info(f"Bloqueio de recursos: aproximadamente {self.measure_saved_bytes(session) / 1024:.0f} KB economizados "
+                        f"(tamanho das URLs únicas bloqueadas).")
+        for url, count in self.blocked_allowed_types.items():
+            logger.warning(f"Bloqueio de recursos: recurso necessário bloqueado {count}x: {url}. Revise BLOCKED_URL_PATTERNS.")
+
+
+default_report = BlockingReport()
@@ -0,0 +1,721 @@
+"""
+A run of the scraper: the authenticated sessions of the configured engine, one check over
+them (listing, details pages, comparison, notification) and the single-run and daemon loops.
+
+The engines are imported when the sessions are opened, so importing this module does not
+load Selenium, requests or BeautifulSoup.
+"""
+import datetime
+import logging
+import signal
+from .comparison import compare_with_previous_run, save_current_state
+from .config import Account, local_timezone
+from .daemon import RecyclePolicy, ScraperDaemon
+from .failure_memory import FailureMemory
+from .fingerprint_index import DEFAULT_INDEX_PATH, FingerprintIndex
+from .notification import deliver_outbox, queue_notification_email
+from .outbox import Outbox
+from .page_parsing import DEFAULT_INSTITUTION_CODE
+from .poll_schedule import PollPolicy, plan_polling
+from .run_history import STATUS_ERROR, STATUS_LOGIN_FAILED, STATUS_OK, RunHistory, run_record
+from .run_journal import DEFAULT_JOURNAL_PATH, RunJournal
+from .session_cache import SessionCache
+from .session_supervisor import LOGGED_OUT, SessionProblem, SessionSupervisor
+from .spans import browser_waits, build_run_metrics, default_spans as spans, export_run_metrics
+from .startup_timing import StartupTimer, default_timer as startup_timer
+from .state_log import StateLog
+from .tramite_store import TramiteStore
+from .worker_pool import run_worker_pool
+
+logger = logging.getLogger('PB_Scraper')
+
+# --- Authenticated sessions ---
+def start_authenticated_http_session(http_client, session_cache, login_email, login_password):
+    """Same as browser.start_authenticated_session, for the HTTP engine (loading the listing is the probe)."""
+    cookies = session_cache.load()
+    if cookies and http_client.restore_session(cookies):
+        logger.info("Sessão em cache reaproveitada; login dispensado.")
+        return True
+    session_cache.clear()
+    if not http_client.login(login_email, login_password):
+        return False
+    session_cache.save(http_client.cookies())
+    return True
+
+class ScraperSessions:
+    """
+    The authenticated sessions of the configured engine: the logged-in main session
+    (worker 0) and the worker sessions cloned from it. With `keep_warm`, worker sessions
+    are kept open across checks (daemon mode); otherwise each check closes the ones it created.
+    `account` is the login used (PB_LOGIN/PB_SENHA by default).
+    """
+
+    def __init__(self, settings, session_cache, keep_warm=False, timer=None, account=None):
+        self.settings = settings
+        self.engine = settings.scraping_engine
+        self.timer = timer or startup_timer # Times the engine imports, provisioning, browser launch and login of `open`
+        self.session_cache = session_cache
+        self.account = account or Account(settings.pb_login, settings.pb_senha, settings.institutions)
+        # Only the first account keeps a browser profile: two browsers cannot share one
+        self.profile_dir = settings.browser_profile_dir if self.account.number == 1 else None
+        self.timezone = local_timezone()
+        self.keep_warm = keep_warm
+        self.sessions = {} # worker_id -> HTTP client or (driver, wait)
+        self.listings_walked = 0
+
+    @property
+    def main_session(self):
+        return self.sessions.get(0)
+
+    def open(self):
+        """Starts and authenticates the main session. Returns False if the login failed."""
+        if self.engine == 'http':
+            logger.info("Usando o engine HTTP (sem navegador).")
+            with self.timer.phase('engine imports'):
+                from .http_engine import PlataformaBrasilHttpClient
+            http_client = PlataformaBrasilHttpClient(self.settings.base_url)
+            self.sessions[0] = http_client
+            with self.timer.phase('login'), spans.span('login'):
+                return start_authenticated_http_session(http_client, self.session_cache,
+                                                        self.account.login, self.account.password)
+        with self.timer.phase('engine imports'):
+            from . import browser
+        driver, wait = browser.initialize_webdriver(self.settings, self.profile_dir, timer=self.timer) # Uses logger internally
+        self.sessions[0] = (driver, wait)
+        with self.timer.phase('login'), spans.span('login'):
+            return browser.start_authenticated_session(driver, wait, self.session_cache,
+                                                       self.account.login, self.account.password)
+
+    def list_caaes(self, listing_rows, institution_code=DEFAULT_INSTITUTION_CODE):
+        """Walks the project listing of `institution_code` with the main session. Returns the CAAE list."""
+        if self.engine == 'http':
+            self.main_session.institution_code = institution_code
+            caaes = self.main_session.list_caaes(listing_rows=listing_rows)
+        else:
+            from . import browser
+            driver, wait = self.main_session
+            if self.listings_walked:
+                browser.reload_listing(driver)
+            caaes = browser.extract_valid_caaes(driver, wait, listing_rows=listing_rows,
+                                                institution_code=institution_code) # Uses logger
+        self.listings_walked += 1
+        return caaes
+
+    def new_session(self, worker_id):
+        """
+        Worker session factory: the other workers share the cookies of the main session.
+        A session replacing one that is already kept (a fresh session for the deferred
+        retries) only lasts for the check.
+        """
+        if self.engine == 'http':
+            session = self.main_session.clone()
+        else:
+            from . import browser
+            session = browser.clone_authenticated_session(self.main_session[0], self.settings)
+        if self.keep_warm and worker_id not in self.sessions:
+            self.sessions[worker_id] = session
+        return session
+
+    def process_caae(self, session, caae):
+        if self.engine == 'http':
+            from .http_engine import SessionExpiredError
+            try:
+                return session.fetch_caae_details(caae, self.timezone)
+            except SessionExpiredError as e:
+                raise SessionProblem(LOGGED_OUT, str(e)) from e
+        from . import browser
+        return browser.process_caae_details(session[0], session[1], caae, self.timezone)
+
+    def reopen(self, worker_id, session, kind, login):
+        """
+        Replaces the broken `session` of `worker_id` for the SessionSupervisor. The new session
+        is authenticated from the session cache, or by a new login when `login` is set (the
+        cache is cleared first, and then holds the cookies the other workers restore), so each
+        worker only drives its own session. The main session is kept unless its browser died.
+        Returns (session, whether the caller owns it).
+        """
+        if login:
+            self.session_cache.clear() # Its cookies are those of the expired session
+        if worker_id == 0:
+            if not self._is_alive(session):
+                self._discard(0, session)
+                self.sessions[0] = self._launch(self.profile_dir)
+            if not self._authenticate(self.main_session):
+                raise RuntimeError("login failed")
+            return self.main_session, False
+        self._discard(worker_id, session)
+        fresh = self._launch()
+        try:
+            if not self._authenticate(fresh):
+                raise RuntimeError("login failed")
+        except Exception:
+            self._close(fresh)
+            raise
+        if self.keep_warm:
+            self.sessions[worker_id] = fresh
+        return fresh, True
+
+    def _is_alive(self, session):
+        if self.engine == 'http':
+            return True
+        from selenium.common.exceptions import WebDriverException
+        try:
+            session[0].current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def _discard(self, worker_id, session):
+        if self.sessions.get(worker_id) is session:
+            del self.sessions[worker_id]
+        try:
+            self._close(session)
+        except Exception as e:
+            logger.warning(f"Worker {worker_id}: error closing the broken session: {e}")
+
+    def _launch(self, profile_dir=None):
+        """A new, not yet authenticated session."""
+        if self.engine == 'http':
+            from .http_engine import PlataformaBrasilHttpClient
+            return PlataformaBrasilHttpClient(self.settings.base_url, institution_code=self.main_session.institution_code)
+        from . import browser
+        return browser.initialize_webdriver(self.settings, profile_dir)
+
+    def _authenticate(self, session):
+        with spans.span('login'):
+            if self.engine == 'http':
+                return start_authenticated_http_session(session, self.session_cache,
+                                                        self.account.login, self.account.password)
+            from . import browser
+            return browser.start_authenticated_session(session[0], session[1], self.session_cache,
+                                                       self.account.login, self.account.password)
+
+    def release(self, session):
+        """Closes a worker session at the end of a check, unless it is kept warm."""
+        if session not in self.sessions.values():
+            self._close(session)
+
+    def _close(self, session):
+        if self.engine == 'http':
+            session.close()
+        else:
+            from . import browser
+            browser.quit_browser_session(session[0], self.settings.block_resources)
+
+    def is_healthy(self):
+        """Probes the server session and drops worker browsers that died. Returns False if the main session is unusable."""
+        from .session_cache import LISTING_PATH, probe_session
+        if self.engine != 'http':
+            from selenium.common.exceptions import WebDriverException
+            for worker_id, (driver, _) in list(self.sessions.items()):
+                try:
+                    driver.current_url
+                except WebDriverException:
+                    logger.warning(f"Worker {worker_id}: browser is no longer responding.")
+                    if worker_id == 0:
+                        return False
+                    del self.sessions[worker_id]
+            cookies = self.main_session[0].get_cookies()
+        else:
+            cookies = self.main_session.cookies()
+        return probe_session(cookies, self.settings.base_url + LISTING_PATH)
+
+    def keepalive(self):
+        """Refreshes the idle timer of the server session (shared by every worker)."""
+        if not self.is_healthy():
+            from .http_engine import PlataformaBrasilError
+            raise PlataformaBrasilError("Session probe failed during keepalive.")
+
+    def memory_mb(self):
+        """Resident memory of the browsers and their drivers, in MB (None for the HTTP engine)."""
+        if self.engine == 'http':
+            return None
+        import psutil
+        total = 0
+        for driver, _ in self.sessions.values():
+            try:
+                process = psutil.Process(driver.service.process.pid)
+                total += sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+            except (AttributeError, psutil.Error):
+                continue
+        return total / (1024 * 1024)
+
+    def close(self):
+        for worker_id, session in list(self.sessions.items()):
+            try:
+                self._close(session)
+            except Exception as e:
+                logger.error(f"Worker {worker_id}: error closing session: {e}", exc_info=True)
+        self.sessions.clear()
+
+class SessionGroup:
+    """
+    The ScraperSessions of every configured account (PB_LOGIN, PB_LOGIN_2...), each with its
+    own login and session cache. Accounts whose login fails are left out of the checks.
+    """
+
+    def __init__(self, settings, keep_warm=False, timer=None):
+        self.settings = settings
+        self.timezone = local_timezone()
+        accounts = settings.accounts or [None]
+        self.members = [ScraperSessions(settings, SessionCache(settings.session_cache_for(account) if account else
+                                                               settings.session_cache_path, settings.session_max_age),
+                                        keep_warm=keep_warm, timer=timer, account=account)
+                        for account in accounts]
+        self.opened = [] # Members whose login succeeded
+
+    def open(self):
+        """Logs every account in. Returns False if none could log in (raising the first error, if there was one)."""
+        first_error = None
+        for member in self.members:
+            try:
+                if member.open():
+                    self.opened.append(member)
+                    continue
+                if len(self.members) > 1:
+                    logger.critical(f"Falha no login da conta {member.account.login}; suas instituições dependem das demais contas.")
+            except Exception as e:
+                if len(self.members) == 1:
+                    raise
+                logger.critical(f"Erro ao abrir sessões da conta {member.account.login}: {e}", exc_info=True)
+                first_error = first_error or e
+        if not self.opened and first_error:
+            raise first_error
+        return bool(self.opened)
+
+    def members_for(self, institution_code):
+        """The logged-in members whose account lists `institution_code`, in account order."""
+        return [member for member in self.opened if institution_code in member.account.institutions]
+
+    def has_sessions(self):
+        return any(member.sessions for member in self.members)
+
+    def is_healthy(self):
+        return all(member.is_healthy() for member in self.opened)
+
+    def keepalive(self):
+        for member in self.opened:
+            member.keepalive()
+
+    def memory_mb(self):
+        """Resident memory of every account's browsers, in MB (None for the HTTP engine)."""
+        if self.settings.scraping_engine == 'http':
+            return None
+        return sum(member.memory_mb() for member in self.members)
+
+    def close(self):
+        for member in self.members:
+            member.close()
+        self.opened = []
+
+class InstitutionCheck:
+    """The state of one institution during a check: its run journal, listing, stored studies and fingerprints."""
+
+    def __init__(self, code, settings):
+        self.code = code
+        self.primary = code == settings.institutions[0] # The first institution keeps the unsuffixed state files
+        self.label = code if len(settings.institutions) > 1 else None # Named in messages only when there are several
+        self.recipient = settings.recipients.get(code, settings.destinatario_email)
+        self.journal = RunJournal(settings.state_path(DEFAULT_JOURNAL_PATH, code), freshness=settings.resume_window)
+        self.store = None
+        self.fingerprints = None
+        self.caaes, self.listing_rows = [], {}
+        self.journaled_records = []
+        self.to_fetch = []
+
+    def open_state(self, settings):
+        self.store = TramiteStore(settings.state_path(settings.state_db_path, self.code))
+        if self.primary and self.store.is_empty():
+            with spans.span('csv.import'):
+                # First run with the store: start from the state kept by PB3.py (new.csv, or the state log that replaced it)
+                self.store.import_legacy_csv() or self.store.import_state_log(StateLog(settings.state_log_path))
+        self.fingerprints = FingerprintIndex(settings.state_path(DEFAULT_INDEX_PATH, self.code))
+
+    def message(self, text):
+        return f"{self.label}: {text}" if self.label else text
+
+    def close(self):
+        if self.store:
+            self.store.close()
+        self.journal.close()
+
+def list_institution(check, members, owners):
+    """
+    Fills `check` with the listing of its institution: resumed from an interrupted run, or
+    walked with every account that lists it. `owners` maps each CAAE to the first account
+    that listed it, which opens its details page.
+    """
+    # Resume an interrupted run: reuse its listing and skip the CAAEs it already processed
+    journaled_listing = check.journal.listing()
+    if journaled_listing:
+        check.caaes, check.listing_rows = journaled_listing
+        logger.info(check.message(f"Retomando execução interrompida: {len(check.caaes)} CAAEs da listagem e {len(check.journal.records())} já processados."))
+    else:
+        caaes = set()
+        for member in members:
+            member_rows = {}
+            listed = member.list_caaes(member_rows, check.code)
+            if len(members) > 1:
+                logger.info(f"Instituição {check.code}: {len(listed)} CAAEs visíveis para a conta {member.account.login}.")
+            caaes.update(listed)
+            for caae in listed:
+                owners.setdefault(caae, member)
+                check.listing_rows.setdefault(caae, member_rows.get(caae))
+        check.caaes = sorted(caaes)
+        if check.caaes:
+            check.journal.record_listing(check.caaes, check.listing_rows)
+    for caae in check.caaes:
+        owners.setdefault(caae, members[0])
+
+def plan_institution(check, settings, run_started):
+    """Sets `check.to_fetch`: the CAAEs of the institution whose details page must be opened, most active first."""
+    # Every finished CAAE is journaled right away, so a crash does not lose it
+    check.journaled_records = [{'caae': caae, 'details': record['details']}
+                               for caae, record in check.journal.records().items() if caae in check.caaes]
+    journaled_caaes = {record['caae'] for record in check.journaled_records}
+    caaes_pending = [caae for caae in check.caaes if caae not in journaled_caaes]
+    check.open_state(settings)
+
+    # Incremental mode: skip CAAEs whose listing row did not change; their state is already stored
+    if not settings.incremental_scraping:
+        check.to_fetch = caaes_pending
+        return
+    poll_plan = None
+    if settings.adaptive_polling:
+        policy = PollPolicy(settings.force_refresh_age, settings.active_window, settings.idle_poll_ratio)
+        poll_plan = plan_polling(caaes_pending, check.listing_rows, check.store.tramite_times(), policy,
+                                 run_started.replace(tzinfo=None)) # Trâmite dates are local, without offset
+    caaes_to_fetch, caaes_to_reuse, fetch_reasons = check.fingerprints.plan(
+        caaes_pending, check.listing_rows, check.store.known_caaes(), run_started, settings.force_refresh_age,
+        poll_plan.refresh_ages if poll_plan else None)
+    if poll_plan:
+        caaes_to_fetch = poll_plan.by_priority(caaes_to_fetch) # Most active first: an interrupted run has done them
+    for caae_s_num in caaes_to_fetch:
+        logger.info(f"CAAE {caae_s_num} será aberto: {fetch_reasons[caae_s_num]}.")
+    logger.info(check.message(f"Modo incremental: {len(caaes_to_fetch)} CAAEs a abrir, {len(caaes_to_reuse)} sem alteração na listagem."))
+    check.to_fetch = caaes_to_fetch
+
+def queue_institution_email(check, processed_caaes_data, settings, check_started, timezone, outbox):
+    """
+    Compares the processed CAAEs of `check` with its stored state, enqueues its notification
+    in `outbox` and only then saves the new state, so a crash cannot lose the notification.
+    Returns (updates, idempotency keys of the queued messages, email facts).
+    """
+    digest_entries, num_updated_total, num_changed_rows = compare_with_previous_run(
+        processed_caaes_data, check.store, save_state=False) # Uses logger
+    keys, message_stats = [], {}
+    if num_updated_total > 0:
+        logger.info(check.message(f"Encontradas {num_updated_total} atualizações/novos estudos. Preparando email..."))
+        keys = queue_notification_email( # Uses logger
+            outbox,
+            recipient_email=check.recipient,
+            num_updates=num_updated_total,
+            digest_entries=digest_entries,
+            script_start_time_obj=check_started, # Pass the actual start time object
+            timezone_obj=timezone,
+            num_changed_rows=num_changed_rows,
+            message_stats=message_stats,
+            institution=check.label,
+            max_bytes=settings.email_max_bytes,
+            overflow=settings.email_overflow
+        )
+    else:
+        logger.info(check.message("Nenhuma atualização ou novo estudo encontrado após comparação. Email não será enviado."))
+    save_current_state(processed_caaes_data, check.store)
+    return num_updated_total, keys, {'email_bytes': message_stats.get('bytes'), 'email_parts': message_stats.get('parts')}
+
+def skipped_caaes_report(failures, failed_caaes, backing_off, unprocessed=()):
+    """
+    Logs exactly which CAAEs were not checked: those that failed in this run, those left
+    unprocessed when their sessions could not be recovered and those still backing off.
+    """
+    if not failed_caaes and not backing_off and not unprocessed:
+        return
+    lines = [f"  {failures.describe(caae)}: falhou nesta execução, mesmo após nova tentativa no fim da fila." for caae in failed_caaes]
+    lines += [f"  {caae}: não processado, nenhuma sessão disponível (sessões perdidas ou limite de recuperações atingido)." for caae in unprocessed]
+    lines += [f"  {failures.describe(caae)}: em espera após falhas em execuções anteriores." for caae in backing_off]
+    logger.warning(f"CAAEs não verificados nesta execução ({len(lines)}); seus dados anteriores foram mantidos:\n" + "\n".join(lines))
+
+def email_status_message(check, num_updates, keys, sent_keys):
+    """The email status of `check` once the outbox was flushed."""
+    if not num_updates:
+        return check.message("Nenhuma atualização ou novo estudo encontrado, email não enviado.")
+    if all(key in sent_keys for key in keys):
+        message = check.message(f"Email enviado com sucesso para {check.recipient} com {num_updates} atualizações/novos estudos.")
+        logger.info(message)
+    else:
+        message = check.message(f"Email para {check.recipient} com {num_updates} atualizações/novos estudos ficou na fila de "
+                                f"envio; 'python -m pb outbox send' tentará novamente.")
+        logger.error(message)
+    return message
+
+# --- Main script execution logic ---
+def run_check(sessions, settings, check_started=None, run_facts=None):
+    """
+    Runs one check over the SessionGroup `sessions`: walks the listing of every institution,
+    opens the details pages that need it (each CAAE once, with the first account that lists
+    it), compares them with the institution's stored state and queues its notification email
+    in the outbox, which is then flushed over one SMTP connection. CAAEs that keep failing
+    across runs are left out until their backoff elapses (pb.failure_memory).
+    Returns (number of updated/new studies, email status message).
+    If `run_facts` is a dict, it is filled with the CAAE counts of the check for the run metrics.
+    """
+    timezone = sessions.timezone
+    check_started = check_started or datetime.datetime.now(timezone)
+    run_facts = {} if run_facts is None else run_facts
+    checks = []
+
+    try:
+        owners = {} # {caae: ScraperSessions of the account that opens it}
+        for code in settings.institutions:
+            members = sessions.members_for(code)
+            if not members:
+                logger.error(f"Instituição {code}: nenhuma conta com login ativo lista seus projetos; ignorada nesta verificação.")
+                continue
+            check = InstitutionCheck(code, settings)
+            checks.append(check)
+            list_institution(check, members, owners)
+            if not check.caaes:
+                logger.warning(check.message("Nenhum CAAE extraído. Verifique a plataforma ou os filtros. Encerrando."))
+                checks.remove(check)
+                check.close()
+        run_facts['caaes'] = len({caae for check in checks for caae in check.caaes})
+        if not checks:
+            return 0, "Nenhum CAAE extraído, email não enviado."
+
+        run_started = datetime.datetime.now(timezone)
+        for check in checks:
+            plan_institution(check, settings, run_started)
+        journals_of = {} # {caae: journals of the institutions listing it}
+        for check in checks:
+            for caae in check.caaes:
+                journals_of.setdefault(caae, []).append(check.journal)
+        caaes_to_fetch = list(dict.fromkeys(caae for check in checks for caae in check.to_fetch))
+        failures = FailureMemory(settings.failure_memory_path, settings.failure_backoff)
+        caaes_to_fetch, backing_off = failures.split(caaes_to_fetch, run_started)
+        if backing_off:
+            logger.info(f"{len(backing_off)} CAAEs com falhas recentes ficam fora desta execução até o fim da espera.")
+
+        def process_caae(member):
+            def process(session, caae):
+                record = member.process_caae(session, caae)
+                if record:
+                    for journal in journals_of[caae]:
+                        journal.record(caae, {'details': record['details']})
+                return record
+            return process
+
+        logger.info(f"Iniciando processamento de {len(caaes_to_fetch)} CAAEs com {settings.num_workers} worker(s)...")
+        fetched_records, failed_caaes, attempts, unprocessed, recoveries = [], [], {}, [], 0
+        for member in sessions.opened:
+            member_caaes = [caae for caae in caaes_to_fetch if owners[caae] is member]
+            if not member_caaes:
+                continue
+            if len(sessions.opened) > 1:
+                logger.info(f"Conta {member.account.login}: {len(member_caaes)} CAAEs a abrir.")
+            # Worker 0 reuses the logged-in main session; the other workers clone it (or reuse warm clones).
+            # Sessions logged out or crashed mid-check are reopened, up to PB_MAX_SESSION_RECOVERIES
+            supervisor = SessionSupervisor(member.reopen, settings.max_session_recoveries)
+            pool_result = run_worker_pool(
+                member_caaes,
+                session_factory=member.new_session,
+                process_caae=process_caae(member),
+                num_workers=settings.num_workers,
+                close_session=member.release,
+                initial_sessions=dict(member.sessions),
+                supervisor=supervisor
+            )
+            fetched_records += pool_result.records
+            failed_caaes += [caae for caae in pool_result.failed_caaes if caae not in pool_result.unprocessed]
+            unprocessed += pool_result.unprocessed
+            attempts.update(pool_result.attempts)
+            recoveries += len(supervisor.recoveries)
+        logger.info("Processamento de todos os CAAEs concluído.")
+        for record in fetched_records:
+            failures.record_success(record['caae'])
+        for caae_s_num in failed_caaes: # The CAAEs left without a session did not fail themselves
+            failures.record_failure(caae_s_num, run_started)
+        failures.save()
+        skipped_caaes_report(failures, failed_caaes, backing_off, unprocessed)
+
+        not_checked = failed_caaes + unprocessed + backing_off
+        run_facts.update(fetched=len(fetched_records), failed=len(failed_caaes),
+                         retries=sum(attempts.values()) - len(attempts), processed=0, updates=0,
+                         skipped=len(not_checked), skipped_caaes=sorted(not_checked), session_recoveries=recoveries)
+        outbox = Outbox(settings.outbox_path)
+        num_updated_total, status_messages, institution_facts, queued = 0, [], {}, []
+        for check in checks:
+            caaes = set(check.caaes)
+            processed_caaes_data = check.journaled_records + [record for record in fetched_records if record['caae'] in caaes]
+            run_facts['processed'] += len(processed_caaes_data)
+            for record in processed_caaes_data:
+                check.fingerprints.record_fetch(record['caae'], check.listing_rows.get(record['caae']), run_started)
+            check.fingerprints.save()
+
+            if (check.to_fetch or check.journaled_records) and not processed_caaes_data:
+                logger.warning(check.message("Nenhum dado de CAAE foi processado com sucesso. Não há o que comparar ou enviar por email."))
+                status_messages.append(check.message("Nenhum CAAE processado com sucesso, email não enviado."))
+                continue
+
+            num_updates, keys, email_facts = queue_institution_email(
+                check, processed_caaes_data, settings, check_started, timezone, outbox)
+            check.journal.complete() # The notification is queued: delivery problems never cost another scrape
+            num_updated_total += num_updates
+            queued.append((check, num_updates, keys))
+            institution_facts[check.code] = {'caaes': len(check.caaes), 'updates': num_updates}
+            for fact in ('email_bytes', 'email_parts'):
+                if email_facts[fact] is not None:
+                    run_facts[fact] = (run_facts.get(fact) or 0) + email_facts[fact]
+
+        # One SMTP connection for the messages of every institution, and those left by earlier runs
+        deliver_outbox(outbox, settings.email_password, max_attempts=settings.email_max_attempts)
+        sent_keys = outbox.sent_keys()
+        for check, num_updates, keys in queued:
+            status_messages.append(email_status_message(check, num_updates, keys, sent_keys))
+            if keys:
+                run_facts['email_sent'] = run_facts.get('email_sent', True) and all(key in sent_keys for key in keys)
+        run_facts['updates'] = num_updated_total
+        if len(settings.institutions) > 1:
+            run_facts['institutions'] = institution_facts
+        return num_updated_total, " ".join(status_messages)
+    finally:
+        for check in checks:
+            check.close()
+
+def log_run_summaries(settings):
+    """Logs the step timings of the run and the wait, extraction and resource blocking summaries (cumulative since the process started)."""
+    spans.log_summary()
+    if settings.scraping_engine != 'http':
+        from .browser_extraction import default_stats as extraction_stats
+        from .resource_blocking import default_report as blocking_report
+        from .waits import default_recorder
+        default_recorder.log_summary()
+        extraction_stats.log_summary()
+        if settings.block_resources:
+            blocking_report.log_summary()
+
+def record_run(settings, run_facts, started, finished, status, source, waits_baseline=None, timer=None):
+    """
+    Writes the metrics of a run or check to PB_METRICS_JSON and PB_METRICS_PROM, and appends
+    its record (with the time of each span and startup phase) to the run history.
+    """
+    metrics_facts = dict(run_facts, started=started, finished=finished, engine=settings.scraping_engine,
+                         workers=settings.num_workers, duration_seconds=round((finished - started).total_seconds(), 3))
+    export_run_metrics(build_run_metrics(metrics_facts, spans, waits_baseline),
+                       settings.metrics_json_path, settings.metrics_prometheus_path)
+    stages = {f'startup.{phase}': seconds for phase, seconds in (timer.phases.items() if timer else ())}
+    stages.update((name, entry['total']) for name, entry in spans.summary('span').items())
+    try:
+        RunHistory(settings.run_history_path).append(run_record(started, finished, status, source, stages, **run_facts))
+    except OSError as e:
+        logger.error(f"Failed to append the run to '{settings.run_history_path}': {e}", exc_info=True)
+
+def run(settings):
+    """
+    One run (`python -m pb run`): logs in, runs a check and closes the sessions.
+    Returns the number of updated/new studies.
+    """
+    timezone = local_timezone()
+    run_started = datetime.datetime.now(timezone) # Script start time
+    logger.info(f"--- Iniciando script PB3 --- Hora de início: {run_started.strftime('%d/%m/%Y %H:%M:%S')} ---")
+
+    num_updates, email_status = 0, "Status do email não determinado devido a erro."
+    run_facts, status = {}, STATUS_ERROR
+    spans.reset()
+    waits_baseline = browser_waits()
+    sessions = SessionGroup(settings)
+    try:
+        if settings.scraping_engine != 'http':
+            from .browser import kill_existing_browser_processes
+            with startup_timer.phase('browser cleanup'):
+                kill_existing_browser_processes() # Uses logger internally
+        opened = sessions.open() # Uses logger
+        startup_timer.log_summary()
+        if not opened:
+            logger.critical("Falha no login. Encerrando o script.")
+            status = STATUS_LOGIN_FAILED
+            return 0
+
+        num_updates, email_status = run_check(sessions, settings, run_started, run_facts)
+        status = STATUS_OK
+
+    except Exception as e: # Catch any unexpected error in the run
+        logger.critical(f"Erro crítico inesperado na execução: {e}", exc_info=True)
+        email_status = f"Script encerrado prematuramente devido a erro crítico: {e}"
+    finally:
+        if sessions.has_sessions():
+            logger.info("Fechando sessões.")
+            sessions.close()
+
+        log_run_summaries(settings)
+
+        script_end_time = datetime.datetime.now(timezone)
+        total_duration = script_end_time - run_started
+
+        logger.info(f"--- Script PB3 concluído --- Hora de término: {script_end_time.strftime('%d/%m/%Y %H:%M:%S')} ---")
+        logger.info(f"Tempo total de execução: {str(total_duration).split('.')[0]}")
+        logger.info(f"Número de estudos atualizados/novos: {num_updates}")
+        logger.info(f"Status final do Email: {email_status}")
+        record_run(settings, run_facts, run_started, script_end_time, status, 'pb', waits_baseline, startup_timer)
+    return num_updates
+
+def run_daemon(settings):
+    """
+    Daemon mode (`python -m pb daemon`): keeps the authenticated sessions warm and runs a
+    check every PB_DAEMON_INTERVAL_MINUTES (with jitter), until SIGTERM/SIGINT.
+    `touch pb_daemon.trigger` or SIGUSR1 requests a check right away.
+    """
+    logger.info(f"--- Iniciando PB4 em modo daemon --- intervalo de {settings.daemon_interval} com jitter de {settings.daemon_jitter:.0%} ---")
+    timezone = local_timezone()
+
+    timers = [startup_timer] # The first start also reports the imports; recycled sessions get a fresh timer
+
+    def open_sessions():
+        timer = timers.pop() if timers else StartupTimer()
+        sessions = SessionGroup(settings, keep_warm=True, timer=timer)
+        try:
+            opened = sessions.open()
+            timer.log_summary()
+            if opened:
+                return sessions
+            logger.critical("Falha no login.")
+        except Exception as e:
+            logger.critical(f"Erro ao abrir sessões: {e}", exc_info=True)
+        sessions.close()
+        return None
+
+    waits_baseline = [browser_waits()]
+
+    def check(sessions):
+        check_started = datetime.datetime.now(timezone)
+        logger.info(f"--- Verificação iniciada: {check_started.strftime('%d/%m/%Y %H:%M:%S')} ---")
+        run_facts, status = {}, STATUS_ERROR
+        try:
+            num_updates, email_status = run_check(sessions, settings, check_started, run_facts)
+            status = STATUS_OK
+            logger.info(f"Número de estudos atualizados/novos: {num_updates}. Status do Email: {email_status}")
+            log_run_summaries(settings)
+        finally:
+            # Every check exports its own metrics: the spans since the previous check (logins and keepalives included)
+            record_run(settings, run_facts, check_started, datetime.datetime.now(timezone), status, 'daemon',
+                       waits_baseline[0])
+            spans.reset()
+            waits_baseline[0] = browser_waits()
+
+    daemon = ScraperDaemon(
+        open_sessions, check,
+        interval=settings.daemon_interval.total_seconds(),
+        jitter=settings.daemon_jitter,
+        policy=RecyclePolicy(max_age=settings.daemon_max_session_age, max_memory_mb=settings.daemon_max_memory_mb),
+        keepalive_interval=settings.daemon_keepalive.total_seconds(),
+        trigger_path=settings.daemon_trigger_path)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: daemon.trigger())
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+
+    if settings.scraping_engine != 'http':
+        from .browser import kill_existing_browser_processes
+        kill_existing_browser_processes() # Only once, before the first browser starts
+    daemon.run()
+    logger.info(f"--- Modo daemon encerrado: {daemon.checks_run} verificações, {daemon.recycles} reciclagens de sessão ---")
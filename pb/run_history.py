@@ -0,0 +1,255 @@
+"""
+Append-only history of the runs, one structured record per run, and the trend report.
+
+Every run (or daemon check) appends a record to `run_history.jsonl`: start, end, duration,
+the time of each stage, the CAAEs listed, processed and failed, the retries, the CAAEs
+skipped (failed or backing off after earlier failures), the updates found and the size of
+the email. Older runs only exist as free-form lines in registro.txt;
+`parse_legacy_log` turns them into the same records (both the two-line messages of PB3.py
+and the logger format of the pb package), with the fields the log does not hold left as None.
+
+The report groups the runs by month or week and flags the runs whose duration or CAAE
+failure rate regresses beyond a threshold compared with the median of the runs before them.
+
+Format: one JSON object per line. Records are never rewritten; importing the same log
+twice skips the runs already stored (same start time).
+"""
+import datetime
+import json
+import logging
+import os
+import re
+import statistics
+import threading
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_HISTORY_PATH = "run_history.jsonl"
+# registro.txt times are local wall-clock times (some lines carry a wrong offset)
+LEGACY_TIMEZONE = datetime.timezone(datetime.timedelta(hours=-3))
+STATUS_OK, STATUS_LOGIN_FAILED, STATUS_ERROR = 'ok', 'login_failed', 'error'
+FIELDS = ('started', 'finished', 'duration_seconds', 'status', 'source', 'caaes', 'processed', 'failed',
+          'retries', 'skipped_caaes', 'session_recoveries', 'updates', 'email_sent', 'email_bytes', 'email_parts', 'stages')
+
+
+def run_record(started, finished, status=STATUS_OK, source='pb', stages=None, **facts):
+    """
+    A history record. `facts` holds any of caaes, processed, failed, retries, skipped_caaes,
+    session_recoveries, updates, email_sent, email_bytes, email_parts.
+    """
+    record = dict.fromkeys(FIELDS)
+    record.update({key: value for key, value in facts.items() if key in FIELDS})
+    record.update(started=started.isoformat(), finished=finished.isoformat() if finished else None,
+                  duration_seconds=round((finished - started).total_seconds(), 3) if finished else None,
+                  status=status, source=source, stages={name: round(seconds, 3) for name, seconds in (stages or {}).items()})
+    return record
+
+
+class RunHistory:
+    """The history file at `path`. `append` is thread-safe and fsyncs every record."""
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def records(self):
+        """Every record, oldest first. Unreadable lines (a torn last write) are skipped."""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Ignoring unreadable line in run history '{self.path}'.")
+        return sorted(records, key=lambda record: started_at(record))
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def import_records(self, records):
+        """Appends the records whose start time is not in the history yet. Returns how many were added."""
+        known = {started_at(record) for record in self.records()}
+        new_records = [record for record in records if started_at(record) not in known]
+        if new_records:
+            self.extend(new_records)
+        return len(new_records)
+
+
+def started_at(record):
+    return _aware(datetime.datetime.fromisoformat(record['started']))
+
+
+def _aware(moment):
+    return moment.replace(tzinfo=LEGACY_TIMEZONE) if moment.tzinfo is None else moment
+
+# --- registro.txt ---
+_PB3_START = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?)(?:[+-]\d{2}:\d{2})? - O programa comecou a rodar')
+_PB3_END = re.compile(r'^\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2} - O email (foi enviado com sucesso|nao precisou ser enviado)\. '
+                      r'(\d+) estudos atualizados\. Demorou: (.+?) minutos')
+_LOG_LINE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) - (\w+) - (?:\S+ - )?(.*)$')
+_DURATION = re.compile(r'^(?:(\d+) days?, )?(\d+):(\d{2}):(\d{2}(?:\.\d+)?)$')
+
+
+def parse_duration(text):
+    """Parses str(timedelta) ('0:35:59.513264', '1 day, 2:00:00'). Returns a timedelta, or None."""
+    match = _DURATION.match(text.strip())
+    if not match:
+        return None
+    days, hours, minutes, seconds = match.groups()
+    return datetime.timedelta(days=int(days or 0), hours=int(hours), minutes=int(minutes), seconds=float(seconds))
+
+
+def parse_legacy_log(lines, timezone=LEGACY_TIMEZONE):
+    """
+    Turns registro.txt lines into history records (source 'registro.txt'). A run that
+    started but never logged its end (a crash, with the traceback in between) is kept
+    with status 'error' and no end or duration.
+    """
+    records = []
+    current = None # The run being read: {'started', 'source', facts...}
+
+    def close(finished=None, status=STATUS_ERROR):
+        nonlocal current
+        if current is not None:
+            started = current.pop('started')
+            records.append(run_record(started, finished, status, source='registro.txt', **current))
+        current = None
+
+    for line in lines:
+        line = line.rstrip('\n')
+        match = _PB3_START.match(line)
+        if match:
+            close()
+            current = {'started': datetime.datetime.fromisoformat(match.group(1)).replace(tzinfo=timezone)}
+            continue
+        match = _PB3_END.match(line)
+        if match and current is not None:
+            duration = parse_duration(match.group(3))
+            current.update(updates=int(match.group(2)), email_sent=match.group(1) == 'foi enviado com sucesso')
+            close(current['started'] + duration if duration is not None else None, STATUS_OK)
+            continue
+        match = _LOG_LINE.match(line)
+        if not match:
+            continue
+        logged_at = datetime.datetime.fromisoformat(f"{match.group(1)}.{match.group(2)}").replace(tzinfo=timezone)
+        level, message = match.group(3), match.group(4)
+        if message.startswith('--- Iniciando script PB3 ---'):
+            close()
+            started = re.search(r'Hora de início: (\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})', message)
+            current = {'started': datetime.datetime.strptime(started.group(1), '%d/%m/%Y %H:%M:%S').replace(tzinfo=timezone)
+                       if started else logged_at, 'failed': 0}
+        elif current is None:
+            continue
+        elif message.startswith('Iniciando processamento de '):
+            processing = re.match(r'Iniciando processamento de (\d+) CAAEs', message)
+            if processing:
+                current['caaes'] = int(processing.group(1))
+        elif message.startswith('Falha ao processar detalhes para o CAAE'):
+            current['failed'] += 1
+        elif 'Falha no login' in message:
+            current['status'] = STATUS_LOGIN_FAILED
+        elif level == 'CRITICAL' and 'Erro crítico' in message:
+            current['status'] = STATUS_ERROR
+        elif message.startswith('Número de estudos atualizados/novos:'):
+            current['updates'] = int(message.rsplit(':', 1)[1])
+        elif message.startswith('Status final do Email:'):
+            current['email_sent'] = 'enviado com sucesso' in message
+            status = current.pop('status', STATUS_OK)
+            if current.get('caaes') is not None:
+                current['processed'] = current['caaes'] - current['failed']
+            close(logged_at, status)
+    close()
+    return records
+
+
+def import_legacy_log(history, log_path="registro.txt"):
+    """Imports the runs found in registro.txt into `history`. Returns (runs found, runs added)."""
+    with open(log_path, encoding='utf-8', errors='replace') as f:
+        records = parse_legacy_log(f)
+    return len(records), history.import_records(records)
+
+# --- Trends and regressions ---
+def failure_rate(record):
+    if not record.get('caaes'):
+        return None
+    return (record.get('failed') or 0) / record['caaes']
+
+
+def find_regressions(records, window=10, duration_threshold=0.5, failure_threshold=0.1, min_history=3):
+    """
+    Flags the runs that regressed against the median of the `window` successful runs before them:
+    a duration more than `duration_threshold` above it (0.5 is 50% slower), or a CAAE failure
+    rate more than `failure_threshold` above it (absolute, 0.1 is 10 points). Runs that did not
+    finish are flagged too. Needs `min_history` earlier runs. Returns [(record, [reasons])].
+    """
+    flagged = []
+    previous = []
+    for record in records:
+        reasons = []
+        if record.get('status') != STATUS_OK:
+            reasons.append(f"execução com status {record.get('status')}")
+        baseline = previous[-window:]
+        durations = [run['duration_seconds'] for run in baseline if run.get('duration_seconds') is not None]
+        if record.get('duration_seconds') is not None and len(durations) >= min_history:
+            median = statistics.median(durations)
+            if median and record['duration_seconds'] > median * (1 + duration_threshold):
+                reasons.append(f"duração {format_seconds(record['duration_seconds'])} contra mediana "
+                               f"{format_seconds(median)} (+{record['duration_seconds'] / median - 1:.0%})")
+        rates = [rate for rate in map(failure_rate, baseline) if rate is not None]
+        rate = failure_rate(record)
+        if rate is not None and len(rates) >= min_history:
+            median = statistics.median(rates)
+            if rate > median + failure_threshold:
+                reasons.append(f"taxa de falhas {rate:.1%} contra mediana {median:.1%}")
+        if reasons:
+            flagged.append((record, reasons))
+        if record.get('status') == STATUS_OK:
+            previous.append(record)
+    return flagged
+
+
+def format_seconds(seconds):
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+def _period(record, by):
+    started = started_at(record).astimezone(LEGACY_TIMEZONE)
+    if by == 'week':
+        year, week, _ = started.isocalendar()
+        return f"{year}-W{week:02d}"
+    return started.strftime('%Y-%m')
+
+
+def trend_lines(records, by='month'):
+    """One line per month (or ISO week): runs, unfinished runs, median and p90 duration, updates and failure rate."""
+    periods = {}
+    for record in records:
+        periods.setdefault(_period(record, by), []).append(record)
+    lines = []
+    for period, runs in periods.items():
+        durations = sorted(run['duration_seconds'] for run in runs if run.get('duration_seconds') is not None)
+        caaes = sum(run.get('caaes') or 0 for run in runs)
+        failed = sum(run.get('failed') or 0 for run in runs)
+        line = f"{period}: {len(runs)} execuções ({sum(run.get('status') != STATUS_OK for run in runs)} sem sucesso)"
+        if durations:
+            p90 = durations[min(len(durations) - 1, int(0.9 * len(durations)))]
+            line += f", duração mediana {format_seconds(statistics.median(durations))} (p90 {format_seconds(p90)})"
+        line += f", {sum(run.get('updates') or 0 for run in runs)} atualizações"
+        if caaes:
+            line += f", falhas {failed}/{caaes} CAAEs ({failed / caaes:.1%})"
+        lines.append(line)
+    return lines
+
+
+def regression_lines(flagged):
+    return [f"{started_at(record).astimezone(LEGACY_TIMEZONE).strftime('%d/%m/%Y %H:%M')} ({record.get('source')}): "
+            + '; '.join(reasons) for record, reasons in flagged]
@@ -0,0 +1,121 @@
+"""
+Append-only journal of an in-progress scrape, so a restarted run can resume.
+
+The CI workflow retries a failed run from scratch. With the journal, every completed CAAE
+is written (and fsync'd) as soon as it finishes, together with the CAAE listing once it
+has been walked. A run that starts while an unfinished journal is still within the
+freshness window reuses those entries and only processes what is missing. A finished
+run appends a 'complete' entry, so the next run starts a new journal.
+
+Format: one JSON object per line, with a 'type' of 'run', 'listing', 'record' or 'complete'.
+"""
+import datetime
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_JOURNAL_PATH = "run_journal.jsonl"
+DEFAULT_FRESHNESS = datetime.timedelta(hours=4)
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def read_entries(path):
+    """
+    Returns the entries of a journal file. A torn last line (the process died in the
+    middle of a write) and lines that are not valid JSON are ignored.
+    """
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Ignoring unreadable line in run journal '{path}'.")
+    return entries
+
+
+class RunJournal:
+    """
+    Journal of the current run. On creation it either resumes the unfinished journal
+    found at `path` (if started less than `freshness` ago) or starts a new one.
+    `record` is thread-safe, so pool workers can journal their own results.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH, freshness=DEFAULT_FRESHNESS, now=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._listing = None
+        self._records = {}
+        now = now or _utc_now()
+
+        entries = read_entries(path)
+        self.resumed = self._can_resume(entries, now, freshness)
+        if self.resumed:
+            oldest_allowed = now - freshness
+            for entry in entries:
+                if datetime.datetime.fromisoformat(entry.get('at', entries[0]['at'])) < oldest_allowed:
+                    continue
+                if entry['type'] == 'listing':
+                    self._listing = entry
+                elif entry['type'] == 'record':
+                    self._records[entry['caae']] = entry['record']
+            logger.info(f"Resuming run journal '{path}' started at {entries[0]['at']}: "
+                        f"{len(self._records)} CAAEs already processed, listing {'reused' if self._listing else 'not saved'}.")
+            self._file = open(path, 'a', encoding='utf-8')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+            self._append({'type': 'run', 'at': now.isoformat()})
+
+    @staticmethod
+    def _can_resume(entries, now, freshness):
+        if not entries or entries[0].get('type') != 'run':
+            return False
+        if any(entry.get('type') == 'complete' for entry in entries):
+            return False
+        return now - datetime.datetime.fromisoformat(entries[0]['at']) < freshness
+
+    def _append(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    # --- Resumed state ---
+
+    def listing(self):
+        """Returns (caae_list, listing_rows) journaled by the interrupted run, or None."""
+        if self._listing is None:
+            return None
+        return self._listing['caaes'], self._listing.get('rows', {})
+
+    def records(self):
+        """Returns {caae: record} of the CAAEs already processed by the interrupted run."""
+        return dict(self._records)
+
+    # --- Writes ---
+
+    def record_listing(self, caae_list, listing_rows=None):
+        self._listing = {'type': 'listing', 'at': _utc_now().isoformat(), 'caaes': list(caae_list),
+                         'rows': listing_rows or {}}
+        self._append(self._listing)
+
+    def record(self, caae, record):
+        """Journals the JSON-serialisable `record` of a completed CAAE."""
+        self._records[caae] = record
+        self._append({'type': 'record', 'at': _utc_now().isoformat(), 'caae': caae, 'record': record})
+
+    def complete(self):
+        """Marks the run as finished: the next run will not resume from this journal."""
+        self._append({'type': 'complete', 'at': _utc_now().isoformat()})
+
+    def close(self):
+        with self._lock:
+            self._file.close()
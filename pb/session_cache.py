@@ -0,0 +1,142 @@
+"""
+Authenticated session cache, so a run (or a retry of a failed run) can skip the login.
+
+Logging in fills the j_id19 form, may have to confirm the "usuário já logado" modal
+(which kills whatever session was open) and waits for the landing page. After a
+successful login the session cookies are saved to a JSON file readable only by its
+owner. The next run checks them with one plain HTTP GET of the project listing. If the
+server answers with the listing rather than the login form, the cookies are loaded into
+the browser (or the HTTP client) and the login is skipped. Otherwise the cache is cleared
+and the usual login runs.
+
+The file holds a live session: it is ignored by git and must not be committed.
+"""
+import datetime
+import json
+import logging
+import os
+from urllib.parse import urlsplit
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_SESSION_PATH = "pb_session.json"
+DEFAULT_MAX_AGE = datetime.timedelta(hours=12)
+BASE_URL = "https://plataformabrasil.saude.gov.br"
+LISTING_PATH = "/visao/pesquisador/gerirPesquisa/gerirPesquisaAgrupador.jsf"
+PROBE_URL = BASE_URL + LISTING_PATH
+LOGIN_FORM_MARKER = 'j_id19:email' # Name of the e-mail input of the login form
+LISTING_MARKER = 'rich-datascr' # Datascroller of the project listing
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class SessionCache:
+    """Cookies of the last authenticated session, stored at `path`."""
+
+    def __init__(self, path=DEFAULT_SESSION_PATH, max_age=DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+
+    def load(self, now=None):
+        """Returns the cached cookies (Selenium cookie dicts), or None if there is no usable cache."""
+        now = now or _utc_now()
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                cached = json.load(f)
+            saved_at = datetime.datetime.fromisoformat(cached['saved_at'])
+            cookies = cached['cookies']
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable session cache '{self.path}': {e}")
+            return None
+        if now - saved_at > self.max_age:
+            logger.info(f"Session cache '{self.path}' is older than {self.max_age}; ignoring it.")
+            return None
+        cookies = [cookie for cookie in cookies if cookie.get('expiry') is None or cookie['expiry'] > now.timestamp()]
+        return cookies or None
+
+    def save(self, cookies, now=None):
+        """Saves `cookies` atomically, with owner-only permissions."""
+        tmp_path = self.path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'saved_at': (now or _utc_now()).isoformat(), 'cookies': list(cookies)}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def probe_session(cookies, url=PROBE_URL, timeout=15, http=None):
+    """
+    Returns True if `cookies` still authenticate a session: one GET of the project
+    listing must return the listing instead of the login form.
+    """
+    import requests
+    http = http or requests
+    jar = {cookie['name']: cookie['value'] for cookie in cookies}
+    try:
+        response = http.get(url, cookies=jar, timeout=timeout)
+    except requests.RequestException as e:
+        logger.warning(f"Session probe failed: {e}")
+        return False
+    return response.status_code == 200 and LOGIN_FORM_MARKER not in response.text and LISTING_MARKER in response.text
+
+
+def _origin(url):
+    """'https://host:port/path' -> 'https://host:port'."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _cdp_cookie(cookie, origin=BASE_URL):
+    cdp = {key: cookie[key] for key in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly') if key in cookie}
+    if cookie.get('expiry') is not None:
+        cdp['expires'] = cookie['expiry']
+    if 'domain' not in cdp:
+        cdp['url'] = origin
+    return cdp
+
+
+def restore_browser_session(driver, cookies, url=PROBE_URL):
+    """
+    Loads `cookies` into `driver` and opens `url`. The cookies are set through the
+    DevTools protocol, which needs no page load; browsers without it get them with
+    add_cookie after opening the login page (cookies need a page of their domain).
+    Cookies without a domain, and the login page, belong to the server of `url`.
+    """
+    from selenium.common.exceptions import WebDriverException
+    origin = _origin(url)
+    try:
+        driver.execute_cdp_cmd('Network.setCookies', {'cookies': [_cdp_cookie(cookie, origin) for cookie in cookies]})
+    except (WebDriverException, AttributeError):
+        driver.get(origin + "/login.jsf")
+        for cookie in cookies:
+            cookie = dict(cookie)
+            cookie.pop('sameSite', None)
+            driver.add_cookie(cookie)
+    driver.get(url)
+
+
+def restore_http_session(session, cookies):
+    """Loads `cookies` into a requests.Session."""
+    for cookie in cookies:
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+
+
+def http_session_cookies(session):
+    """Returns the cookies of a requests.Session as Selenium cookie dicts, for SessionCache.save."""
+    cookies = []
+    for cookie in session.cookies:
+        cookie_dict = {'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+                       'secure': bool(cookie.secure)}
+        if cookie.expires is not None:
+            cookie_dict['expiry'] = cookie.expires
+        cookies.append(cookie_dict)
+    return cookies
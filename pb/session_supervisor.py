@@ -0,0 +1,96 @@
+"""
+Session supervisor: repairs the sessions of a check when the server logs them out, a
+browser dies or its pages keep going stale, so a long run gets through its whole list.
+
+The engines raise SessionProblem when the session, not the CAAE, failed:
+
+- LOGGED_OUT (sent to the login page, or an expired session): the account logs in again,
+  once for all its workers. The first worker to notice logs in; the others, whose sessions
+  predate that login, only take fresh ones.
+- DRIVER_DEAD (the browser no longer answers): the worker gets a new browser; when it was
+  the main one, it is relaunched and authenticated again.
+- STALE_ELEMENT (the page changed under the worker): an isolated one is a failure of the
+  CAAE, but `stale_storm` in a row in the same session mean its page state is wedged, and
+  the session is replaced.
+
+After a recovery the CAAE that revealed the problem is tried again at once, without
+counting as an attempt, and the worker goes on with the next unprocessed CAAEs; the records
+gathered so far are kept. A check makes at most `max_recoveries` recoveries: past that, or
+when a recovery fails, SessionLostError stops the worker and its CAAEs go to the other
+workers, or are reported as not processed.
+
+This module has no engine imports: sessions are reopened through the `reopen` callable.
+"""
+import collections
+import logging
+import threading
+
+logger = logging.getLogger('PB_Scraper')
+
+LOGGED_OUT, DRIVER_DEAD, STALE_ELEMENT = 'logged_out', 'driver_dead', 'stale_element'
+DEFAULT_MAX_RECOVERIES = 5
+DEFAULT_STALE_STORM = 3
+
+
+class SessionProblem(Exception):
+    """Raised by an engine when its session failed. `kind` is LOGGED_OUT, DRIVER_DEAD or STALE_ELEMENT."""
+
+    def __init__(self, kind, message=''):
+        super().__init__(message or kind)
+        self.kind = kind
+
+
+class SessionLostError(Exception):
+    """A session could not be recovered: the worker holding it stops."""
+
+
+class SessionSupervisor:
+    """
+    Recovery policy for the sessions of one account. `reopen(worker_id, session, kind, login)`
+    replaces the broken `session` of a worker, logging the account in again first when `login`
+    is set, and returns (new session, whether the caller owns it).
+    """
+
+    def __init__(self, reopen, max_recoveries=DEFAULT_MAX_RECOVERIES, stale_storm=DEFAULT_STALE_STORM):
+        self.reopen = reopen
+        self.max_recoveries = max_recoveries
+        self.stale_storm = stale_storm
+        self.recoveries = [] # (worker_id, kind) of every recovery made
+        self._lock = threading.Lock()
+        self._login_generation = 0 # Logins made by the supervisor so far
+        self._generations = {} # {worker_id: login generation of its current session}
+        self._stale = collections.Counter() # {worker_id: stale element errors in a row}
+
+    def succeeded(self, worker_id):
+        with self._lock:
+            self._stale[worker_id] = 0
+
+    def recover(self, worker_id, session, problem):
+        """
+        Handles `problem`, raised by `session` of `worker_id`. Returns None when it only counts
+        as a failure of the CAAE (an isolated stale element), otherwise (new session, owned),
+        after which the CAAE is retried. Raises SessionLostError if the session cannot be recovered.
+        """
+        with self._lock: # One recovery at a time: a single login serves every worker
+            if problem.kind == STALE_ELEMENT:
+                self._stale[worker_id] += 1
+                if self._stale[worker_id] < self.stale_storm:
+                    return None
+                logger.warning(f"Worker {worker_id}: {self._stale[worker_id]} stale element errors in a row; replacing its session.")
+            if len(self.recoveries) >= self.max_recoveries:
+                raise SessionLostError(f"Worker {worker_id}: {problem.kind} after {len(self.recoveries)} session recoveries "
+                                       f"(limit {self.max_recoveries}).")
+            login = problem.kind == LOGGED_OUT and self._generations.get(worker_id, 0) == self._login_generation
+            logger.warning(f"Worker {worker_id}: session problem ({problem.kind}: {problem}); "
+                           f"{'logging in again' if login else 'reopening the session'}.")
+            try:
+                recovered = self.reopen(worker_id, session, problem.kind, login)
+            except Exception as e:
+                raise SessionLostError(f"Worker {worker_id}: could not recover from {problem.kind}: {e}") from e
+            self.recoveries.append((worker_id, problem.kind))
+            if login:
+                self._login_generation += 1
+            self._generations[worker_id] = self._login_generation
+            self._stale[worker_id] = 0
+            logger.info(f"Worker {worker_id}: session recovered ({len(self.recoveries)}/{self.max_recoveries}); continuing.")
+            return recovered
@@ -0,0 +1,154 @@
+"""
+End-to-end benchmarks of scraping strategies against the local Plataforma Brasil simulator.
+
+Every strategy (engine, number of workers, wait poll interval) gets a fresh simulator
+(pb.fake_plataforma) with the same projects, latency and failure rate, and goes through the
+real code paths: login, the listing walk and the details pages through the worker pool.
+Nothing is compared, stored or emailed. The browser engine needs Chrome; a strategy that
+cannot start reports its error instead of a timing.
+"""
+import datetime
+import logging
+import os
+import tempfile
+import time
+from .config import Settings
+from .fake_plataforma import FakePlataformaBrasil, generate_projects, serve_in_thread
+from .session_cache import SessionCache
+from .startup_timing import StartupTimer
+from .worker_pool import run_worker_pool
+
+logger = logging.getLogger('PB_Scraper')
+
+SIMULATOR_USER = 'pesquisador@example.org'
+SIMULATOR_PASSWORD = 'senha'
+ENGINES = ('browser', 'http')
+
+
+class Strategy:
+    """One way of scraping: the engine, the number of workers and the browser wait poll interval."""
+
+    def __init__(self, engine='http', workers=1, poll_seconds=0.1):
+        self.engine = engine
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+
+    def describe(self):
+        return {'engine': self.engine, 'workers': self.workers, 'poll_seconds': self.poll_seconds}
+
+    def settings(self, base_url, workdir):
+        """Settings pointing to the simulator at `base_url`, with the state files in `workdir`."""
+        return Settings({
+            'PB_BASE_URL': base_url, 'PB_ENGINE': self.engine, 'PB_WORKERS': str(self.workers),
+            'PB_WAIT_POLL_SECONDS': str(self.poll_seconds), 'PB_HEADLESS': '1',
+            'PB_LOGIN': SIMULATOR_USER, 'PB_SENHA': SIMULATOR_PASSWORD,
+            'PB_SESSION_CACHE': os.path.join(workdir, 'pb_session.json'),
+            'PB_STATE_DB': os.path.join(workdir, 'pb_state.sqlite3'),
+            'PB_DRIVER_CACHE': os.environ.get('PB_DRIVER_CACHE', 'chromedriver_cache.json'),
+            'PB_CHROME_BINARY': os.environ.get('PB_CHROME_BINARY', ''),
+        })
+
+
+class SimulatorConfig:
+    """The simulated server: dataset size and history length, response latency and failures."""
+
+    def __init__(self, projects=100, max_tramites=12, latency=0.05, jitter=0.0, error_rate=0.0,
+                 error_kinds=('status', 'view_expired'), page_sizes=None, seed=0):
+        self.projects = projects
+        self.max_tramites = max_tramites
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_kinds = tuple(error_kinds)
+        self.page_sizes = page_sizes
+        self.seed = seed
+
+    def describe(self):
+        return {'projects': self.projects, 'max_tramites': self.max_tramites, 'latency_ms': self.latency * 1000,
+                'jitter_ms': self.jitter * 1000, 'error_rate': self.error_rate, 'error_kinds': list(self.error_kinds),
+                'page_sizes': list(self.page_sizes) if self.page_sizes else None, 'seed': self.seed}
+
+    def build(self):
+        return FakePlataformaBrasil(
+            generate_projects(self.projects, max_tramites=self.max_tramites, seed=self.seed),
+            users={SIMULATOR_USER: SIMULATOR_PASSWORD}, page_sizes=self.page_sizes, latency=self.latency,
+            jitter=self.jitter, error_rate=self.error_rate, error_kinds=self.error_kinds, seed=self.seed)
+
+
+def run_strategy(strategy, simulator):
+    """
+    Scrapes a fresh simulator with `strategy`. Returns a dict with the phase durations
+    (login, listing, details), the CAAEs processed and failed, and the requests served.
+    """
+    from .run import ScraperSessions # Imports the engines lazily, like a real run
+    app = simulator.build()
+    server, base_url = serve_in_thread(app)
+    result = strategy.describe()
+    timer = StartupTimer()
+    sessions = None
+    try:
+        if strategy.engine not in ENGINES:
+            raise ValueError(f"unknown engine '{strategy.engine}'")
+        with tempfile.TemporaryDirectory(prefix='pb-sim-') as workdir:
+            settings = strategy.settings(base_url, workdir)
+            sessions = ScraperSessions(settings, SessionCache(settings.session_cache_path), timer=timer)
+            started = time.perf_counter()
+            if not sessions.open():
+                raise RuntimeError("login failed")
+            listing_started = time.perf_counter()
+            caaes = sessions.list_caaes({})
+            details_started = time.perf_counter()
+            pool_result = run_worker_pool(
+                caaes, session_factory=sessions.new_session, process_caae=sessions.process_caae,
+                num_workers=settings.num_workers, close_session=sessions.release,
+                initial_sessions=dict(sessions.sessions))
+            finished = time.perf_counter()
+            sessions.close()
+            sessions = None
+        details_seconds = finished - details_started
+        result.update({
+            'login_seconds': round(listing_started - started, 4),
+            'listing_seconds': round(details_started - listing_started, 4),
+            'details_seconds': round(details_seconds, 4),
+            'total_seconds': round(finished - started, 4),
+            'caaes': len(caaes),
+            'processed': len(pool_result.records),
+            'failed': len(pool_result.failed_caaes),
+            'caaes_per_second': round(len(pool_result.records) / details_seconds, 3) if details_seconds else None,
+        })
+    except Exception as e:
+        logger.error(f"Strategy {strategy.describe()} failed: {e}")
+        result['error'] = str(e)
+    finally:
+        if sessions is not None:
+            sessions.close()
+        server.shutdown()
+        server.server_close()
+    result['requests'] = sum(app.request_counts.values())
+    result['injected_failures'] = dict(app.error_counts)
+    return result
+
+
+def run_benchmark(strategies, simulator, repeats=1):
+    """Runs every strategy `repeats` times against identical simulators. Returns the results as a JSON-serializable dict."""
+    runs = [run_strategy(strategy, simulator) for strategy in strategies for _ in range(repeats)]
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'simulator': simulator.describe(),
+        'runs': runs,
+    }
+
+
+def format_runs(results):
+    """One line per run, for the console."""
+    lines = []
+    for run in results['runs']:
+        name = f"{run['engine']} x{run['workers']} (poll {run['poll_seconds']}s)"
+        if 'error' in run:
+            lines.append(f"{name}: erro: {run['error']}")
+            continue
+        lines.append(f"{name}: {run['processed']}/{run['caaes']} CAAEs em {run['total_seconds']:.2f}s "
+                     f"(login {run['login_seconds']:.2f}s, listagem {run['listing_seconds']:.2f}s, "
+                     f"detalhes {run['details_seconds']:.2f}s, {run['caaes_per_second']}/s), "
+                     f"{run['failed']} falhas, {run['requests']} requisições, falhas injetadas {run['injected_failures']}")
+    return lines
@@ -0,0 +1,200 @@
+"""
+Span-based timing of a run, exported as JSON and as a Prometheus textfile.
+
+A span is a named step of the run (`login`, `listing.page`, `caae.search`, `caae.lupa`,
+`caae.parse`, `caae.back`, `compare`, `state.write`, `smtp.send`...). The time of every span is
+added up per name, whatever the thread. Deliberate sleeps are recorded apart from the spans,
+and so are the server waits: the readiness waits of the browser (pb.waits, when that module
+is loaded) and the HTTP requests of the HTTP engine. That shows how much of a run is spent
+waiting on the server and how much sleeping on purpose. The steps include the server waits
+made inside them; the sleeps are never part of a step.
+
+The Prometheus file follows the textfile collector format of node_exporter and is
+replaced atomically, so the collector never reads a partial file.
+"""
+import contextlib
+import datetime
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_JSON_PATH = "run_metrics.json"
+DEFAULT_PROMETHEUS_PATH = "run_metrics.prom"
+METRIC_PREFIX = 'pb'
+
+SPAN, SERVER, SLEEP = 'span', 'server', 'sleep' # Kinds of recorded time
+
+
+class SpanRecorder:
+    """Thread-safe totals of the spans, sleeps and server waits of a run, by name."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.entries = {} # (kind, name) -> {'count', 'total', 'max'}
+
+    def record(self, name, seconds, kind=SPAN):
+        with self._lock:
+            entry = self.entries.setdefault((kind, name), {'count': 0, 'total': 0.0, 'max': 0.0})
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+
+    @contextlib.contextmanager
+    def span(self, name, kind=SPAN):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, self.clock() - started, kind)
+
+    def sleep(self, seconds, name='sleep'):
+        """A deliberate pause: sleeps and records it as a sleep, not as a step or a server wait."""
+        started = self.clock()
+        time.sleep(seconds)
+        self.record(name, self.clock() - started, SLEEP)
+
+    def reset(self):
+        with self._lock:
+            self.entries.clear()
+
+    def summary(self, kind=None):
+        """Returns {name: {'count', 'total', 'max'}} for one kind, or {kind: {...}} for all of them."""
+        with self._lock:
+            entries = {key: dict(entry) for key, entry in self.entries.items()}
+        if kind is not None:
+            return {name: entry for (entry_kind, name), entry in entries.items() if entry_kind == kind}
+        result = {SPAN: {}, SLEEP: {}, SERVER: {}}
+        for (entry_kind, name), entry in entries.items():
+            result.setdefault(entry_kind, {})[name] = entry
+        return result
+
+    def log_summary(self):
+        summary = self.summary()
+        if not any(summary.values()):
+            return
+        totals = {kind: sum(entry['total'] for entry in entries.values()) for kind, entries in summary.items()}
+        logger.info(f"Etapas: {totals[SPAN]:.1f}s, espera do servidor {totals[SERVER]:.1f}s, "
+                    f"pausas deliberadas {totals[SLEEP]:.1f}s (somadas entre threads).")
+        for name, entry in sorted(summary[SPAN].items(), key=lambda item: -item[1]['total']):
+            logger.info(f"  {name}: {entry['count']}x, total {entry['total']:.1f}s, máx {entry['max']:.2f}s")
+
+
+default_spans = SpanRecorder()
+
+
+def browser_waits():
+    """Totals of the readiness waits recorded by pb.waits since the process started ({} if the browser engine is not loaded)."""
+    waits = sys.modules.get(f'{__package__}.waits')
+    if waits is None:
+        return {}
+    return {name: {'count': entry['count'], 'total': entry['total'], 'max': entry['max']}
+            for name, entry in waits.default_recorder.summary().items()}
+
+
+def _waits_since(baseline):
+    """The browser waits recorded after `baseline` (an earlier browser_waits()); the max is the cumulative one."""
+    waits = browser_waits()
+    for name, before in (baseline or {}).items():
+        entry = waits.get(name)
+        if entry is None:
+            continue
+        entry.update(count=entry['count'] - before['count'], total=entry['total'] - before['total'])
+        if not entry['count']:
+            del waits[name]
+    return waits
+
+
+def build_run_metrics(run, spans=None, waits_baseline=None, waits=None):
+    """
+    The metrics of a run as a JSON-serializable dict. `run` holds the facts of the run
+    (started/finished datetimes, engine, caaes, processed, failed, updates, ...).
+    The browser waits are the ones recorded since `waits_baseline` (from browser_waits())
+    unless `waits` gives them explicitly.
+    """
+    spans = spans or default_spans
+    summary = spans.summary()
+    server = dict(summary[SERVER])
+    for name, entry in (_waits_since(waits_baseline) if waits is None else waits).items():
+        server[f'wait.{name}'] = entry
+    run = dict(run)
+    for key in ('started', 'finished'):
+        if isinstance(run.get(key), datetime.datetime):
+            run[key] = run[key].isoformat()
+    totals = {
+        'span_seconds': round(sum(entry['total'] for entry in summary[SPAN].values()), 6),
+        'server_wait_seconds': round(sum(entry['total'] for entry in server.values()), 6),
+        'sleep_seconds': round(sum(entry['total'] for entry in summary[SLEEP].values()), 6),
+    }
+    def rounded(entries):
+        return {name: {'count': entry['count'], 'total': round(entry['total'], 6), 'max': round(entry['max'], 6)}
+                for name, entry in sorted(entries.items())}
+    return {'run': run, 'totals': totals, 'spans': rounded(summary[SPAN]),
+            'server_waits': rounded(server), 'sleeps': rounded(summary[SLEEP])}
+
+
+def _write_atomically(path, text):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as output:
+        output.write(text)
+    os.replace(temporary_path, path)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(metrics):
+    """Renders build_run_metrics output in the Prometheus text exposition format."""
+    lines = []
+    def metric(name, help_text, samples, metric_type='gauge'):
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} {metric_type}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{_label(val)}"' for key, val in labels.items())
+            lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                         else f"{METRIC_PREFIX}_{name} {value}")
+
+    run = metrics['run']
+    if run.get('duration_seconds') is not None:
+        metric('run_duration_seconds', "Duration of the last run.", [({}, run['duration_seconds'])])
+    if run.get('finished'):
+        finished = datetime.datetime.fromisoformat(run['finished'])
+        metric('run_finished_timestamp_seconds', "End of the last run (Unix time).", [({}, round(finished.timestamp(), 3))])
+    counts = [({'state': key}, run[key]) for key in ('caaes', 'fetched', 'processed', 'failed', 'skipped', 'updates') if run.get(key) is not None]
+    if counts:
+        metric('run_caaes', "CAAEs of the last run, by state.", counts)
+    metric('run_time_seconds', "Time of the last run by category (summed across threads).",
+           [({'category': 'span'}, metrics['totals']['span_seconds']),
+            ({'category': 'server_wait'}, metrics['totals']['server_wait_seconds']),
+            ({'category': 'sleep'}, metrics['totals']['sleep_seconds'])])
+    for section, label, help_text in (('spans', 'span', "Time spent in each step of the last run."),
+                                      ('server_waits', 'wait', "Time spent waiting on the server in the last run."),
+                                      ('sleeps', 'sleep', "Time spent in deliberate sleeps in the last run.")):
+        entries = metrics[section]
+        if not entries:
+            continue
+        name = {'spans': 'span', 'server_waits': 'server_wait', 'sleeps': 'sleep'}[section]
+        metric(f'{name}_seconds_total', help_text, [({label: key}, entry['total']) for key, entry in entries.items()])
+        metric(f'{name}_count', f"Occurrences of each {label} in the last run.",
+               [({label: key}, entry['count']) for key, entry in entries.items()])
+        metric(f'{name}_max_seconds', f"Longest occurrence of each {label} in the last run.",
+               [({label: key}, entry['max']) for key, entry in entries.items()])
+    return '\n'.join(lines) + '\n'
+
+
+def export_run_metrics(metrics, json_path=DEFAULT_JSON_PATH, prometheus_path=DEFAULT_PROMETHEUS_PATH):
+    """Writes `metrics` to the JSON file and the Prometheus textfile (either path may be None)."""
+    try:
+        if json_path:
+            _write_atomically(json_path, json.dumps(metrics, indent=2, ensure_ascii=False))
+        if prometheus_path:
+            _write_atomically(prometheus_path, prometheus_text(metrics))
+        logger.info(f"Métricas da execução gravadas em {', '.join(p for p in (json_path, prometheus_path) if p)}.")
+    except OSError as e:
+        logger.error(f"Failed to write the run metrics: {e}", exc_info=True)
@@ -0,0 +1,63 @@
+"""
+Timing report of the startup phases, paid before any CAAE is processed.
+
+`imports` runs from the start of the process (interpreter start-up included) to the end of
+the module imports. The other phases are timed where they happen: chromedriver provisioning,
+browser launch and the login (or restored session).
+"""
+import contextlib
+import logging
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger('PB_Scraper')
+
+
+class StartupTimer:
+    """Durations of the named startup phases, in the order they were first measured."""
+
+    def __init__(self):
+        self.phases = {}
+
+    def record(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def record_imports(self):
+        """Records the time since the process started as the 'imports' phase."""
+        import psutil
+        self.record('imports', max(0.0, time.time() - psutil.Process().create_time()))
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def summary(self):
+        parts = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        return f"{parts} (total {sum(self.phases.values()):.2f}s)"
+
+    def log_summary(self):
+        if self.phases:
+            logger.info(f"Inicialização: {self.summary()}.")
+
+
+default_timer = StartupTimer()
+
+
+def measure_import_time(module, python=sys.executable):
+    """
+    Cumulative import time of `module` in a fresh interpreter, in seconds, from `python -X importtime`
+    (the interpreter start-up is not included).
+    """
+    result = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    # Lines look like "import time:   self [us] | cumulative | imported package"; the top-level module comes last
+    for line in reversed(result.stderr.splitlines()):
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6
+    raise ValueError(f"No import time reported for {module}")
@@ -0,0 +1,168 @@
+"""
+Append-only, compressed log of the study states of past runs, replacing the new.csv/old.csv
+rotation of PB3.py: each run writes only what changed, and any earlier state can be rebuilt.
+
+Layout of the log directory:
+
+- `deltas/<run>-<time>.json.gz`: the CAAEs whose value (the study's HTML fragment) changed
+  in run `<run>`, and those that left the listing. A run that changed nothing writes nothing.
+- `snapshots/<run>-<time>.json.gz`: the whole state after run `<run>`. The first run is a
+  snapshot, and one is added every `snapshot_every` runs, so rebuilding a state reads one
+  snapshot and fewer than `snapshot_every` deltas.
+
+Files are never rewritten, and are gzipped deterministically (no timestamp in the header),
+so a committed log grows by the size of the changes. `compact` applies the retention: the
+deltas older than it are folded into one snapshot and removed.
+"""
+import datetime
+import gzip
+import json
+import logging
+import os
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_STATE_LOG_PATH = "pb_history"
+DEFAULT_SNAPSHOT_EVERY = 30
+DELTAS, SNAPSHOTS = 'deltas', 'snapshots'
+TIME_FORMAT = '%Y%m%dT%H%M%SZ' # UTC, in the file names
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _write_gzip_json(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as raw, gzip.GzipFile(filename='', mode='wb', fileobj=raw, mtime=0) as f:
+        f.write(json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    os.replace(temp_path, path)
+
+
+def _read_gzip_json(path):
+    with gzip.open(path, 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))
+
+
+class StateLog:
+    """The delta and snapshot files under `path`: {caae: value} states indexed by run number and time."""
+
+    def __init__(self, path=DEFAULT_STATE_LOG_PATH, snapshot_every=DEFAULT_SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_every = snapshot_every
+
+    def _files(self, kind):
+        """{run: (time, file path)} of the `kind` files."""
+        directory = os.path.join(self.path, kind)
+        files = {}
+        for name in os.listdir(directory) if os.path.isdir(directory) else []:
+            if not name.endswith('.json.gz'):
+                continue
+            run, _, time = name[:-len('.json.gz')].partition('-')
+            files[int(run)] = (datetime.datetime.strptime(time, TIME_FORMAT).replace(tzinfo=datetime.timezone.utc),
+                               os.path.join(directory, name))
+        return files
+
+    def _write(self, kind, run, time, data):
+        directory = os.path.join(self.path, kind)
+        os.makedirs(directory, exist_ok=True)
+        name = f"{run:06d}-{time.astimezone(datetime.timezone.utc).strftime(TIME_FORMAT)}.json.gz"
+        _write_gzip_json(os.path.join(directory, name), dict(data, run=run, time=time.isoformat()))
+
+    def runs(self):
+        """[(run, time)] of the runs the log can rebuild, oldest first."""
+        runs = {run: time for run, (time, _) in self._files(DELTAS).items()}
+        runs.update((run, time) for run, (time, _) in self._files(SNAPSHOTS).items())
+        return sorted(runs.items())
+
+    def is_empty(self):
+        return not self.runs()
+
+    def run_at(self, when):
+        """The last run made at or before `when`, or None."""
+        runs = [run for run, time in self.runs() if time <= when]
+        return runs[-1] if runs else None
+
+    def state(self, run=None):
+        """The state after `run` (the latest by default): the closest snapshot, then the deltas after it."""
+        snapshots = self._files(SNAPSHOTS)
+        if run is None:
+            runs = self.runs()
+            if not runs:
+                return {}
+            run = runs[-1][0]
+        base = max((snapshot for snapshot in snapshots if snapshot <= run), default=None)
+        if base is None:
+            raise ValueError(f"Run {run} is older than the state log '{self.path}' keeps.")
+        state = _read_gzip_json(snapshots[base][1])['state']
+        deltas = self._files(DELTAS)
+        for delta_run in sorted(delta_run for delta_run in deltas if base < delta_run <= run):
+            delta = _read_gzip_json(deltas[delta_run][1])
+            state.update(delta['changed'])
+            for caae in delta['removed']:
+                state.pop(caae, None)
+        return state
+
+    def append(self, state, now=None):
+        """
+        Records `state` ({caae: value}) as a new run, writing only the CAAEs that changed since
+        the last one. Returns the run number, or None if nothing changed.
+        """
+        now = now or _now()
+        runs = self.runs()
+        if not runs:
+            self._write(SNAPSHOTS, 1, now, {'state': state})
+            logger.info(f"Histórico de estados iniciado em '{self.path}' com {len(state)} CAAEs.")
+            return 1
+        previous = self.state()
+        changed = {caae: value for caae, value in state.items() if previous.get(caae) != value}
+        removed = sorted(caae for caae in previous if caae not in state)
+        if not changed and not removed:
+            return None
+        run = runs[-1][0] + 1
+        self._write(DELTAS, run, now, {'changed': changed, 'removed': removed})
+        last_snapshot = max(self._files(SNAPSHOTS))
+        if run - last_snapshot >= self.snapshot_every:
+            self._write(SNAPSHOTS, run, now, {'state': state})
+        logger.info(f"Histórico de estados: execução {run} com {len(changed)} CAAEs alterados e {len(removed)} removidos.")
+        return run
+
+    def compact(self, keep, now=None):
+        """
+        Retention: folds the runs older than `keep` (a timedelta) into one snapshot of the last
+        of them and removes their files, so every state of the last `keep` can still be rebuilt.
+        Returns the number of files removed.
+        """
+        cutoff = (now or _now()) - keep
+        oldest_kept = self.run_at(cutoff)
+        if oldest_kept is None:
+            return 0
+        snapshots = self._files(SNAPSHOTS)
+        if oldest_kept not in snapshots:
+            time = dict(self.runs())[oldest_kept]
+            self._write(SNAPSHOTS, oldest_kept, time, {'state': self.state(oldest_kept)})
+        removed = [path for run, (_, path) in self._files(DELTAS).items() if run <= oldest_kept]
+        removed += [path for run, (_, path) in snapshots.items() if run < oldest_kept]
+        for path in removed:
+            os.remove(path)
+        if removed:
+            logger.info(f"Histórico de estados compactado: {len(removed)} arquivos anteriores à execução {oldest_kept} removidos.")
+        return len(removed)
+
+    def import_csv(self, csv_path, now=None):
+        """
+        Appends the state kept in a new.csv/old.csv of PB3.py ('CAAE'/'email' columns) as a run.
+        Returns the run number, or None if the file does not exist or changed nothing.
+        """
+        if not os.path.exists(csv_path):
+            return None
+        import pandas as pd # Only needed to migrate the CSV files
+        legacy_df = pd.read_csv(csv_path, dtype=str).dropna(subset=['CAAE', 'email'])
+        run = self.append(dict(zip(legacy_df['CAAE'], legacy_df['email'])), now)
+        logger.info(f"Importados {len(legacy_df)} CAAEs de '{csv_path}' para o histórico de estados.")
+        return run
+
+    def size(self):
+        """(number of files, total bytes) of the log."""
+        files = list(self._files(DELTAS).values()) + list(self._files(SNAPSHOTS).values())
+        return len(files), sum(os.path.getsize(path) for _, path in files)
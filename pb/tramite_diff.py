@@ -0,0 +1,78 @@
+"""
+Row-level comparison of trâmite histories.
+
+A study used to count as updated whenever its rendered HTML differed from the previous
+run, and the notification then repeated its whole trâmite history. Here the parsed rows
+are matched by a stable key (apreciação + data/hora + tipo + versão) and classified as
+added, removed or modified, so only those rows reach the notification email.
+"""
+import collections
+
+KEY_COLUMNS = (0, 1, 2, 3) # Apreciação, Data/Hora, Tipo Trâmite, Versão
+
+
+def tramite_key(row):
+    """Returns the stable key of a trâmite row."""
+    return tuple(row[column] for column in KEY_COLUMNS)
+
+
+def _keyed_rows(rows):
+    """
+    Maps each row to (key, occurrence) so that rows sharing a key (the same trâmite
+    repeated in the table) are matched in order instead of collapsing into one.
+    """
+    seen = collections.Counter()
+    keyed = {}
+    for row in rows or []:
+        key = tramite_key(row)
+        keyed[(key, seen[key])] = row
+        seen[key] += 1
+    return keyed
+
+
+class StudyDiff:
+    """Changes of one study between the stored state and the current run."""
+
+    def __init__(self, caae, details, is_new=False, added=None, removed=None, modified=None, header_changed=False):
+        self.caae = caae
+        self.details = details # Current details, used for the study header in the notification
+        self.is_new = is_new # No stored state: every current row is reported as added
+        self.added = added or [] # Rows only in the current run, in table order
+        self.removed = removed or [] # Rows only in the stored state, in their previous order
+        self.modified = modified or [] # (previous row, current row) pairs sharing a key
+        self.header_changed = header_changed # Title, PI or CAAE label changed
+
+    @property
+    def changed_rows(self):
+        return len(self.added) + len(self.removed) + len(self.modified)
+
+    def __bool__(self):
+        return self.is_new or self.header_changed or self.changed_rows > 0
+
+
+def diff_tramites(previous_rows, current_rows):
+    """Returns (added, removed, modified) between two lists of trâmite rows."""
+    previous = _keyed_rows(previous_rows)
+    current = _keyed_rows(current_rows)
+    added = [row for key, row in current.items() if key not in previous]
+    removed = [row for key, row in previous.items() if key not in current]
+    modified = [(previous[key], row) for key, row in current.items() if key in previous and previous[key] != row]
+    return added, removed, modified
+
+
+def diff_study(caae, previous_details, current_details):
+    """Compares the stored details of `caae` (None if unknown) with the current ones. Returns a StudyDiff."""
+    if previous_details is None:
+        return StudyDiff(caae, current_details, is_new=True, added=list(current_details['tramites'] or []))
+    if previous_details == current_details:
+        return StudyDiff(caae, current_details)
+    header_changed = any(previous_details[field] != current_details[field] for field in ('nome_estudo', 'pi', 'caae'))
+    added, removed, modified = diff_tramites(previous_details['tramites'], current_details['tramites'])
+    return StudyDiff(caae, current_details, added=added, removed=removed, modified=modified,
+                     header_changed=header_changed)
+
+
+def diff_studies(previous_studies, current_studies):
+    """Returns the StudyDiff of every study in `current_studies` ({caae: details}) that changed, in its order."""
+    diffs = (diff_study(caae, previous_studies.get(caae), details) for caae, details in current_studies.items())
+    return [diff for diff in diffs if diff]
@@ -0,0 +1,184 @@
+"""
+SQLite store of the studies and trâmite rows collected by the scraper.
+
+Replaces the rendered HTML fragments kept in new.csv/old.csv: every study is stored
+once in `studies` and its trâmite history as one row per trâmite in `tramites`, indexed
+by CAAE and by timestamp. Loading the previous state of a CAAE is an indexed lookup,
+and the notification HTML is rendered from these rows only when an email is built.
+"""
+import datetime
+import logging
+import os
+import sqlite3
+from .page_parsing import parse_study_html
+
+logger = logging.getLogger('PB_Scraper')
+
+DEFAULT_DB_PATH = "pb_state.sqlite3"
+TRAMITE_FIELDS = ('apreciacao', 'data_hora', 'tipo', 'versao', 'perfil', 'origem', 'destino', 'informacoes')
+SQLITE_MAX_PARAMETERS = 900 # Below SQLite's default limit of 999 host parameters
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    caae TEXT PRIMARY KEY,
+    caae_label TEXT NOT NULL,
+    nome_estudo TEXT NOT NULL,
+    pi TEXT NOT NULL,
+    has_tramite_table INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tramites (
+    caae TEXT NOT NULL REFERENCES studies(caae) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    apreciacao TEXT NOT NULL,
+    data_hora TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    versao TEXT NOT NULL,
+    perfil TEXT NOT NULL,
+    origem TEXT NOT NULL,
+    destino TEXT NOT NULL,
+    informacoes TEXT NOT NULL,
+    timestamp TEXT,
+    PRIMARY KEY (caae, position) -- Also serves as the index on CAAE
+);
+CREATE INDEX IF NOT EXISTS idx_tramites_timestamp ON tramites(timestamp);
+"""
+
+
+def tramite_timestamp(data_hora):
+    """Converts the 'dd/mm/yyyy HH:MM:SS' of the trâmite table to a sortable ISO string, or None."""
+    for fmt in ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y'):
+        try:
+            return datetime.datetime.strptime(data_hora.strip(), fmt).isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+class TramiteStore:
+    """
+    Studies and trâmites persisted in a SQLite file. The store is used from the main
+    thread only; workers hand their parsed details back to it through the pool results.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # --- Reads ---
+
+    def is_empty(self):
+        return self.connection.execute('SELECT 1 FROM studies LIMIT 1').fetchone() is None
+
+    def known_caaes(self):
+        """Returns the set of CAAEs with a stored study."""
+        return {row[0] for row in self.connection.execute('SELECT caae FROM studies')}
+
+    def load_studies(self, caaes):
+        """
+        Returns {caae: details} for the given CAAEs that are stored, where details has the
+        keys of page_parsing.parse_caae_details ('tramites' is None when the details page
+        had no trâmite table).
+        """
+        caaes = list(caaes)
+        studies = {}
+        for start in range(0, len(caaes), SQLITE_MAX_PARAMETERS):
+            chunk = caaes[start:start + SQLITE_MAX_PARAMETERS]
+            placeholders = ','.join('?' * len(chunk))
+            for caae, label, nome, pi, has_table in self.connection.execute(
+                    f'SELECT caae, caae_label, nome_estudo, pi, has_tramite_table FROM studies WHERE caae IN ({placeholders})',
+                    chunk):
+                studies[caae] = {'nome_estudo': nome, 'pi': pi, 'caae': label, 'tramites': [] if has_table else None}
+            for row in self.connection.execute(
+                    f'SELECT caae, {", ".join(TRAMITE_FIELDS)} FROM tramites WHERE caae IN ({placeholders}) ORDER BY caae, position',
+                    chunk):
+                studies[row[0]]['tramites'].append(list(row[1:]))
+        return studies
+
+    def load_study(self, caae):
+        """Returns the stored details of `caae`, or None."""
+        return self.load_studies([caae]).get(caae)
+
+    def tramites_since(self, since):
+        """Returns the trâmites dated at or after the datetime `since`, newest first, as dicts with their CAAE."""
+        cursor = self.connection.execute(
+            f'SELECT caae, {", ".join(TRAMITE_FIELDS)} FROM tramites WHERE timestamp >= ? ORDER BY timestamp DESC',
+            (since.replace(tzinfo=None).isoformat(),))
+        return [dict(zip(('caae',) + TRAMITE_FIELDS, row)) for row in cursor]
+
+    def tramite_times(self):
+        """Returns {caae: [datetime of each dated trâmite, newest first]} for every stored study."""
+        times = {}
+        for caae, timestamp in self.connection.execute(
+                'SELECT caae, timestamp FROM tramites WHERE timestamp IS NOT NULL ORDER BY caae, timestamp DESC'):
+            times.setdefault(caae, []).append(datetime.datetime.fromisoformat(timestamp))
+        return times
+
+    # --- Writes ---
+
+    def save_studies(self, studies, saved_at=None):
+        """Stores {caae: details} in one transaction, replacing the previous trâmites of each study."""
+        saved_at = (saved_at or datetime.datetime.now()).isoformat()
+        with self.connection:
+            for caae, details in studies.items():
+                self.connection.execute(
+                    'INSERT INTO studies (caae, caae_label, nome_estudo, pi, has_tramite_table, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(caae) DO UPDATE SET caae_label = excluded.caae_label, '
+                    'nome_estudo = excluded.nome_estudo, pi = excluded.pi, '
+                    'has_tramite_table = excluded.has_tramite_table, updated_at = excluded.updated_at',
+                    (caae, details['caae'], details['nome_estudo'], details['pi'],
+                     int(details['tramites'] is not None), saved_at))
+                self.connection.execute('DELETE FROM tramites WHERE caae = ?', (caae,))
+                self.connection.executemany(
+                    f'INSERT INTO tramites (caae, position, {", ".join(TRAMITE_FIELDS)}, timestamp) '
+                    f'VALUES (?, ?, {", ".join("?" * len(TRAMITE_FIELDS))}, ?)',
+                    [(caae, position, *row, tramite_timestamp(row[1]))
+                     for position, row in enumerate(details['tramites'] or [])])
+
+    def save_study(self, caae, details, saved_at=None):
+        self.save_studies({caae: details}, saved_at)
+
+    def import_legacy_csv(self, csv_path="new.csv"):
+        """
+        Fills the store from a new.csv written before the store existed, parsing its HTML
+        fragments ('caae'/'email_html' columns from PB4 or 'CAAE'/'email' from PB3).
+        Returns the number of studies imported.
+        """
+        if not os.path.exists(csv_path):
+            return 0
+        try:
+            import pandas as pd # Only needed for this one-off migration
+            legacy_df = pd.read_csv(csv_path, dtype=str).rename(columns={'CAAE': 'caae', 'email': 'email_html'})
+            legacy_df = legacy_df.dropna(subset=['caae', 'email_html'])
+        except Exception as e:
+            logger.error(f"Could not import legacy data from '{csv_path}': {e}", exc_info=True)
+            return 0
+        self.save_studies({caae: parse_study_html(html) for caae, html in zip(legacy_df['caae'], legacy_df['email_html'])})
+        logger.info(f"Imported {len(legacy_df)} studies from legacy file '{csv_path}' into '{self.path}'.")
+        return len(legacy_df)
+
+    def import_state_log(self, state_log):
+        """
+        Fills the store from the latest state of PB3.py's state log (pb.state_log), which
+        replaced its new.csv. Returns the number of studies imported.
+        """
+        try:
+            state = state_log.state()
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not import the state log '{state_log.path}': {e}", exc_info=True)
+            return 0
+        if state:
+            self.save_studies({caae: parse_study_html(html) for caae, html in state.items()})
+            logger.info(f"Imported {len(state)} studies from the state log '{state_log.path}' into '{self.path}'.")
+        return len(state)
@@ -0,0 +1,158 @@
+"""
+Readiness waits for Plataforma Brasil pages.
+
+Each wait polls a condition that the page itself exposes (an element being present,
+the listing rows changing, the AJAX traffic going idle) and returns as soon as it holds,
+instead of sleeping for a fixed budget. Every wait has a timeout and reports how long it
+actually waited to a WaitRecorder, so the log shows what the server really needed.
+"""
+import logging
+import threading
+import time
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException, StaleElementReferenceException
+
+logger = logging.getLogger('PB_Scraper')
+
+POLL_FREQUENCY = 0.1 # Seconds between condition checks
+
+# Counts XMLHttpRequests in flight. RichFaces (A4J) sends its AJAX requests through
+# XMLHttpRequest, so a zero count after a click means the A4J queue has drained.
+AJAX_MONITOR_JS = """
+if (!window.__pbAjax) {
+    window.__pbAjax = {pending: 0};
+    var originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        var finished = false;
+        var finish = function() { if (!finished) { finished = true; window.__pbAjax.pending--; } };
+        window.__pbAjax.pending++;
+        this.addEventListener('loadend', finish);
+        try { return originalSend.apply(this, arguments); } catch (e) { finish(); throw e; }
+    };
+}
+"""
+
+AJAX_IDLE_JS = """
+return document.readyState === 'complete' && (!window.__pbAjax || window.__pbAjax.pending === 0);
+"""
+
+# Text of every row in a table body, used to detect that a listing page was replaced.
+ROWS_SIGNATURE_JS = """
+var tbody = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!tbody) { return null; }
+var rows = tbody.rows || [];
+var parts = [];
+for (var i = 0; i < rows.length; i++) { parts.push(rows[i].textContent.replace(/\\s+/g, ' ').trim()); }
+return parts.join('\\n');
+"""
+
+
+class WaitRecorder:
+    """Thread-safe collection of wait durations, grouped by wait name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = [] # (name, seconds waited, timed out)
+
+    def record(self, name, elapsed, timed_out=False):
+        with self._lock:
+            self.records.append((name, elapsed, timed_out))
+        logger.debug(f"Wait '{name}' {'timed out' if timed_out else 'satisfied'} after {elapsed:.2f}s.")
+
+    def summary(self):
+        """Returns {name: {'count', 'total', 'max', 'timeouts'}}."""
+        result = {}
+        with self._lock:
+            records = list(self.records)
+        for name, elapsed, timed_out in records:
+            entry = result.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0, 'timeouts': 0})
+            entry['count'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['timeouts'] += int(timed_out)
+        return result
+
+    def log_summary(self):
+        summary = self.summary()
+        if not summary:
+            return
+        logger.info("Resumo das esperas (nome: quantidade, total, média, máximo, timeouts):")
+        for name, entry in sorted(summary.items()):
+            mean = entry['total'] / entry['count']
+            logger.info(f"  {name}: {entry['count']}x, total {entry['total']:.1f}s, média {mean:.2f}s, máx {entry['max']:.2f}s, timeouts {entry['timeouts']}")
+
+
+default_recorder = WaitRecorder()
+
+
+def wait_until(driver, condition, timeout, name, recorder=None):
+    """
+    Waits until `condition(driver)` returns a truthy value and returns that value.
+    Records the time waited under `name`; raises TimeoutException after `timeout` seconds.
+    """
+    recorder = recorder or default_recorder
+    start = time.monotonic()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY,
+                               ignored_exceptions=(StaleElementReferenceException,)).until(condition)
+    except TimeoutException:
+        recorder.record(name, time.monotonic() - start, timed_out=True)
+        raise
+    recorder.record(name, time.monotonic() - start)
+    return result
+
+
+def install_ajax_monitor(driver):
+    """Installs the XMLHttpRequest counter on the current page (idempotent)."""
+    try:
+        driver.execute_script(AJAX_MONITOR_JS)
+    except WebDriverException as e:
+        logger.debug(f"Could not install AJAX monitor: {e}")
+
+
+def is_ajax_idle(driver):
+    """Returns True if the document is loaded and no AJAX request is in flight."""
+    try:
+        return bool(driver.execute_script(AJAX_IDLE_JS))
+    except WebDriverException:
+        return False # Page in the middle of navigating; try again
+
+
+def wait_for_ajax_idle(driver, timeout=30, name='ajax_idle', recorder=None):
+    """Waits until the document is loaded and no AJAX request is in flight."""
+    return wait_until(driver, is_ajax_idle, timeout, name, recorder)
+
+
+def wait_for_element(driver, locator, timeout=30, name=None, clickable=False, recorder=None):
+    """Waits for the element at `locator` to be present (or clickable) and returns it."""
+    condition = EC.element_to_be_clickable(locator) if clickable else EC.presence_of_element_located(locator)
+    return wait_until(driver, condition, timeout, name or f"element {locator[1]}", recorder)
+
+
+def rows_signature(driver, tbody_xpath):
+    """Returns a string identifying the rows currently shown in the table body at `tbody_xpath`."""
+    try:
+        return driver.execute_script(ROWS_SIGNATURE_JS, tbody_xpath)
+    except WebDriverException:
+        return None
+
+
+def wait_for_rows_change(driver, tbody_xpath, previous_signature, timeout=30, expected_text=None,
+                         name='rows_change', recorder=None):
+    """
+    Waits until the rows of the table body at `tbody_xpath` differ from `previous_signature`
+    and AJAX traffic is idle. If `expected_text` is given, the wait is also satisfied as soon
+    as every row contains it, which covers a search that returns the rows already shown.
+    Returns the new signature.
+    """
+    def rows_changed(drv):
+        signature = rows_signature(drv, tbody_xpath)
+        if signature is None:
+            return False
+        changed = signature != previous_signature or (
+            expected_text is not None and all(expected_text in row for row in signature.split('\n')))
+        return changed and is_ajax_idle(drv)
+
+    wait_until(driver, rows_changed, timeout, name, recorder)
+    return rows_signature(driver, tbody_xpath)
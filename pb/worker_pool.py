@@ -0,0 +1,214 @@
+"""
+Worker pool for processing CAAEs over several independent browser sessions.
+
+Each worker owns one session (a WebDriver and its WebDriverWait) and a local
+deque of CAAEs. A worker drains its own deque first and, once it is empty,
+steals from the tail of the busiest remaining deque, so a slow worker never
+keeps the others idle. A CAAE that fails goes to a deferred queue, retried only
+once every deque is empty, so the healthy CAAEs never wait behind a broken one;
+a worker retrying a CAAE that failed in its own session first opens a fresh one.
+With a SessionSupervisor, a session that breaks (logged out, dead browser) is repaired and
+the worker goes on from the CAAE it was on. Results are merged back in the order of the input list, which keeps the downstream comparison
+independent of thread scheduling.
+
+This module has no Selenium imports of its own: sessions are created, used and
+closed through the callables passed to `run_worker_pool`.
+"""
+import collections
+import logging
+import threading
+from .session_supervisor import SessionLostError, SessionProblem
+
+logger = logging.getLogger('PB_Scraper')
+
+
+class WorkerPoolResult:
+    """Outcome of a pool run: merged records plus the CAAEs that never succeeded."""
+
+    def __init__(self, records, failed_caaes, attempts, unprocessed=()):
+        self.records = records # Successful records, in the order of the input list
+        self.failed_caaes = failed_caaes # CAAEs that never succeeded, in input order
+        self.attempts = attempts # {caae: number of attempts made}
+        # The failed CAAEs left without a session to finish them (not a failure of the CAAE itself)
+        self.unprocessed = list(unprocessed)
+
+
+class _WorkQueue:
+    """Per-worker deques guarded by one lock, with stealing from the busiest deque, and the deferred retries."""
+
+    def __init__(self, items, num_workers):
+        self._lock = threading.Lock()
+        self._deques = [collections.deque() for _ in range(num_workers)]
+        self._deferred = collections.deque()
+        for index, item in enumerate(items):
+            self._deques[index % num_workers].append(item) # Round-robin initial split
+
+    def take(self, worker_id):
+        """
+        Returns the next item for `worker_id`, stealing if its own deque is empty, then the
+        oldest deferred item once every deque is empty, or None.
+        """
+        with self._lock:
+            own = self._deques[worker_id]
+            if own:
+                return own.popleft()
+            victim = max(self._deques, key=len)
+            if victim:
+                return victim.pop() # Steal from the tail, away from the victim's own end
+            if self._deferred:
+                return self._deferred.popleft()
+            return None
+
+    def push_front(self, worker_id, item):
+        """Puts an item back at the head of the worker's own deque (the next one it takes)."""
+        with self._lock:
+            self._deques[worker_id].appendleft(item)
+
+    def defer(self, item):
+        """Queues a failed item for a retry after everything not yet tried."""
+        with self._lock:
+            self._deferred.append(item)
+
+    def drain(self):
+        """Removes and returns every item still queued (e.g. when no worker could start)."""
+        with self._lock:
+            remaining = [item for d in self._deques for item in d] + list(self._deferred)
+            for d in self._deques:
+                d.clear()
+            self._deferred.clear()
+            return remaining
+
+
+def run_worker_pool(caae_list, session_factory, process_caae, num_workers,
+                    max_attempts=2, close_session=None, initial_sessions=None, supervisor=None):
+    """
+    Processes `caae_list` with `num_workers` sessions pulling from a shared queue.
+
+    `session_factory(worker_id)` returns a new logged-in session, `process_caae(session, caae)`
+    returns a record dict or None on failure, and `close_session(session)` releases a session.
+    `initial_sessions` maps worker ids to sessions that already exist (e.g. the main driver).
+    A failed CAAE is deferred to the end of the queue until it has been tried `max_attempts`
+    times; a worker retrying a CAAE that failed in its current session first replaces it with
+    a new one from `session_factory` (keeping the old one if that fails). When `process_caae`
+    raises SessionProblem, `supervisor` (pb.session_supervisor) repairs the session and the
+    CAAE is tried again without counting as an attempt; a worker whose session is lost stops,
+    leaving its CAAEs to the others. Returns a WorkerPoolResult.
+    """
+    caae_list = list(caae_list)
+    num_workers = max(1, min(num_workers, len(caae_list) or 1))
+    initial_sessions = dict(initial_sessions or {})
+    order = {caae: index for index, caae in enumerate(caae_list)}
+
+    queue = _WorkQueue(caae_list, num_workers)
+    results = {}
+    attempts = collections.Counter()
+    failed = set()
+    unprocessed = set()
+    failed_in = {} # {caae: session of its last failed attempt}
+    state_lock = threading.Lock()
+
+    def worker(worker_id):
+        session = initial_sessions.pop(worker_id, None)
+        owns_session = session is None
+
+        def replace_session():
+            nonlocal session, owns_session
+            try:
+                fresh = session_factory(worker_id)
+            except Exception as e:
+                logger.error(f"Worker {worker_id}: could not open a fresh session: {e}. Retrying in the current one.", exc_info=True)
+                return
+            if close_session and owns_session:
+                try:
+                    close_session(session)
+                except Exception as e:
+                    logger.error(f"Worker {worker_id}: error closing session: {e}", exc_info=True)
+            session, owns_session = fresh, True
+            logger.info(f"Worker {worker_id}: fresh session ready for the deferred retries.")
+
+        try:
+            if session is None:
+                try:
+                    session = session_factory(worker_id)
+                except Exception as e:
+                    # Its deque stays in the queue, where the other workers will steal from it
+                    logger.error(f"Worker {worker_id}: could not start a session: {e}. Other workers will take its CAAEs.", exc_info=True)
+                    return
+            logger.info(f"Worker {worker_id}: session ready.")
+
+            while True:
+                caae = queue.take(worker_id)
+                if caae is None:
+                    break
+                with state_lock:
+                    attempts[caae] += 1
+                    attempt = attempts[caae]
+                if attempt > 1 and failed_in.get(caae) is session:
+                    replace_session()
+                try:
+                    record = process_caae(session, caae)
+                except SessionProblem as problem:
+                    record = None
+                    if supervisor is None:
+                        logger.error(f"Worker {worker_id}: session problem on CAAE {caae}: {problem}")
+                    else:
+                        try:
+                            recovered = supervisor.recover(worker_id, session, problem)
+                        except SessionLostError as e:
+                            logger.error(f"{e} Worker {worker_id} stops; its CAAEs are left to the other workers.")
+                            with state_lock:
+                                attempts[caae] -= 1
+                            queue.push_front(worker_id, caae)
+                            return
+                        if recovered is not None:
+                            session, owns_session = recovered
+                            with state_lock:
+                                attempts[caae] -= 1
+                            queue.push_front(worker_id, caae)
+                            continue
+                except Exception as e:
+                    logger.error(f"Worker {worker_id}: unexpected error on CAAE {caae}: {e}", exc_info=True)
+                    record = None
+                if record and supervisor is not None:
+                    supervisor.succeeded(worker_id)
+
+                if not record:
+                    with state_lock:
+                        failed_in[caae] = session
+                if record:
+                    with state_lock:
+                        results[caae] = record
+                    logger.info(f"Worker {worker_id}: CAAE {caae} done.")
+                elif attempt < max_attempts:
+                    logger.warning(f"Worker {worker_id}: CAAE {caae} failed (attempt {attempt}/{max_attempts}). Deferred to the end of the queue.")
+                    queue.defer(caae)
+                else:
+                    logger.error(f"Worker {worker_id}: CAAE {caae} failed after {attempt} attempts. Giving up.")
+                    with state_lock:
+                        failed.add(caae)
+        finally:
+            if session is not None and close_session and owns_session:
+                try:
+                    close_session(session)
+                except Exception as e:
+                    logger.error(f"Worker {worker_id}: error closing session: {e}", exc_info=True)
+
+    threads = [threading.Thread(target=worker, args=(worker_id,), name=f"pb-worker-{worker_id}", daemon=True)
+               for worker_id in range(num_workers)]
+    logger.info(f"Starting worker pool with {num_workers} worker(s) for {len(caae_list)} CAAEs.")
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for caae in queue.drain():
+        logger.error(f"CAAE {caae} was never processed: no worker session was available.")
+        unprocessed.add(caae)
+
+    # Deterministic merge: input order, regardless of which worker finished first
+    records = [results[caae] for caae in sorted(results, key=order.__getitem__)]
+    failed_caaes = sorted((failed | unprocessed) - set(results), key=order.__getitem__)
+    logger.info(f"Worker pool finished: {len(records)} succeeded, {len(failed_caaes)} failed"
+                f"{f' ({len(unprocessed)} left without a session)' if unprocessed else ''}.")
+    return WorkerPoolResult(records, failed_caaes, {caae: count for caae, count in attempts.items() if count},
+                            sorted(unprocessed, key=order.__getitem__))
@@ -0,0 +1,61 @@
+import json
+from pb.benchmark import (RecordedDataset, SyntheticDataset, anonymize_page, compare_results, evolve_studies,
+                          percentile, run_benchmark, write_results)
+from pb.fake_plataforma import generate_projects, render_detail_page, render_listing_page
+
+STAGES = ['parse_listing', 'parse_details', 'diff', 'render', 'assemble_email', 'compare_legacy']
+
+def test_synthetic_run_reports_every_stage(tmp_path):
+    results = run_benchmark(SyntheticDataset(20, max_tramites=30, changed_ratio=0.25))
+    assert list(results['stages']) == STAGES
+    assert results['dataset']['caaes'] == 20
+    assert results['stages']['parse_details']['items'] == 20
+    assert results['updated_studies'] == 5
+    for stage in results['stages'].values():
+        assert stage['p50_ms'] <= stage['p90_ms'] <= stage['p99_ms'] <= stage['max_ms']
+        assert stage['peak_memory_mb'] is not None
+    path = tmp_path / 'results.json'
+    write_results(results, path)
+    assert json.loads(path.read_text(encoding='utf-8'))['stages']['diff']['items'] == 20
+
+def test_recorded_pages_are_read_from_a_directory(tmp_path):
+    projects = [p for p in generate_projects(10, seed=4) if p['caae'].endswith('5262')]
+    (tmp_path / 'listing_1.html').write_text(render_listing_page('j1', 'u', projects, 1, '', page_size=100), encoding='utf-8')
+    for index, project in enumerate(projects):
+        (tmp_path / f'detail_{index}.html').write_text(render_detail_page('j2', 'u', project), encoding='utf-8')
+    results = run_benchmark(RecordedDataset(str(tmp_path)), track_memory=False, legacy=False)
+    assert results['stages']['parse_listing']['items'] == 1
+    assert results['stages']['parse_details']['items'] == len(projects)
+    assert results['stages']['parse_details']['peak_memory_mb'] is None
+    assert 'compare_legacy' not in results['stages']
+
+def test_evolved_studies_only_change_the_selected_share():
+    previous = {str(i): {'nome_estudo': 'x', 'pi': 'y', 'caae': str(i), 'tramites': [['E1', f'0{i}/01/2025', 't', '1', 'p', 'o', 'd', '']]}
+                for i in range(8)}
+    current = evolve_studies(previous, 0.5)
+    changed = [caae for caae in previous if current[caae] != previous[caae]]
+    assert changed == ['0', '2', '4', '6']
+    assert len(current['0']['tramites']) == 2 and previous['0']['tramites'][0][7] == ''
+
+def test_percentile_interpolates():
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([5], 99) == 5
+    assert percentile([], 50) is None
+
+def test_regressions_are_flagged_beyond_the_tolerance():
+    baseline = {'stages': {'parse_details': {'p50_ms': 10.0, 'peak_memory_mb': 5.0, 'throughput_per_second': 100.0},
+                           'diff': {'p50_ms': 0.002, 'peak_memory_mb': None, 'throughput_per_second': 50000.0}}}
+    current = {'stages': {'parse_details': {'p50_ms': 13.0, 'peak_memory_mb': 5.5, 'throughput_per_second': 70.0},
+                          'diff': {'p50_ms': 0.004, 'peak_memory_mb': None, 'throughput_per_second': 25000.0}}}
+    regressions = compare_results(baseline, current, tolerance=0.2)
+    assert len(regressions) == 2
+    assert all(r.startswith('parse_details:') for r in regressions)
+    assert compare_results(baseline, baseline) == []
+
+def test_anonymized_pages_keep_structure_but_not_personal_data():
+    html = ('<td>Pesquisador Responsável: Maria da Silva</td><td>CAAE: 12345678.9.0000.5262</td>'
+            '<span>maria@fiocruz.br</span><span>123.456.789-00</span>')
+    masked = anonymize_page(html)
+    assert 'Maria' not in masked and 'maria@' not in masked and '123.456.789-00' not in masked
+    assert '12345678' not in masked and '.9.0000.5262' in masked
+    assert masked == anonymize_page(html)
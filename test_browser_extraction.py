@@ -0,0 +1,75 @@
+import pytest
+from selenium.common.exceptions import JavascriptException
+from pb.browser_extraction import DETAILS_JS, LISTING_JS, ExtractionStats, extract_details, extract_listing
+from pb.fake_plataforma import generate_projects, render_detail_page, render_listing_page
+from pb.page_parsing import TRAMITE_TABLE_ID, extract_listing_rows, parse_caae_details
+
+PROJECTS = generate_projects(10, seed=11)
+
+class ScriptDriver:
+    """Driver whose execute_script returns canned results (or raises), with a page_source fallback."""
+
+    def __init__(self, page_source, results):
+        self.page_source = page_source
+        self.results = results
+        self.calls = []
+
+    def execute_script(self, script, *args):
+        self.calls.append((script, args))
+        result = self.results[script]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+def test_details_from_script_result():
+    project = PROJECTS[0]
+    spans = [f'  {cell}\n' for row in project['tramites'] for cell in row]
+    driver = ScriptDriver('', {DETAILS_JS: {
+        'title': 'Título da Pesquisa: "' + project['titulo'] + '"',
+        'pi': f"\nPesquisador Responsável: {project['pesquisador']}\n",
+        'caae': f"CAAE: {project['caae']}",
+        'spans': spans,
+    }})
+    stats = ExtractionStats()
+    details = extract_details(driver, stats)
+    assert details == parse_caae_details(render_detail_page('j_id1', 'pesquisador', project))
+    assert driver.calls == [(DETAILS_JS, (TRAMITE_TABLE_ID,))]
+    assert (stats.scripted, stats.fallbacks) == (1, 0)
+
+def test_details_script_without_table():
+    driver = ScriptDriver('', {DETAILS_JS: {'title': None, 'pi': None, 'caae': None, 'spans': None}})
+    assert extract_details(driver, ExtractionStats())['tramites'] is None
+
+@pytest.mark.parametrize('failure', [JavascriptException('closest is not a function'), None])
+def test_details_fall_back_to_page_source(failure):
+    html = render_detail_page('j_id1', 'pesquisador', PROJECTS[1])
+    stats = ExtractionStats()
+    details = extract_details(ScriptDriver(html, {DETAILS_JS: failure}), stats)
+    assert details == parse_caae_details(html, 'html.parser')
+    assert (stats.scripted, stats.fallbacks) == (0, 1)
+    assert stats.fallback_bytes == len(html.encode('utf-8'))
+
+def test_listing_from_script_result():
+    driver = ScriptDriver('', {LISTING_JS: [
+        {'label': '\n11111111.1.0000.5262\n', 'cells': ['11111111.1.0000.5262', ' Em\n apreciação ', '']},
+        {'label': '22222222.2.0000.5262', 'cells': None},
+    ]})
+    assert extract_listing(driver, '5262', ExtractionStats()) == [
+        {'caae': '11111111.1.0000.5262', 'columns': ['11111111.1.0000.5262', 'Em apreciação', '']},
+        {'caae': '22222222.2.0000.5262', 'columns': []},
+    ]
+    assert driver.calls == [(LISTING_JS, ('5262',))]
+
+def test_listing_falls_back_to_page_source():
+    html = render_listing_page('j_id1', 'pesquisador', PROJECTS, 0, '')
+    rows = extract_listing(ScriptDriver(html, {LISTING_JS: JavascriptException('boom')}), '5262', ExtractionStats())
+    assert rows == extract_listing_rows(html, '5262', 'html.parser')
+    assert rows
+
+def test_fast_parser_matches_html_parser():
+    pytest.importorskip('lxml')
+    for project in PROJECTS:
+        html = render_detail_page('j_id1', 'pesquisador', project)
+        assert parse_caae_details(html, 'lxml') == parse_caae_details(html, 'html.parser')
+    html = render_listing_page('j_id1', 'pesquisador', PROJECTS, 0, '')
+    assert extract_listing_rows(html, '5262', 'lxml') == extract_listing_rows(html, '5262', 'html.parser')
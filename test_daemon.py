@@ -0,0 +1,102 @@
+import datetime
+import random
+import pb.daemon as daemon_module
+from pb.daemon import RecyclePolicy, ScraperDaemon
+
+class FakeSessions:
+    def __init__(self, healthy=True, memory_mb=100):
+        self.healthy = healthy
+        self.memory = memory_mb
+        self.closed = False
+        self.keepalives = 0
+
+    def is_healthy(self):
+        return self.healthy
+
+    def keepalive(self):
+        self.keepalives += 1
+
+    def memory_mb(self):
+        return self.memory
+
+    def close(self):
+        self.closed = True
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_daemon(tmp_path, run_check, opened, clock=None, **kwargs):
+    def open_sessions():
+        opened.append(FakeSessions())
+        return opened[-1]
+    return ScraperDaemon(open_sessions, run_check, interval=0, trigger_path=str(tmp_path / 'trigger'),
+                         clock=clock or FakeClock(), rng=random.Random(1), **kwargs)
+
+def test_policy_reasons():
+    policy = RecyclePolicy(max_age=datetime.timedelta(hours=1), max_checks=5, max_failures=2, max_memory_mb=500)
+    assert policy.reason(10, 1, 0, 100, True) is None
+    assert policy.reason(10, 1, 0, 100, False) == "health probe failed"
+    assert 'consecutive' in policy.reason(10, 1, 2, 100, True)
+    assert 'checks' in policy.reason(10, 5, 0, 100, True)
+    assert 'older' in policy.reason(3600, 1, 0, 100, True)
+    assert 'memory' in policy.reason(10, 1, 0, 600, True)
+    assert RecyclePolicy(max_memory_mb=None).reason(10, 1, 0, None, True) is None
+
+def test_sessions_stay_warm_across_checks(tmp_path):
+    opened, seen = [], []
+    daemon = make_daemon(tmp_path, seen.append, opened)
+    daemon.run(max_checks=3)
+    assert daemon.checks_run == 3
+    assert len(opened) == 1 and seen == [opened[0]] * 3
+    assert opened[0].closed # Closed when the daemon stops
+
+def test_unhealthy_sessions_are_recycled_and_reopened(tmp_path):
+    opened = []
+    def check(sessions):
+        sessions.healthy = False
+    daemon = make_daemon(tmp_path, check, opened)
+    assert daemon.run_once()
+    assert daemon.recycles == 1
+    assert opened[0].closed and len(opened) == 2 and not opened[1].closed
+
+def test_repeated_failures_recycle_the_sessions(tmp_path):
+    opened = []
+    def check(sessions):
+        raise RuntimeError('logout page')
+    daemon = make_daemon(tmp_path, check, opened, policy=RecyclePolicy(max_failures=2))
+    assert not daemon.run_once()
+    assert daemon.recycles == 0
+    assert not daemon.run_once()
+    assert daemon.recycles == 1 and len(opened) == 2
+
+def test_jittered_delay_stays_within_bounds(tmp_path):
+    daemon = ScraperDaemon(lambda: None, lambda sessions: None, interval=600, jitter=0.25, rng=random.Random(3),
+                           trigger_path=str(tmp_path / 'trigger'))
+    delays = [daemon.next_delay() for _ in range(200)]
+    assert all(450 <= delay <= 750 for delay in delays)
+    assert len(set(delays)) > 1
+
+def test_trigger_file_ends_the_wait(tmp_path):
+    opened = []
+    daemon = make_daemon(tmp_path, lambda sessions: None, opened)
+    (tmp_path / 'trigger').write_text('')
+    daemon._wait(3600) # The fake clock never advances: only the trigger can end the wait
+    assert not (tmp_path / 'trigger').exists()
+    daemon.trigger()
+    daemon._wait(3600)
+
+def test_keepalive_runs_while_waiting(tmp_path, monkeypatch):
+    monkeypatch.setattr(daemon_module, 'POLL_SECONDS', 0.001)
+    class TickingClock(FakeClock):
+        def __call__(self):
+            self.now += 1
+            return self.now
+    opened = []
+    daemon = make_daemon(tmp_path, lambda sessions: None, opened, clock=TickingClock(), keepalive_interval=10)
+    daemon.run_once()
+    daemon._wait(35)
+    assert opened[0].keepalives in (2, 3)
@@ -0,0 +1,56 @@
+import io
+import zipfile
+from pb.digest import (ATTACHMENT_NAME, OVERFLOW_ATTACHMENT, Digest, build_digest, entry_from_diff, entry_from_study,
+                       message_size)
+from pb.page_parsing import render_study_html
+from pb.tramite_diff import diff_study
+
+def study(number, tramites=6):
+    rows = [['Apreciação', f'0{day % 9 + 1}/05/2025 10:00', 'Parecer <liberado>', '2', 'Coordenador', 'CEP', 'PESQUISADOR',
+             'Informações do trâmite ' * 3] for day in range(tramites)]
+    return {'nome_estudo': f'Estudo número {number}', 'pi': 'Pesquisadora Ção', 'caae': f'{number:08d}.0.0000.5262',
+            'tramites': rows}
+
+def entries(count, tramites=6):
+    return [entry_from_diff(diff_study(study(n)['caae'], None, study(n, tramites))) for n in range(count)]
+
+def digest():
+    return Digest('Atualizações da Plataforma Brasil em 01/06/2025', 'de@example.org', 'para@example.org',
+                  ['Bom dia equipe,', 'Houve alteração em <b>3</b> estudos.'], ['Um ótimo dia!'])
+
+def test_small_digest_is_one_multipart_alternative_message_with_shared_styles():
+    [msg] = build_digest(digest(), entries(3))
+    assert msg.get_content_type() == 'multipart/alternative'
+    text, html = [part.get_content() for part in msg.iter_parts()]
+    assert 'Houve alteração em 3 estudos.' in text and 'CAAE 00000002.0.0000.5262 - Estudo número 2' in text
+    assert '  Novo: Apreciação | 01/05/2025 10:00 | Parecer <liberado> | 2' in text
+    assert html.count('<style>') == 1 and 'style="' not in html and 'border="1"' not in html
+    assert 'Parecer &lt;liberado&gt;' in html
+    compact = entry_from_study(study(1))
+    assert len(compact.html) < 0.6 * len(render_study_html(study(1)))
+
+def test_overflow_is_split_into_numbered_parts_within_the_budget():
+    studies = entries(60)
+    messages = build_digest(digest(), studies, max_bytes=30 * 1024)
+    assert len(messages) > 1 and all(message_size(msg) <= 30 * 1024 for msg in messages)
+    assert messages[-1]['Subject'].endswith(f'(parte {len(messages)}/{len(messages)})')
+    texts = [msg.get_body(('plain',)).get_content() for msg in messages]
+    assert 'Parte 1 de' in texts[0] and sum(text.count('CAAE ') for text in texts) == 60
+    assert all(entry.caae in ''.join(texts) for entry in studies)
+
+def test_overflow_can_go_to_a_zipped_attachment():
+    studies = entries(60)
+    [msg] = build_digest(digest(), studies, max_bytes=30 * 1024, overflow=OVERFLOW_ATTACHMENT)
+    assert msg.get_content_type() == 'multipart/mixed' and message_size(msg) <= 30 * 1024
+    attachment = next(msg.iter_attachments())
+    assert attachment.get_filename() == ATTACHMENT_NAME
+    with zipfile.ZipFile(io.BytesIO(attachment.get_content())) as archive:
+        zipped = archive.read('estudos.html').decode('utf-8')
+    inline = msg.get_body(('plain',)).get_content()
+    assert 'estão no anexo' in inline
+    assert all((entry.caae in inline) != (entry.caae in zipped) for entry in studies)
+
+def test_a_study_larger_than_the_budget_is_sent_alone():
+    studies = entries(2, tramites=200)
+    messages = build_digest(digest(), studies, max_bytes=4 * 1024)
+    assert len(messages) == 2 and all(message_size(msg) > 4 * 1024 for msg in messages)
@@ -0,0 +1,75 @@
+import stat
+from pb.driver_provisioning import DriverCache, installed_chrome_version, provision_driver
+
+def fake_binary(directory, name, output):
+    path = directory / name
+    path.write_text(f"#!/bin/sh\necho '{output}'\n")
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
+
+def counting_install(path):
+    calls = []
+    def install():
+        calls.append(path)
+        return path
+    return install, calls
+
+def test_chrome_version_from_binary(tmp_path):
+    chrome = fake_binary(tmp_path, 'chrome', 'Google Chrome 124.0.6367.91 ')
+    assert installed_chrome_version(chrome) == '124.0.6367.91'
+    assert installed_chrome_version(str(tmp_path / 'missing')) is None
+
+def test_driver_is_resolved_once_then_served_from_the_cache(tmp_path):
+    chrome = fake_binary(tmp_path, 'chrome', 'Google Chrome 124.0.6367.91')
+    driver = fake_binary(tmp_path, 'chromedriver', 'ChromeDriver 124.0.6367.91 (abc)')
+    install, calls = counting_install(driver)
+    cache_path = str(tmp_path / 'cache.json')
+
+    assert provision_driver(DriverCache(cache_path), install, chrome_binary=chrome) == driver
+    assert provision_driver(DriverCache(cache_path), install, chrome_binary=chrome) == driver
+    assert len(calls) == 1
+    entry = DriverCache(cache_path).get('124')
+    assert entry['version'] == '124.0.6367.91' and entry['chrome_version'] == '124.0.6367.91'
+
+def test_chrome_update_invalidates_the_cached_driver(tmp_path):
+    old_driver = fake_binary(tmp_path, 'chromedriver-124', 'ChromeDriver 124.0.6367.91')
+    new_driver = fake_binary(tmp_path, 'chromedriver-125', 'ChromeDriver 125.0.6422.60')
+    cache = DriverCache(str(tmp_path / 'cache.json'))
+    cache.put('124.0.6367.91', old_driver, '124.0.6367.91')
+    chrome = fake_binary(tmp_path, 'chrome', 'Google Chrome 125.0.6422.60')
+    install, calls = counting_install(new_driver)
+    assert provision_driver(cache, install, chrome_binary=chrome) == new_driver
+    assert calls == [new_driver]
+
+def test_missing_cached_binary_is_resolved_again(tmp_path):
+    chrome = fake_binary(tmp_path, 'chrome', 'Google Chrome 124.0.6367.91')
+    cache = DriverCache(str(tmp_path / 'cache.json'))
+    cache.put('124.0.6367.91', str(tmp_path / 'gone'), '124.0.6367.91')
+    driver = fake_binary(tmp_path, 'chromedriver', 'ChromeDriver 124.0.6367.91')
+    install, calls = counting_install(driver)
+    assert provision_driver(cache, install, chrome_binary=chrome) == driver
+    assert len(calls) == 1
+
+def test_offline_uses_path_driver_or_selenium_manager(tmp_path, monkeypatch):
+    chrome = fake_binary(tmp_path, 'chrome', 'Google Chrome 124.0.6367.91')
+    def no_network():
+        raise AssertionError('offline mode must not resolve drivers online')
+    cache = DriverCache(str(tmp_path / 'cache.json'))
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    monkeypatch.setenv('PATH', str(bin_dir))
+    assert provision_driver(cache, no_network, offline=True, chrome_binary=chrome) is None
+    path_driver = fake_binary(bin_dir, 'chromedriver', 'ChromeDriver 124.0.6367.91')
+    assert provision_driver(cache, no_network, offline=True, chrome_binary=chrome) == path_driver
+
+def test_failed_online_install_falls_back(tmp_path, monkeypatch):
+    chrome = fake_binary(tmp_path, 'chrome', 'Google Chrome 124.0.6367.91')
+    def failing_install():
+        raise ConnectionError('no network')
+    monkeypatch.setenv('PATH', str(tmp_path / 'empty'))
+    assert provision_driver(DriverCache(str(tmp_path / 'cache.json')), failing_install, chrome_binary=chrome) is None
+
+def test_unreadable_cache_is_ignored(tmp_path):
+    path = tmp_path / 'cache.json'
+    path.write_text('{"124": ')
+    assert DriverCache(str(path)).entries == {}
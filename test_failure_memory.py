@@ -0,0 +1,61 @@
+import datetime
+import json
+from pb.config import Settings
+from pb.failure_memory import MAX_BACKOFF, FailureMemory
+from pb.fake_plataforma import FakePlataformaBrasil, generate_projects, serve_in_thread
+from pb.run import ScraperSessions, SessionGroup, run_check
+
+NOW = datetime.datetime(2025, 6, 2, 8, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=-3)))
+HOUR = datetime.timedelta(hours=1)
+
+def test_failing_caaes_back_off_and_are_forgotten_on_success(tmp_path):
+    path = str(tmp_path / 'caae_failures.json')
+    memory = FailureMemory(path)
+    memory.record_failure('b', NOW)
+    assert memory.split(['a', 'b', 'c'], NOW) == (['a', 'c'], ['b'])
+    assert memory.split(['a', 'b', 'c'], NOW + HOUR) == (['a', 'b', 'c'], [])
+    memory.record_failure('b', NOW + HOUR)
+    memory.save()
+    memory = FailureMemory(path)
+    assert memory.entries['b']['failures'] == 2 and memory.split(['b'], NOW + 2 * HOUR) == ([], ['b'])
+    assert memory.split(['b'], NOW + 3 * HOUR) == (['b'], [])
+    assert memory.backoff(20) == MAX_BACKOFF
+    assert memory.describe('b').startswith('b (2 execuções com falha, próxima tentativa 02/06/2025 11:00')
+    memory.record_success('b')
+    assert memory.entries == {}
+
+def test_broken_caae_is_retried_last_then_skipped_in_the_next_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    projects = generate_projects(10, seed=7)
+    ours = sorted(project['caae'] for project in projects if project['caae'].endswith('5262'))
+    broken = ours[0]
+    server, url = serve_in_thread(FakePlataformaBrasil(projects, users={'a@example.org': 'pa'}))
+    fetched = []
+    process_caae = ScraperSessions.process_caae
+    def failing_process_caae(self, session, caae):
+        fetched.append(caae)
+        return None if caae == broken else process_caae(self, session, caae)
+    monkeypatch.setattr(ScraperSessions, 'process_caae', failing_process_caae)
+    settings = Settings({'PB_LOGIN': 'a@example.org', 'PB_SENHA': 'pa', 'PB_ENGINE': 'http', 'PB_BASE_URL': url,
+                         'PB_INCREMENTAL': '0'})
+    runs = []
+    try:
+        for _ in range(2):
+            group = SessionGroup(settings)
+            try:
+                assert group.open()
+                run_facts = {}
+                run_check(group, settings, run_facts=run_facts)
+                runs.append(run_facts)
+            finally:
+                group.close()
+    finally:
+        server.shutdown()
+
+    first_run = fetched[:len(ours) + 1]
+    assert first_run[0] == broken and first_run[-1] == broken # Retried after every healthy CAAE
+    assert sorted(first_run[1:-1]) == ours[1:]
+    assert fetched[len(ours) + 1:] == ours[1:] # Backing off in the second run
+    assert [(facts['failed'], facts['skipped_caaes']) for facts in runs] == [(1, [broken]), (0, [broken])]
+    with open(tmp_path / 'caae_failures.json', encoding='utf-8') as f:
+        assert json.load(f)[broken]['failures'] == 1
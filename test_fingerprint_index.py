@@ -0,0 +1,76 @@
+import datetime
+import json
+from pb.fake_plataforma import generate_projects, render_listing_page
+from pb.fingerprint_index import FingerprintIndex, row_fingerprint
+from pb.page_parsing import extract_caaes_from_listing, extract_listing_rows
+
+NOW = datetime.datetime(2024, 5, 10, 12, 0, tzinfo=datetime.timezone.utc)
+ROWS = {
+    '11111111.1.0000.5262': ['11111111.1.0000.5262', 'Estudo A', 'Em apreciação', '10/05/2024'],
+    '22222222.2.0000.5262': ['22222222.2.0000.5262', 'Estudo B', 'Aprovado', '01/04/2024'],
+}
+
+def indexed(tmp_path, fetched_at=NOW):
+    index = FingerprintIndex(str(tmp_path / 'fingerprints.json'))
+    for caae, columns in ROWS.items():
+        index.record_fetch(caae, columns, fetched_at)
+    return index
+
+def test_row_fingerprint_depends_on_every_column():
+    assert row_fingerprint(['a', 'b']) == row_fingerprint(['a', 'b'])
+    assert row_fingerprint(['a', 'b']) != row_fingerprint(['a', 'c'])
+    assert row_fingerprint(['ab', '']) != row_fingerprint(['a', 'b'])
+
+def test_unchanged_rows_are_reused(tmp_path):
+    index = indexed(tmp_path)
+    to_fetch, to_reuse, _ = index.plan(list(ROWS), ROWS, set(ROWS), NOW + datetime.timedelta(hours=1))
+    assert to_fetch == []
+    assert to_reuse == list(ROWS)
+
+def test_new_changed_and_unknown_rows_are_fetched(tmp_path):
+    index = indexed(tmp_path)
+    listing = dict(ROWS)
+    listing['22222222.2.0000.5262'] = ['22222222.2.0000.5262', 'Estudo B', 'Pendência', '09/05/2024']
+    listing['33333333.3.0000.5262'] = ['33333333.3.0000.5262', 'Estudo C', 'Em edição', '09/05/2024']
+    caaes = list(listing) + ['44444444.4.0000.5262']
+    to_fetch, to_reuse, reasons = index.plan(caaes, listing, set(ROWS), NOW)
+    assert to_reuse == ['11111111.1.0000.5262']
+    assert reasons == {
+        '22222222.2.0000.5262': 'listing changed',
+        '33333333.3.0000.5262': 'new',
+        '44444444.4.0000.5262': 'no listing columns',
+    }
+    assert to_fetch == caaes[1:]
+
+def test_missing_stored_record_and_refresh_age_force_a_fetch(tmp_path):
+    index = indexed(tmp_path, fetched_at=NOW - datetime.timedelta(days=8))
+    index.record_fetch('11111111.1.0000.5262', ROWS['11111111.1.0000.5262'], NOW)
+    to_fetch, _, reasons = index.plan(list(ROWS), ROWS, {'22222222.2.0000.5262'}, NOW)
+    assert to_fetch == list(ROWS)
+    assert reasons['11111111.1.0000.5262'] == 'no stored record'
+    assert reasons['22222222.2.0000.5262'] == 'refresh age expired'
+
+def test_save_and_reload(tmp_path):
+    index = indexed(tmp_path)
+    index.save()
+    reloaded = FingerprintIndex(index.path)
+    assert reloaded.entries == json.loads(json.dumps(index.entries))
+    assert not (tmp_path / 'fingerprints.json.tmp').exists()
+    assert reloaded.plan(list(ROWS), ROWS, set(ROWS), NOW)[0] == []
+
+def test_corrupt_index_is_ignored(tmp_path):
+    path = tmp_path / 'fingerprints.json'
+    path.write_text('{not json', encoding='utf-8')
+    assert FingerprintIndex(str(path)).entries == {}
+
+def test_extract_listing_rows_from_listing_page():
+    projects = generate_projects(8, seed=3)
+    html = render_listing_page('j_id1', 'pesquisador', projects, 0, '')
+    rows = extract_listing_rows(html)
+    own = [p for p in projects if p['caae'].endswith('.5262')]
+    assert [row['caae'] for row in rows] == [p['caae'] for p in own]
+    assert extract_caaes_from_listing(html) == [p['caae'] for p in own]
+    for row, project in zip(rows, own):
+        assert row['columns'][0] == project['caae']
+        assert project['situacao'] in row['columns']
+        assert project['ultima_atualizacao'] in row['columns']
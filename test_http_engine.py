@@ -0,0 +1,102 @@
+import pytest
+from pb.fake_plataforma import FakePlataformaBrasil, generate_projects, serve_in_thread, LISTING_PATH
+from pb.http_engine import PlataformaBrasilHttpClient, SessionExpiredError, jsf_parameters
+
+# Offline tests for the browserless engine against the local stand-in server.
+
+USER, PASSWORD = 'pesquisador@example.org', 'senha'
+
+@pytest.fixture
+def app():
+    return FakePlataformaBrasil(generate_projects(35, seed=7), users={USER: PASSWORD})
+
+@pytest.fixture
+def base_url(app):
+    server, url = serve_in_thread(app)
+    yield url
+    server.shutdown()
+
+@pytest.fixture
+def client(base_url):
+    client = PlataformaBrasilHttpClient(base_url)
+    assert client.login(USER, PASSWORD)
+    yield client
+    client.close()
+
+def expected_details(project):
+    """The details the Selenium engine would parse for `project`."""
+    return {
+        'nome_estudo': project['titulo'],
+        'caae': project['caae'],
+        'pi': f"Pesquisador Responsável: {project['pesquisador']}",
+        'tramites': project['tramites'],
+    }
+
+def test_jsf_parameters():
+    assert jsf_parameters("if(typeof jsfcljs == 'function'){jsfcljs(document.getElementById('f'),{'f:t:0:lupa':'f:t:0:lupa'},'');}return false") == {'f:t:0:lupa': 'f:t:0:lupa'}
+    assert jsf_parameters("A4J.AJAX.Submit('_viewRoot','f',event,{'similarityGroupingId':'f:b','parameters':{'f:b':'f:b'}})") == {'f:b': 'f:b'}
+    assert jsf_parameters(None) == {}
+
+def test_login_with_wrong_password(base_url):
+    client = PlataformaBrasilHttpClient(base_url)
+    assert not client.login(USER, 'errada')
+
+def test_login_invalidates_existing_session(app, base_url):
+    first = PlataformaBrasilHttpClient(base_url)
+    assert first.login(USER, PASSWORD)
+    second = PlataformaBrasilHttpClient(base_url)
+    assert second.login(USER, PASSWORD) # Goes through the "usuário já logado" modal
+    with pytest.raises(SessionExpiredError):
+        first.fetch_caae_details(app.projects[0]['caae'])
+
+def own_caaes(app):
+    return sorted(p['caae'] for p in app.projects if p['caae'].endswith('.5262'))
+
+def test_list_caaes_filters_on_the_server(app, client):
+    own = own_caaes(app)
+    listing_rows = {}
+    assert client.list_caaes(listing_rows) == own
+    assert sorted(listing_rows) == own
+    # One search for the institution, then one request per extra page of our own projects
+    assert app.request_counts[('POST', LISTING_PATH)] == 1 + (len(own) - 1) // 10
+
+def test_list_caaes_uses_largest_page_size():
+    app = FakePlataformaBrasil(generate_projects(120, seed=5), users={USER: PASSWORD}, page_sizes=(10, 25, 50))
+    server, url = serve_in_thread(app)
+    try:
+        client = PlataformaBrasilHttpClient(url)
+        assert client.login(USER, PASSWORD)
+        assert client.list_caaes() == own_caaes(app)
+        # Page size change and search, then pages of 50 rows
+        assert app.request_counts[('POST', LISTING_PATH)] == 2 + (len(own_caaes(app)) - 1) // 50
+    finally:
+        server.shutdown()
+
+def test_list_caaes_walks_full_listing_when_search_does_not_filter(app, client, monkeypatch):
+    monkeypatch.setattr(app, 'filtered_projects', lambda filter_text: app.projects)
+    assert client.list_caaes() == own_caaes(app)
+    # Search and cleared search, then pages 2, 3 and 4 of the 35 records
+    assert app.request_counts[('POST', LISTING_PATH)] == 2 + 3
+
+def test_fetch_caae_details_matches_browser_details(app, client):
+    for project in app.projects[:5]:
+        record = client.fetch_caae_details(project['caae'])
+        assert record['caae'] == project['caae']
+        assert record['details'] == expected_details(project)
+
+def test_fetch_unknown_caae(client):
+    assert client.fetch_caae_details('00000000.0.0000.0000') is None
+
+def test_recovers_from_expired_view(app, client):
+    """A listing ViewState evicted on the server is replaced by reloading the listing."""
+    client.fetch_caae_details(app.projects[0]['caae'])
+    client._listing['fields']['javax.faces.ViewState'] = 'j_idexpired'
+    record = client.fetch_caae_details(app.projects[1]['caae'])
+    assert record['details'] == expected_details(app.projects[1])
+
+def test_clone_shares_login(app, client):
+    clone = client.clone()
+    record = clone.fetch_caae_details(app.projects[2]['caae'])
+    assert record['details'] == expected_details(app.projects[2])
+    # The original client keeps working in the same server session
+    assert client.fetch_caae_details(app.projects[3]['caae']) is not None
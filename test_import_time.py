@@ -0,0 +1,17 @@
+import subprocess
+import sys
+from pb.startup_timing import measure_import_time
+
+HEAVY_MODULES = ('pandas', 'numpy', 'bs4', 'requests', 'selenium', 'psutil')
+
+def test_library_modules_import_no_heavy_dependencies():
+    code = ("import sys\n"
+            "import pb, pb.cli, pb.config, pb.comparison, pb.notification, pb.run, pb.tramite_diff, pb.tramite_store\n"
+            "import PB3, PB4\n"
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
+
+def test_import_time_is_measured_in_a_fresh_interpreter():
+    seconds = measure_import_time('pb.tramite_diff')
+    assert 0 < seconds < 5
@@ -0,0 +1,51 @@
+import collections
+from pb.config import Settings
+from pb.fake_plataforma import FakePlataformaBrasil, generate_projects, serve_in_thread
+from pb.run import ScraperSessions, SessionGroup, run_check
+from pb.tramite_store import TramiteStore
+
+ENV = {'PB_LOGIN': 'a@example.org', 'PB_SENHA': 'pa', 'PB_LOGIN_2': 'b@example.org', 'PB_SENHA_2': 'pb',
+       'PB_INSTITUTIONS': '5262,5240', 'DESTINATARIO_EMAIL': 'todos@example.org',
+       'DESTINATARIO_EMAIL_5240': 'outra@example.org'}
+
+def test_accounts_institutions_and_recipients_are_read_from_the_environment():
+    settings = Settings(dict(ENV, PB_INSTITUTIONS_2='5240, 9999', PB_LOGIN_3='c@example.org'))
+    assert [(account.number, account.login, account.institutions) for account in settings.accounts] == [
+        (1, 'a@example.org', ['5262', '5240']), (2, 'b@example.org', ['5240']), (3, 'c@example.org', ['5262', '5240'])]
+    assert settings.missing_required() == ['EMAIL_PASSWORD', 'PB_SENHA_3']
+    assert settings.recipients == {'5262': 'todos@example.org', '5240': 'outra@example.org'}
+    assert settings.state_path('pb_state.sqlite3', '5262') == 'pb_state.sqlite3'
+    assert settings.state_path('pb_state.sqlite3', '5240') == 'pb_state_5240.sqlite3'
+    assert settings.session_cache_for(settings.accounts[1]) == 'pb_session_2.json'
+    single = Settings({'PB_LOGIN': 'a@example.org', 'PB_SENHA': 'pa'})
+    assert single.institutions == ['5262'] and len(single.accounts) == 1
+
+def test_each_caae_is_fetched_once_and_state_is_kept_per_institution(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    projects = generate_projects(12, seed=4)
+    server, url = serve_in_thread(FakePlataformaBrasil(projects, users={'a@example.org': 'pa', 'b@example.org': 'pb'}))
+    fetched = collections.Counter()
+    process_caae = ScraperSessions.process_caae
+    def counting_process_caae(self, session, caae):
+        fetched[(self.account.number, caae)] += 1
+        return process_caae(self, session, caae)
+    monkeypatch.setattr(ScraperSessions, 'process_caae', counting_process_caae)
+    settings = Settings(dict(ENV, PB_ENGINE='http', PB_BASE_URL=url))
+    group = SessionGroup(settings)
+    try:
+        assert group.open() and len(group.opened) == 2
+        run_facts = {}
+        updates, status = run_check(group, settings, run_facts=run_facts)
+    finally:
+        group.close()
+        server.shutdown()
+
+    ours = {project['caae'] for project in projects if project['caae'].endswith(('5262', '5240'))}
+    assert {caae for _, caae in fetched} == ours
+    assert set(fetched.values()) == {1} and {account for account, _ in fetched} == {1} # Listed first by account 1
+    assert updates == len(ours) == run_facts['caaes'] and status.startswith('5262: ') and '5240: ' in status
+    assert run_facts['institutions']['5240']['updates'] == sum(caae.endswith('5240') for caae in ours)
+    for path, code in (('pb_state.sqlite3', '5262'), ('pb_state_5240.sqlite3', '5240')):
+        with TramiteStore(str(tmp_path / path)) as store:
+            assert store.known_caaes() == {caae for caae in ours if caae.endswith(code)}
+    assert (tmp_path / 'fingerprints_5240.json').exists() and (tmp_path / 'pb_session_2.json').exists()
@@ -0,0 +1,104 @@
+import datetime
+import smtplib
+import PB3
+from pb.cli import main
+from pb.digest import Digest, build_digest, entry_from_study
+from pb.outbox import BASE_DELAY, Outbox, flush_outbox
+
+NOW = datetime.datetime(2025, 6, 2, 12, 0, tzinfo=datetime.timezone.utc)
+
+def messages(count, recipient='para@example.org', subject='Atualizações'):
+    digest = Digest(subject, 'de@example.org', recipient, ['Bom dia equipe,'])
+    return [build_digest(digest, [entry_from_study({'nome_estudo': f'Estudo {n}', 'pi': 'PI', 'caae': f'{n}.5262',
+                                                    'tramites': None})])[0] for n in range(count)]
+
+class FakeSMTP:
+    """Records the messages sent; `failures` lists the exception (or None) raised by each send_message call."""
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.sent = []
+
+    def send_message(self, msg):
+        failure = self.failures.pop(0) if self.failures else None
+        if failure:
+            raise failure
+        self.sent.append(msg['Subject'] + ' ' + msg['To'])
+
+    def quit(self):
+        pass
+
+def test_enqueue_is_durable_and_idempotent(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox'))
+    first, second = messages(2)
+    key = outbox.enqueue(first, NOW)
+    assert key and outbox.enqueue(messages(1)[0], NOW) is None # Same recipient and studies: same key
+    assert outbox.enqueue(second, NOW)
+    keys = {state['key'] for state in outbox.pending()}
+    assert keys == {key, second['X-PB-Idempotency-Key']}
+    assert outbox.message({'key': key})['Message-ID'] == f"<{key}@example.org>"
+    connection = FakeSMTP()
+    assert set(flush_outbox(outbox, lambda: connection, NOW).sent) == keys and len(connection.sent) == 2
+    assert outbox.pending() == [] and outbox.enqueue(messages(1)[0], NOW) is None # Already sent
+
+def test_a_later_notification_with_the_same_studies_is_sent(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox'))
+    outbox.enqueue(messages(1, subject='Atualizações em 02/06/2025')[0], NOW)
+    flush_outbox(outbox, FakeSMTP, NOW)
+    later = NOW + datetime.timedelta(days=1) # The study went back to the same trâmite the next day
+    assert outbox.enqueue(messages(1, subject='Atualizações em 03/06/2025')[0], later)
+    assert len(flush_outbox(outbox, FakeSMTP, later).sent) == 1
+
+def test_pb3_rerun_of_the_same_run_queues_its_digest_once(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox'))
+    fragment = ('<p><b>Estudo A</b></p><p>CAAE: 11111111.1.0000.5262</p><p>PI</p>'
+                '<table><tbody><tr><td>PO</td><td>01/06/2025 10:00</td><td>Parecer</td><td>1</td>'
+                '<td>CEP</td><td>CEP</td><td>PI</td><td>ok</td></tr></tbody></table>')
+    PB3.enfileirar_email(outbox, [fragment], 'para@example.org', NOW)
+    PB3.enfileirar_email(outbox, [fragment], 'para@example.org', NOW + datetime.timedelta(minutes=3, seconds=7)) # Retried run
+    assert len(outbox.pending()) == 1
+
+def test_one_connection_is_reused_and_reopened_once_when_dropped(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox'))
+    for msg in messages(3):
+        outbox.enqueue(msg, NOW)
+    connections = [FakeSMTP([None, smtplib.SMTPServerDisconnected('gone')]), FakeSMTP()]
+    result = flush_outbox(outbox, lambda: connections.pop(0), NOW)
+    assert len(result.sent) == 3 and connections == []
+    assert outbox.sent_keys() == set(result.sent)
+
+def test_failures_back_off_and_give_up_after_max_attempts(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox'))
+    for msg in messages(2):
+        outbox.enqueue(msg, NOW)
+    def unreachable():
+        raise ConnectionRefusedError('no route')
+    result = flush_outbox(outbox, unreachable, NOW, max_attempts=3)
+    assert len(result.deferred) == 2 and outbox.due(NOW) == []
+    assert outbox.due(NOW + BASE_DELAY) != [] and outbox.pending()[0]['last_error'] == 'no route'
+    refused = smtplib.SMTPRecipientsRefused({'para@example.org': (550, b'no such user')})
+    result = flush_outbox(outbox, lambda: FakeSMTP([refused]), NOW + BASE_DELAY)
+    assert len(result.sent) == 1 and len(result.deferred) == 1 # Only the refused message waits
+    later = NOW + datetime.timedelta(hours=1)
+    result = flush_outbox(outbox, lambda: FakeSMTP([refused]), later, max_attempts=3)
+    assert len(result.dead) == 1 and outbox.pending() == []
+    assert len(list((tmp_path / 'outbox' / 'failed').glob('*.eml'))) == 1
+
+def test_authentication_failure_defers_everything(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox'))
+    for msg in messages(2):
+        outbox.enqueue(msg, NOW)
+    def bad_login():
+        raise smtplib.SMTPAuthenticationError(535, b'bad credentials')
+    result = flush_outbox(outbox, bad_login, NOW)
+    assert result.sent == [] and len(result.deferred) == 2
+    assert [state['attempts'] for state in outbox.pending()] == [1, 1]
+
+def test_status_and_send_commands(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('EMAIL_PASSWORD', raising=False)
+    outbox = Outbox(str(tmp_path / 'outbox'))
+    outbox.enqueue(messages(1)[0])
+    assert main(['outbox', 'status', '--outbox', outbox.path]) == 0
+    assert '1 mensagens pendentes' in capsys.readouterr().out
+    assert main(['outbox', 'send', '--outbox', outbox.path]) == 1 # No password: the message stays queued
+    assert len(outbox.pending()) == 1
@@ -0,0 +1,30 @@
+from bs4 import BeautifulSoup
+from pb.fake_plataforma import generate_projects, render_listing_page
+from pb.page_parsing import count_listing_rows, find_page_size_select, institution_filter, listing_page_count
+
+PROJECTS = generate_projects(30, seed=2)
+
+def test_institution_filter_matches_only_own_caaes():
+    assert institution_filter('5262') == '.5262'
+    assert all(p['caae'].endswith('.5262') == (institution_filter() in p['caae']) for p in PROJECTS)
+
+def test_listing_page_count():
+    assert listing_page_count(0, 10) == 1
+    assert listing_page_count(10, 10) == 1
+    assert listing_page_count(11, 10) == 2
+    assert listing_page_count(87, 50) == 2
+    assert listing_page_count(25, 0) == 3 # Unknown rows per page: datascroller default of 10
+
+def test_count_listing_rows():
+    html = render_listing_page('j_id1', 'pesquisador', PROJECTS, 2, '')
+    assert count_listing_rows(html) == 10
+    assert count_listing_rows(render_listing_page('j_id1', 'pesquisador', [], 0, '')) == 0
+
+def test_find_page_size_select():
+    html = render_listing_page('j_id1', 'pesquisador', PROJECTS, 0, '', page_size=25, page_sizes=(10, 25, 50))
+    page_size = find_page_size_select(BeautifulSoup(html, 'html.parser'))
+    assert page_size['sizes'] == [10, 25, 50]
+    assert page_size['selected'] == 25
+    assert 'A4J.AJAX.Submit' in page_size['onchange']
+    assert find_page_size_select(BeautifulSoup(render_listing_page('j_id1', 'u', PROJECTS, 0, ''), 'html.parser')) is None
+    assert find_page_size_select(BeautifulSoup('<select name="uf"><option>RJ</option><option>SP</option></select>', 'html.parser')) is None
@@ -1,6 +1,6 @@
 import pandas as pd
 import pytest
-from PB3 import _perform_data_comparison # Import the helper function
+from pb.comparison import _perform_data_comparison # Import the helper function
 
 # Instructions for running tests:
 # Ensure pytest is installed (pip install pytest).
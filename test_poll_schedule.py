@@ -0,0 +1,71 @@
+import datetime
+from pb.fingerprint_index import FingerprintIndex
+from pb.poll_schedule import ACTIVE, SETTLED, PollPolicy, listing_status, plan_polling
+from pb.tramite_store import TramiteStore
+
+NOW = datetime.datetime(2025, 6, 2, 11, 0)
+WEEK = datetime.timedelta(days=7)
+
+def row(caae, title, situation, modified='01/01/2025'):
+    """The cells of a listing row, as the listing lays them out."""
+    return [caae, title, 'Pesquisador', '1', 'Instituição', situation, 'Pesquisador', modified, '01/01/2024', '']
+
+ROWS = {
+    'active.5262': row('active.5262', 'Estudo A', 'Em Apreciação Ética', '01/01/2025'),
+    'recent.5262': row('recent.5262', 'Estudo B', 'Aprovado', '20/05/2025'),
+    'dormant.5262': row('dormant.5262', 'Estudo C', 'Aprovado', '01/06/2024'),
+    'quiet.5262': row('quiet.5262', 'Estudo D', 'Desconhecida', '01/04/2025'),
+}
+TRAMITES = {
+    'active.5262': [datetime.datetime(2025, 1, 1)],
+    'recent.5262': [datetime.datetime(2025, 5, 20), datetime.datetime(2025, 5, 1), datetime.datetime(2025, 4, 1)],
+    'dormant.5262': [datetime.datetime(2024, 6, 1)],
+    'quiet.5262': [datetime.datetime(2025, 4, 1)],
+}
+
+def days(value):
+    return datetime.timedelta(days=value)
+
+def test_listing_situations_are_classified_without_accents():
+    assert listing_status(row('x', 'Estudo', 'Em Apreciação Ética')) == ACTIVE
+    assert listing_status(row('x', 'Estudo', 'PENDENCIA DOCUMENTAL')) == ACTIVE
+    assert listing_status(row('x', 'Estudo', 'Não Aprovado')) == SETTLED
+    assert listing_status(row('x', 'Estudo', 'Retirado')) == SETTLED
+    assert listing_status(row('x', 'Estudo', 'Outra')) is None and listing_status(None) is None
+
+def test_only_the_situation_column_is_matched():
+    title = 'Validação de recurso terapêutico aguardando comparação com placebo'
+    assert listing_status(row('x', title, 'Aprovado')) == SETTLED
+    assert listing_status(row('x', title, 'Outra')) is None
+    assert listing_status(['x', title, 'Em Apreciação Ética']) is None # Not a listing row
+
+def test_active_studies_every_run_and_dormant_ones_on_a_capped_decaying_schedule():
+    plan = plan_polling(list(ROWS), ROWS, TRAMITES, PollPolicy(max_staleness=WEEK), NOW)
+    assert plan.refresh_ages['active.5262'] == days(0) # Situation under review
+    assert plan.refresh_ages['recent.5262'] == days(0) # Trâmite within the active window
+    assert plan.refresh_ages['quiet.5262'] == (NOW - TRAMITES['quiet.5262'][0]) * 0.1 # 10% of the idle time
+    assert plan.refresh_ages['dormant.5262'] == WEEK # Settled and idle for a year: capped at the maximum staleness
+    assert plan.refresh_ages.get('unknown.5262') is None
+    assert plan_polling(['new.5262'], {}, {}, PollPolicy(WEEK), NOW).refresh_ages['new.5262'] == WEEK
+    assert sorted(plan.every_run()) == ['active.5262', 'recent.5262']
+    assert plan.by_priority(list(ROWS)) == ['recent.5262', 'active.5262', 'quiet.5262', 'dormant.5262']
+
+def test_fingerprint_plan_follows_the_refresh_ages(tmp_path):
+    index = FingerprintIndex(str(tmp_path / 'fingerprints.json'))
+    fetched = NOW - days(3)
+    for caae, columns in ROWS.items():
+        index.record_fetch(caae, columns, fetched)
+    plan = plan_polling(list(ROWS), ROWS, TRAMITES, PollPolicy(max_staleness=WEEK), NOW)
+    to_fetch, to_reuse, reasons = index.plan(list(ROWS), ROWS, set(ROWS), NOW, WEEK, plan.refresh_ages)
+    assert to_fetch == ['active.5262', 'recent.5262']
+    assert reasons['active.5262'] == 'active study'
+    to_fetch, _, reasons = index.plan(list(ROWS), ROWS, set(ROWS), NOW + days(4), WEEK, plan.refresh_ages)
+    assert to_fetch == list(ROWS) # Nothing goes unpolled for longer than a week
+    assert reasons['dormant.5262'] == 'refresh age expired' and reasons['quiet.5262'].startswith('poll interval')
+
+def test_store_returns_the_trâmite_dates_newest_first(tmp_path):
+    with TramiteStore(str(tmp_path / 'state.sqlite3')) as store:
+        tramites = [['A', '01/04/2025 10:00:00', 't', '1', 'p', 'o', 'd', ''], ['A', '20/05/2025', 't', '1', 'p', 'o', 'd', ''],
+                    ['A', 'sem data', 't', '1', 'p', 'o', 'd', '']]
+        store.save_study('x.5262', {'nome_estudo': 'X', 'pi': 'PI', 'caae': 'x.5262', 'tramites': tramites})
+        assert store.tramite_times() == {'x.5262': [datetime.datetime(2025, 5, 20), datetime.datetime(2025, 4, 1, 10)]}
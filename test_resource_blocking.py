@@ -0,0 +1,89 @@
+import fnmatch
+import json
+from selenium.common.exceptions import WebDriverException
+from pb.resource_blocking import ALLOWED_RESOURCE_TYPES, BLOCKED_URL_PATTERNS, BlockingReport, enable_blocking
+
+PAGE_RESOURCES = [
+    'https://plataformabrasil.saude.gov.br/login.jsf',
+    'https://plataformabrasil.saude.gov.br/visao/pesquisador/gerirPesquisa/gerirPesquisaAgrupador.jsf',
+    'https://plataformabrasil.saude.gov.br/a4j/g/3_3_3.Finalorg.ajax4jsf.javascript.AjaxScript.jsf',
+    'https://plataformabrasil.saude.gov.br/a4j/g/3_3_3.Finalorg/richfaces/renderkit/html/scripts/scrollable-data-table.js.jsf',
+    'https://plataformabrasil.saude.gov.br/resources/js/prototype.js',
+]
+
+def blocked(url):
+    return any(fnmatch.fnmatchcase(url, pattern) for pattern in BLOCKED_URL_PATTERNS)
+
+class FakeDriver:
+    def __init__(self, log=None, fail=False):
+        self.commands = []
+        self.log = log or []
+        self.fail = fail
+
+    def execute_cdp_cmd(self, command, params):
+        if self.fail:
+            raise WebDriverException('cdp unavailable')
+        self.commands.append((command, params))
+
+    def get_log(self, kind):
+        assert kind == 'performance'
+        return [{'message': json.dumps({'message': message})} for message in self.log]
+
+class FakeResponse:
+    def __init__(self, length):
+        self.headers = {'Content-Length': str(length)}
+
+class FakeSession:
+    def __init__(self):
+        self.urls = []
+
+    def head(self, url, timeout, allow_redirects):
+        self.urls.append(url)
+        return FakeResponse(1024)
+
+def test_patterns_keep_documents_scripts_and_ajax():
+    assert not any(blocked(url) for url in PAGE_RESOURCES)
+    assert blocked('https://plataformabrasil.saude.gov.br/resources/css/estilo.css')
+    assert blocked('https://plataformabrasil.saude.gov.br/a4j/s/3_3_3.Finalorg/richfaces/skin.xcss/DATB/eAF7')
+    assert blocked('https://plataformabrasil.saude.gov.br/imagens/logo.png?v=2')
+    assert blocked('https://www.googletagmanager.com/gtag/js?id=UA-1')
+
+def test_enable_blocking_sends_cdp_commands():
+    driver = FakeDriver()
+    assert enable_blocking(driver)
+    assert driver.commands[0] == ('Network.enable', {})
+    assert driver.commands[1] == ('Network.setBlockedURLs', {'urls': list(BLOCKED_URL_PATTERNS)})
+    assert not enable_blocking(FakeDriver(fail=True))
+
+def request(request_id, url, resource_type):
+    return {'method': 'Network.requestWillBeSent', 'params': {'requestId': request_id, 'type': resource_type, 'request': {'url': url}}}
+
+def test_report_counts_blocked_and_loaded_requests():
+    css = 'https://plataformabrasil.saude.gov.br/estilo.css'
+    log = [
+        request('1', PAGE_RESOURCES[0], 'Document'),
+        {'method': 'Network.loadingFinished', 'params': {'requestId': '1', 'encodedDataLength': 2048}},
+        request('2', css, 'Stylesheet'),
+        {'method': 'Network.loadingFailed', 'params': {'requestId': '2', 'type': 'Stylesheet', 'blockedReason': 'inspector'}},
+        request('3', css, 'Stylesheet'),
+        {'method': 'Network.loadingFailed', 'params': {'requestId': '3', 'type': 'Stylesheet', 'blockedReason': 'inspector'}},
+        request('4', PAGE_RESOURCES[2], 'Script'),
+        {'method': 'Network.loadingFailed', 'params': {'requestId': '4', 'type': 'Script', 'errorText': 'net::ERR_FAILED'}},
+    ]
+    report = BlockingReport()
+    report.collect(FakeDriver(log))
+    assert (report.loaded_requests, report.loaded_bytes) == (1, 2048)
+    assert report.blocked_requests == {'Stylesheet': 2}
+    assert report.blocked_urls == {css: 2}
+    assert not report.blocked_allowed_types
+
+    session = FakeSession()
+    assert report.measure_saved_bytes(session) == 1024
+    assert session.urls == [css]
+
+def test_report_flags_blocked_allowed_types():
+    report = BlockingReport()
+    report.add_events([request('1', PAGE_RESOURCES[4], 'Script'),
+                       {'method': 'Network.loadingFailed', 'params': {'requestId': '1', 'type': 'Script', 'blockedReason': 'inspector'}}])
+    assert 'Script' in ALLOWED_RESOURCE_TYPES
+    assert report.blocked_allowed_types == {PAGE_RESOURCES[4]: 1}
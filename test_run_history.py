@@ -0,0 +1,64 @@
+import datetime
+from pb.cli import main
+from pb.run_history import (LEGACY_TIMEZONE, RunHistory, find_regressions, import_legacy_log, parse_duration,
+                            parse_legacy_log, run_record, trend_lines)
+
+LEGACY_LOG = """2025-02-18 05:05:48.887645 - O programa comecou a rodar.
+18/02/2025 05:05:48 - O email foi enviado com sucesso. 77 estudos atualizados. Demorou: 0:31:35.092597 minutos
+
+2025-02-26 18:35:13.470296+03:00 - O programa comecou a rodar.
+26/02/2025 18:50:13 - O email nao precisou ser enviado. 0 estudos atualizados. Demorou: 0:28:52.070476 minutos
+
+2025-03-01 10:00:00.000000-03:00 - O programa comecou a rodar.
+Traceback (most recent call last):
+selenium.common.exceptions.WebDriverException: Message: disconnected
+2025-05-22 09:55:16,696 - INFO - run.main - --- Iniciando script PB3 --- Hora de início: 22/05/2025 09:55:16 ---
+2025-05-22 09:56:02,087 - INFO - run.run_check - Iniciando processamento de 40 CAAEs com 1 worker(s)...
+2025-05-22 10:20:00,001 - ERROR - run.run_check - Falha ao processar detalhes para o CAAE: 123. Detalhes não serão incluídos.
+2025-05-22 10:25:16,500 - INFO - run.run - Número de estudos atualizados/novos: 3
+2025-05-22 10:25:16,501 - INFO - run.run - Status final do Email: Email enviado com sucesso para x com 3 atualizações/novos estudos.
+"""
+
+def at(day, hour=11):
+    return datetime.datetime(2025, 4, day, hour, tzinfo=LEGACY_TIMEZONE)
+
+def test_legacy_log_runs_become_records():
+    records = parse_legacy_log(LEGACY_LOG.splitlines(keepends=True))
+    assert [record['status'] for record in records] == ['ok', 'ok', 'error', 'ok']
+    first, second, crashed, logged = records
+    assert first['started'] == '2025-02-18T05:05:48.887645-03:00'
+    assert first['duration_seconds'] == 1895.093 and first['updates'] == 77 and first['email_sent'] is True
+    assert second['started'].startswith('2025-02-26T18:35:13') and second['email_sent'] is False
+    assert crashed['finished'] is None and crashed['duration_seconds'] is None
+    assert (logged['caaes'], logged['failed'], logged['processed'], logged['updates']) == (40, 1, 39, 3)
+    assert logged['duration_seconds'] == 1800.501
+    assert parse_duration('1 day, 2:00:00') == datetime.timedelta(days=1, hours=2)
+
+def test_import_is_append_only_and_skips_known_runs(tmp_path):
+    log_path = tmp_path / 'registro.txt'
+    log_path.write_text(LEGACY_LOG, encoding='utf-8')
+    history = RunHistory(str(tmp_path / 'run_history.jsonl'))
+    history.append(run_record(datetime.datetime(2025, 2, 18, 5, 5, 48, 887645, tzinfo=LEGACY_TIMEZONE),
+                              datetime.datetime(2025, 2, 18, 5, 30, tzinfo=LEGACY_TIMEZONE), source='PB3', updates=77))
+    assert import_legacy_log(history, str(log_path)) == (4, 3)
+    assert import_legacy_log(history, str(log_path)) == (4, 0)
+    records = history.records()
+    assert len(records) == 4 and records[0]['source'] == 'PB3'
+
+def test_slow_runs_and_failure_rate_regressions_are_flagged():
+    records = [run_record(at(day), at(day) + datetime.timedelta(minutes=30), caaes=100, failed=1) for day in range(1, 8)]
+    records.append(run_record(at(8), at(8) + datetime.timedelta(minutes=50), caaes=100, failed=1))
+    records.append(run_record(at(9), at(9) + datetime.timedelta(minutes=31), caaes=100, failed=20))
+    records.append(run_record(at(10), None, status='login_failed'))
+    flagged = find_regressions(records, window=5, duration_threshold=0.5, failure_threshold=0.1)
+    assert [record['started'][:10] for record, _ in flagged] == ['2025-04-08', '2025-04-09', '2025-04-10']
+    assert 'duração' in flagged[0][1][0] and 'falhas' in flagged[1][1][0]
+    assert trend_lines(records)[0].startswith('2025-04: 10 execuções (1 sem sucesso)')
+
+def test_report_command_fails_on_a_regressed_latest_run(tmp_path, capsys):
+    history = RunHistory(str(tmp_path / 'run_history.jsonl'))
+    history.extend([run_record(at(day), at(day) + datetime.timedelta(minutes=30)) for day in range(1, 6)])
+    assert main(['history', 'report', '--history', history.path, '--fail-on-regression']) == 0
+    history.append(run_record(at(6), at(6) + datetime.timedelta(hours=2)))
+    assert main(['history', 'report', '--history', history.path, '--fail-on-regression', '--by', 'week']) == 1
+    assert 'Execuções com regressão (1)' in capsys.readouterr().out
@@ -0,0 +1,72 @@
+import datetime
+import json
+import threading
+from pb.run_journal import RunJournal, read_entries
+
+START = datetime.datetime(2024, 5, 10, 9, 0, tzinfo=datetime.timezone.utc)
+FRESHNESS = datetime.timedelta(hours=4)
+
+def interrupted_journal(path, records=3):
+    journal = RunJournal(str(path), FRESHNESS, now=START)
+    journal.record_listing(['a', 'b', 'c', 'd'], {'a': ['a', 'Aprovado']})
+    for caae in 'abcd'[:records]:
+        journal.record(caae, {'details': {'caae': caae}})
+    journal.close()
+
+def test_new_journal_starts_empty(tmp_path):
+    journal = RunJournal(str(tmp_path / 'journal.jsonl'))
+    assert not journal.resumed
+    assert journal.listing() is None and journal.records() == {}
+    journal.close()
+
+def test_resume_after_interruption(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    interrupted_journal(path)
+    journal = RunJournal(str(path), FRESHNESS, now=START + datetime.timedelta(minutes=30))
+    assert journal.resumed
+    assert journal.listing() == (['a', 'b', 'c', 'd'], {'a': ['a', 'Aprovado']})
+    assert set(journal.records()) == {'a', 'b', 'c'}
+    journal.record('d', {'details': {'caae': 'd'}})
+    journal.close()
+    assert set(RunJournal(str(path), FRESHNESS, now=START + datetime.timedelta(minutes=31)).records()) == set('abcd')
+
+def test_completed_run_is_not_resumed(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    interrupted_journal(path)
+    journal = RunJournal(str(path), FRESHNESS, now=START + datetime.timedelta(minutes=30))
+    journal.complete()
+    journal.close()
+    journal = RunJournal(str(path), FRESHNESS, now=START + datetime.timedelta(minutes=40))
+    assert not journal.resumed and journal.records() == {}
+    journal.close()
+    assert [entry['type'] for entry in read_entries(str(path))] == ['run']
+
+def test_stale_journal_is_not_resumed(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    interrupted_journal(path)
+    journal = RunJournal(str(path), FRESHNESS, now=START + datetime.timedelta(hours=5))
+    assert not journal.resumed and journal.listing() is None
+    journal.close()
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    interrupted_journal(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "record", "caae": "d", "rec')
+    journal = RunJournal(str(path), FRESHNESS, now=START + datetime.timedelta(minutes=30))
+    assert set(journal.records()) == {'a', 'b', 'c'}
+    journal.close()
+
+def test_concurrent_records_are_whole_lines(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    journal = RunJournal(str(path))
+    threads = [threading.Thread(target=lambda n=n: [journal.record(f'{n}-{i}', {'email': 'x' * 500}) for i in range(20)])
+               for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    journal.close()
+    with open(path, encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert len(lines) == 1 + 80
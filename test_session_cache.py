@@ -0,0 +1,87 @@
+import datetime
+import os
+import pytest
+from pb.fake_plataforma import FakePlataformaBrasil, generate_projects, serve_in_thread, LISTING_PATH
+from pb.http_engine import PlataformaBrasilHttpClient
+from pb.session_cache import SessionCache, probe_session, restore_browser_session
+
+USER, PASSWORD = 'pesquisador@example.org', 'senha'
+NOW = datetime.datetime(2024, 6, 3, 12, 0, tzinfo=datetime.timezone.utc)
+COOKIE = {'name': 'JSESSIONID', 'value': 'ABC', 'domain': 'plataformabrasil.saude.gov.br', 'path': '/', 'httpOnly': True}
+
+@pytest.fixture
+def base_url():
+    server, url = serve_in_thread(FakePlataformaBrasil(generate_projects(12, seed=3), users={USER: PASSWORD}))
+    yield url
+    server.shutdown()
+
+def test_save_and_load_round_trip(tmp_path):
+    cache = SessionCache(str(tmp_path / 'session.json'))
+    assert cache.load(NOW) is None
+    cache.save([COOKIE], NOW)
+    assert cache.load(NOW + datetime.timedelta(hours=1)) == [COOKIE]
+    assert os.stat(cache.path).st_mode & 0o777 == 0o600
+    cache.clear()
+    assert cache.load(NOW) is None
+
+def test_old_cache_and_expired_cookies_are_ignored(tmp_path):
+    cache = SessionCache(str(tmp_path / 'session.json'), max_age=datetime.timedelta(hours=2))
+    cache.save([COOKIE], NOW)
+    assert cache.load(NOW + datetime.timedelta(hours=3)) is None
+    expired = dict(COOKIE, expiry=int(NOW.timestamp()) - 60)
+    cache.save([expired], NOW)
+    assert cache.load(NOW) is None
+
+def test_unreadable_cache_is_ignored(tmp_path):
+    path = tmp_path / 'session.json'
+    path.write_text('{"saved_at": "2024-06-03T12:00:00+00:00", "cook')
+    assert SessionCache(str(path)).load(NOW) is None
+
+def test_probe_accepts_only_an_authenticated_session(base_url):
+    client = PlataformaBrasilHttpClient(base_url)
+    assert client.login(USER, PASSWORD)
+    probe_url = base_url + LISTING_PATH
+    assert probe_session(client.cookies(), url=probe_url)
+    assert not probe_session([dict(COOKIE, value='UNKNOWN')], url=probe_url)
+    client.close()
+
+def test_http_client_resumes_cached_session(base_url):
+    first = PlataformaBrasilHttpClient(base_url)
+    assert first.login(USER, PASSWORD)
+    cookies = first.cookies()
+    resumed = PlataformaBrasilHttpClient(base_url)
+    assert resumed.restore_session(cookies)
+    assert resumed.list_caaes()
+    assert not PlataformaBrasilHttpClient(base_url).restore_session([dict(cookies[0], value='UNKNOWN')])
+
+class FallbackDriver:
+    """A browser without the DevTools protocol: cookies need a page of their domain first."""
+
+    def __init__(self):
+        self.calls = []
+
+    def execute_cdp_cmd(self, command, params):
+        raise AttributeError('no cdp')
+
+    def get(self, url):
+        self.calls.append(('get', url))
+
+    def add_cookie(self, cookie):
+        self.calls.append(('add_cookie', cookie['name']))
+
+def test_restore_browser_session_without_cdp():
+    driver = FallbackDriver()
+    restore_browser_session(driver, [dict(COOKIE, sameSite='Lax')], url='https://example.org/listing')
+    assert driver.calls == [('get', 'https://example.org/login.jsf'), ('add_cookie', 'JSESSIONID'),
+                            ('get', 'https://example.org/listing')]
+
+def test_restored_cookies_belong_to_the_server_of_the_url():
+    class CdpDriver:
+        def execute_cdp_cmd(self, command, params):
+            self.cookies = params['cookies']
+        def get(self, url):
+            self.url = url
+    driver = CdpDriver()
+    cookie = {key: value for key, value in COOKIE.items() if key != 'domain'}
+    restore_browser_session(driver, [cookie], url='http://127.0.0.1:8765/visao/listing.jsf')
+    assert driver.cookies[0]['url'] == 'http://127.0.0.1:8765' and driver.url == 'http://127.0.0.1:8765/visao/listing.jsf'
@@ -0,0 +1,63 @@
+import pytest
+from pb.config import Settings
+from pb.fake_plataforma import FakePlataformaBrasil, generate_projects, serve_in_thread
+from pb.run import ScraperSessions, SessionGroup, run_check
+from pb.session_supervisor import (DRIVER_DEAD, LOGGED_OUT, STALE_ELEMENT, SessionLostError, SessionProblem,
+                                   SessionSupervisor)
+
+def test_one_login_serves_every_logged_out_worker():
+    calls = []
+    def reopen(worker_id, session, kind, login):
+        calls.append((worker_id, login))
+        return f'{session}+', True
+    supervisor = SessionSupervisor(reopen)
+    assert supervisor.recover(1, 's1', SessionProblem(LOGGED_OUT)) == ('s1+', True)
+    assert supervisor.recover(2, 's2', SessionProblem(LOGGED_OUT)) == ('s2+', True) # Its session predates the login
+    assert supervisor.recover(1, 's1+', SessionProblem(LOGGED_OUT)) == ('s1++', True) # Logged out again: new login
+    assert calls == [(1, True), (2, False), (1, True)]
+    assert supervisor.recoveries == [(1, LOGGED_OUT), (2, LOGGED_OUT), (1, LOGGED_OUT)]
+
+def test_stale_elements_only_reopen_in_a_storm_and_recoveries_are_limited():
+    supervisor = SessionSupervisor(lambda worker_id, session, kind, login: ('new', True), max_recoveries=2, stale_storm=2)
+    assert supervisor.recover(0, 'old', SessionProblem(STALE_ELEMENT)) is None
+    supervisor.succeeded(0)
+    assert supervisor.recover(0, 'old', SessionProblem(STALE_ELEMENT)) is None
+    assert supervisor.recover(0, 'old', SessionProblem(STALE_ELEMENT)) == ('new', True)
+    assert supervisor.recover(0, 'new', SessionProblem(DRIVER_DEAD)) == ('new', True)
+    with pytest.raises(SessionLostError):
+        supervisor.recover(0, 'new', SessionProblem(DRIVER_DEAD))
+
+def test_failed_reopen_loses_the_session():
+    def reopen(worker_id, session, kind, login):
+        raise RuntimeError('no browser')
+    with pytest.raises(SessionLostError):
+        SessionSupervisor(reopen).recover(1, 'old', SessionProblem(DRIVER_DEAD))
+
+def test_check_logs_in_again_when_the_server_session_expires(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    projects = generate_projects(12, seed=3)
+    ours = sorted(project['caae'] for project in projects if project['caae'].endswith('5262'))
+    app = FakePlataformaBrasil(projects, users={'a@example.org': 'pa'})
+    server, url = serve_in_thread(app)
+    fetched = []
+    process_caae = ScraperSessions.process_caae
+    def expiring_process_caae(self, session, caae):
+        fetched.append(caae)
+        if len(fetched) == 3:
+            for server_session in app.sessions.values(): # The server drops every session mid-check
+                server_session['user'] = None
+        return process_caae(self, session, caae)
+    monkeypatch.setattr(ScraperSessions, 'process_caae', expiring_process_caae)
+    settings = Settings({'PB_LOGIN': 'a@example.org', 'PB_SENHA': 'pa', 'PB_ENGINE': 'http', 'PB_BASE_URL': url,
+                         'PB_INCREMENTAL': '0', 'PB_WORKERS': '2'})
+    group = SessionGroup(settings)
+    try:
+        assert group.open()
+        run_facts = {}
+        run_check(group, settings, run_facts=run_facts)
+    finally:
+        group.close()
+        server.shutdown()
+
+    assert run_facts['fetched'] == len(ours) and run_facts['failed'] == 0 and run_facts['skipped_caaes'] == []
+    assert 1 <= run_facts['session_recoveries'] <= 2 and run_facts['retries'] == 0
@@ -0,0 +1,38 @@
+import time
+import requests
+from pb.fake_plataforma import FakePlataformaBrasil, LISTING_PATH, LOGIN_PATH, generate_projects, serve_in_thread
+from pb.simulation import SimulatorConfig, Strategy, format_runs, run_benchmark, run_strategy
+
+def test_responses_are_delayed_by_the_configured_latency():
+    server, url = serve_in_thread(FakePlataformaBrasil(generate_projects(5), latency=0.2, jitter=0.05, seed=1))
+    try:
+        started = time.perf_counter()
+        assert requests.get(url + LOGIN_PATH, timeout=5).status_code == 200
+        assert time.perf_counter() - started >= 0.15
+    finally:
+        server.shutdown()
+
+def test_failures_are_injected_only_in_listing_requests():
+    app = FakePlataformaBrasil(generate_projects(5), error_rate=1.0, error_kinds=('status',), error_status=500, seed=1)
+    server, url = serve_in_thread(app)
+    try:
+        assert requests.get(url + LOGIN_PATH, timeout=5).status_code == 200
+        assert requests.get(url + LISTING_PATH, timeout=5).status_code == 500
+        assert app.error_counts == {'status': 1}
+    finally:
+        server.shutdown()
+
+def test_http_strategy_scrapes_every_caae_despite_failures():
+    simulator = SimulatorConfig(projects=25, latency=0.0, error_rate=0.1, error_kinds=('view_expired',), seed=3)
+    result = run_strategy(Strategy('http', workers=2), simulator)
+    assert 'error' not in result
+    assert result['caaes'] > 0 and result['processed'] == result['caaes'] and result['failed'] == 0
+    assert result['requests'] > result['caaes']
+
+def test_benchmark_runs_each_strategy_and_reports_errors():
+    simulator = SimulatorConfig(projects=10, latency=0.0)
+    results = run_benchmark([Strategy('http', 1), Strategy('unknown', 1)], simulator, repeats=2)
+    assert [run['engine'] for run in results['runs']] == ['http', 'http', 'unknown', 'unknown']
+    assert 'error' not in results['runs'][0]
+    assert 'error' in results['runs'][2]
+    assert len(format_runs(results)) == 4
@@ -0,0 +1,68 @@
+import datetime
+import json
+import threading
+from pb.simulation import SimulatorConfig, Strategy, run_strategy
+from pb.spans import SERVER, SpanRecorder, build_run_metrics, default_spans, export_run_metrics, prometheus_text
+
+def test_spans_sleeps_and_server_waits_are_kept_apart():
+    spans = SpanRecorder()
+    with spans.span('caae.search'):
+        spans.record('http.post', 0.5, SERVER)
+    spans.sleep(0.01, 'lupa_retry')
+    spans.record('caae.search', 2.0)
+    summary = spans.summary()
+    assert summary['span']['caae.search']['count'] == 2
+    assert summary['span']['caae.search']['max'] == 2.0
+    assert summary['server'] == {'http.post': {'count': 1, 'total': 0.5, 'max': 0.5}}
+    assert summary['sleep']['lupa_retry']['total'] >= 0.01
+    spans.reset()
+    assert spans.summary() == {'span': {}, 'server': {}, 'sleep': {}}
+
+def test_spans_are_summed_across_threads():
+    spans = SpanRecorder()
+    threads = [threading.Thread(target=lambda: [spans.record('caae.parse', 0.001) for _ in range(500)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert spans.summary('span')['caae.parse']['count'] == 2000
+
+def test_run_metrics_are_exported_as_json_and_prometheus(tmp_path):
+    spans = SpanRecorder()
+    spans.record('login', 3.0)
+    spans.record('listing.page', 1.0)
+    spans.record('listing.page', 2.0)
+    spans.record('lupa_retry', 1.0, 'sleep')
+    started = datetime.datetime(2025, 5, 1, 8, 0, tzinfo=datetime.timezone.utc)
+    run = {'started': started, 'finished': started + datetime.timedelta(seconds=30), 'duration_seconds': 30.0,
+           'engine': 'browser', 'caaes': 10, 'processed': 9, 'failed': 1, 'updates': 2}
+    metrics = build_run_metrics(run, spans, waits={'detail_page': {'count': 9, 'total': 4.5, 'max': 1.0}})
+    assert metrics['totals'] == {'span_seconds': 6.0, 'server_wait_seconds': 4.5, 'sleep_seconds': 1.0}
+    assert metrics['spans']['listing.page'] == {'count': 2, 'total': 3.0, 'max': 2.0}
+    assert metrics['server_waits']['wait.detail_page']['count'] == 9
+
+    json_path, prometheus_path = tmp_path / 'run_metrics.json', tmp_path / 'run_metrics.prom'
+    export_run_metrics(metrics, str(json_path), str(prometheus_path))
+    assert json.loads(json_path.read_text(encoding='utf-8'))['run']['started'] == started.isoformat()
+    text = prometheus_path.read_text(encoding='utf-8')
+    assert 'pb_run_duration_seconds 30.0' in text
+    assert 'pb_run_caaes{state="failed"} 1' in text
+    assert 'pb_span_seconds_total{span="listing.page"} 3.0' in text
+    assert 'pb_span_count{span="listing.page"} 2' in text
+    assert 'pb_server_wait_seconds_total{wait="wait.detail_page"} 4.5' in text
+    assert 'pb_sleep_seconds_total{sleep="lupa_retry"} 1.0' in text
+    assert 'pb_run_time_seconds{category="sleep"} 1.0' in text
+    assert not (tmp_path / 'run_metrics.prom.tmp').exists()
+    assert prometheus_text(metrics).count('# TYPE pb_span_seconds_total gauge') == 1
+
+def test_http_engine_records_the_steps_and_requests_of_each_caae():
+    default_spans.reset()
+    result = run_strategy(Strategy('http', workers=1), SimulatorConfig(projects=5, latency=0.0))
+    assert 'error' not in result
+    summary = default_spans.summary()
+    assert summary['span']['login']['count'] == 1
+    for step in ('caae.search', 'caae.lupa', 'caae.parse'):
+        assert summary['span'][step]['count'] == result['processed']
+    assert summary['span']['listing.page']['count'] >= 1
+    assert summary['server']['http.post']['count'] >= 2 * result['processed']
+    assert summary['sleep'] == {}
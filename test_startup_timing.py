@@ -0,0 +1,16 @@
+from pb.startup_timing import StartupTimer
+
+def test_phases_are_accumulated_in_order():
+    timer = StartupTimer()
+    timer.record('provisioning', 0.5)
+    with timer.phase('browser launch'):
+        pass
+    timer.record('provisioning', 0.25)
+    assert list(timer.phases) == ['provisioning', 'browser launch']
+    assert timer.phases['provisioning'] == 0.75
+    assert timer.summary().startswith('provisioning 0.75s, browser launch 0.00s (total 0.75s)')
+
+def test_imports_phase_is_measured_from_process_start():
+    timer = StartupTimer()
+    timer.record_imports()
+    assert timer.phases['imports'] > 0
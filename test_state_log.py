@@ -0,0 +1,67 @@
+import csv
+import datetime
+import os
+import pandas as pd
+import pytest
+from pb.cli import main
+from pb.state_log import DELTAS, SNAPSHOTS, StateLog
+from pb.tramite_store import TramiteStore
+
+NOW = datetime.datetime(2025, 6, 2, 8, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=-3)))
+DAY = datetime.timedelta(days=1)
+
+def files(tmp_path, kind):
+    directory = tmp_path / 'pb_history' / kind
+    return sorted(os.listdir(directory)) if directory.exists() else []
+
+def test_runs_store_only_their_changes_and_every_state_can_be_rebuilt(tmp_path):
+    log = StateLog(str(tmp_path / 'pb_history'), snapshot_every=3)
+    states = [{'a': '<p>a1</p>', 'b': '<p>b1</p>'}, {'a': '<p>a2</p>', 'b': '<p>b1</p>'},
+              {'a': '<p>a2</p>', 'b': '<p>b1</p>'}, {'a': '<p>a2</p>', 'c': '<p>c1</p>'},
+              {'a': '<p>a3</p>', 'c': '<p>c1</p>'}]
+    runs = [log.append(state, NOW + n * DAY) for n, state in enumerate(states)]
+    assert runs == [1, 2, None, 3, 4] # An unchanged run writes nothing
+    assert len(files(tmp_path, DELTAS)) == 3 and len(files(tmp_path, SNAPSHOTS)) == 2 # First run, then every 3 runs
+    assert [log.state(run) for run in (1, 2, 3, 4)] == [states[0], states[1], states[3], states[4]]
+    assert log.run_at(NOW + 2 * DAY) == 2 and log.run_at(NOW - DAY) is None
+    with pytest.raises(ValueError):
+        StateLog(str(tmp_path / 'pb_history')).state(0)
+
+def test_compaction_folds_old_runs_into_a_snapshot(tmp_path):
+    log = StateLog(str(tmp_path / 'pb_history'), snapshot_every=100)
+    for n in range(6):
+        log.append({'a': f'<p>a{n}</p>', 'b': '<p>b</p>'}, NOW + n * DAY)
+    expected = {run: log.state(run) for run in range(3, 7)}
+    assert log.compact(datetime.timedelta(days=3), NOW + 5 * DAY) == 3 # Runs 1-3 folded into a snapshot of run 3
+    assert [run for run, _ in log.runs()] == [3, 4, 5, 6]
+    assert {run: log.state(run) for run in range(3, 7)} == expected
+    assert log.compact(datetime.timedelta(days=3), NOW + 5 * DAY) == 0
+
+def test_files_are_deterministic(tmp_path):
+    contents = []
+    for name in ('one', 'two'):
+        log = StateLog(str(tmp_path / name))
+        log.append({'a': '<p>a</p>'}, NOW)
+        log.append({'a': '<p>á</p>'}, NOW + DAY)
+        contents.append([(tmp_path / name / DELTAS / file).read_bytes() for file in os.listdir(tmp_path / name / DELTAS)])
+    assert contents[0] == contents[1]
+
+def test_legacy_csv_import_export_and_store_bootstrap(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    html = ('<p><b>Estudo A</b></p><p>CAAE: 11111111.1.0000.5262</p><p>PI</p>'
+            '<table><tbody><tr><td>PO</td><td>01/06/2025 10:00</td><td>Parecer</td><td>1</td>'
+            '<td>CEP</td><td>CEP</td><td>PI</td><td>ok</td></tr></tbody></table>')
+    pd.DataFrame({'CAAE': ['11111111.1.0000.5262'], 'email': ['<p>old</p>']}).to_csv('old.csv', index=False)
+    pd.DataFrame({'CAAE': ['11111111.1.0000.5262'], 'email': [html]}).to_csv('new.csv', index=False)
+    log = StateLog()
+    assert log.import_csv('old.csv', NOW) == 1 and log.import_csv('new.csv', NOW + DAY) == 2
+    assert main(['state-log', 'export', '--at', '2025-06-02T09:00', '--output', 'then.csv']) == 0
+    with open('then.csv', newline='', encoding='utf-8') as f:
+        assert list(csv.reader(f)) == [['CAAE', 'email'], ['11111111.1.0000.5262', '<p>old</p>']]
+    assert main(['state-log', 'status']) == 0
+    assert '2 execuções' in capsys.readouterr().out
+    store = TramiteStore(str(tmp_path / 'pb_state.sqlite3'))
+    try:
+        assert store.import_state_log(log) == 1 and store.known_caaes() == {'11111111.1.0000.5262'}
+    finally:
+        store.close()
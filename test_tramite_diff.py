@@ -0,0 +1,58 @@
+from pb.page_parsing import render_study_changes_html
+from pb.tramite_diff import diff_studies, diff_study, diff_tramites, tramite_key
+
+def tramite(apreciacao, data_hora, tipo, versao='1', informacoes=''):
+    return [apreciacao, data_hora, tipo, versao, 'Coordenador', 'CEP', 'PESQUISADOR', informacoes]
+
+SUBMISSION = tramite('PO', '01/03/2024 09:30:00', 'Submetido para avaliação do CEP')
+ACCEPTED = tramite('PO', '05/03/2024 14:00:00', 'Aceitação do PP')
+OPINION = tramite('PO', '02/05/2024 10:00:00', 'Parecer liberado')
+
+def study(tramites, nome='Estudo'):
+    return {'nome_estudo': nome, 'pi': 'Pesquisador Responsável: Fulana', 'caae': '11111111.1.0000.5262', 'tramites': tramites}
+
+def test_tramite_key():
+    assert tramite_key(SUBMISSION) == ('PO', '01/03/2024 09:30:00', 'Submetido para avaliação do CEP', '1')
+
+def test_unchanged_study_has_no_diff():
+    diff = diff_study('1', study([ACCEPTED, SUBMISSION]), study([ACCEPTED, SUBMISSION]))
+    assert not diff
+    assert diff.changed_rows == 0
+
+def test_added_removed_and_modified_rows():
+    edited = tramite('PO', '05/03/2024 14:00:00', 'Aceitação do PP', informacoes='Anexo corrigido')
+    added, removed, modified = diff_tramites([ACCEPTED, SUBMISSION], [OPINION, edited])
+    assert added == [OPINION]
+    assert removed == [SUBMISSION]
+    assert modified == [(ACCEPTED, edited)]
+
+def test_repeated_keys_are_matched_in_order():
+    added, removed, modified = diff_tramites([SUBMISSION], [SUBMISSION, SUBMISSION])
+    assert (added, removed, modified) == ([SUBMISSION], [], [])
+
+def test_new_study_reports_every_row():
+    diff = diff_study('1', None, study([ACCEPTED, SUBMISSION]))
+    assert diff.is_new and diff.added == [ACCEPTED, SUBMISSION]
+
+def test_missing_table_on_either_side():
+    assert diff_study('1', study(None), study([SUBMISSION])).added == [SUBMISSION]
+    assert diff_study('1', study([SUBMISSION]), study(None)).removed == [SUBMISSION]
+
+def test_header_change_without_row_change():
+    diff = diff_study('1', study([SUBMISSION]), study([SUBMISSION], nome='Estudo (emenda)'))
+    assert diff and diff.header_changed and diff.changed_rows == 0
+
+def test_diff_studies_keeps_only_changed_studies_in_order():
+    previous = {'a': study([SUBMISSION]), 'b': study([SUBMISSION])}
+    current = {'c': study([SUBMISSION]), 'b': study([ACCEPTED, SUBMISSION]), 'a': study([SUBMISSION])}
+    diffs = diff_studies(previous, current)
+    assert [(diff.caae, diff.is_new, diff.changed_rows) for diff in diffs] == [('c', True, 1), ('b', False, 1)]
+
+def test_rendered_fragment_contains_only_changed_rows():
+    history = [tramite('PO', f'{day:02d}/01/2024 10:00:00', f'Trâmite {day}') for day in range(1, 29)]
+    diff = diff_study('1', study(history), study([OPINION] + history))
+    html = render_study_changes_html(diff.details, diff.added, diff.removed, diff.modified, diff.is_new)
+    assert 'Parecer liberado' in html
+    assert 'Trâmite 1<' not in html
+    assert html.count('<tr><th>Novo</th>') == 1
+    assert '1 trâmite(s) novo(s), 0 alterado(s), 0 removido(s).' in html
@@ -0,0 +1,80 @@
+import datetime
+import pandas as pd
+from pb.page_parsing import parse_study_html, render_study_html
+from pb.tramite_store import TramiteStore, tramite_timestamp
+
+def tramite(apreciacao, data_hora, tipo='Submetido para avaliação do CEP', versao='1'):
+    return [apreciacao, data_hora, tipo, versao, 'Pesquisador Principal', 'PESQUISADOR', 'INI / FIOCRUZ', '']
+
+def study(caae, tramites):
+    return {'nome_estudo': f'Estudo {caae}', 'pi': 'Pesquisador Responsável: Fulana de Tal', 'caae': caae, 'tramites': tramites}
+
+STUDY_A = study('11111111.1.0000.5262', [tramite('PO', '02/05/2024 10:00:00', versao='2'), tramite('PO', '01/03/2024 09:30:00')])
+STUDY_B = study('22222222.2.0000.5262', None) # Details page without trâmite table
+
+def open_store(tmp_path):
+    return TramiteStore(str(tmp_path / 'state.sqlite3'))
+
+def test_round_trip(tmp_path):
+    with open_store(tmp_path) as store:
+        assert store.is_empty()
+        store.save_studies({STUDY_A['caae']: STUDY_A, STUDY_B['caae']: STUDY_B})
+    with open_store(tmp_path) as store:
+        assert store.known_caaes() == {STUDY_A['caae'], STUDY_B['caae']}
+        assert store.load_study(STUDY_A['caae']) == STUDY_A
+        assert store.load_study(STUDY_B['caae']) == STUDY_B
+        assert store.load_study('99999999.9.0000.5262') is None
+
+def test_empty_table_is_not_missing_table(tmp_path):
+    with open_store(tmp_path) as store:
+        store.save_study('3', study('3', []))
+        assert store.load_study('3')['tramites'] == []
+
+def test_save_replaces_tramites(tmp_path):
+    with open_store(tmp_path) as store:
+        store.save_study(STUDY_A['caae'], STUDY_A)
+        updated = study(STUDY_A['caae'], [tramite('E1', '03/05/2024 08:00:00', 'Parecer liberado', '2')] + STUDY_A['tramites'])
+        store.save_study(STUDY_A['caae'], updated)
+        assert store.load_study(STUDY_A['caae']) == updated
+
+def test_load_many_studies(tmp_path):
+    studies = {f'{n:08d}.0.0000.5262': study(f'{n:08d}.0.0000.5262', [tramite('PO', '01/01/2024 00:00:00')]) for n in range(2000)}
+    with open_store(tmp_path) as store:
+        store.save_studies(studies)
+        assert store.load_studies(studies) == studies
+
+def test_tramites_since_uses_timestamp_index(tmp_path):
+    with open_store(tmp_path) as store:
+        store.save_study(STUDY_A['caae'], STUDY_A)
+        recent = store.tramites_since(datetime.datetime(2024, 4, 1))
+        assert [(row['caae'], row['data_hora']) for row in recent] == [(STUDY_A['caae'], '02/05/2024 10:00:00')]
+        plan = ' '.join(str(row) for row in store.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM tramites WHERE timestamp >= ?', ('2024',)))
+        assert 'idx_tramites_timestamp' in plan
+
+def test_tramite_timestamp():
+    assert tramite_timestamp('28/05/2025 13:44:36') == '2025-05-28T13:44:36'
+    assert tramite_timestamp('') is None
+
+def test_parse_study_html_inverts_render():
+    assert parse_study_html(render_study_html(STUDY_A)) == STUDY_A
+    assert parse_study_html(render_study_html(STUDY_B)) == STUDY_B
+
+def test_import_legacy_pb3_csv(tmp_path):
+    pb3_html = f"""
+        <p><b>{STUDY_A['nome_estudo']}</b></p>
+        <p>CAAE: {STUDY_A['caae']}</p>
+        <p>{STUDY_A['pi']}</p>
+        <table border="1" class="dataframe"><thead><tr><th></th><th>Apreciação</th></tr></thead>
+        <tbody>{''.join('<tr><th>1</th>' + ''.join(f'<td>{cell}</td>' for cell in row) + '</tr>' for row in STUDY_A['tramites'])}</tbody>
+        </table>"""
+    csv_path = tmp_path / 'new.csv'
+    pd.DataFrame({'CAAE': [STUDY_A['caae']], 'email': [pb3_html]}).to_csv(csv_path, index=False)
+    with open_store(tmp_path) as store:
+        assert store.import_legacy_csv(str(csv_path)) == 1
+        assert store.load_study(STUDY_A['caae']) == STUDY_A
+
+def test_import_missing_legacy_csv(tmp_path):
+    with open_store(tmp_path) as store:
+        assert store.import_legacy_csv(str(tmp_path / 'absent.csv')) == 0
+        assert store.is_empty()
@@ -0,0 +1,100 @@
+import pytest
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.webdriver.common.by import By
+import pb.waits as waits
+from pb.waits import WaitRecorder, wait_for_ajax_idle, wait_for_element, wait_for_rows_change, wait_until
+
+# Tests for the readiness waits, using a fake driver instead of a browser.
+
+class FakeDriver:
+    """Answers the waits' scripts from queues of canned values (the last value repeats)."""
+
+    def __init__(self, signatures=None, idle=None, element_after=0):
+        self.signatures = list(signatures or [''])
+        self.idle = list(idle or [True])
+        self.element_after = element_after # Number of failed lookups before the element appears
+        self.lookups = 0
+
+    @staticmethod
+    def _next(values):
+        return values.pop(0) if len(values) > 1 else values[0]
+
+    def execute_script(self, script, *args):
+        if script == waits.ROWS_SIGNATURE_JS:
+            return self._next(self.signatures)
+        if script == waits.AJAX_IDLE_JS:
+            return self._next(self.idle)
+        return None
+
+    def find_element(self, by, value):
+        self.lookups += 1
+        if self.lookups <= self.element_after:
+            raise NoSuchElementException(value)
+        return f'<element {value}>'
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(waits, 'POLL_FREQUENCY', 0.01)
+
+def test_wait_until_records_time():
+    recorder = WaitRecorder()
+    assert wait_until(FakeDriver(), lambda drv: 'ready', 1, 'page', recorder) == 'ready'
+    assert recorder.summary()['page']['count'] == 1
+    assert recorder.summary()['page']['timeouts'] == 0
+
+def test_wait_until_timeout_recorded():
+    recorder = WaitRecorder()
+    with pytest.raises(TimeoutException):
+        wait_until(FakeDriver(), lambda drv: False, 0.05, 'never', recorder)
+    entry = recorder.summary()['never']
+    assert entry['timeouts'] == 1
+    assert entry['max'] >= 0.05
+
+def test_wait_for_element_returns_once_present():
+    recorder = WaitRecorder()
+    driver = FakeDriver(element_after=3)
+    element = wait_for_element(driver, (By.ID, 'formDetalharProjeto:tableTramiteApreciacaoProjeto:tb'),
+                               timeout=1, name='detail_page', recorder=recorder)
+    assert element == '<element formDetalharProjeto:tableTramiteApreciacaoProjeto:tb>'
+    assert driver.lookups == 4
+    assert recorder.summary()['detail_page']['count'] == 1
+
+def test_wait_for_ajax_idle():
+    recorder = WaitRecorder()
+    driver = FakeDriver(idle=[False, False, True])
+    assert wait_for_ajax_idle(driver, timeout=1, recorder=recorder)
+    assert recorder.summary()['ajax_idle']['count'] == 1
+
+def test_rows_change_waits_for_new_rows_and_idle_ajax():
+    recorder = WaitRecorder()
+    driver = FakeDriver(signatures=['page 1', 'page 1', 'page 2', 'page 2'], idle=[False, True])
+    signature = wait_for_rows_change(driver, '//tbody', 'page 1', timeout=1, recorder=recorder)
+    assert signature == 'page 2'
+
+def test_rows_change_accepts_unchanged_search_result():
+    """A search returning the rows already shown is satisfied by the expected text."""
+    driver = FakeDriver(signatures=['12345678.0.0000.5262 Estudo'])
+    signature = wait_for_rows_change(driver, '//tbody', '12345678.0.0000.5262 Estudo', timeout=1,
+                                     expected_text='12345678.0.0000.5262', recorder=WaitRecorder())
+    assert signature == '12345678.0.0000.5262 Estudo'
+
+def test_rows_change_expected_text_must_match_every_row():
+    """The full listing merely containing the CAAE does not count as a search result."""
+    listing = '12345678.0.0000.5262 Estudo A\n87654321.0.0000.5262 Estudo B'
+    driver = FakeDriver(signatures=[listing])
+    with pytest.raises(TimeoutException):
+        wait_for_rows_change(driver, '//tbody', listing, timeout=0.05,
+                             expected_text='12345678.0.0000.5262', recorder=WaitRecorder())
+
+def test_rows_change_to_empty_listing():
+    driver = FakeDriver(signatures=[''])
+    assert wait_for_rows_change(driver, '//tbody', 'page 1', timeout=1, recorder=WaitRecorder()) == ''
+
+def test_recorder_summary_groups_by_name():
+    recorder = WaitRecorder()
+    recorder.record('caae_search', 1.0)
+    recorder.record('caae_search', 3.0)
+    recorder.record('detail_page', 2.0, timed_out=True)
+    summary = recorder.summary()
+    assert summary['caae_search'] == {'count': 2, 'total': 4.0, 'max': 3.0, 'timeouts': 0}
+    assert summary['detail_page']['timeouts'] == 1
@@ -0,0 +1,190 @@
+import threading
+import time
+import pytest
+from pb.session_supervisor import DRIVER_DEAD, LOGGED_OUT, SessionProblem, SessionSupervisor
+from pb.worker_pool import run_worker_pool
+
+# Tests for the multi-session worker pool, using fake sessions instead of WebDrivers.
+
+def make_record(caae):
+    return {'caae': caae, 'email_html': f'<p>{caae}</p>'}
+
+@pytest.fixture
+def caae_list():
+    return [f'{i:08d}.0.0000.5262' for i in range(20)]
+
+def test_results_merged_in_input_order(caae_list):
+    """Results come back in input order even when workers finish out of order."""
+    def process(session, caae):
+        time.sleep(0.001 * (hash(caae) % 5))
+        return make_record(caae)
+
+    result = run_worker_pool(caae_list, session_factory=lambda worker_id: worker_id,
+                             process_caae=process, num_workers=4)
+
+    assert [r['caae'] for r in result.records] == caae_list
+    assert result.failed_caaes == []
+
+def test_every_worker_gets_its_own_session(caae_list):
+    """Each worker calls the factory once, except those given an initial session."""
+    created = []
+    used = set()
+    lock = threading.Lock()
+
+    def factory(worker_id):
+        with lock:
+            created.append(worker_id)
+        return f'session-{worker_id}'
+
+    def process(session, caae):
+        with lock:
+            used.add(session)
+        time.sleep(0.005)
+        return make_record(caae)
+
+    run_worker_pool(caae_list, session_factory=factory, process_caae=process,
+                    num_workers=3, initial_sessions={0: 'main-session'})
+
+    assert sorted(created) == [1, 2]
+    assert used == {'main-session', 'session-1', 'session-2'}
+
+def test_slow_worker_work_is_stolen(caae_list):
+    """An idle worker steals from a slow worker's deque instead of waiting."""
+    processed_by = {}
+
+    def process(session, caae):
+        if session == 'slow':
+            time.sleep(0.2)
+        processed_by[caae] = session
+        return make_record(caae)
+
+    result = run_worker_pool(caae_list, session_factory=lambda worker_id: 'fast',
+                             process_caae=process, num_workers=2,
+                             initial_sessions={0: 'slow'})
+
+    assert len(result.records) == len(caae_list)
+    # The slow worker owned half of the list but only gets through a few items
+    assert list(processed_by.values()).count('slow') < len(caae_list) // 2
+
+def test_failed_caae_retried_on_another_attempt(caae_list):
+    """A CAAE that fails once is requeued and succeeds on the second attempt."""
+    failures = {caae_list[3]: 1}
+    lock = threading.Lock()
+
+    def process(session, caae):
+        with lock:
+            if failures.get(caae):
+                failures[caae] -= 1
+                return None
+        return make_record(caae)
+
+    result = run_worker_pool(caae_list, session_factory=lambda worker_id: worker_id,
+                             process_caae=process, num_workers=2, max_attempts=2)
+
+    assert len(result.records) == len(caae_list)
+    assert result.attempts[caae_list[3]] == 2
+
+def test_failed_caae_waits_until_the_others_are_done(caae_list):
+    """A failing CAAE is retried after every other CAAE, in a fresh session, never ahead of them."""
+    order, sessions = [], iter(['first', 'fresh'])
+
+    def process(session, caae):
+        order.append((session, caae))
+        return None if caae == caae_list[2] and session == 'first' else make_record(caae)
+
+    closed = []
+    result = run_worker_pool(caae_list, session_factory=lambda worker_id: next(sessions),
+                             process_caae=process, num_workers=1, close_session=closed.append)
+
+    assert [caae for _, caae in order] == caae_list + [caae_list[2]]
+    assert order[-1] == ('fresh', caae_list[2]) and closed == ['first', 'fresh']
+    assert len(result.records) == len(caae_list) and result.attempts[caae_list[2]] == 2
+
+def test_always_failing_caae_reported(caae_list):
+    """A CAAE that fails on every attempt is reported and does not block the others."""
+    bad = caae_list[5]
+
+    def process(session, caae):
+        if caae == bad:
+            raise RuntimeError("detail page broken")
+        return make_record(caae)
+
+    result = run_worker_pool(caae_list, session_factory=lambda worker_id: worker_id,
+                             process_caae=process, num_workers=3, max_attempts=3)
+
+    assert result.failed_caaes == [bad]
+    assert result.attempts[bad] == 3
+    assert len(result.records) == len(caae_list) - 1
+
+def test_worker_that_cannot_start_is_covered_by_others(caae_list):
+    """If a session cannot be created, the remaining workers process its CAAEs."""
+    closed = []
+
+    def factory(worker_id):
+        if worker_id == 1:
+            raise RuntimeError("login failed")
+        return worker_id
+
+    result = run_worker_pool(caae_list, session_factory=factory,
+                             process_caae=lambda session, caae: make_record(caae),
+                             num_workers=3, close_session=closed.append)
+
+    assert [r['caae'] for r in result.records] == caae_list
+    assert sorted(closed) == [0, 2]
+
+def test_no_session_available():
+    """When no worker can start, every CAAE is reported as failed."""
+    def factory(worker_id):
+        raise RuntimeError("no browser")
+
+    result = run_worker_pool(['a', 'b', 'c'], session_factory=factory,
+                             process_caae=lambda session, caae: make_record(caae),
+                             num_workers=2)
+
+    assert result.records == []
+    assert result.failed_caaes == ['a', 'b', 'c']
+
+def test_empty_list():
+    result = run_worker_pool([], session_factory=lambda worker_id: worker_id,
+                             process_caae=lambda session, caae: make_record(caae),
+                             num_workers=4)
+    assert result.records == []
+    assert result.failed_caaes == []
+
+def test_session_problem_is_recovered_without_counting_an_attempt():
+    """A worker whose session breaks gets a new one from the supervisor and goes on from the same CAAE."""
+    broken = {'old'}
+    reopened = []
+
+    class Supervisor:
+        def recover(self, worker_id, session, problem):
+            reopened.append((session, problem.kind))
+            return 'new', True
+        def succeeded(self, worker_id):
+            pass
+
+    def process(session, caae):
+        if session in broken and caae == 'b':
+            raise SessionProblem(LOGGED_OUT)
+        return make_record(caae)
+
+    result = run_worker_pool(['a', 'b', 'c'], session_factory=lambda worker_id: 'old',
+                             process_caae=process, num_workers=1, max_attempts=1, supervisor=Supervisor())
+
+    assert [r['caae'] for r in result.records] == ['a', 'b', 'c']
+    assert reopened == [('old', LOGGED_OUT)] and result.attempts == {'a': 1, 'b': 1, 'c': 1}
+
+def test_lost_session_leaves_its_caaes_unprocessed():
+    """Past the recovery limit the worker stops; its CAAEs are reported as unprocessed, not failed."""
+    def process(session, caae):
+        if caae != 'a':
+            raise SessionProblem(DRIVER_DEAD)
+        return make_record(caae)
+
+    supervisor = SessionSupervisor(lambda worker_id, session, kind, login: ('new', True), max_recoveries=2)
+    result = run_worker_pool(['a', 'b', 'c'], session_factory=lambda worker_id: 'old',
+                             process_caae=process, num_workers=1, supervisor=supervisor)
+
+    assert [r['caae'] for r in result.records] == ['a']
+    assert result.failed_caaes == result.unprocessed == ['b', 'c']
+    assert len(supervisor.recoveries) == 2 and 'c' not in result.attempts